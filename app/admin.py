@@ -1,13 +1,19 @@
 from django.contrib import admin
 
 # Register your models here.
-from .models import Caso, Arquivo, Banco, Agencia, Relatorio
+from .models import Caso, Arquivo, Banco, Agencia, Relatorio, ImportJob
 
 admin.site.register(Caso)
 admin.site.register(Arquivo)
 admin.site.register(Banco)
 admin.site.register(Agencia)
 
+@admin.register(ImportJob)
+class ImportJobAdmin(admin.ModelAdmin):
+    list_display = ['id', 'caso', 'tipo', 'status', 'linhas_processadas', 'linhas_rejeitadas', 'created_by', 'created_at']
+    list_filter = ['tipo', 'status', 'created_at']
+    readonly_fields = ['created_at', 'iniciado_em', 'finalizado_em', 'updated_at']
+
 @admin.register(Relatorio)
 class RelatorioAdmin(admin.ModelAdmin):
     list_display = ['nome', 'tipo', 'status', 'created_by', 'created_at']
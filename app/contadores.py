@@ -0,0 +1,254 @@
+"""Contadores de registros por caso, RIF, cooperação e arquivo.
+
+As telas de visão geral leem as quantidades da tabela Contador em uma única
+consulta por caso, em vez de contar os registros de cada RIF, cooperação ou
+arquivo a cada acesso. A criação do caso, a das RIFs e cooperações, os
+importadores e as exclusões chamam atualizar_contadores na própria transação;
+o comando ``python manage.py reconstruir_contadores`` refaz a tabela do zero. A
+leitura nunca grava: um caso ainda sem contadores (ex.: dados anteriores à
+tabela) recebe contadores calculados na hora, sem gravar.
+"""
+import logging
+from collections import defaultdict
+
+from django.db import router, transaction
+from django.db.models import Count, Sum
+
+from bancaria.models import Cooperacao, ExtratoDetalhado
+from financeira.models import RIF, Comunicacao, Envolvido, Ocorrencia
+from .models import Arquivo, Caso, Contador
+
+logger = logging.getLogger(__name__)
+
+# Tipos de Arquivo de cada origem (Arquivo.external_id aponta para a RIF ou para a cooperação)
+TIPOS_ARQUIVO_RIF = ('comunicacoes', 'envolvidos', 'ocorrencias')
+TIPO_ARQUIVO_COOPERACAO = 'cooperacao_bancaria'
+
+# Registros contados em cada RIF (e nos arquivos dela)
+MODELOS_RIF = {'comunicacoes': Comunicacao, 'envolvidos': Envolvido, 'ocorrencias': Ocorrencia}
+
+CAMPOS = ['rifs', 'cooperacoes', 'arquivos', 'comunicacoes', 'envolvidos', 'ocorrencias', 'extratos', 'titulares']
+
+# Totais do caso somados a partir dos contadores das RIFs e das cooperações
+CAMPOS_SOMADOS = ['arquivos', 'comunicacoes', 'envolvidos', 'ocorrencias', 'extratos']
+
+
+#########################################################################################################################
+# ATUALIZAÇÃO
+#########################################################################################################################
+def _contar_por(queryset, campo):
+    """Quantidade de registros por valor de `campo` (GROUP BY no banco)."""
+    return dict(queryset.order_by().values_list(campo).annotate(total=Count('*')))
+
+
+def _contadores_rifs(caso_id, rif_ids, banco):
+    """Conta comunicações, envolvidos e ocorrências das RIFs e dos arquivos delas.
+
+    Returns:
+        dict: {(escopo, id): {campo: quantidade}}.
+    """
+    contadores = {('rif', rif_id): {} for rif_id in rif_ids}
+    arquivos = Arquivo.objects.using(banco).filter(
+        caso_id=caso_id, tipo__in=TIPOS_ARQUIVO_RIF, external_id__in=rif_ids)
+    for arquivo_id, rif_id in arquivos.values_list('id', 'external_id'):
+        contadores[('arquivo', arquivo_id)] = {}
+        contadores[('rif', rif_id)]['arquivos'] = contadores[('rif', rif_id)].get('arquivos', 0) + 1
+
+    for campo, modelo in MODELOS_RIF.items():
+        registros = modelo.objects.using(banco).filter(rif_id__in=rif_ids)
+        for rif_id, total in _contar_por(registros, 'rif_id').items():
+            contadores[('rif', rif_id)][campo] = total
+        # Na reimportação, os registros alterados passam para o arquivo novo
+        for arquivo_id, total in _contar_por(registros, 'arquivo_id').items():
+            contadores.setdefault(('arquivo', arquivo_id), {})[campo] = total
+    return contadores
+
+
+def _contadores_cooperacoes(caso_id, cooperacao_ids, banco):
+    """Conta lançamentos e titulares distintos das cooperações e dos arquivos delas.
+
+    Returns:
+        dict: {(escopo, id): {campo: quantidade}}.
+    """
+    contadores = {('cooperacao', cooperacao_id): {} for cooperacao_id in cooperacao_ids}
+    arquivos = Arquivo.objects.using(banco).filter(
+        caso_id=caso_id, tipo=TIPO_ARQUIVO_COOPERACAO, external_id__in=cooperacao_ids)
+    for arquivo_id, cooperacao_id in arquivos.values_list('id', 'external_id'):
+        contadores[('arquivo', arquivo_id)] = {}
+        contador = contadores[('cooperacao', cooperacao_id)]
+        contador['arquivos'] = contador.get('arquivos', 0) + 1
+
+    extratos = ExtratoDetalhado.objects.using(banco).filter(cooperacao_id__in=cooperacao_ids)
+    por_cooperacao = extratos.order_by().values('cooperacao_id').annotate(
+        extratos=Count('*'), titulares=Count('cpf_cnpj_titular', distinct=True))
+    for linha in por_cooperacao:
+        contadores[('cooperacao', linha['cooperacao_id'])].update(
+            extratos=linha['extratos'], titulares=linha['titulares'])
+    for arquivo_id, total in _contar_por(extratos, 'arquivo_id').items():
+        contadores.setdefault(('arquivo', arquivo_id), {})['extratos'] = total
+    return contadores
+
+
+def _totais_do_caso(caso_id, rif_ids, cooperacao_ids, somas, banco):
+    """Contador do caso: as somas dos contadores das RIFs e das cooperações, mais as quantidades do caso."""
+    totais = {campo: somas.get(campo) or 0 for campo in CAMPOS_SOMADOS}
+    totais.update(
+        rifs=len(rif_ids),
+        cooperacoes=len(cooperacao_ids),
+        titulares=ExtratoDetalhado.objects.using(banco).filter(caso_id=caso_id).aggregate(
+            total=Count('cpf_cnpj_titular', distinct=True))['total'],
+    )
+    return totais
+
+
+def _ids_do_caso(caso_id, banco):
+    """Ids das RIFs, das cooperações e dos arquivos do caso."""
+    return (
+        set(RIF.objects.using(banco).filter(caso_id=caso_id).values_list('id', flat=True)),
+        set(Cooperacao.objects.using(banco).filter(caso_id=caso_id).values_list('id', flat=True)),
+        set(Arquivo.objects.using(banco).filter(caso_id=caso_id).values_list('id', flat=True)),
+    )
+
+
+def _registros(caso_id, contadores):
+    """Instâncias de Contador (não gravadas) a partir de {(escopo, id): {campo: quantidade}}."""
+    return [
+        Contador(caso_id=caso_id, escopo=escopo, escopo_id=escopo_id,
+                 **{campo: valores.get(campo, 0) for campo in CAMPOS})
+        for (escopo, escopo_id), valores in contadores.items()
+    ]
+
+
+def _gravar(caso_id, contadores, banco):
+    """Grava os contadores (insere ou substitui pelo par escopo + id)."""
+    Contador.objects.using(banco).bulk_create(
+        _registros(caso_id, contadores), update_conflicts=True, unique_fields=['escopo', 'escopo_id'],
+        update_fields=['caso', *CAMPOS, 'atualizado_em'])
+
+
+def atualizar_contadores(caso_id, rifs=(), cooperacoes=(), using=None):
+    """Recalcula os contadores das RIFs e cooperações informadas e os totais do caso.
+
+    Chamada pelos importadores, ao final da gravação de cada arquivo, e pelas
+    exclusões. RIFs e cooperações do caso ainda sem contador são contadas
+    também, e os contadores de registros que não existem mais são removidos,
+    então atualizar_contadores(caso_id) sozinho deixa o caso consistente.
+
+    No PostgreSQL, a linha do caso fica bloqueada até o fim da transação, para
+    que importações simultâneas no mesmo caso não gravem totais desatualizados.
+
+    Args:
+        caso_id (int): Id do caso.
+        rifs (Iterable[int]): Ids das RIFs cujos registros mudaram.
+        cooperacoes (Iterable[int]): Ids das cooperações cujos registros mudaram.
+        using (Optional[str]): Alias do banco; por padrão, o de gravação de Contador.
+    """
+    banco = using or router.db_for_write(Contador)
+
+    with transaction.atomic(using=banco):
+        list(Caso.objects.using(banco).select_for_update().filter(id=caso_id).values_list('id'))
+
+        rif_ids, cooperacao_ids, arquivo_ids = _ids_do_caso(caso_id, banco)
+        existentes = {escopo: set() for escopo, _ in Contador.ESCOPO_CHOICES}
+        for escopo, escopo_id in Contador.objects.using(banco).filter(caso_id=caso_id).values_list('escopo', 'escopo_id'):
+            existentes[escopo].add(escopo_id)
+
+        # Contadores de RIFs, cooperações ou arquivos excluídos
+        obsoletos = {
+            'rif': existentes['rif'] - rif_ids,
+            'cooperacao': existentes['cooperacao'] - cooperacao_ids,
+            'arquivo': existentes['arquivo'] - arquivo_ids,
+        }
+        for escopo, ids in obsoletos.items():
+            if ids:
+                Contador.objects.using(banco).filter(caso_id=caso_id, escopo=escopo, escopo_id__in=ids).delete()
+
+        rifs_recontar = (set(rifs) | (rif_ids - existentes['rif'])) & rif_ids
+        cooperacoes_recontar = (set(cooperacoes) | (cooperacao_ids - existentes['cooperacao'])) & cooperacao_ids
+        contadores = {}
+        if rifs_recontar:
+            contadores.update(_contadores_rifs(caso_id, rifs_recontar, banco))
+        if cooperacoes_recontar:
+            contadores.update(_contadores_cooperacoes(caso_id, cooperacoes_recontar, banco))
+        if contadores:
+            _gravar(caso_id, contadores, banco)
+
+        # Totais do caso a partir dos contadores das RIFs e das cooperações
+        somas = Contador.objects.using(banco).filter(caso_id=caso_id, escopo__in=['rif', 'cooperacao']).aggregate(
+            **{campo: Sum(campo) for campo in CAMPOS_SOMADOS})
+        _gravar(caso_id, {('caso', caso_id): _totais_do_caso(caso_id, rif_ids, cooperacao_ids, somas, banco)}, banco)
+
+
+def reconstruir_contadores(casos=None, using=None):
+    """Apaga e recalcula os contadores de todos os casos (ou dos casos informados).
+
+    Args:
+        casos (Optional[Iterable[int]]): Ids dos casos; todos, se não informado.
+        using (Optional[str]): Alias do banco; por padrão, o de gravação de Contador.
+
+    Returns:
+        int: Quantidade de casos recalculados.
+    """
+    banco = using or router.db_for_write(Contador)
+    caso_ids = list(casos) if casos is not None else list(
+        Caso.objects.using(banco).order_by('id').values_list('id', flat=True))
+
+    for caso_id in caso_ids:
+        with transaction.atomic(using=banco):
+            Contador.objects.using(banco).filter(caso_id=caso_id).delete()
+            atualizar_contadores(caso_id, using=banco)
+        logger.info("Contadores do caso %s reconstruídos", caso_id)
+    return len(caso_ids)
+
+
+#########################################################################################################################
+# LEITURA
+#########################################################################################################################
+def contadores_do_caso(caso_id, using=None):
+    """Contadores do caso, das RIFs, das cooperações e dos arquivos em uma única consulta.
+
+    A leitura nunca grava: se o caso ainda não tiver contadores (ex.: dados
+    anteriores à tabela), eles são calculados nesse momento, sem gravar; os
+    gravados são criados pela próxima importação ou exclusão no caso ou pelo
+    comando reconstruir_contadores.
+
+    Args:
+        caso_id (int): Id do caso.
+        using (Optional[str]): Alias do banco; por padrão, o de leitura de Contador.
+
+    Returns:
+        dict: {'caso': Contador, 'rif': {id: Contador}, 'cooperacao': {...}, 'arquivo': {...}}.
+            Ids sem contador devolvem um Contador zerado.
+    """
+    banco = using or router.db_for_read(Contador)
+    contadores = list(Contador.objects.using(banco).filter(caso_id=caso_id))
+    if not any(contador.escopo == 'caso' for contador in contadores):
+        contadores = _contadores_nao_gravados(caso_id, banco)
+
+    resultado = {escopo: defaultdict(Contador) for escopo in ('rif', 'cooperacao', 'arquivo')}
+    resultado['caso'] = Contador()
+    for contador in contadores:
+        if contador.escopo == 'caso':
+            resultado['caso'] = contador
+        else:
+            resultado[contador.escopo][contador.escopo_id] = contador
+    return resultado
+
+
+def _contadores_nao_gravados(caso_id, banco):
+    """Contadores do caso calculados a partir dos registros, sem gravar."""
+    rif_ids, cooperacao_ids, _ = _ids_do_caso(caso_id, banco)
+    if rif_ids or cooperacao_ids:
+        logger.warning("Caso %s sem contadores gravados; calculados na leitura (ver reconstruir_contadores)",
+                       caso_id)
+
+    contadores = {}
+    if rif_ids:
+        contadores.update(_contadores_rifs(caso_id, rif_ids, banco))
+    if cooperacao_ids:
+        contadores.update(_contadores_cooperacoes(caso_id, cooperacao_ids, banco))
+    somas = {campo: sum(valores.get(campo, 0) for (escopo, _), valores in contadores.items()
+                        if escopo in ('rif', 'cooperacao'))
+             for campo in CAMPOS_SOMADOS}
+    contadores[('caso', caso_id)] = _totais_do_caso(caso_id, rif_ids, cooperacao_ids, somas, banco)
+    return _registros(caso_id, contadores)
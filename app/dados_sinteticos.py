@@ -0,0 +1,367 @@
+"""Geração de arquivos sintéticos de RIF (COAF) e de cooperação bancária (SIMBA).
+
+Os arquivos seguem os layouts lidos pelos importadores (financeira.importacao e
+bancaria.importacao), com CPFs/CNPJs de dígitos verificadores válidos, valores no
+formato brasileiro e o rodapé exportado pelo COAF. Servem para medir a
+importação sem usar dados reais sigilosos (comando benchmark_importacao).
+
+A geração é vetorizada e escrita em blocos, então a memória usada não depende da
+quantidade de linhas pedida.
+"""
+import os
+import zipfile
+
+import numpy as np
+import pandas as pd
+
+# Linhas geradas e escritas por vez
+TAMANHO_BLOCO = 50000
+
+# Nome de cada arquivo da RIF, por tipo
+ARQUIVOS_RIF = {
+    'comunicacoes': 'RIF_Comunicacoes.csv',
+    'envolvidos': 'RIF_Envolvidos.csv',
+    'ocorrencias': 'RIF_Ocorrencias.csv',
+}
+
+NOMES = ['Ana', 'Bruno', 'Carla', 'Daniel', 'Eduarda', 'Felipe', 'Gabriela', 'Henrique', 'Isabela', 'João',
+         'Larissa', 'Marcos', 'Natália', 'Otávio', 'Patrícia', 'Rafael', 'Sabrina', 'Tiago', 'Vanessa', 'Wesley']
+SOBRENOMES = ['Silva', 'Santos', 'Oliveira', 'Souza', 'Rodrigues', 'Ferreira', 'Alves', 'Pereira', 'Lima', 'Gomes',
+              'Costa', 'Ribeiro', 'Martins', 'Carvalho', 'Araújo', 'Melo', 'Barbosa', 'Cardoso', 'Rocha', 'Dias']
+EMPRESAS = ['Comércio', 'Transportes', 'Construtora', 'Distribuidora', 'Serviços', 'Agropecuária', 'Importadora',
+            'Tecnologia', 'Representações', 'Participações']
+BANCOS = [('001', 'Banco do Brasil S.A.', '00000000000191'), ('104', 'Caixa Econômica Federal', '00360305000104'),
+          ('237', 'Banco Bradesco S.A.', '60746948000112'), ('341', 'Itaú Unibanco S.A.', '60701190000104'),
+          ('260', 'Nu Pagamentos S.A.', '18236120000158')]
+CIDADES = [('Fortaleza', 'CE'), ('Sobral', 'CE'), ('Juazeiro do Norte', 'CE'), ('Recife', 'PE'),
+           ('São Paulo', 'SP'), ('Salvador', 'BA'), ('Teresina', 'PI'), ('Natal', 'RN')]
+TIPOS_ENVOLVIDO = ['Titular', 'Remetente', 'Destinatário', 'Procurador/Representante', 'Sócio']
+OCORRENCIAS = [
+    (1010, 'Movimentação de recursos incompatível com o patrimônio, a atividade econômica ou a ocupação profissional'),
+    (1011, 'Realização de operações que, por sua habitualidade, valor e forma, configurem artifício para burla da identificação'),
+    (1012, 'Movimentação de recursos em espécie em montante incompatível com a atividade'),
+    (1013, 'Fragmentação de depósitos em espécie de forma a dissimular o valor total da movimentação'),
+    (1020, 'Recebimento de recursos com imediata compra de instrumentos para a realização de pagamentos'),
+    (1030, 'Transferências de valores arredondados na casa do milhar, em curto período'),
+]
+DESCRICOES_LANCAMENTO = ['PIX RECEBIDO', 'PIX ENVIADO', 'TED RECEBIDA', 'TED ENVIADA', 'DEPOSITO EM ESPECIE',
+                         'SAQUE ATM', 'PAGAMENTO DE BOLETO', 'TRANSFERENCIA ENTRE CONTAS', 'TARIFA BANCARIA']
+LOCAIS_TRANSACAO = ['Telefone', 'Internet Banking', 'Agência', 'Caixa Eletrônico', 'Correspondente']
+
+
+#########################################################################################################################
+# VALORES SINTÉTICOS
+#########################################################################################################################
+def _digitos_verificadores(base, pesos):
+    """Acrescenta a `base` (matriz de dígitos) um dígito verificador calculado com os pesos (módulo 11)."""
+    resto = (base * pesos).sum(axis=1) % 11
+    digito = np.where(resto < 2, 0, 11 - resto)
+    return np.column_stack([base, digito])
+
+
+def cpfs(rng, quantidade):
+    """CPFs válidos, só com dígitos (11 caracteres, com zeros à esquerda)."""
+    digitos = rng.integers(0, 10, size=(quantidade, 9))
+    digitos = _digitos_verificadores(digitos, np.arange(10, 1, -1))
+    digitos = _digitos_verificadores(digitos, np.arange(11, 1, -1))
+    return _juntar_digitos(digitos)
+
+
+def cnpjs(rng, quantidade):
+    """CNPJs válidos (matriz 0001), só com dígitos."""
+    raiz = rng.integers(0, 10, size=(quantidade, 8))
+    digitos = np.column_stack([raiz, np.tile([0, 0, 0, 1], (quantidade, 1))])
+    digitos = _digitos_verificadores(digitos, np.array([5, 4, 3, 2, 9, 8, 7, 6, 5, 4, 3, 2]))
+    digitos = _digitos_verificadores(digitos, np.array([6, 5, 4, 3, 2, 9, 8, 7, 6, 5, 4, 3, 2]))
+    return _juntar_digitos(digitos)
+
+
+def _juntar_digitos(digitos):
+    """Junta a matriz de dígitos em textos de tamanho fixo, com zeros à esquerda."""
+    tamanho = digitos.shape[1]
+    numeros = digitos @ (10 ** np.arange(tamanho - 1, -1, -1, dtype=np.int64))
+    return pd.Series(numeros).astype(str).str.zfill(tamanho)
+
+
+def formatar_cpf_cnpj(documentos):
+    """Aplica a máscara 000.000.000-00 ou 00.000.000/0000-00, como nos arquivos do COAF."""
+    cpf = documentos.str.replace(r'^(\d{3})(\d{3})(\d{3})(\d{2})$', r'\1.\2.\3-\4', regex=True)
+    return cpf.str.replace(r'^(\d{2})(\d{3})(\d{3})(\d{4})(\d{2})$', r'\1.\2.\3/\4-\5', regex=True)
+
+
+def nomes_pessoas(rng, quantidade):
+    """Nomes completos de pessoas físicas."""
+    return (pd.Series(rng.choice(NOMES, quantidade)) + ' ' + rng.choice(SOBRENOMES, quantidade)
+            + ' ' + rng.choice(SOBRENOMES, quantidade))
+
+
+def nomes_empresas(rng, quantidade):
+    """Razões sociais de pessoas jurídicas."""
+    return (pd.Series(rng.choice(SOBRENOMES, quantidade)) + ' ' + rng.choice(EMPRESAS, quantidade)
+            + pd.Series(rng.choice([' Ltda', ' S.A.', ' ME', ' EIRELI'], quantidade)))
+
+
+def valores_brasileiros(centavos):
+    """Formata valores em centavos como '1.234,56'."""
+    centavos = pd.Series(centavos)
+    inteiros = (centavos // 100).map('{:,}'.format).str.replace(',', '.', regex=False)
+    return inteiros + ',' + (centavos % 100).astype(str).str.zfill(2)
+
+
+def datas_aleatorias(rng, quantidade, inicio='2020-01-01', fim='2024-12-31'):
+    """Datas uniformes no intervalo."""
+    inicio, fim = pd.Timestamp(inicio), pd.Timestamp(fim)
+    dias = rng.integers(0, (fim - inicio).days + 1, quantidade)
+    return pd.Series(inicio + pd.to_timedelta(dias, unit='D'))
+
+
+#########################################################################################################################
+# RIF
+#########################################################################################################################
+def _bloco_comunicacoes(rng, indexadores):
+    n = len(indexadores)
+    bancos = rng.integers(0, len(BANCOS), n)
+    cidades = rng.integers(0, len(CIDADES), n)
+    recebimento = datas_aleatorias(rng, n, '2023-01-01', '2024-12-31')
+    operacao = recebimento - pd.to_timedelta(rng.integers(30, 365, n), unit='D')
+    fim_fato = operacao + pd.to_timedelta(rng.integers(1, 180, n), unit='D')
+    credito = rng.lognormal(11, 1.5, n).astype(np.int64)
+    debito = (credito * rng.uniform(0.7, 1.0, n)).astype(np.int64)
+    titulares = nomes_pessoas(rng, n)
+
+    informacoes = (
+        'Cliente ' + titulares + ', renda declarada de R$ ' + valores_brasileiros(rng.integers(150000, 2500000, n))
+        + '. No período analisado movimentou a crédito R$ ' + valores_brasileiros(credito)
+        + ' e a débito R$ ' + valores_brasileiros(debito)
+        + ', com recursos provenientes principalmente de ' + nomes_empresas(rng, n)
+        + ' e destinados a ' + nomes_pessoas(rng, n)
+        + '. Movimentação considerada atípica frente ao perfil cadastral, com fracionamento de depósitos em espécie.'
+    )
+
+    return pd.DataFrame({
+        'Indexador': indexadores,
+        'idComunicacao': indexadores + 10000000,
+        'NumeroOcorrenciaBC': pd.Series(rng.integers(10 ** 8, 10 ** 9, n)).astype(str),
+        'Data_do_Recebimento': recebimento.dt.strftime('%d/%m/%Y') + ' '
+                               + pd.Series(rng.integers(0, 86400, n)).map(lambda s: f'{s // 3600:02d}:{s // 60 % 60:02d}:{s % 60:02d}'),
+        'Data_da_operacao': operacao.dt.strftime('%d/%m/%Y'),
+        'DataFimFato': fim_fato.dt.strftime('%d/%m/%Y'),
+        'cpfCnpjComunicante': formatar_cpf_cnpj(pd.Series([BANCOS[b][2] for b in bancos])),
+        'nomeComunicante': [BANCOS[b][1] for b in bancos],
+        'CidadeAgencia': [CIDADES[c][0] for c in cidades],
+        'UFAgencia': [CIDADES[c][1] for c in cidades],
+        'NomeAgencia': 'Agência ' + pd.Series([CIDADES[c][0] for c in cidades]),
+        'NumeroAgencia': rng.integers(1, 9999, n),
+        'informacoesAdicionais': informacoes,
+        'CampoA': valores_brasileiros(credito),
+        'CampoB': valores_brasileiros(debito),
+        'CampoC': valores_brasileiros(rng.integers(0, 5000000, n)),
+        'CampoD': valores_brasileiros(rng.integers(0, 1000000, n)),
+        'CampoE': valores_brasileiros(np.zeros(n, dtype=np.int64)),
+        'CodigoSegmento': rng.choice([41, 42, 43, 46], n),
+    })
+
+
+def _bloco_envolvidos(rng, indexadores, envolvidos_por_comunicacao):
+    # O primeiro envolvido de cada comunicação é o titular
+    quantidades = rng.integers(1, 2 * envolvidos_por_comunicacao, len(indexadores))
+    indexador = np.repeat(indexadores, quantidades)
+    n = len(indexador)
+    primeiro = np.r_[True, indexador[1:] != indexador[:-1]]
+    pessoa_juridica = ~primeiro & (rng.random(n) < 0.3)
+
+    documentos = cpfs(rng, n).where(~pessoa_juridica, cnpjs(rng, n))
+    nomes = nomes_pessoas(rng, n).where(~pessoa_juridica, nomes_empresas(rng, n))
+    tipos = pd.Series(rng.choice(TIPOS_ENVOLVIDO[1:], n)).where(~primeiro, 'Titular')
+    abertura = datas_aleatorias(rng, n, '2005-01-01', '2022-12-31')
+    com_conta = primeiro | (rng.random(n) < 0.4)
+
+    return pd.DataFrame({
+        'Indexador': indexador,
+        'cpfCnpjEnvolvido': formatar_cpf_cnpj(documentos),
+        'nomeEnvolvido': nomes.str.upper(),
+        'tipoEnvolvido': tipos,
+        'agenciaEnvolvido': pd.Series(rng.integers(1, 9999, n)).astype(str).where(com_conta, '-'),
+        'contaEnvolvido': pd.Series(rng.integers(10000, 99999999, n)).astype(str).where(com_conta, '-'),
+        'DataAberturaConta': abertura.dt.strftime('%d/%m/%Y').where(com_conta, '-'),
+        'DataAtualizacaoConta': (abertura + pd.to_timedelta(rng.integers(0, 700, n), unit='D'))
+                                .dt.strftime('%d/%m/%Y').where(com_conta, '-'),
+        'bitPepCitado': rng.choice(['Não', 'Sim'], n, p=[0.98, 0.02]),
+        'bitPessoaObrigadaCitado': rng.choice(['Não', 'Sim'], n, p=[0.99, 0.01]),
+        'intServidorCitado': rng.choice(['Não', 'Sim', '-'], n, p=[0.9, 0.05, 0.05]),
+    })
+
+
+def _bloco_ocorrencias(rng, indexadores):
+    quantidades = rng.integers(1, 4, len(indexadores))
+    indexador = np.repeat(indexadores, quantidades)
+    escolhidas = rng.integers(0, len(OCORRENCIAS), len(indexador))
+    return pd.DataFrame({
+        'Indexador': indexador,
+        'idOcorrencia': [OCORRENCIAS[o][0] for o in escolhidas],
+        'Ocorrencia': [OCORRENCIAS[o][1] for o in escolhidas],
+    }).drop_duplicates(['Indexador', 'idOcorrencia'])
+
+
+def gerar_rif(diretorio, comunicacoes, envolvidos_por_comunicacao=2, semente=None):
+    """Gera os três arquivos da RIF (CSV em windows-1252 separado por ';', com o rodapé do COAF).
+
+    Args:
+        diretorio (str): Diretório de destino (criado se não existir).
+        comunicacoes (int): Quantidade de comunicações.
+        envolvidos_por_comunicacao (int): Média de envolvidos por comunicação.
+        semente (Optional[int]): Semente do gerador aleatório, para arquivos reproduzíveis.
+
+    Returns:
+        dict: {tipo: {'caminho', 'linhas'}} de cada arquivo gerado.
+    """
+    os.makedirs(diretorio, exist_ok=True)
+    rng = np.random.default_rng(semente)
+    geradores = {
+        'comunicacoes': _bloco_comunicacoes,
+        'envolvidos': lambda rng, indexadores: _bloco_envolvidos(rng, indexadores, envolvidos_por_comunicacao),
+        'ocorrencias': _bloco_ocorrencias,
+    }
+
+    resultado = {}
+    for tipo, gerar_bloco in geradores.items():
+        caminho = os.path.join(diretorio, ARQUIVOS_RIF[tipo])
+        linhas = 0
+        with open(caminho, 'w', encoding='windows-1252', errors='replace', newline='') as arquivo:
+            for inicio in range(0, comunicacoes, TAMANHO_BLOCO):
+                indexadores = np.arange(inicio + 1, min(inicio + TAMANHO_BLOCO, comunicacoes) + 1)
+                bloco = gerar_bloco(rng, indexadores)
+                bloco.to_csv(arquivo, sep=';', index=False, header=inicio == 0, lineterminator='\r\n')
+                linhas += len(bloco)
+            # Rodapé do arquivo exportado pelo COAF
+            colunas = len(bloco.columns)
+            arquivo.write('#' + ';' * (colunas - 1) + '\r\n')
+            arquivo.write('Arquivo gerado pelo Siscoaf' + ';' * (colunas - 1) + '\r\n')
+        resultado[tipo] = {'caminho': caminho, 'linhas': linhas}
+
+    return resultado
+
+
+#########################################################################################################################
+# SIMBA
+#########################################################################################################################
+def _escrever_membro(zip_ref, nome, blocos):
+    """Escreve um arquivo em texto do BACEN no .zip (separado por tabulação, sem cabeçalho), bloco a bloco."""
+    linhas = 0
+    with zip_ref.open(nome, 'w', force_zip64=True) as membro:
+        for bloco in blocos:
+            membro.write(bloco.to_csv(sep='\t', index=False, header=False, lineterminator='\r\n').encode('utf-8'))
+            linhas += len(bloco)
+    return linhas
+
+
+def gerar_simba(caminho, lancamentos, contas=None, semente=None, prefixo='0000000-00.2025.8.06.0001'):
+    """Gera o .zip de uma quebra de sigilo bancário no layout do SIMBA/BACEN.
+
+    Args:
+        caminho (str): Caminho do .zip de destino.
+        lancamentos (int): Quantidade de lançamentos no EXTRATO.
+        contas (Optional[int]): Quantidade de contas investigadas (padrão: 1 a cada 500 lançamentos).
+        semente (Optional[int]): Semente do gerador aleatório.
+        prefixo (str): Número do processo, usado no nome dos arquivos.
+
+    Returns:
+        dict: 'caminho' e a quantidade de linhas de cada arquivo.
+    """
+    os.makedirs(os.path.dirname(os.path.abspath(caminho)), exist_ok=True)
+    rng = np.random.default_rng(semente)
+    contas = contas or max(1, lancamentos // 500)
+
+    banco = rng.choice([b[0] for b in BANCOS], contas)
+    tabela_contas = pd.DataFrame({
+        'banco': banco,
+        'agencia': pd.Series(rng.integers(1, 9999, contas)).astype(str).str.zfill(4),
+        'conta': pd.Series(rng.integers(10000, 999999999, contas)).astype(str),
+        'tipo_conta': rng.choice(['1', '2', '4'], contas),
+    })
+    titulares = pd.DataFrame({
+        **tabela_contas,
+        'tipo_titular': 'T',
+        'pessoa_investigada': '1',
+        'tipo_pessoa': '1',
+        'cpf_cnpj': cpfs(rng, contas),
+        'nome': nomes_pessoas(rng, contas),
+        'nome_documento': 'RG',
+        'documento': pd.Series(rng.integers(10 ** 7, 10 ** 8, contas)).astype(str),
+        'endereco': 'Rua ' + pd.Series(rng.choice(SOBRENOMES, contas)) + ' ' + pd.Series(rng.integers(1, 999, contas)).astype(str),
+        'cidade': rng.choice([c[0] for c in CIDADES], contas),
+        'uf': 'CE',
+        'pais': 'BR',
+        'cep': pd.Series(rng.integers(60000000, 63999999, contas)).astype(str),
+        'telefone': '55859' + pd.Series(rng.integers(10 ** 7, 10 ** 8, contas)).astype(str),
+        'renda': rng.integers(150000, 2500000, contas),
+        'data_renda': datas_aleatorias(rng, contas, '2023-01-01', '2024-12-31').dt.strftime('%d%m%Y'),
+        'inicio_relacionamento': datas_aleatorias(rng, contas, '2010-01-01', '2022-12-31').dt.strftime('%d%m%Y'),
+        'fim_relacionamento': '',
+    })
+    agencias = tabela_contas[['banco', 'agencia']].drop_duplicates().assign(
+        nome_agencia=lambda df: [dict((b[0], b[1]) for b in BANCOS)[codigo] for codigo in df['banco']],
+        endereco='Av. Central, 100', cidade='Fortaleza', uf='CE', pais='BRASIL', cep='60000000',
+        telefone='8532000000', data_abertura='01012000', data_fechamento='')
+    contas_txt = tabela_contas.assign(
+        data_abertura=datas_aleatorias(rng, contas, '2010-01-01', '2022-12-31').dt.strftime('%d%m%Y'),
+        data_encerramento='', movimentacao='3')
+
+    def extrato():
+        for inicio in range(0, lancamentos, TAMANHO_BLOCO):
+            n = min(TAMANHO_BLOCO, lancamentos - inicio)
+            conta = tabela_contas.iloc[rng.integers(0, contas, n)].reset_index(drop=True)
+            natureza = rng.choice(['C', 'D'], n)
+            yield pd.DataFrame({
+                'chave_extrato': np.arange(inicio + 1, inicio + n + 1),
+                **conta,
+                'data_lancamento': datas_aleatorias(rng, n, '2023-01-01', '2024-12-31').dt.strftime('%d%m%Y'),
+                'documento': 'DOC' + pd.Series(rng.integers(10 ** 6, 10 ** 7, n)).astype(str),
+                'descricao': rng.choice(DESCRICOES_LANCAMENTO, n),
+                'tipo': rng.choice(['101', '213', '105', '201'], n),
+                'valor': rng.lognormal(9, 1.8, n).astype(np.int64) + 1,
+                'natureza': natureza,
+                'saldo': rng.integers(0, 50000000, n),
+                'natureza_saldo': 'C',
+                'local_transacao': rng.choice(LOCAIS_TRANSACAO, n),
+            })
+
+    def origem_destino():
+        # Cerca de 90% dos lançamentos têm a contraparte identificada
+        codigo = 0
+        for inicio in range(0, lancamentos, TAMANHO_BLOCO):
+            chaves = np.arange(inicio + 1, min(inicio + TAMANHO_BLOCO, lancamentos) + 1)
+            chaves = chaves[rng.random(len(chaves)) < 0.9]
+            n = len(chaves)
+            pessoa_juridica = rng.random(n) < 0.3
+            yield pd.DataFrame({
+                'codigo_chave': np.arange(codigo + 1, codigo + n + 1),
+                'chave_extrato': chaves,
+                'valor': rng.lognormal(9, 1.8, n).astype(np.int64) + 1,
+                'documento': '',
+                'banco_destino': rng.choice([b[0] for b in BANCOS], n),
+                'agencia_destino': pd.Series(rng.integers(1, 9999, n)).astype(str).str.zfill(4),
+                'conta_destino': pd.Series(rng.integers(10000, 999999999, n)).astype(str),
+                'tipo_conta': '1',
+                'tipo_pessoa': np.where(pessoa_juridica, '2', '1'),
+                'cpf_cnpj': cpfs(rng, n).where(~pessoa_juridica, cnpjs(rng, n)),
+                'nome_pessoa': nomes_pessoas(rng, n).where(~pessoa_juridica, nomes_empresas(rng, n)),
+                'documento_pessoa': '',
+                'codigo_barras': '',
+                'endossante_cheque': '',
+                'documento_endossante': '',
+                'situacao_identificacao': '0',
+                'observacao': '',
+                'documento_transacao': 'E' + pd.Series(rng.integers(10 ** 9, 10 ** 10, n)).astype(str),
+            })
+            codigo += n
+
+    resultado = {'caminho': caminho}
+    with zipfile.ZipFile(caminho, 'w', zipfile.ZIP_DEFLATED) as zip_ref:
+        resultado['agencias'] = _escrever_membro(zip_ref, f'{prefixo}_AGENCIAS.txt', [agencias])
+        resultado['contas'] = _escrever_membro(zip_ref, f'{prefixo}_CONTAS.txt', [contas_txt])
+        resultado['titulares'] = _escrever_membro(zip_ref, f'{prefixo}_TITULARES.txt', [titulares])
+        resultado['extrato'] = _escrever_membro(zip_ref, f'{prefixo}_EXTRATO.txt', extrato())
+        resultado['origem_destino'] = _escrever_membro(zip_ref, f'{prefixo}_ORIGEM_DESTINO.txt', origem_destino())
+
+    return resultado
@@ -0,0 +1,291 @@
+"""Exclusão em massa de RIFs, cooperações, arquivos e casos.
+
+O Model.delete() do Django carrega na memória todos os registros dependentes
+(comunicações, envolvidos, lançamentos...) antes de excluí-los. Aqui, as
+tabelas volumosas são esvaziadas com DELETEs diretos no banco (_raw_delete), na
+ordem das dependências e em lotes por faixa de chave primária, cada lote na
+própria transação. Só depois o registro principal é excluído pelo ORM, que
+cuida das tabelas pequenas restantes, e os contadores, o resumo financeiro e
+os titulares das comunicações são atualizados em uma única transação.
+
+Exclusões grandes podem ser enfileiradas e executadas pelo worker de
+importações (comando processar_importacoes), como um ImportJob do tipo
+'exclusao_*'. Se o worker for interrompido, basta excluir de novo: os lotes já
+excluídos não voltam.
+"""
+import logging
+
+from django.core.exceptions import FieldDoesNotExist
+from django.db import router, transaction
+from django.db.models import Max, Min
+
+from bancaria.models import Cooperacao, ExtratoDetalhado
+from bancaria.particionamento import particionada, remover_particoes
+from bancaria.snapshot import enfileirar_snapshot, invalidar_snapshot
+from financeira.importacao import atualizar_titulares
+from financeira.models import (KYC, RIF, AnaliseIA, Comunicacao, ComunicacaoNaoProcessada, Envolvido,
+                               ImportacaoProblema, InformacaoAdicional, Ocorrencia)
+from financeira.problemas import detectar_problemas_importacao
+from financeira.resumo import atualizar_resumo_financeiro
+from .contadores import TIPO_ARQUIVO_COOPERACAO, TIPOS_ARQUIVO_RIF, atualizar_contadores, contadores_do_caso
+from .models import Arquivo, Caso, ImportJob
+
+logger = logging.getLogger(__name__)
+
+# Largura de cada faixa de ids excluída em uma transação
+TAMANHO_LOTE = 50000
+
+# Acima dessa quantidade de registros, as views enfileiram a exclusão para o worker
+LIMITE_EXCLUSAO_IMEDIATA = 100000
+
+# Tabelas volumosas na ordem de exclusão (dependentes antes), com o caminho até o campo
+# do escopo ('rif_id', 'arquivo_id', 'cooperacao_id' ou 'caso_id'). Registros de
+# comunicações excluídas são alcançados também pela comunicação, que pode ser de
+# outro arquivo (na reimportação, a comunicação passa para o arquivo novo).
+PLANO = [
+    (ImportacaoProblema, 'comunicacao__{}'),
+    (ImportacaoProblema, 'envolvido__{}'),
+    (ImportacaoProblema, 'ocorrencia__{}'),
+    (ImportacaoProblema, '{}'),
+    (AnaliseIA, 'comunicacao__{}'),
+    (KYC, 'comunicacao__{}'),
+    (KYC, '{}'),
+    (InformacaoAdicional, 'comunicacao__{}'),
+    (InformacaoAdicional, '{}'),
+    (Comunicacao, '{}'),
+    (ComunicacaoNaoProcessada, '{}'),
+    (Envolvido, '{}'),
+    (Ocorrencia, '{}'),
+    (ExtratoDetalhado, '{}'),
+]
+
+
+#########################################################################################################################
+# EXCLUSÃO DOS REGISTROS DEPENDENTES
+#########################################################################################################################
+def _tem_caminho(modelo, caminho):
+    """Indica se o caminho de campos (ex.: 'comunicacao__rif_id') existe no modelo."""
+    *relacoes, campo = caminho.split('__')
+    try:
+        for relacao in relacoes:
+            modelo = modelo._meta.get_field(relacao).related_model
+        modelo._meta.get_field(campo)
+    except FieldDoesNotExist:
+        return False
+    return True
+
+
+def _excluir_em_lotes(queryset, banco, progresso=None):
+    """Exclui os registros do queryset com DELETEs diretos, uma faixa de ids por vez.
+
+    Sem coletor do Django e sem sinais: cada lote é um único DELETE no banco, na
+    própria transação (um savepoint, se já houver uma transação aberta).
+
+    Returns:
+        int: Quantidade de registros excluídos.
+    """
+    limites = queryset.aggregate(inicio=Min('pk'), fim=Max('pk'))
+    if limites['inicio'] is None:
+        return 0
+
+    excluidos = 0
+    for inicio in range(limites['inicio'], limites['fim'] + 1, TAMANHO_LOTE):
+        with transaction.atomic(using=banco):
+            lote = queryset.filter(pk__gte=inicio, pk__lt=inicio + TAMANHO_LOTE)._raw_delete(banco)
+        excluidos += lote
+        if progresso and lote:
+            progresso(lote)
+    return excluidos
+
+
+def _excluir_dependentes(escopo, ids, banco, progresso=None):
+    """Esvazia as tabelas volumosas para os ids do escopo, na ordem de PLANO.
+
+    Antes dos envolvidos, as comunicações que os têm como titular (de outros
+    arquivos) deixam de apontar para eles, como faria o on_delete da FK.
+
+    Returns:
+        dict: {nome do modelo: quantidade excluída}.
+    """
+    excluidos = {}
+    for modelo, caminho in PLANO:
+        caminho = caminho.format(escopo)
+        if not _tem_caminho(modelo, caminho):
+            continue
+        registros = modelo.objects.using(banco).filter(**{f'{caminho}__in': ids}).order_by()
+        if modelo is Envolvido:
+            Comunicacao.objects.using(banco).filter(envolvido_titular__in=registros).update(
+                envolvido_titular=None, nome_titular='', cpf_cnpj_titular=None)
+        quantidade = _excluir_em_lotes(registros, banco, progresso=progresso)
+        if quantidade:
+            nome = modelo._meta.model_name
+            excluidos[nome] = excluidos.get(nome, 0) + quantidade
+    return excluidos
+
+
+def _finalizar(caso_id, rifs, cooperacoes, banco):
+    """Atualiza titulares, contadores, resumo financeiro e problemas de importação do caso após a exclusão."""
+    rifs_restantes = list(RIF.objects.using(banco).filter(id__in=rifs).values_list('id', flat=True))
+    for rif_id in rifs_restantes:
+        atualizar_titulares(rif_id)
+    atualizar_contadores(caso_id, rifs=rifs_restantes, cooperacoes=cooperacoes, using=banco)
+    atualizar_resumo_financeiro(caso_id, rifs=rifs_restantes, using=banco)
+    # Informações adicionais excluídas podem deixar sem informação envolvidos de qualquer RIF do caso
+    detectar_problemas_importacao(caso_id, using=banco)
+
+
+#########################################################################################################################
+# EXCLUSÕES
+#########################################################################################################################
+def excluir_rif(rif, progresso=None):
+    """Exclui a RIF, os arquivos e todos os registros importados dela.
+
+    Args:
+        rif (RIF): RIF a excluir.
+        progresso (Optional[callable]): Recebe a quantidade de registros de cada lote excluído.
+
+    Returns:
+        dict: {nome do modelo: quantidade excluída} das tabelas volumosas.
+    """
+    banco = router.db_for_write(RIF)
+    excluidos = _excluir_dependentes('rif_id', [rif.id], banco, progresso)
+    with transaction.atomic(using=banco):
+        Arquivo.objects.using(banco).filter(
+            caso_id=rif.caso_id, external_id=rif.id, tipo__in=TIPOS_ARQUIVO_RIF).delete()
+        RIF.objects.using(banco).filter(id=rif.id).delete()
+        _finalizar(rif.caso_id, [], [], banco)
+    logger.info("RIF %s excluída: %s", rif.id, excluidos)
+    return excluidos
+
+
+def excluir_cooperacao(cooperacao, progresso=None):
+    """Exclui a cooperação, os arquivos e os lançamentos dela.
+
+    Com a tabela de extratos particionada, os lançamentos saem com a partição.
+
+    Args:
+        cooperacao (Cooperacao): Cooperação a excluir.
+        progresso (Optional[callable]): Recebe a quantidade de registros de cada lote excluído.
+
+    Returns:
+        dict: {nome do modelo: quantidade excluída} das tabelas volumosas.
+    """
+    banco = router.db_for_write(Cooperacao)
+    remover_particoes(cooperacoes=[cooperacao.id], using=banco)
+    excluidos = _excluir_dependentes('cooperacao_id', [cooperacao.id], banco, progresso)
+    with transaction.atomic(using=banco):
+        Arquivo.objects.using(banco).filter(
+            caso_id=cooperacao.caso_id, external_id=cooperacao.id, tipo=TIPO_ARQUIVO_COOPERACAO).delete()
+        Cooperacao.objects.using(banco).filter(id=cooperacao.id).delete()
+        _finalizar(cooperacao.caso_id, [], [], banco)
+        enfileirar_snapshot(cooperacao.caso_id)
+    logger.info("Cooperação %s excluída: %s", cooperacao.id, excluidos)
+    return excluidos
+
+
+def excluir_arquivo(arquivo, progresso=None):
+    """Exclui o arquivo e os registros importados dele, mantendo a RIF ou a cooperação.
+
+    Args:
+        arquivo (Arquivo): Arquivo a excluir.
+        progresso (Optional[callable]): Recebe a quantidade de registros de cada lote excluído.
+
+    Returns:
+        dict: {nome do modelo: quantidade excluída} das tabelas volumosas.
+    """
+    banco = router.db_for_write(Arquivo)
+    excluidos = _excluir_dependentes('arquivo_id', [arquivo.id], banco, progresso)
+    rifs = [arquivo.external_id] if arquivo.tipo in TIPOS_ARQUIVO_RIF else []
+    cooperacoes = [arquivo.external_id] if arquivo.tipo == TIPO_ARQUIVO_COOPERACAO else []
+    with transaction.atomic(using=banco):
+        Arquivo.objects.using(banco).filter(id=arquivo.id).delete()
+        _finalizar(arquivo.caso_id, rifs, cooperacoes, banco)
+        if cooperacoes:
+            enfileirar_snapshot(arquivo.caso_id)
+    logger.info("Arquivo %s excluído: %s", arquivo.id, excluidos)
+    return excluidos
+
+
+def excluir_caso(caso, progresso=None):
+    """Exclui o caso e todos os dados dele.
+
+    Args:
+        caso (Caso): Caso a excluir.
+        progresso (Optional[callable]): Recebe a quantidade de registros de cada lote excluído.
+
+    Returns:
+        dict: {nome do modelo: quantidade excluída} das tabelas volumosas.
+    """
+    banco = router.db_for_write(Caso)
+    remover_particoes(casos=[caso.id], using=banco)
+    excluidos = _excluir_dependentes('caso_id', [caso.id], banco, progresso)
+    # O restante (RIFs, cooperações, arquivos, contadores, resumo...) é pequeno e sai pelo CASCADE
+    Caso.objects.using(banco).filter(id=caso.id).delete()
+    invalidar_snapshot(caso.id)
+    logger.info("Caso %s excluído: %s", caso.id, excluidos)
+    return excluidos
+
+
+#########################################################################################################################
+# EXCLUSÃO EM SEGUNDO PLANO
+#########################################################################################################################
+def registros_a_excluir(tipo, objeto):
+    """Quantidade de registros volumosos que a exclusão vai remover, pelos contadores do caso.
+
+    Args:
+        tipo (str): 'rif', 'cooperacao' ou 'arquivo'.
+        objeto (RIF | Cooperacao | Arquivo): Registro a excluir.
+
+    Returns:
+        int: Soma de comunicações, envolvidos, ocorrências e lançamentos. Lançamentos
+            de cooperações com a tabela particionada não contam (saem com a partição).
+    """
+    contador = contadores_do_caso(objeto.caso_id)[tipo][objeto.id]
+    extratos = 0 if tipo == 'cooperacao' and particionada() else contador.extratos
+    return contador.comunicacoes + contador.envolvidos + contador.ocorrencias + extratos
+
+
+def enfileirar_exclusao(usuario, tipo, objeto):
+    """Cria o ImportJob que exclui o registro no worker de importações.
+
+    Args:
+        usuario (CustomUser): Usuário que pediu a exclusão.
+        tipo (str): 'rif', 'cooperacao' ou 'arquivo'.
+        objeto (RIF | Cooperacao | Arquivo): Registro a excluir.
+
+    Returns:
+        ImportJob: Job pendente (ou o já existente para o mesmo registro).
+    """
+    job, _ = ImportJob.objects.get_or_create(
+        caso_id=objeto.caso_id,
+        tipo=f'exclusao_{tipo}',
+        external_id=objeto.id,
+        status__in=['pendente', 'processando'],
+        defaults={'created_by': usuario, 'status': 'pendente'},
+    )
+    return job
+
+
+def processar_exclusao(job, progresso):
+    """Processa um ImportJob do tipo 'exclusao_*' (executado pelo worker de importações).
+
+    Args:
+        job (ImportJob): Job com o id do registro a excluir em external_id.
+        progresso (ProgressoJob): Acumulador do andamento da exclusão.
+
+    Returns:
+        str: Resumo da exclusão.
+    """
+    if job.tipo == 'exclusao_rif':
+        objeto, excluir, tipo = RIF.objects.filter(id=job.external_id).first(), excluir_rif, 'rif'
+    elif job.tipo == 'exclusao_cooperacao':
+        objeto, excluir, tipo = Cooperacao.objects.filter(id=job.external_id).first(), excluir_cooperacao, 'cooperacao'
+    else:
+        objeto, excluir, tipo = Arquivo.objects.filter(id=job.external_id).first(), excluir_arquivo, 'arquivo'
+
+    if objeto is None:
+        return 'Registro já excluído.'
+
+    progresso.definir_total(registros_a_excluir(tipo, objeto))
+    excluidos = excluir(objeto, progresso=progresso.registrar)
+    return f'{sum(excluidos.values())} registros excluídos.'
@@ -0,0 +1,267 @@
+"""Fila de importações processadas em segundo plano.
+
+As views de upload apenas armazenam os arquivos e criam um ImportJob. O comando
+``python manage.py processar_importacoes`` consome a fila, usando o próprio banco
+de dados como broker, e chama o processador de cada tipo de importação.
+
+Enquanto processa um job, o worker grava o progresso a cada poucos segundos
+(updated_at). Um job 'processando' sem gravações há mais de
+settings.IMPORTACAO_TEMPO_SEM_PROGRESSO segundos pertencia a um worker que foi
+encerrado: ele é marcado como erro e seus arquivos são removidos.
+"""
+import logging
+import os
+import shutil
+import threading
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import DatabaseError, connection
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import ImportJob
+
+logger = logging.getLogger(__name__)
+
+# Diretório onde os arquivos enviados aguardam o processamento
+DIRETORIO_IMPORTACOES = os.path.join(settings.MEDIA_ROOT, 'uploads', 'importacoes')
+
+# Função responsável por cada tipo de importação: processar(job, progresso) -> str
+PROCESSADORES = {
+    'rif': 'financeira.importacao.processar_importacao_rif',
+    'simba': 'bancaria.importacao.processar_importacao_simba',
+    'exclusao_rif': 'app.exclusoes.processar_exclusao',
+    'exclusao_cooperacao': 'app.exclusoes.processar_exclusao',
+    'exclusao_arquivo': 'app.exclusoes.processar_exclusao',
+    'snapshot': 'bancaria.snapshot.processar_snapshot',
+}
+
+# Quantidade máxima de linhas rejeitadas guardadas no job
+LIMITE_REJEICOES = 100
+
+
+def enfileirar_importacao(caso, usuario, tipo, external_id, arquivos):
+    """Armazena os arquivos enviados e cria o ImportJob pendente.
+
+    Args:
+        caso (Caso): Caso ao qual a importação pertence.
+        usuario (CustomUser): Usuário que enviou os arquivos.
+        tipo (str): Tipo da importação ('rif' ou 'simba').
+        external_id (int): Id da RIF ou da Cooperação de destino.
+        arquivos (dict): {tipo do arquivo: UploadedFile}. Entradas vazias são ignoradas.
+
+    Returns:
+        ImportJob: Job criado, com status 'pendente'.
+    """
+    diretorio = os.path.join(DIRETORIO_IMPORTACOES, uuid.uuid4().hex)
+
+    caminhos = {}
+    for chave, arquivo in arquivos.items():
+        if not arquivo:
+            continue
+
+        # Um subdiretório por arquivo preserva o nome original, usado na identificação do layout
+        caminho = os.path.join(diretorio, chave, os.path.basename(arquivo.name))
+        os.makedirs(os.path.dirname(caminho), exist_ok=True)
+        with open(caminho, 'wb') as destino:
+            for chunk in arquivo.chunks():
+                destino.write(chunk)
+        caminhos[chave] = caminho
+
+    return ImportJob.objects.create(
+        caso=caso,
+        tipo=tipo,
+        external_id=external_id,
+        arquivos=caminhos,
+        created_by=usuario
+    )
+
+
+def _remover_arquivos(job):
+    """Remove o diretório em que enfileirar_importacao armazenou os arquivos do job."""
+    for caminho in job.arquivos.values():
+        shutil.rmtree(os.path.dirname(os.path.dirname(caminho)), ignore_errors=True)
+
+
+def recuperar_jobs_abandonados():
+    """Marca como erro os jobs 'processando' sem progresso gravado há muito tempo.
+
+    A marcação é um UPDATE condicionado ao status e à última gravação, então um
+    job que voltou a gravar progresso enquanto isso não é afetado.
+
+    Returns:
+        int: Quantidade de jobs marcados como erro.
+    """
+    limite = timezone.now() - timedelta(seconds=settings.IMPORTACAO_TEMPO_SEM_PROGRESSO)
+    recuperados = 0
+    for job in ImportJob.objects.filter(status='processando', updated_at__lt=limite):
+        marcado = ImportJob.objects.filter(id=job.id, status='processando', updated_at__lt=limite).update(
+            status='erro',
+            mensagem='Processamento interrompido antes de terminar (worker encerrado). Tente novamente.',
+            finalizado_em=timezone.now(),
+            updated_at=timezone.now()
+        )
+        if marcado:
+            logger.warning("Importação %s abandonada desde %s marcada como erro", job.id, job.updated_at)
+            _remover_arquivos(job)
+            recuperados += marcado
+    return recuperados
+
+
+def reservar_proximo_job():
+    """Reserva o job pendente mais antigo para este processo.
+
+    A reserva é um UPDATE condicionado ao status 'pendente', então dois workers
+    nunca processam o mesmo job. Antes, os jobs abandonados por workers
+    encerrados são marcados como erro (recuperar_jobs_abandonados).
+
+    Returns:
+        Optional[ImportJob]: Job reservado, ou None se a fila estiver vazia.
+    """
+    recuperar_jobs_abandonados()
+
+    pendentes = ImportJob.objects.filter(status='pendente').order_by('created_at')
+    for job_id in pendentes.values_list('id', flat=True)[:10]:
+        reservado = ImportJob.objects.filter(id=job_id, status='pendente').update(
+            status='processando',
+            iniciado_em=timezone.now(),
+            updated_at=timezone.now()
+        )
+        if reservado:
+            return ImportJob.objects.get(id=job_id)
+    return None
+
+
+def executar_job(job):
+    """Executa o processador do job e registra o resultado.
+
+    Os arquivos armazenados para o job são removidos ao final, com ou sem erro.
+
+    Args:
+        job (ImportJob): Job já reservado por reservar_proximo_job.
+    """
+    processar = import_string(PROCESSADORES[job.tipo])
+
+    try:
+        with ProgressoJob(job) as progresso:
+            mensagem = processar(job, progresso)
+        status = 'concluido'
+    except Exception as e:
+        logger.exception("Erro ao processar a importação %s", job.id)
+        mensagem = str(e)
+        status = 'erro'
+    finally:
+        _remover_arquivos(job)
+
+    ImportJob.objects.filter(id=job.id).update(
+        status=status,
+        mensagem=mensagem or '',
+        finalizado_em=timezone.now()
+    )
+
+
+def status_job(job):
+    """Monta o resumo do andamento do job para o endpoint de status.
+
+    Args:
+        job (ImportJob): Job consultado.
+
+    Returns:
+        dict: Status, linhas processadas/rejeitadas, total e ETA em segundos
+            (None enquanto não houver dados suficientes para a estimativa).
+    """
+    eta = None
+    lidas = job.linhas_processadas + job.linhas_rejeitadas
+    if job.status == 'processando' and job.iniciado_em and lidas and job.linhas_total:
+        decorrido = (timezone.now() - job.iniciado_em).total_seconds()
+        restantes = max(job.linhas_total - lidas, 0)
+        eta = round(restantes * decorrido / lidas)
+    elif job.status in ('concluido', 'erro'):
+        eta = 0
+
+    return {
+        'id': job.id,
+        'tipo': job.tipo,
+        'status': job.status,
+        'status_display': job.get_status_display(),
+        'linhas_total': job.linhas_total,
+        'linhas_processadas': job.linhas_processadas,
+        'linhas_rejeitadas': job.linhas_rejeitadas,
+        'rejeicoes': job.rejeicoes,
+        'eta_segundos': eta,
+        'mensagem': job.mensagem,
+        'created_at': job.created_at.isoformat(),
+        'iniciado_em': job.iniciado_em.isoformat() if job.iniciado_em else None,
+        'finalizado_em': job.finalizado_em.isoformat() if job.finalizado_em else None,
+    }
+
+
+class ProgressoJob:
+    """Acumula o andamento de um job e o grava periodicamente no banco.
+
+    Os importadores gravam cada arquivo dentro de uma transação, então o progresso
+    é gravado por uma thread à parte, com conexão própria, para ficar visível ao
+    endpoint de status antes do commit. Cada gravação atualiza updated_at, que
+    indica que o worker continua ativo (ver recuperar_jobs_abandonados).
+    """
+
+    INTERVALO = 2  # segundos entre gravações
+
+    def __init__(self, job):
+        self.job_id = job.id
+        self.total = 0
+        self.processadas = 0
+        self.rejeitadas = 0
+        self.rejeicoes = []
+        self._lock = threading.Lock()
+        self._parar = threading.Event()
+        self._thread = None
+
+    def __enter__(self):
+        self._thread = threading.Thread(target=self._executar, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self._parar.set()
+        self._thread.join()
+        self._gravar()
+        return False
+
+    def definir_total(self, total):
+        """Informa o total de linhas a processar, usado no cálculo do ETA."""
+        with self._lock:
+            self.total = total
+
+    def registrar(self, processadas=0, rejeicoes=()):
+        """Soma as linhas gravadas e rejeitadas desde a última chamada."""
+        with self._lock:
+            self.processadas += processadas
+            self.rejeitadas += len(rejeicoes)
+            espaco = LIMITE_REJEICOES - len(self.rejeicoes)
+            if espaco > 0:
+                self.rejeicoes.extend(list(rejeicoes)[:espaco])
+
+    def _gravar(self):
+        with self._lock:
+            valores = {
+                'linhas_total': self.total,
+                'linhas_processadas': self.processadas,
+                'linhas_rejeitadas': self.rejeitadas,
+                'rejeicoes': list(self.rejeicoes),
+                'updated_at': timezone.now(),
+            }
+        ImportJob.objects.filter(id=self.job_id).update(**valores)
+
+    def _executar(self):
+        try:
+            while not self._parar.wait(self.INTERVALO):
+                try:
+                    self._gravar()
+                except DatabaseError:
+                    # No SQLite a escrita pode aguardar a transação da importação; tenta de novo depois
+                    pass
+        finally:
+            connection.close()
@@ -0,0 +1,254 @@
+import json
+import os
+import platform
+import resource
+import shutil
+import tempfile
+import threading
+import time
+
+import django
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+
+from app.dados_sinteticos import ARQUIVOS_RIF, gerar_rif, gerar_simba
+from app.importacoes import ProgressoJob
+from app.models import Caso, ImportJob
+from bancaria.importacao import processar_importacao_simba
+from bancaria.models import Cooperacao
+from financeira.importacao import processar_importacao_rif
+from financeira.models import RIF
+
+
+class MedidorMemoria:
+    """Pico de memória residente (RSS) do processo durante o bloco `with`.
+
+    O ru_maxrss do sistema é o pico desde o início do processo; para medir cada
+    importação separadamente, a RSS atual é amostrada por uma thread.
+    """
+
+    INTERVALO = 0.05  # segundos entre amostras
+
+    def __init__(self):
+        self.pico = 0
+        self._parar = threading.Event()
+        self._thread = None
+
+    @staticmethod
+    def rss_atual():
+        """RSS atual em bytes (Linux); nos demais sistemas, o pico informado pelo getrusage."""
+        try:
+            with open('/proc/self/statm') as statm:
+                return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+        except (OSError, ValueError):
+            return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+    def _amostrar(self):
+        while not self._parar.wait(self.INTERVALO):
+            self.pico = max(self.pico, self.rss_atual())
+
+    def __enter__(self):
+        self.pico = self.rss_atual()
+        self._thread = threading.Thread(target=self._amostrar, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self._parar.set()
+        self._thread.join()
+        self.pico = max(self.pico, self.rss_atual())
+        return False
+
+
+class Command(BaseCommand):
+    help = ('Mede a importação de RIF e de cooperação bancária com dados sintéticos (linhas/s, pico de memória '
+            'e consultas ao banco) em um banco de testes descartável e grava o resultado em JSON')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--comunicacoes', type=int, default=10000,
+            help='Quantidade de comunicações da RIF sintética (0 para não medir a RIF)'
+        )
+        parser.add_argument(
+            '--lancamentos', type=int, default=100000,
+            help='Quantidade de lançamentos da cooperação sintética (0 para não medir o SIMBA)'
+        )
+        parser.add_argument(
+            '--semente', type=int, default=42,
+            help='Semente do gerador, para que execuções diferentes usem os mesmos arquivos'
+        )
+        parser.add_argument(
+            '--dados',
+            help='Diretório gerado por gerar_dados_sinteticos, usado no lugar de gerar os arquivos novamente'
+        )
+        parser.add_argument(
+            '--saida', default='benchmark_importacao.json',
+            help='Arquivo JSON do relatório'
+        )
+        parser.add_argument(
+            '--referencia',
+            help='Relatório anterior; o comando falha se a vazão cair ou as consultas aumentarem além da tolerância'
+        )
+        parser.add_argument(
+            '--tolerancia', type=float, default=20,
+            help='Variação aceita em relação à referência, em porcentagem'
+        )
+
+    def handle(self, *args, **options):
+        referencia = None
+        if options['referencia']:
+            with open(options['referencia'], encoding='utf-8') as arquivo:
+                referencia = json.load(arquivo)
+
+        diretorio = tempfile.mkdtemp(prefix='benchmark_importacao_')
+        try:
+            arquivos = self._preparar_arquivos(options, diretorio)
+            resultados = self._medir_em_banco_de_testes(arquivos, diretorio)
+        finally:
+            shutil.rmtree(diretorio, ignore_errors=True)
+
+        relatorio = {
+            'executado_em': timezone.now().isoformat(),
+            'banco': connection.vendor,
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'escala': {'comunicacoes': options['comunicacoes'], 'lancamentos': options['lancamentos'],
+                       'semente': options['semente']},
+            'resultados': resultados,
+        }
+        with open(options['saida'], 'w', encoding='utf-8') as arquivo:
+            json.dump(relatorio, arquivo, ensure_ascii=False, indent=2)
+
+        for tipo, resultado in resultados.items():
+            self.stdout.write(
+                f"{tipo}: {resultado['linhas']} linhas em {resultado['segundos']} s "
+                f"({resultado['linhas_por_segundo']} linhas/s), pico de {resultado['pico_rss_mb']} MB, "
+                f"{resultado['consultas']} consultas"
+            )
+        self.stdout.write(self.style.SUCCESS(f"Relatório gravado em {options['saida']}."))
+
+        if referencia:
+            if referencia.get('escala') != relatorio['escala'] or referencia.get('banco') != relatorio['banco']:
+                self.stdout.write(self.style.WARNING('A referência foi medida com outra escala ou outro banco.'))
+            regressoes = self._comparar(resultados, referencia, options['tolerancia'])
+            if regressoes:
+                raise CommandError('Regressão em relação à referência: ' + '; '.join(regressoes))
+
+    #####################################################################################################################
+    # PREPARAÇÃO
+    #####################################################################################################################
+    def _preparar_arquivos(self, options, diretorio):
+        """Copia os arquivos de --dados (ou gera novos) para o diretório de trabalho.
+
+        A cópia isola os arquivos de origem dos diretórios temporários criados pelos importadores.
+        """
+        arquivos = {}
+        origem = options['dados']
+
+        if options['comunicacoes']:
+            destino_rif = os.path.join(diretorio, 'rif')
+            if origem:
+                shutil.copytree(os.path.join(origem, 'rif'), destino_rif)
+            else:
+                self.stdout.write(f"Gerando RIF com {options['comunicacoes']} comunicações...")
+                gerar_rif(destino_rif, options['comunicacoes'], semente=options['semente'])
+            arquivos['rif'] = {tipo: os.path.join(destino_rif, nome) for tipo, nome in ARQUIVOS_RIF.items()}
+
+        if options['lancamentos']:
+            destino_simba = os.path.join(diretorio, 'simba', 'simba.zip')
+            if origem:
+                os.makedirs(os.path.dirname(destino_simba))
+                shutil.copyfile(os.path.join(origem, 'simba.zip'), destino_simba)
+            else:
+                self.stdout.write(f"Gerando cooperação com {options['lancamentos']} lançamentos...")
+                gerar_simba(destino_simba, options['lancamentos'], semente=options['semente'])
+            arquivos['simba'] = {'arquivo': destino_simba}
+
+        if not arquivos:
+            raise CommandError('Nada a medir: informe --comunicacoes e/ou --lancamentos.')
+        return arquivos
+
+    def _medir_em_banco_de_testes(self, arquivos, diretorio):
+        """Cria um banco de testes, executa as importações nele e o remove ao final."""
+        if connection.vendor == 'sqlite':
+            # Arquivo em disco, como em uso real, em vez do banco em memória dos testes
+            connection.settings_dict['TEST']['NAME'] = os.path.join(diretorio, 'benchmark.sqlite3')
+
+        nome_original = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            usuario = get_user_model().objects.create(
+                cpf=52998224725, username='benchmark', email='benchmark@mpce.mp.br',
+                nome_completo='Benchmark de Importação')
+            caso = Caso.objects.create(nome='Benchmark', numero='0', resumo='', created_by=usuario)
+
+            resultados = {}
+            if 'rif' in arquivos:
+                rif = RIF.objects.create(caso=caso, numero='Benchmark', outras_informacoes='')
+                resultados['rif'] = self._medir(
+                    processar_importacao_rif, caso, usuario, 'rif', rif.id, arquivos['rif'])
+            if 'simba' in arquivos:
+                cooperacao = Cooperacao.objects.create(caso=caso, numero='Benchmark', inquerito='', processo='')
+                resultados['simba'] = self._medir(
+                    processar_importacao_simba, caso, usuario, 'simba', cooperacao.id, arquivos['simba'])
+            return resultados
+        finally:
+            connection.creation.destroy_test_db(nome_original, verbosity=0)
+
+    #####################################################################################################################
+    # MEDIÇÃO
+    #####################################################################################################################
+    def _medir(self, processar, caso, usuario, tipo, external_id, arquivos):
+        """Executa um importador como o worker faria e coleta as métricas.
+
+        As consultas são contadas na conexão desta thread: as gravações de progresso
+        (thread própria) e os dados enviados por COPY no PostgreSQL não entram na conta.
+        """
+        self.stdout.write(f'Importando {tipo}...')
+        job = ImportJob.objects.create(caso=caso, tipo=tipo, external_id=external_id, arquivos=arquivos,
+                                       status='processando', iniciado_em=timezone.now(), created_by=usuario)
+        consultas = []
+
+        def contar(execute, sql, params, many, context):
+            consultas.append(sql)
+            return execute(sql, params, many, context)
+
+        filhos_antes = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+        with MedidorMemoria() as memoria, connection.execute_wrapper(contar), ProgressoJob(job) as progresso:
+            inicio = time.perf_counter()
+            mensagem = processar(job, progresso)
+            segundos = time.perf_counter() - inicio
+        filhos = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+
+        linhas = progresso.processadas + progresso.rejeitadas
+        return {
+            'linhas': linhas,
+            'linhas_gravadas': progresso.processadas,
+            'linhas_rejeitadas': progresso.rejeitadas,
+            'segundos': round(segundos, 3),
+            'linhas_por_segundo': round(linhas / segundos) if segundos else None,
+            'pico_rss_mb': round(memoria.pico / 1024 ** 2, 1),
+            # Processos de conversão da RIF; ru_maxrss está em KB no Linux
+            'pico_rss_filhos_mb': round(filhos / 1024, 1) if filhos > filhos_antes else None,
+            'consultas': len(consultas),
+            'mensagem': mensagem,
+        }
+
+    def _comparar(self, resultados, referencia, tolerancia):
+        """Lista as métricas piores que as da referência além da tolerância (em %)."""
+        regressoes = []
+        fator = tolerancia / 100
+        for tipo, atual in resultados.items():
+            anterior = referencia.get('resultados', {}).get(tipo)
+            if not anterior:
+                continue
+            if anterior['linhas_por_segundo'] and atual['linhas_por_segundo'] < anterior['linhas_por_segundo'] * (1 - fator):
+                regressoes.append(f"{tipo}: {atual['linhas_por_segundo']} linhas/s "
+                                  f"(referência {anterior['linhas_por_segundo']})")
+            if atual['pico_rss_mb'] > anterior['pico_rss_mb'] * (1 + fator):
+                regressoes.append(f"{tipo}: pico de {atual['pico_rss_mb']} MB (referência {anterior['pico_rss_mb']})")
+            if atual['consultas'] > anterior['consultas'] * (1 + fator):
+                regressoes.append(f"{tipo}: {atual['consultas']} consultas (referência {anterior['consultas']})")
+        return regressoes
@@ -0,0 +1,55 @@
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from app.dados_sinteticos import gerar_rif, gerar_simba
+
+
+class Command(BaseCommand):
+    help = 'Gera arquivos sintéticos de RIF (CSV do COAF) e de cooperação bancária (.zip do SIMBA) para testes de carga'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'destino',
+            help='Diretório de destino: a RIF é gravada em <destino>/rif/ e a cooperação em <destino>/simba.zip'
+        )
+        parser.add_argument(
+            '--comunicacoes', type=int, default=10000,
+            help='Quantidade de comunicações da RIF (0 para não gerar a RIF)'
+        )
+        parser.add_argument(
+            '--envolvidos', type=int, default=2,
+            help='Média de envolvidos por comunicação'
+        )
+        parser.add_argument(
+            '--lancamentos', type=int, default=100000,
+            help='Quantidade de lançamentos do extrato bancário (0 para não gerar o .zip)'
+        )
+        parser.add_argument(
+            '--contas', type=int, default=None,
+            help='Quantidade de contas investigadas (padrão: uma a cada 500 lançamentos)'
+        )
+        parser.add_argument(
+            '--semente', type=int, default=None,
+            help='Semente do gerador aleatório, para gerar sempre os mesmos arquivos'
+        )
+
+    def handle(self, *args, **options):
+        if options['comunicacoes'] < 0 or options['lancamentos'] < 0:
+            raise CommandError('As quantidades devem ser positivas.')
+
+        if options['comunicacoes']:
+            arquivos = gerar_rif(os.path.join(options['destino'], 'rif'), options['comunicacoes'],
+                                 envolvidos_por_comunicacao=options['envolvidos'], semente=options['semente'])
+            for tipo, arquivo in arquivos.items():
+                self.stdout.write(f"{tipo}: {arquivo['linhas']} linhas em {arquivo['caminho']}")
+
+        if options['lancamentos']:
+            simba = gerar_simba(os.path.join(options['destino'], 'simba.zip'), options['lancamentos'],
+                                contas=options['contas'], semente=options['semente'])
+            self.stdout.write(
+                f"simba: {simba['extrato']} lançamentos, {simba['origem_destino']} origens/destinos e "
+                f"{simba['titulares']} titulares em {simba['caminho']}"
+            )
+
+        self.stdout.write(self.style.SUCCESS('Arquivos sintéticos gerados.'))
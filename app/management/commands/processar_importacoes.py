@@ -0,0 +1,45 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from app.importacoes import executar_job, reservar_proximo_job
+
+
+class Command(BaseCommand):
+    help = 'Processa a fila de importações (RIF e cooperações bancárias) e de exclusões grandes em segundo plano'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--intervalo', type=float, default=5,
+            help='Segundos de espera entre consultas quando a fila está vazia'
+        )
+        parser.add_argument(
+            '--uma-vez', action='store_true',
+            help='Processa os jobs pendentes e encerra, sem aguardar novos'
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write(self.style.SUCCESS('Worker de importações iniciado.'))
+
+        while True:
+            close_old_connections()
+            job = reservar_proximo_job()
+
+            if job is None:
+                if options['uma_vez']:
+                    break
+                time.sleep(options['intervalo'])
+                continue
+
+            self.stdout.write(f'Processando importação {job.id} ({job.get_tipo_display()})...')
+            executar_job(job)
+            job.refresh_from_db()
+
+            if job.status == 'concluido':
+                self.stdout.write(self.style.SUCCESS(
+                    f'Importação {job.id} concluída: {job.linhas_processadas} linhas gravadas, '
+                    f'{job.linhas_rejeitadas} rejeitadas.'
+                ))
+            else:
+                self.stdout.write(self.style.ERROR(f'Importação {job.id} falhou: {job.mensagem}'))
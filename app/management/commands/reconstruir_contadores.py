@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from app.contadores import reconstruir_contadores
+
+
+class Command(BaseCommand):
+    help = ('Apaga e recalcula a tabela de contadores (registros por caso, RIF, cooperação e arquivo) '
+            'a partir dos dados gravados')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--caso', type=int, action='append', dest='casos',
+            help='Id do caso a recalcular (pode ser repetido); por padrão, todos os casos'
+        )
+
+    def handle(self, *args, **options):
+        total = reconstruir_contadores(options['casos'])
+        self.stdout.write(self.style.SUCCESS(f'Contadores de {total} caso(s) reconstruídos.'))
@@ -0,0 +1,42 @@
+# Generated by Django 5.1.4 on 2026-10-18 12:51
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0007_casoativousuario'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImportJob',
+            fields=[
+                ('id', models.AutoField(primary_key=True, serialize=False)),
+                ('tipo', models.CharField(choices=[('rif', 'RIF'), ('simba', 'Cooperação Bancária')], max_length=20)),
+                ('external_id', models.IntegerField()),
+                ('arquivos', models.JSONField(default=dict)),
+                ('status', models.CharField(choices=[('pendente', 'Pendente'), ('processando', 'Processando'), ('concluido', 'Concluído'), ('erro', 'Erro')], default='pendente', max_length=20)),
+                ('linhas_total', models.IntegerField(default=0)),
+                ('linhas_processadas', models.IntegerField(default=0)),
+                ('linhas_rejeitadas', models.IntegerField(default=0)),
+                ('rejeicoes', models.JSONField(blank=True, default=list)),
+                ('mensagem', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('iniciado_em', models.DateTimeField(blank=True, null=True)),
+                ('finalizado_em', models.DateTimeField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('caso', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='app.caso')),
+                ('created_by', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Importação',
+                'verbose_name_plural': 'Importações',
+                'indexes': [models.Index(fields=['status', 'created_at'], name='app_importj_status_4c6ac5_idx')],
+            },
+        ),
+    ]
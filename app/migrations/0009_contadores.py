@@ -0,0 +1,37 @@
+# Generated by Django 5.1.4 on 2026-10-18 14:01
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0008_importjob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Contador',
+            fields=[
+                ('id', models.AutoField(primary_key=True, serialize=False)),
+                ('escopo', models.CharField(choices=[('caso', 'Caso'), ('rif', 'RIF'), ('cooperacao', 'Cooperação Bancária'), ('arquivo', 'Arquivo')], max_length=20)),
+                ('escopo_id', models.IntegerField()),
+                ('rifs', models.IntegerField(default=0)),
+                ('cooperacoes', models.IntegerField(default=0)),
+                ('arquivos', models.IntegerField(default=0)),
+                ('comunicacoes', models.BigIntegerField(default=0)),
+                ('envolvidos', models.BigIntegerField(default=0)),
+                ('ocorrencias', models.BigIntegerField(default=0)),
+                ('extratos', models.BigIntegerField(default=0)),
+                ('titulares', models.BigIntegerField(default=0)),
+                ('atualizado_em', models.DateTimeField(auto_now=True)),
+                ('caso', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='app.caso')),
+            ],
+            options={
+                'verbose_name': 'Contador',
+                'verbose_name_plural': 'Contadores',
+                'constraints': [models.UniqueConstraint(fields=('escopo', 'escopo_id'), name='contador_escopo')],
+            },
+        ),
+    ]
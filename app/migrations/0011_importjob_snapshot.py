@@ -0,0 +1,18 @@
+# Generated by Django 5.1.4 on 2026-10-18 15:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0010_importjob_exclusoes'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='importjob',
+            name='tipo',
+            field=models.CharField(choices=[('rif', 'RIF'), ('simba', 'Cooperação Bancária'), ('exclusao_rif', 'Exclusão de RIF'), ('exclusao_cooperacao', 'Exclusão de Cooperação Bancária'), ('exclusao_arquivo', 'Exclusão de Arquivo'), ('snapshot', 'Snapshot dos Lançamentos')], max_length=20),
+        ),
+    ]
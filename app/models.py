@@ -149,6 +149,85 @@ class Arquivo(models.Model):
         verbose_name_plural = 'Arquivos'
 
 
+# Fila de importações (e exclusões grandes) processadas fora da requisição HTTP (comando processar_importacoes)
+class ImportJob(models.Model):
+    TIPO_CHOICES = [
+        ('rif', 'RIF'),
+        ('simba', 'Cooperação Bancária'),
+        ('exclusao_rif', 'Exclusão de RIF'),
+        ('exclusao_cooperacao', 'Exclusão de Cooperação Bancária'),
+        ('exclusao_arquivo', 'Exclusão de Arquivo'),
+        ('snapshot', 'Snapshot dos Lançamentos'),
+    ]
+    STATUS_CHOICES = [
+        ('pendente', 'Pendente'),
+        ('processando', 'Processando'),
+        ('concluido', 'Concluído'),
+        ('erro', 'Erro'),
+    ]
+
+    id = models.AutoField(primary_key=True)
+    caso = models.ForeignKey(Caso, on_delete=models.CASCADE)
+    tipo = models.CharField(max_length=20, choices=TIPO_CHOICES)
+    external_id = models.IntegerField()                         # id da RIF ou da Cooperação de destino (ou do registro a excluir)
+    arquivos = models.JSONField(default=dict)                   # {tipo do arquivo: caminho do arquivo armazenado}
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pendente')
+    linhas_total = models.IntegerField(default=0)
+    linhas_processadas = models.IntegerField(default=0)
+    linhas_rejeitadas = models.IntegerField(default=0)
+    rejeicoes = models.JSONField(default=list, blank=True)      # primeiras linhas rejeitadas, com o motivo
+    mensagem = models.TextField(blank=True)
+    created_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
+    created_at = models.DateTimeField(auto_now_add=True)
+    iniciado_em = models.DateTimeField(null=True, blank=True)
+    finalizado_em = models.DateTimeField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.caso.numero} - {self.get_tipo_display()} - {self.get_status_display()}"
+
+    class Meta:
+        verbose_name = 'Importação'
+        verbose_name_plural = 'Importações'
+        indexes = [
+            models.Index(fields=['status', 'created_at']),
+        ]
+
+
+# Quantidades de registros por caso, RIF, cooperação e arquivo, mantidas por app.contadores
+class Contador(models.Model):
+    ESCOPO_CHOICES = [
+        ('caso', 'Caso'),
+        ('rif', 'RIF'),
+        ('cooperacao', 'Cooperação Bancária'),
+        ('arquivo', 'Arquivo'),
+    ]
+
+    id = models.AutoField(primary_key=True)
+    caso = models.ForeignKey(Caso, on_delete=models.CASCADE)
+    escopo = models.CharField(max_length=20, choices=ESCOPO_CHOICES)
+    escopo_id = models.IntegerField()                           # id do caso, da RIF, da cooperação ou do arquivo
+    rifs = models.IntegerField(default=0)
+    cooperacoes = models.IntegerField(default=0)
+    arquivos = models.IntegerField(default=0)
+    comunicacoes = models.BigIntegerField(default=0)
+    envolvidos = models.BigIntegerField(default=0)
+    ocorrencias = models.BigIntegerField(default=0)
+    extratos = models.BigIntegerField(default=0)
+    titulares = models.BigIntegerField(default=0)               # CPF/CNPJ distintos de titulares nos extratos
+    atualizado_em = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.caso_id} - {self.get_escopo_display()} {self.escopo_id}"
+
+    class Meta:
+        verbose_name = 'Contador'
+        verbose_name_plural = 'Contadores'
+        constraints = [
+            models.UniqueConstraint(fields=['escopo', 'escopo_id'], name='contador_escopo'),
+        ]
+
+
 
 
 ########################################################################
@@ -1,3 +1,447 @@
-from django.test import TestCase
+import io
+import json
+import os
+import tempfile
+from datetime import date, timedelta
+from unittest import mock, skipUnless
 
-# Create your tests here.
+import pandas as pd
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.http import JsonResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from bancaria.importacao import gravar_extrato, ler_arquivo_simba
+from bancaria.models import Cooperacao, ExtratoDetalhado
+from financeira.importacao import importar_arquivo_rif, ler_arquivo_em_blocos
+from financeira.models import RIF, Comunicacao, Envolvido, Ocorrencia
+from financeira.resumo import resumo_financeiro
+from middleware.replica import ReplicaMiddleware
+from utils.conversores import datas, valores_centavos, valores_monetarios
+from utils.replica import COOKIE_FIXACAO, usar_replica
+from .contadores import CAMPOS, TIPOS_ARQUIVO_RIF, atualizar_contadores, contadores_do_caso
+from .dados_sinteticos import gerar_rif, gerar_simba
+from .exclusoes import enfileirar_exclusao, excluir_arquivo, excluir_caso, excluir_cooperacao, excluir_rif
+from .importacoes import enfileirar_importacao, executar_job, recuperar_jobs_abandonados, reservar_proximo_job
+from .models import Arquivo, Caso, CasoUsuario, Contador, ImportJob
+from .views import importacao_status
+
+
+class CasoSinteticoMixin:
+    """Caso com duas RIFs e uma cooperação importadas dos geradores de dados sintéticos."""
+
+    @classmethod
+    def setUpTestData(cls):
+        usuario = get_user_model().objects.create(
+            cpf=52998224725, username='teste', email='teste@mpce.mp.br', nome_completo='Usuário de Teste')
+        cls.caso = Caso.objects.create(nome='Caso', numero='1', resumo='', created_by=usuario)
+        cls.rifs = [RIF.objects.create(caso=cls.caso, numero=f'RIF {i}', outras_informacoes='') for i in (1, 2)]
+        cls.cooperacao = Cooperacao.objects.create(caso=cls.caso, numero='001', inquerito='', processo='')
+
+        with tempfile.TemporaryDirectory() as diretorio:
+            for semente, rif in enumerate(cls.rifs):
+                arquivos = gerar_rif(os.path.join(diretorio, str(semente)), 20 + semente * 10, semente=semente)
+                for tipo, arquivo in arquivos.items():
+                    importar_arquivo_rif(tipo, ler_arquivo_em_blocos(arquivo['caminho'], tipo),
+                                         rif, f'{tipo}.csv', f'{tipo}{semente}')
+            caminho = os.path.join(diretorio, 'simba.zip')
+            gerar_simba(caminho, 300, contas=4, semente=1)
+            cls.arquivo_extrato, _, _ = gravar_extrato(
+                ler_arquivo_simba(caminho), cls.cooperacao, cls.caso, 'simba.zip', 'hash')
+
+    def assertContadoresCorretos(self):
+        contadores = contadores_do_caso(self.caso.id)
+        for rif in RIF.objects.filter(caso=self.caso):
+            contador = contadores['rif'][rif.id]
+            self.assertEqual(contador.comunicacoes, Comunicacao.objects.filter(rif=rif).count())
+            self.assertEqual(contador.envolvidos, Envolvido.objects.filter(rif=rif).count())
+            self.assertEqual(contador.ocorrencias, Ocorrencia.objects.filter(rif=rif).count())
+            self.assertEqual(contador.arquivos,
+                             Arquivo.objects.filter(external_id=rif.id, tipo__in=TIPOS_ARQUIVO_RIF).count())
+
+        extratos = ExtratoDetalhado.objects.filter(caso=self.caso)
+        for cooperacao in Cooperacao.objects.filter(caso=self.caso):
+            contador = contadores['cooperacao'][cooperacao.id]
+            self.assertEqual(contador.extratos, extratos.filter(cooperacao=cooperacao).count())
+            self.assertEqual(contador.titulares,
+                             extratos.filter(cooperacao=cooperacao).values('cpf_cnpj_titular').distinct().count())
+        for arquivo in Arquivo.objects.filter(caso=self.caso, tipo='cooperacao_bancaria'):
+            self.assertEqual(contadores['arquivo'][arquivo.id].extratos, extratos.filter(arquivo=arquivo).count())
+
+        caso = contadores['caso']
+        self.assertEqual(caso.rifs, RIF.objects.filter(caso=self.caso).count())
+        self.assertEqual(caso.cooperacoes, Cooperacao.objects.filter(caso=self.caso).count())
+        self.assertEqual(caso.comunicacoes, Comunicacao.objects.filter(caso=self.caso).count())
+        self.assertEqual(caso.envolvidos, Envolvido.objects.filter(caso=self.caso).count())
+        self.assertEqual(caso.extratos, extratos.count())
+        self.assertEqual(caso.titulares, extratos.values('cpf_cnpj_titular').distinct().count())
+        return contadores
+
+
+class ContadoresTests(CasoSinteticoMixin, TestCase):
+    """Os contadores acompanham as importações e exclusões e podem ser reconstruídos."""
+
+    def test_atualizados_pelas_importacoes(self):
+        contadores = self.assertContadoresCorretos()
+        self.assertEqual(contadores['caso'].comunicacoes, 50)
+        self.assertEqual(contadores['caso'].extratos, 300)
+
+    def test_leitura_em_uma_consulta(self):
+        with self.assertNumQueries(1):
+            contadores_do_caso(self.caso.id)
+
+    def test_leitura_sem_contadores_nao_grava(self):
+        gravados = {(c.escopo, c.escopo_id): [getattr(c, campo) for campo in CAMPOS]
+                    for c in Contador.objects.filter(caso=self.caso)}
+        Contador.objects.filter(caso=self.caso).delete()
+
+        with CaptureQueriesContext(connection) as consultas, self.assertLogs('app.contadores', 'WARNING'):
+            contadores = self.assertContadoresCorretos()
+        self.assertFalse([c['sql'] for c in consultas.captured_queries if not c['sql'].startswith('SELECT')])
+        self.assertFalse(Contador.objects.filter(caso=self.caso).exists())
+
+        calculados = {(c.escopo, c.escopo_id): [getattr(c, campo) for campo in CAMPOS]
+                      for escopo in ('rif', 'cooperacao', 'arquivo') for c in contadores[escopo].values()}
+        calculados[('caso', self.caso.id)] = [getattr(contadores['caso'], campo) for campo in CAMPOS]
+        self.assertEqual(calculados, gravados)
+
+    def test_exclusao_de_rif_e_de_arquivo(self):
+        rif = self.rifs[0]
+        rif_id, arquivo_id = rif.id, self.arquivo_extrato.id
+        Comunicacao.objects.filter(rif=rif).delete()
+        rif.delete()
+        ExtratoDetalhado.objects.filter(arquivo=self.arquivo_extrato).delete()
+        self.arquivo_extrato.delete()
+
+        atualizar_contadores(self.caso.id, cooperacoes=[self.cooperacao.id])
+        contadores = self.assertContadoresCorretos()
+        self.assertFalse(Contador.objects.filter(escopo='rif', escopo_id=rif_id).exists())
+        self.assertFalse(Contador.objects.filter(escopo='arquivo', escopo_id=arquivo_id).exists())
+        self.assertEqual(contadores['caso'].extratos, 0)
+
+    def test_reconstrucao(self):
+        Contador.objects.filter(caso=self.caso, escopo='rif').update(comunicacoes=999)
+        Contador.objects.filter(caso=self.caso, escopo='caso').delete()
+
+        call_command('reconstruir_contadores', caso=[self.caso.id], stdout=io.StringIO())
+        self.assertContadoresCorretos()
+
+
+class ExclusoesTests(CasoSinteticoMixin, TestCase):
+    """A exclusão em massa remove os dependentes em lotes e deixa contadores, resumo e titulares consistentes."""
+
+    def _deletes(self, consultas, modelo):
+        tabela = modelo._meta.db_table
+        return [c['sql'] for c in consultas.captured_queries if c['sql'].startswith(f'DELETE FROM "{tabela}"')]
+
+    def test_excluir_rif_em_lotes(self):
+        rif, outra = self.rifs
+        with mock.patch('app.exclusoes.TAMANHO_LOTE', 7), CaptureQueriesContext(connection) as consultas:
+            excluidos = excluir_rif(rif)
+
+        self.assertEqual(excluidos['comunicacao'], 20)
+        self.assertGreater(len(self._deletes(consultas, Comunicacao)), 1)
+        # Nenhuma comunicação é carregada na memória para ser excluída
+        self.assertFalse([c for c in consultas.captured_queries
+                          if c['sql'].startswith('SELECT "financeira_comunicacao"."id", "financeira_comunicacao"."rif_id"')])
+        self.assertFalse(RIF.objects.filter(id=rif.id).exists())
+        self.assertFalse(Comunicacao.objects.filter(rif_id=rif.id).exists())
+        self.assertFalse(Arquivo.objects.filter(external_id=rif.id, tipo__in=TIPOS_ARQUIVO_RIF).exists())
+        self.assertEqual(Comunicacao.objects.filter(rif=outra).count(), 30)
+
+        self.assertContadoresCorretos()
+        resumo = resumo_financeiro(self.caso.id)
+        self.assertEqual(resumo.comunicacoes, 30)
+        self.assertEqual(list(resumo.por_rif), [str(outra.id)])
+
+    def test_excluir_arquivo_de_envolvidos_limpa_os_titulares(self):
+        rif = self.rifs[0]
+        arquivo = Arquivo.objects.get(external_id=rif.id, tipo='envolvidos')
+        excluir_arquivo(arquivo)
+
+        self.assertFalse(Envolvido.objects.filter(rif=rif).exists())
+        self.assertEqual(Comunicacao.objects.filter(rif=rif).count(), 20)
+        self.assertFalse(Comunicacao.objects.filter(rif=rif).exclude(nome_titular='').exists())
+        self.assertFalse(Comunicacao.objects.filter(rif=rif, envolvido_titular__isnull=False).exists())
+        self.assertContadoresCorretos()
+
+    def test_excluir_cooperacao(self):
+        with mock.patch('app.exclusoes.TAMANHO_LOTE', 50):
+            excluidos = excluir_cooperacao(self.cooperacao)
+        self.assertEqual(excluidos, {'extratodetalhado': 300})
+        self.assertFalse(Arquivo.objects.filter(id=self.arquivo_extrato.id).exists())
+        contadores = self.assertContadoresCorretos()
+        self.assertEqual(contadores['caso'].cooperacoes, 0)
+        # O snapshot dos lançamentos é refeito pelo worker (um job pendente por caso)
+        self.assertEqual(ImportJob.objects.filter(caso=self.caso, tipo='snapshot', status='pendente').count(), 1)
+
+    def test_excluir_caso(self):
+        excluir_caso(self.caso)
+        self.assertFalse(Caso.objects.filter(id=self.caso.id).exists())
+        self.assertFalse(Comunicacao.objects.exists())
+        self.assertFalse(ExtratoDetalhado.objects.exists())
+        self.assertFalse(Contador.objects.exists())
+
+    def test_exclusao_em_segundo_plano(self):
+        # Sem o job de snapshot enfileirado pela importação, o primeiro da fila é a exclusão
+        ImportJob.objects.filter(tipo='snapshot').delete()
+        job = enfileirar_exclusao(self.caso.created_by, 'cooperacao', self.cooperacao)
+        self.assertEqual(enfileirar_exclusao(self.caso.created_by, 'cooperacao', self.cooperacao), job)
+
+        executar_job(reservar_proximo_job())
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'concluido', job.mensagem)
+        self.assertEqual(job.linhas_total, 300)
+        self.assertEqual(job.linhas_processadas, 300)
+        self.assertFalse(Cooperacao.objects.filter(id=self.cooperacao.id).exists())
+        self.assertEqual(reservar_proximo_job().tipo, 'snapshot')
+        self.assertIsNone(reservar_proximo_job())
+
+
+def _processador_com_erro(job, progresso):
+    """Processador de teste: registra parte do progresso e falha."""
+    progresso.registrar(3, [{'linha': 2, 'motivo': 'inválida'}])
+    raise ValueError('Arquivo corrompido')
+
+
+class FilaImportacoesTests(TestCase):
+    """Jobs de importação: armazenamento dos arquivos, reserva, execução, recuperação e status."""
+
+    def setUp(self):
+        self.usuario = get_user_model().objects.create(
+            cpf=52998224725, username='teste', email='teste@mpce.mp.br', nome_completo='Usuário de Teste')
+        self.caso = Caso.objects.create(nome='Caso', numero='1', resumo='', created_by=self.usuario)
+
+        diretorio = tempfile.TemporaryDirectory()
+        self.addCleanup(diretorio.cleanup)
+        self.diretorio = diretorio.name
+        patcher = mock.patch('app.importacoes.DIRETORIO_IMPORTACOES', self.diretorio)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _enfileirar(self):
+        return enfileirar_importacao(self.caso, self.usuario, 'rif', 1, {
+            'comunicacoes': SimpleUploadedFile('Comunicacoes.csv', b'Indexador;idComunicacao\n1;10\n'),
+            'envolvidos': None,
+        })
+
+    def test_enfileirar_importacao(self):
+        job = self._enfileirar()
+
+        self.assertEqual(job.status, 'pendente')
+        self.assertEqual(list(job.arquivos), ['comunicacoes'])
+        caminho = job.arquivos['comunicacoes']
+        self.assertTrue(caminho.startswith(self.diretorio))
+        self.assertEqual(os.path.basename(caminho), 'Comunicacoes.csv')
+        with open(caminho, 'rb') as arquivo:
+            self.assertEqual(arquivo.read(), b'Indexador;idComunicacao\n1;10\n')
+
+    def test_reserva_do_mais_antigo_uma_unica_vez(self):
+        primeiro, segundo = self._enfileirar(), self._enfileirar()
+
+        self.assertEqual(reservar_proximo_job().id, primeiro.id)
+        self.assertEqual(reservar_proximo_job().id, segundo.id)
+        self.assertIsNone(reservar_proximo_job())
+        primeiro.refresh_from_db()
+        self.assertEqual(primeiro.status, 'processando')
+        self.assertIsNotNone(primeiro.iniciado_em)
+
+    def test_reserva_ignora_job_reservado_por_outro_worker(self):
+        job = self._enfileirar()
+        # Outro worker reserva o job entre a listagem dos pendentes e o UPDATE condicional
+        listar = ImportJob.objects.filter
+
+        def filtrar(*args, **kwargs):
+            if kwargs.get('id') == job.id:
+                ImportJob.objects.filter(pk=job.id).update(status='processando')
+            return listar(*args, **kwargs)
+
+        with mock.patch.object(ImportJob.objects, 'filter', side_effect=filtrar):
+            self.assertIsNone(reservar_proximo_job())
+
+    def test_erro_no_processamento(self):
+        job = self._enfileirar()
+        with mock.patch.dict('app.importacoes.PROCESSADORES', {'rif': 'app.tests._processador_com_erro'}), \
+                self.assertLogs('app.importacoes', 'ERROR'):
+            executar_job(reservar_proximo_job())
+
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.mensagem), ('erro', 'Arquivo corrompido'))
+        self.assertEqual((job.linhas_processadas, job.linhas_rejeitadas), (3, 1))
+        self.assertIsNotNone(job.finalizado_em)
+        self.assertFalse(os.listdir(self.diretorio))
+
+    def test_job_abandonado_e_recuperado(self):
+        abandonado, ativo = self._enfileirar(), self._enfileirar()
+        reservar_proximo_job()
+        reservar_proximo_job()
+        ImportJob.objects.filter(id=abandonado.id).update(updated_at=timezone.now() - timedelta(hours=1))
+
+        with override_settings(IMPORTACAO_TEMPO_SEM_PROGRESSO=600), self.assertLogs('app.importacoes', 'WARNING'):
+            self.assertEqual(recuperar_jobs_abandonados(), 1)
+        abandonado.refresh_from_db()
+        ativo.refresh_from_db()
+        self.assertEqual(abandonado.status, 'erro')
+        self.assertFalse(os.path.exists(abandonado.arquivos['comunicacoes']))
+        self.assertEqual(ativo.status, 'processando')
+        self.assertTrue(os.path.exists(ativo.arquivos['comunicacoes']))
+
+    def test_status_restrito_ao_caso(self):
+        job = self._enfileirar()
+        outro = get_user_model().objects.create(
+            cpf=11144477735, username='outro', email='outro@mpce.mp.br', nome_completo='Outro Usuário')
+
+        def consultar(usuario):
+            request = RequestFactory().get(f'/importacoes/{job.id}/status/')
+            request.user = usuario
+            return importacao_status(request, job.id)
+
+        resposta = consultar(self.usuario)
+        self.assertEqual(resposta.status_code, 200)
+        self.assertEqual(json.loads(resposta.content)['job']['status'], 'pendente')
+        self.assertEqual(consultar(outro).status_code, 404)
+
+        CasoUsuario.objects.create(caso=self.caso, usuario=outro)
+        self.assertEqual(consultar(outro).status_code, 200)
+
+
+def _lista(serie):
+    """Valores da série, com None no lugar de NaN/NaT, para comparação."""
+    return [None if pd.isna(valor) else valor for valor in serie.tolist()]
+
+
+class ConversoresTests(SimpleTestCase):
+    """Conversores de valores monetários e datas compartilhados pelos importadores (utils.conversores)."""
+
+    def test_valores_monetarios(self):
+        casos = [
+            ('1.234,56', 1234.56),
+            ('1234,56', 1234.56),
+            ('R$ 55,00', 55.0),
+            ('-1.234,56', -1234.56),
+            ('- 5,00', -5.0),
+            ('-50', -50.0),
+            ('12.34', 12.34),
+            ('1.234', 1234.0),
+            ('1.234.567', 1234567.0),
+            ('', None),
+            ('   ', None),
+            (None, None),
+            (float('nan'), None),
+            ('abc', None),
+            ('1,2,3', None),
+            ('(5,00)', None),
+        ]
+        for valor, esperado in casos:
+            with self.subTest(valor=valor):
+                self.assertEqual(_lista(valores_monetarios(pd.Series([valor], dtype=object))), [esperado])
+
+    def test_valores_monetarios_numericos(self):
+        self.assertEqual(_lista(valores_monetarios(pd.Series([1234, -5.5, float('nan')]))), [1234.0, -5.5, None])
+
+    def test_valores_centavos(self):
+        casos = [
+            ('5300', 53.0),
+            ('53', 0.53),
+            ('007', 0.07),
+            ('-5300', -53.0),
+            ('5300.0', 53.0),
+            ('12,50', 12.5),
+            ('1.234,56', 1234.56),
+            ('', None),
+            (None, None),
+            ('abc', None),
+        ]
+        for valor, esperado in casos:
+            with self.subTest(valor=valor):
+                self.assertEqual(_lista(valores_centavos(pd.Series([valor], dtype=object))), [esperado])
+
+        self.assertEqual(_lista(valores_centavos(pd.Series([5300, -53]))), [53.0, -0.53])
+
+    def test_datas(self):
+        casos = [
+            ('21/01/2024', date(2024, 1, 21)),
+            (' 21/01/2024 ', date(2024, 1, 21)),
+            ('21012024', date(2024, 1, 21)),
+            # DDMMAAAA lida como número perde o zero à esquerda
+            ('1012024', date(2024, 1, 1)),
+            ('1012024.0', date(2024, 1, 1)),
+            ('31/02/2024', None),
+            ('2024-01-21', None),
+            ('32/01/2024', None),
+            ('abc', None),
+            ('', None),
+            (None, None),
+        ]
+        for valor, esperado in casos:
+            with self.subTest(valor=valor):
+                convertidas = datas(pd.Series([valor], dtype=object), ['%d/%m/%Y', '%d%m%Y'])
+                self.assertEqual(_lista(convertidas.dt.date), [esperado])
+
+    def test_datas_mantem_o_indice(self):
+        serie = pd.Series(['2024-01-21', '21/01/2024'], index=[10, 20])
+        convertidas = datas(serie, ['%Y-%m-%d', '%d/%m/%Y'])
+        self.assertEqual(convertidas.index.tolist(), [10, 20])
+        self.assertEqual(_lista(convertidas.dt.date), [date(2024, 1, 21)] * 2)
+
+
+@usar_replica
+def _view_casos(request):
+    """View de teste: grava (se pedido) e lista os nomes dos casos do banco de leitura."""
+    if request.GET.get('gravar'):
+        Caso.objects.filter(nome='Principal').update(resumo='gravado')
+    return JsonResponse({'casos': list(Caso.objects.order_by('id').values_list('nome', flat=True))})
+
+
+REPLICA = settings.BANCO_REPLICA if settings.BANCO_REPLICA in settings.DATABASES else None
+
+
+class ReplicaTests(TestCase):
+    """Views @usar_replica leem da réplica, e voltam ao banco principal sem ela ou após gravações.
+
+    Os testes com réplica rodam com um segundo banco configurado (ex.: DB_REPLICA_NAME=/tmp/replica.sqlite3).
+    """
+
+    databases = {'default', REPLICA} if REPLICA else {'default'}
+
+    @classmethod
+    def setUpTestData(cls):
+        for banco, nome in [('default', 'Principal'), (REPLICA, 'Réplica')]:
+            if banco is None:
+                continue
+            usuario = get_user_model().objects.db_manager(banco).create(
+                cpf=52998224725, username='teste', email='teste@mpce.mp.br', nome_completo='Usuário de Teste')
+            Caso.objects.using(banco).create(nome=nome, numero='1', resumo='', created_by=usuario)
+
+    def _casos(self, gravar=False, cookies=None):
+        request = RequestFactory().get('/', {'gravar': '1'} if gravar else {})
+        request.COOKIES.update(cookies or {})
+        response = ReplicaMiddleware(_view_casos)(request)
+        return json.loads(response.content)['casos'], response.cookies
+
+    def test_sem_replica_le_do_banco_principal(self):
+        with override_settings(BANCO_REPLICA='inexistente'):
+            casos, cookies = self._casos(gravar=True)
+        self.assertEqual(casos, ['Principal'])
+        self.assertNotIn(COOKIE_FIXACAO, cookies)
+
+    @skipUnless(REPLICA, 'réplica não configurada')
+    def test_le_da_replica(self):
+        casos, cookies = self._casos()
+        self.assertEqual(casos, ['Réplica'])
+        self.assertNotIn(COOKIE_FIXACAO, cookies)
+
+    @skipUnless(REPLICA, 'réplica não configurada')
+    def test_gravacao_fixa_as_leituras_no_banco_principal(self):
+        casos, cookies = self._casos(gravar=True)
+        self.assertEqual(casos, ['Principal'])
+        self.assertIn(COOKIE_FIXACAO, cookies)
+
+        # Requisições seguintes do mesmo navegador também leem do principal até o cookie expirar
+        casos, _ = self._casos(cookies={COOKIE_FIXACAO: '1'})
+        self.assertEqual(casos, ['Principal'])
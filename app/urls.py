@@ -20,6 +20,9 @@ urlpatterns = [
     path('casos/<int:id>/investigados/<int:investigado_id>/excluir/', views.excluir_investigado, name='excluir_investigado'),
     path('investigados/<int:investigado_id>/excluir/', views.excluir_investigado, name='excluir_investigado'),
     path('api/buscar-investigado/', views.buscar_investigado, name='buscar_investigado'),
+
+    # Andamento das importações em segundo plano
+    path('importacoes/<int:job_id>/status/', views.importacao_status, name='importacao_status'),
     
     # CRUD de Relatórios
     path('relatorios/', views.relatorios_list, name='relatorios_list'),
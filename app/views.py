@@ -5,8 +5,13 @@ from django.contrib import messages
 from django.contrib.auth.decorators import login_required
 from django.http import JsonResponse
 from django.views.decorators.http import require_POST
+import json
 import logging
-from .models import Caso, Investigado, CasoInvestigado, Relatorio, CasoAtivoUsuario, Arquivo
+from .models import Caso, Investigado, CasoInvestigado, Relatorio, CasoAtivoUsuario, Arquivo, CasoUsuario, ImportJob
+from .importacoes import status_job
+from .contadores import atualizar_contadores, contadores_do_caso
+from .exclusoes import excluir_caso as excluir_caso_em_massa
+from financeira.resumo import maiores_comunicacoes, resumo_financeiro
 from financeira.models import RIF, Comunicacao, Envolvido, InformacaoAdicional, Ocorrencia
 from bancaria.models import Cooperacao, ExtratoDetalhado
 from .forms import CasoForm, InvestigadoForm, AdicionarInvestigadoForm
@@ -28,15 +33,14 @@ def home(request):
     
     print(f"[DEBUG] home - Caso ativo: {caso_ativo}")
     
-    volume_financeiro_por_comunicacao = {}
+    volume_financeiro_por_comunicacao = []
     volume_financeiro_bancaria = {}
     
     if caso_ativo is not None and not isinstance(caso_ativo, HttpResponseRedirect):
-        # RIF: Calcular o volume financeiro por comunicação
-        for comunicacao in caso_ativo.comunicacao_set.all():
-            volume_financeiro_por_comunicacao[f"{comunicacao.rif} - Ind. {comunicacao.indexador}"] = comunicacao.campo_a
+        # RIF: comunicações de maior volume financeiro, do resumo pré-calculado do caso
+        volume_financeiro_por_comunicacao = maiores_comunicacoes(resumo_financeiro(caso_ativo.id))
         
-    return render(request, 'home/index.html', {'caso': caso_ativo, 'casos': casos, 'volume_financeiro_por_comunicacao': volume_financeiro_por_comunicacao})
+    return render(request, 'home/index.html', {'caso': caso_ativo, 'casos': casos, 'volume_financeiro_por_comunicacao': json.dumps(volume_financeiro_por_comunicacao)})
 
 
 @login_required(login_url='/login')
@@ -62,6 +66,8 @@ def novo_caso(request):
             caso = form.save(commit=False)
             caso.created_by = request.user
             caso.save()
+            # Contadores zerados do caso novo (a leitura deles nunca grava)
+            atualizar_contadores(caso.id)
             messages.success(request, 'Caso criado com sucesso!')
             return redirect('casos')
         else:
@@ -95,9 +101,9 @@ def excluir_caso(request, id):
     caso = get_object_or_404(Caso, id=id)
     
     if request.method == 'POST':
-        # O Django já vai cuidar de excluir todos os registros relacionados
-        # devido ao on_delete=models.CASCADE nas ForeignKeys
-        caso.delete()
+        # Comunicações, envolvidos e lançamentos saem com DELETEs em lote (ou com a
+        # partição do caso); o restante, pelo on_delete=models.CASCADE das ForeignKeys
+        excluir_caso_em_massa(caso)
         messages.success(request, 'Caso excluído com sucesso!')
         return redirect('casos')
     
@@ -480,41 +486,33 @@ def detalhes_caso(request, id):
     caso = get_object_or_404(Caso, id=id)
     
     # Dados dos RIFs (Financeira)
+    contadores = contadores_do_caso(caso.id)
     rifs = RIF.objects.filter(caso=caso).order_by('-created_at')
     for rif in rifs:
-        rif.total_comunicacoes = Comunicacao.objects.filter(rif=rif).count()
-        rif.total_envolvidos = Envolvido.objects.filter(rif=rif).count()
-        rif.total_ocorrencias = Ocorrencia.objects.filter(rif=rif).count()
-        rif.arquivos = Arquivo.objects.filter(caso=caso, external_id=rif.id).count()
+        rif.total_comunicacoes = contadores['rif'][rif.id].comunicacoes
+        rif.total_envolvidos = contadores['rif'][rif.id].envolvidos
+        rif.total_ocorrencias = contadores['rif'][rif.id].ocorrencias
+        rif.arquivos = contadores['rif'][rif.id].arquivos
     
     # Estatísticas gerais dos RIFs
-    total_rifs = rifs.count()
-    total_comunicacoes = Comunicacao.objects.filter(caso=caso).count()
-    total_envolvidos = Envolvido.objects.filter(caso=caso).count()
-    total_ocorrencias = Ocorrencia.objects.filter(caso=caso).count()
+    total_rifs = contadores['caso'].rifs
+    total_comunicacoes = contadores['caso'].comunicacoes
+    total_envolvidos = contadores['caso'].envolvidos
+    total_ocorrencias = contadores['caso'].ocorrencias
+    # Gravadas pela análise das comunicações, fora dos contadores: uma única contagem no caso
     total_info_adicionais = InformacaoAdicional.objects.filter(caso=caso).count()
     
     # Dados bancários (Bancária)
     cooperacoes = Cooperacao.objects.filter(caso=caso).order_by('-created_at')
     for cooperacao in cooperacoes:
-        cooperacao.total_titulares = ExtratoDetalhado.objects.filter(
-            cooperacao=cooperacao
-        ).values('cpf_cnpj_titular').distinct().count()
-        cooperacao.total_registros = ExtratoDetalhado.objects.filter(
-            cooperacao=cooperacao
-        ).count()
-        cooperacao.arquivos = Arquivo.objects.filter(
-            caso=caso, 
-            external_id=cooperacao.id, 
-            tipo='cooperacao_bancaria'
-        ).count()
+        cooperacao.total_titulares = contadores['cooperacao'][cooperacao.id].titulares
+        cooperacao.total_registros = contadores['cooperacao'][cooperacao.id].extratos
+        cooperacao.arquivos = contadores['cooperacao'][cooperacao.id].arquivos
     
     # Estatísticas gerais bancárias
-    total_cooperacoes = cooperacoes.count()
-    total_titulares_unicos = ExtratoDetalhado.objects.filter(
-        caso=caso
-    ).values('cpf_cnpj_titular').distinct().count()
-    total_registros_extrato = ExtratoDetalhado.objects.filter(caso=caso).count()
+    total_cooperacoes = contadores['caso'].cooperacoes
+    total_titulares_unicos = contadores['caso'].titulares
+    total_registros_extrato = contadores['caso'].extratos
     
     # Arquivos importados
     arquivos_financeira = Arquivo.objects.filter(
@@ -557,4 +555,26 @@ def detalhes_caso(request, id):
         'arquivos_bancaria': arquivos_bancaria,
     }
     
-    return render(request, 'casos/detalhes.html', context)
\ No newline at end of file
+    return render(request, 'casos/detalhes.html', context)
+
+
+@login_required(login_url='/login')
+def importacao_status(request, job_id):
+    """Retorna em JSON o andamento de uma importação em segundo plano.
+
+    Acessível a quem enviou os arquivos e aos usuários com acesso ao caso.
+    """
+    job = get_object_or_404(ImportJob.objects.select_related('caso'), id=job_id)
+
+    autorizado = (
+        job.created_by_id == request.user.pk
+        or job.caso.created_by_id == request.user.pk
+        or CasoUsuario.objects.filter(caso_id=job.caso_id, usuario=request.user).exists()
+    )
+    if not autorizado:
+        return JsonResponse({
+            'success': False,
+            'message': 'Importação não encontrada'
+        }, status=404)
+
+    return JsonResponse({'success': True, 'job': status_job(job)})
@@ -0,0 +1,561 @@
+"""Importação dos arquivos de cooperação bancária (SIMBA).
+
+Lê o Extrato Detalhado (CSV/Excel) ou o .zip com os arquivos em texto do BACEN
+em blocos no layout de ExtratoDetalhado e grava os lançamentos em lotes, sem
+carregar o arquivo inteiro na memória.
+Executado pelo worker de importações (comando processar_importacoes).
+"""
+import codecs
+import csv
+import hashlib
+import io
+import logging
+import os
+import sqlite3
+import tempfile
+import zipfile
+
+import pandas as pd
+from django.db import connections, router, transaction
+
+from app.contadores import atualizar_contadores
+from app.models import Arquivo
+from utils.conversores import datas, valores_centavos, valores_monetarios
+from .models import Cooperacao, ExtratoDetalhado
+from .particionamento import criar_particoes
+from .snapshot import enfileirar_snapshot
+
+logger = logging.getLogger(__name__)
+
+# Quantidade de lançamentos enviados ao banco em cada INSERT
+TAMANHO_LOTE = 2000
+
+# Quantidade de linhas lidas do arquivo por vez
+TAMANHO_BLOCO = 20000
+
+# Marcador de valor nulo no CSV enviado ao COPY (sempre sem aspas; o vazio continua sendo '')
+NULO_COPY = r'\N'
+
+# Encodings testados na leitura do Extrato Detalhado em CSV
+ENCODINGS_CSV = ['utf-8-sig', 'utf-8', 'latin1', 'cp1252']
+
+# Arquivos em texto do BACEN que o .zip deve conter (sufixo do nome). AGENCIAS e CONTAS também
+# fazem parte do pacote, mas nenhum campo de ExtratoDetalhado vem deles
+ARQUIVOS_OBRIGATORIOS = ['_EXTRATO.txt', '_ORIGEM_DESTINO.txt', '_TITULARES.txt']
+
+# Colunas de cada arquivo em texto do BACEN
+COLUNAS_EXTRATO = [
+    'chave_extrato', 'banco', 'agencia', 'conta',
+    'tipo_conta', 'data_lancamento', 'documento', 'descricao', 'tipo',
+    'valor', 'natureza', 'saldo', 'natureza_saldo', 'local_transacao'
+]
+COLUNAS_ORIGEM_DESTINO = [
+    'codigo_chave', 'chave_extrato', 'valor', 'documento',
+    'banco_destino', 'agencia_destino', 'conta_destino', 'tipo_conta',
+    'tipo_pessoa', 'cpf_cnpj', 'nome_pessoa', 'documento_pessoa',
+    'codigo_barras', 'endossante_cheque', 'documento_endossante', 'situacao_identificacao',
+    'observacao', 'documento_transacao'
+]
+COLUNAS_TITULARES = [
+    'banco', 'agencia', 'conta', 'tipo_conta',
+    'tipo_titular', 'pessoa_investigada', 'tipo_pessoa', 'cpf_cnpj',
+    'nome', 'nome_documento', 'documento', 'endereco',
+    'cidade', 'uf', 'pais', 'cep', 'telefone',
+    'renda', 'data_renda', 'inicio_relacionamento', 'fim_relacionamento'
+]
+
+# Colunas de cada arquivo usadas no extrato, já com o nome do campo em ExtratoDetalhado
+CAMPOS_EXTRATO = {
+    'chave_extrato': 'chave_extrato',
+    'banco': 'banco',
+    'agencia': 'numero_agencia',
+    'conta': 'numero_conta',
+    'tipo_conta': 'tipo',
+    'data_lancamento': 'data_lancamento',
+    'documento': 'numero_documento',
+    'descricao': 'descricao_lancamento',
+    'valor': 'valor_transacao',
+    'natureza': 'natureza_lancamento',
+    'saldo': 'valor_saldo',
+    'natureza_saldo': 'natureza_saldo',
+    'local_transacao': 'local_transacao',
+}
+CAMPOS_ORIGEM_DESTINO = {
+    'chave_extrato': 'chave_extrato',
+    'cpf_cnpj': 'cpf_cnpj_od',
+    'nome_pessoa': 'nome_pessoa_od',
+    'tipo_pessoa': 'tipo_pessoa_od',
+    'banco_destino': 'numero_banco_od',
+    'agencia_destino': 'numero_agencia_od',
+    'conta_destino': 'numero_conta_od',
+    'observacao': 'observacao',
+    'endossante_cheque': 'nome_endossante_cheque',
+    'documento_endossante': 'doc_endossante_cheque',
+    'documento_transacao': 'numero_documento_transacao',
+}
+CAMPOS_TITULARES = {
+    'banco': 'chave_banco',
+    'agencia': 'chave_agencia',
+    'conta': 'chave_conta',
+    'nome': 'nome_titular',
+    'cpf_cnpj': 'cpf_cnpj_titular',
+}
+
+# Tipo de pessoa da contraparte no arquivo ORIGEM_DESTINO
+TIPOS_PESSOA = {'1': 'PF', '2': 'PJ'}
+
+# Campos do ExtratoDetalhado preenchidos a partir do DataFrame final
+CAMPOS_NUMERICOS = ['banco', 'numero_agencia', 'numero_conta', 'tipo',
+                    'numero_banco_od', 'numero_agencia_od', 'numero_conta_od']
+CAMPOS_TEXTO = ['nome_titular', 'cpf_cnpj_titular', 'descricao_lancamento', 'cnab',
+                'numero_documento', 'numero_documento_transacao', 'local_transacao',
+                'natureza_lancamento', 'natureza_saldo', 'cpf_cnpj_od', 'nome_pessoa_od',
+                'tipo_pessoa_od', 'observacao', 'nome_endossante_cheque', 'doc_endossante_cheque']
+
+
+#########################################################################################################################
+# CONVERSORES
+#########################################################################################################################
+def _codigo(serie):
+    """Converte códigos numéricos (banco, agência, conta) para texto, sem o '.0' herdado do float."""
+    texto = serie.where(serie.notna(), '').astype(str).str.strip()
+    # A expressão regular só é aplicada aos valores com ponto, raros nos arquivos lidos como texto
+    com_ponto = texto.str.contains('.', regex=False)
+    if com_ponto.any():
+        texto = texto.mask(com_ponto, texto[com_ponto].str.replace(r'^(-?\d+)\.0+$', r'\1', regex=True))
+    return texto
+
+
+def _chave_conta(serie):
+    """Normaliza banco, agência ou conta para o cruzamento entre arquivos ('0001' e '1' são a mesma agência)."""
+    return serie.str.strip().str.lstrip('0')
+
+
+def _normalizar_bloco(df, primeira_linha):
+    """Converte um bloco de lançamentos para os tipos dos campos de ExtratoDetalhado.
+
+    Args:
+        df (pd.DataFrame): Bloco com os nomes de campos do modelo.
+        primeira_linha (int): Número, no arquivo, da linha de índice 0.
+
+    Returns:
+        tuple: (lançamentos válidos, lista de rejeições {'linha', 'motivo'}).
+    """
+    # Remove colunas desnecessárias se existirem
+    df = df.drop(columns=[c for c in ['NUMERO_CASO', 'NOME_BANCO', 'nome_banco'] if c in df.columns])
+    df.columns = df.columns.str.lower()
+    df = df.rename(columns={'numero_banco': 'banco', 'tipo_conta': 'tipo'})
+
+    df['data_lancamento'] = datas(
+        df['data_lancamento'], ['%Y-%m-%d', '%d%m%Y', '%d/%m/%Y', '%Y-%m-%d %H:%M:%S']).dt.date
+    df['valor_transacao'] = valores_monetarios(df['valor_transacao']).fillna(0.0)
+    df['valor_saldo'] = valores_monetarios(df['valor_saldo']).fillna(0.0)
+
+    # Campos numéricos gravados como texto, sem o '.0' herdado do float
+    for campo in CAMPOS_NUMERICOS:
+        if campo in df.columns:
+            df[campo] = _codigo(df[campo])
+        else:
+            df[campo] = ''
+
+    for campo in CAMPOS_TEXTO:
+        if campo in df.columns:
+            df[campo] = df[campo].fillna('').astype(str)
+        else:
+            df[campo] = ''
+
+    sem_data = df['data_lancamento'].isna()
+    rejeitados = [
+        {'linha': int(indice) + primeira_linha, 'motivo': 'Data do lançamento inválida'}
+        for indice in df.index[sem_data]
+    ]
+    return df[~sem_data], rejeitados
+
+
+#########################################################################################################################
+# LEITURA DOS ARQUIVOS
+#########################################################################################################################
+def _encoding_csv(caminho):
+    """Primeiro encoding de ENCODINGS_CSV capaz de decodificar o arquivo inteiro, lido em partes."""
+    for encoding in ENCODINGS_CSV:
+        decodificador = codecs.getincrementaldecoder(encoding)()
+        try:
+            with open(caminho, 'rb') as arquivo:
+                for parte in iter(lambda: arquivo.read(1024 * 1024), b''):
+                    decodificador.decode(parte)
+                decodificador.decode(b'', final=True)
+            return encoding
+        except UnicodeDecodeError:
+            continue
+    raise ValueError('Não foi possível ler o arquivo CSV com nenhuma combinação de encoding e separador')
+
+
+def _ler_planilha(caminho, tamanho_bloco):
+    """Lê o Extrato Detalhado em CSV (em blocos) ou Excel (fatias da planilha), com todas as colunas como texto."""
+    if caminho.lower().endswith('.xlsx'):
+        # O Excel não permite leitura parcial
+        planilha = pd.read_excel(caminho, dtype=str)
+        for inicio in range(0, len(planilha), tamanho_bloco):
+            yield planilha.iloc[inicio:inicio + tamanho_bloco]
+        return
+
+    with pd.read_csv(caminho, sep=';', encoding=_encoding_csv(caminho), dtype=str, chunksize=tamanho_bloco) as leitor:
+        try:
+            yield from leitor
+        except pd.errors.ParserError as e:
+            raise ValueError(f'Erro ao ler o arquivo CSV: {e}')
+
+
+def _membro(nomes, sufixo):
+    """Nome do arquivo do .zip terminado pelo sufixo (ex.: '_EXTRATO.txt'), ou None."""
+    return next((nome for nome in nomes if nome.endswith(sufixo)), None)
+
+
+def _ler_txt(zip_ref, nome, colunas, tamanho_bloco=None):
+    """Lê um arquivo em texto do BACEN direto do .zip, com todas as colunas como texto.
+
+    Args:
+        zip_ref (ZipFile): .zip aberto.
+        nome (str): Nome do arquivo dentro do .zip.
+        colunas (list): Colunas do layout do arquivo.
+        tamanho_bloco (Optional[int]): Se informado, devolve um leitor de blocos.
+
+    Returns:
+        pd.DataFrame ou TextFileReader: Conteúdo do arquivo, ou o leitor de blocos.
+    """
+    return pd.read_csv(
+        zip_ref.open(nome), sep='\t', header=None, names=colunas, index_col=False,
+        dtype=str, keep_default_na=False, skip_blank_lines=True, on_bad_lines='skip',
+        chunksize=tamanho_bloco
+    )
+
+
+def _indexar_origem_destino(zip_ref, nome, caminho_indice, tamanho_bloco):
+    """Grava o arquivo ORIGEM_DESTINO em um SQLite temporário, indexado pela chave do extrato.
+
+    O arquivo pode ter o mesmo tamanho do EXTRATO; com o índice em disco, cada
+    bloco do extrato busca apenas as suas contrapartes.
+
+    Returns:
+        sqlite3.Connection: Conexão com as tabelas 'origem_destino' e 'chaves' (auxiliar da busca).
+    """
+    conexao = sqlite3.connect(caminho_indice)
+    colunas = list(CAMPOS_ORIGEM_DESTINO.values())
+    conexao.execute(f"CREATE TABLE origem_destino ({', '.join(f'{coluna} TEXT' for coluna in colunas)})")
+
+    with _ler_txt(zip_ref, nome, COLUNAS_ORIGEM_DESTINO, tamanho_bloco) as leitor:
+        for bloco in leitor:
+            bloco = bloco[list(CAMPOS_ORIGEM_DESTINO)].rename(columns=CAMPOS_ORIGEM_DESTINO)
+            bloco['tipo_pessoa_od'] = bloco['tipo_pessoa_od'].str.strip().map(TIPOS_PESSOA)
+            bloco.to_sql('origem_destino', conexao, if_exists='append', index=False)
+
+    conexao.execute('CREATE INDEX origem_destino_chave ON origem_destino (chave_extrato)')
+    conexao.execute('CREATE TABLE chaves (chave_extrato TEXT PRIMARY KEY)')
+    return conexao
+
+
+def _origem_destino_do_bloco(conexao, chaves):
+    """Contrapartes dos lançamentos do bloco, indexadas pela chave do extrato."""
+    conexao.execute('DELETE FROM chaves')
+    conexao.executemany('INSERT INTO chaves VALUES (?)', ((chave,) for chave in chaves))
+    origem_destino = pd.read_sql_query(
+        'SELECT origem_destino.* FROM chaves JOIN origem_destino USING (chave_extrato)', conexao)
+    return origem_destino.set_index('chave_extrato')
+
+
+def _ler_titulares(zip_ref, nome):
+    """Lê o titular de cada conta, indexado por banco/agência/conta normalizados.
+
+    ExtratoDetalhado guarda um titular por lançamento: nas contas conjuntas fica o
+    primeiro titular do tipo 'T' (ou o primeiro da conta, se não houver), para que o
+    cruzamento não repita os lançamentos. Os demais titulares dessas contas são
+    registrados no log.
+    """
+    titulares = _ler_txt(zip_ref, nome, COLUNAS_TITULARES)
+    titulares = titulares[[*CAMPOS_TITULARES, 'tipo_titular']].rename(columns=CAMPOS_TITULARES)
+    chave = ['chave_banco', 'chave_agencia', 'chave_conta']
+    for coluna in chave:
+        titulares[coluna] = _chave_conta(titulares[coluna])
+
+    titulares = titulares.sort_values('tipo_titular', key=lambda tipo: tipo.str.strip() != 'T', kind='stable')
+    descartados = titulares.duplicated(chave)
+    if descartados.any():
+        contas = titulares.loc[descartados].groupby(chave).size()
+        logger.warning(
+            "%s titulares de %s contas conjuntas não foram associados aos lançamentos (banco/agência/conta: "
+            "titulares descartados): %s", int(descartados.sum()), len(contas),
+            ', '.join(f"{'/'.join(conta)}: {quantidade}" for conta, quantidade in contas.items()))
+    return titulares[~descartados].drop(columns='tipo_titular').set_index(chave)
+
+
+def _ler_zip(caminho, tamanho_bloco):
+    """Lê o .zip do BACEN em blocos de lançamentos, sem extrair os arquivos.
+
+    Cada bloco do EXTRATO é cruzado com a contraparte (ORIGEM_DESTINO, indexado em
+    um SQLite no diretório temporário exclusivo desta leitura) e com o titular da
+    conta (TITULARES, pequeno, mantido em memória).
+
+    Yields:
+        tuple: (bloco no layout de ExtratoDetalhado, número da linha de índice 0).
+    """
+    with zipfile.ZipFile(caminho, 'r') as zip_ref, \
+            tempfile.TemporaryDirectory(prefix='simba_', dir=os.path.dirname(caminho)) as temporario:
+        nomes = zip_ref.namelist()
+        membros = {sufixo: _membro(nomes, sufixo) for sufixo in ARQUIVOS_OBRIGATORIOS}
+        if None in membros.values():
+            raise ValueError('Arquivo .zip inválido: arquivos EXTRATO, ORIGEM_DESTINO e TITULARES são obrigatórios.')
+
+        titulares = _ler_titulares(zip_ref, membros['_TITULARES.txt'])
+        conexao = _indexar_origem_destino(
+            zip_ref, membros['_ORIGEM_DESTINO.txt'], os.path.join(temporario, 'origem_destino.sqlite3'), tamanho_bloco)
+        try:
+            with _ler_txt(zip_ref, membros['_EXTRATO.txt'], COLUNAS_EXTRATO, tamanho_bloco) as leitor:
+                for bloco in leitor:
+                    df = bloco[list(CAMPOS_EXTRATO)].rename(columns=CAMPOS_EXTRATO)
+                    df['valor_transacao'] = valores_centavos(df['valor_transacao'])
+                    df['valor_saldo'] = valores_centavos(df['valor_saldo'])
+
+                    df = df.join(_origem_destino_do_bloco(conexao, df['chave_extrato'].unique()), on='chave_extrato')
+
+                    df['chave_banco'] = _chave_conta(df['banco'])
+                    df['chave_agencia'] = _chave_conta(df['numero_agencia'])
+                    df['chave_conta'] = _chave_conta(df['numero_conta'])
+                    df = df.join(titulares, on=['chave_banco', 'chave_agencia', 'chave_conta'])
+
+                    df['cnab'] = ''
+                    yield df.drop(columns=['chave_extrato', 'chave_banco', 'chave_agencia', 'chave_conta']), 1
+        finally:
+            conexao.close()
+
+
+def ler_arquivo_simba(caminho, tamanho_bloco=TAMANHO_BLOCO):
+    """Lê o arquivo de cooperação bancária em blocos no layout de ExtratoDetalhado.
+
+    Todas as colunas são lidas como texto, preservando os zeros à esquerda de
+    CPF/CNPJ, agências e contas.
+
+    Args:
+        caminho (str): Caminho do Extrato Detalhado (.csv/.xlsx) ou do .zip do BACEN.
+        tamanho_bloco (int): Quantidade de linhas lidas por vez.
+
+    Yields:
+        tuple: (lançamentos válidos do bloco, com os nomes de campos do modelo,
+            lista de rejeições {'linha', 'motivo'}).
+
+    Raises:
+        ValueError: Se o formato não for suportado ou o arquivo não puder ser lido.
+    """
+    nome = os.path.basename(caminho).lower()
+    if nome.endswith('.zip'):
+        blocos = _ler_zip(caminho, tamanho_bloco)
+    elif nome.endswith('.csv') or nome.endswith('.xlsx'):
+        # A linha 1 é o cabeçalho
+        blocos = ((bloco, 2) for bloco in _ler_planilha(caminho, tamanho_bloco))
+    else:
+        raise ValueError('Formato de arquivo não suportado')
+
+    for bloco, primeira_linha in blocos:
+        yield _normalizar_bloco(bloco, primeira_linha)
+
+
+def _contar_quebras(arquivo):
+    """Quantidade de quebras de linha do arquivo binário, lido em partes."""
+    return sum(parte.count(b'\n') for parte in iter(lambda: arquivo.read(1024 * 1024), b''))
+
+
+def contar_lancamentos(caminho):
+    """Estimativa da quantidade de lançamentos, sem carregar o arquivo, usada no cálculo do ETA."""
+    nome = os.path.basename(caminho).lower()
+    if nome.endswith('.zip'):
+        with zipfile.ZipFile(caminho, 'r') as zip_ref:
+            membro = _membro(zip_ref.namelist(), '_EXTRATO.txt')
+            if not membro:
+                return 0
+            with zip_ref.open(membro) as arquivo:
+                return _contar_quebras(arquivo)
+    if nome.endswith('.csv'):
+        with open(caminho, 'rb') as arquivo:
+            return max(_contar_quebras(arquivo) - 1, 0)
+    return 0
+
+
+#########################################################################################################################
+# GRAVAÇÃO
+#########################################################################################################################
+# Campos do ExtratoDetalhado gravados a partir dos blocos lidos
+CAMPOS_GRAVADOS = CAMPOS_NUMERICOS + CAMPOS_TEXTO + ['data_lancamento', 'valor_transacao', 'valor_saldo']
+
+
+def _gravar_bulk_create(df, campos_comuns, banco, progresso=None):
+    """Grava um bloco de lançamentos com bulk_create, em lotes de TAMANHO_LOTE.
+
+    As instâncias são montadas lote a lote, então só um lote fica na memória.
+
+    Returns:
+        int: Quantidade de lançamentos gravados.
+    """
+    registros = df[CAMPOS_GRAVADOS].to_dict('records')
+    for inicio in range(0, len(registros), TAMANHO_LOTE):
+        lote = [
+            ExtratoDetalhado(**campos_comuns, **registro)
+            for registro in registros[inicio:inicio + TAMANHO_LOTE]
+        ]
+        ExtratoDetalhado.objects.using(banco).bulk_create(lote, batch_size=TAMANHO_LOTE)
+        if progresso:
+            progresso(len(lote), [])
+    return len(registros)
+
+
+def _csv_copy(dados):
+    """CSV de um bloco no formato lido pelo COPY com NULL NULO_COPY.
+
+    Valores ausentes (NaN, None, NaT) são escritos como NULO_COPY, sem aspas, e
+    chegam ao banco como NULL; o texto vazio é escrito sem aspas e chega como ''.
+    Um texto igual a NULO_COPY também seria lido como NULL, o que faz o COPY
+    falhar nas colunas NOT NULL em vez de gravar um valor trocado.
+
+    Returns:
+        io.StringIO: Buffer posicionado no início.
+    """
+    buffer = io.StringIO()
+    dados.to_csv(buffer, header=False, index=False, quoting=csv.QUOTE_MINIMAL, na_rep=NULO_COPY)
+    buffer.seek(0)
+    return buffer
+
+
+def _gravar_copy(df, campos_comuns, banco, progresso=None):
+    """Grava um bloco de lançamentos com COPY ... FROM STDIN (PostgreSQL).
+
+    O bloco é convertido em CSV na memória (ver _csv_copy) e enviado em um único
+    COPY, sem criar instâncias do modelo.
+
+    Returns:
+        int: Quantidade de lançamentos gravados.
+    """
+    conexao = connections[banco]
+    opcoes = ExtratoDetalhado._meta
+    campos = list(campos_comuns) + CAMPOS_GRAVADOS
+    colunas = ', '.join(conexao.ops.quote_name(opcoes.get_field(campo).column) for campo in campos)
+    sql = (f"COPY {conexao.ops.quote_name(opcoes.db_table)} ({colunas}) FROM STDIN "
+           f"WITH (FORMAT csv, NULL '{NULO_COPY}')")
+
+    dados = df[CAMPOS_GRAVADOS].assign(**{campo: valor.pk for campo, valor in campos_comuns.items()})
+    buffer = _csv_copy(dados[campos])
+
+    # wrap_database_errors: erros do driver chegam como os do Django (IntegrityError etc.)
+    with conexao.cursor() as cursor, conexao.wrap_database_errors:
+        cursor_driver = cursor.cursor
+        if hasattr(cursor_driver, 'copy_expert'):
+            # psycopg2
+            cursor_driver.copy_expert(sql, buffer)
+        else:
+            # psycopg 3
+            with cursor_driver.copy(sql) as copia:
+                copia.write(buffer.getvalue())
+
+    if progresso:
+        progresso(len(dados), [])
+    return len(dados)
+
+
+def carregador_extrato(banco):
+    """Escolhe a forma de gravação dos lançamentos conforme o banco de dados.
+
+    Args:
+        banco (str): Alias do banco de dados (settings.DATABASES).
+
+    Returns:
+        callable: _gravar_copy no PostgreSQL; _gravar_bulk_create nos demais (ex.: SQLite).
+    """
+    if connections[banco].vendor == 'postgresql':
+        return _gravar_copy
+    return _gravar_bulk_create
+
+
+def gravar_extrato(blocos, cooperacao, caso, nome_arquivo, hash_arquivo, progresso=None):
+    """Grava os lançamentos em ExtratoDetalhado à medida que os blocos são lidos.
+
+    No PostgreSQL cada bloco é gravado com COPY; nos demais bancos, com bulk_create
+    em lotes (ver carregador_extrato). O Arquivo e os lançamentos são gravados na
+    mesma transação.
+
+    Args:
+        blocos (Iterable[tuple]): Blocos gerados por ler_arquivo_simba.
+        cooperacao (Cooperacao): Cooperação de destino.
+        caso (Caso): Caso da cooperação.
+        nome_arquivo (str): Nome do arquivo enviado.
+        hash_arquivo (str): Hash SHA256 do arquivo enviado.
+        progresso (Optional[callable]): Recebe (gravadas, rejeicoes) a cada lote.
+
+    Returns:
+        tuple: Arquivo importado, quantidade de lançamentos gravados e lista de rejeições.
+    """
+    banco = router.db_for_write(ExtratoDetalhado)
+    gravar = carregador_extrato(banco)
+    gravados = 0
+    rejeitados = []
+
+    with transaction.atomic(using=banco):
+        # Com a tabela particionada, os lançamentos vão direto para a partição da cooperação
+        criar_particoes(caso.id, cooperacao.id, using=banco)
+        arquivo = Arquivo.objects.using(banco).create(
+            caso=caso,
+            nome=nome_arquivo,
+            hash=hash_arquivo,
+            tipo='cooperacao_bancaria',
+            external_id=cooperacao.id,
+            registros=0
+        )
+        campos_comuns = {'cooperacao': cooperacao, 'caso': caso, 'arquivo': arquivo}
+
+        for df, rejeitados_bloco in blocos:
+            rejeitados.extend(rejeitados_bloco)
+            if progresso and rejeitados_bloco:
+                progresso(0, rejeitados_bloco)
+            if not df.empty:
+                gravados += gravar(df, campos_comuns, banco, progresso)
+
+        Arquivo.objects.using(banco).filter(id=arquivo.id).update(registros=gravados)
+        arquivo.registros = gravados
+        atualizar_contadores(caso.id, cooperacoes=[cooperacao.id], using=banco)
+        # Snapshot Parquet das análises, refeito pelo worker depois do commit dos lançamentos
+        enfileirar_snapshot(caso.id)
+
+    return arquivo, gravados, rejeitados
+
+
+def processar_importacao_simba(job, progresso):
+    """Processa um ImportJob do tipo 'simba' (executado pelo worker de importações).
+
+    Args:
+        job (ImportJob): Job com o caminho do arquivo da cooperação.
+        progresso (ProgressoJob): Acumulador do andamento da importação.
+
+    Returns:
+        str: Resumo da importação.
+
+    Raises:
+        ValueError: Se o arquivo já foi importado ou não puder ser lido.
+    """
+    cooperacao = Cooperacao.objects.get(id=job.external_id, caso_id=job.caso_id)
+    caminho = job.arquivos['arquivo']
+
+    hash_arquivo = hashlib.sha256()
+    with open(caminho, 'rb') as arquivo:
+        for bloco in iter(lambda: arquivo.read(1024 * 1024), b''):
+            hash_arquivo.update(bloco)
+    hash_arquivo = hash_arquivo.hexdigest()
+
+    if Arquivo.objects.filter(hash=hash_arquivo, external_id=cooperacao.id,
+                              tipo='cooperacao_bancaria', caso_id=job.caso_id).exists():
+        raise ValueError('Este arquivo já foi processado anteriormente')
+
+    progresso.definir_total(contar_lancamentos(caminho))
+
+    _, gravados, rejeitados = gravar_extrato(
+        ler_arquivo_simba(caminho), cooperacao, job.caso, os.path.basename(caminho), hash_arquivo,
+        progresso=progresso.registrar)
+
+    if rejeitados:
+        return f'{gravados} lançamentos importados, {len(rejeitados)} rejeitados'
+    return f'{gravados} lançamentos importados'
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from bancaria.snapshot import gravar_snapshots
+
+
+class Command(BaseCommand):
+    help = ('Grava os snapshots Parquet dos lançamentos bancários dos casos (normalmente gravados pelo worker '
+            'de importações após cada importação ou exclusão)')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--caso', type=int, action='append', dest='casos',
+            help='Id do caso a gravar (pode ser repetido); por padrão, todos os casos com lançamentos'
+        )
+
+    def handle(self, *args, **options):
+        total = gravar_snapshots(options['casos'])
+        self.stdout.write(self.style.SUCCESS(f'Snapshot de {total} caso(s) gravado(s).'))
@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, router
+
+from bancaria.models import ExtratoDetalhado
+from bancaria.particionamento import desparticionar_tabela, particionada, particionar_tabela
+
+
+class Command(BaseCommand):
+    help = ('Converte a tabela de lançamentos (ExtratoDetalhado) em tabela particionada por caso e '
+            'cooperação no PostgreSQL, ou volta à tabela simples com --desfazer')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--desfazer', action='store_true',
+            help='Volta à tabela simples, com os lançamentos de todas as partições'
+        )
+        parser.add_argument(
+            '--database', default=None,
+            help='Alias do banco; por padrão, o de gravação de ExtratoDetalhado'
+        )
+
+    def handle(self, *args, **options):
+        banco = options['database'] or router.db_for_write(ExtratoDetalhado)
+        if connections[banco].vendor != 'postgresql':
+            raise CommandError('O particionamento de ExtratoDetalhado só está disponível no PostgreSQL.')
+
+        if options['desfazer']:
+            convertida = desparticionar_tabela(using=banco)
+            mensagem = 'Tabela convertida em tabela simples.' if convertida else 'A tabela não está particionada.'
+        else:
+            convertida = particionar_tabela(using=banco)
+            mensagem = ('Tabela particionada por caso e cooperação.' if convertida
+                        else 'A tabela já está particionada.')
+        self.stdout.write(self.style.SUCCESS(mensagem) if convertida else mensagem)
+        if particionada(banco):
+            self.stdout.write('Novas partições são criadas na importação de cada cooperação.')
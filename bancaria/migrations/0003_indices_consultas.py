@@ -0,0 +1,26 @@
+# Generated by Django 5.1.4 on 2026-10-18 13:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0008_importjob'),
+        ('bancaria', '0002_alter_extratodetalhado_banco_and_more'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='extratodetalhado',
+            index=models.Index(fields=['caso', 'cpf_cnpj_titular'], name='extrato_caso_titular'),
+        ),
+        migrations.AddIndex(
+            model_name='extratodetalhado',
+            index=models.Index(fields=['caso', 'cpf_cnpj_od'], name='extrato_caso_od'),
+        ),
+        migrations.AddIndex(
+            model_name='extratodetalhado',
+            index=models.Index(fields=['caso', 'data_lancamento'], name='extrato_caso_data'),
+        ),
+    ]
@@ -81,3 +81,10 @@ class ExtratoDetalhado(models.Model):
 
     def __str__(self):
         return f"Extrato {self.id} - {self.nome_titular}"
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['caso', 'cpf_cnpj_titular'], name='extrato_caso_titular'),
+            models.Index(fields=['caso', 'cpf_cnpj_od'], name='extrato_caso_od'),
+            models.Index(fields=['caso', 'data_lancamento'], name='extrato_caso_data'),
+        ]
@@ -0,0 +1,271 @@
+"""Particionamento opcional de ExtratoDetalhado no PostgreSQL.
+
+Com o particionamento ativo, a tabela de lançamentos é particionada por caso
+(LIST em caso_id) e cada partição de caso, por cooperação (LIST em
+cooperacao_id):
+
+    bancaria_extratodetalhado
+    ├── bancaria_extratodetalhado_padrao         (DEFAULT)
+    └── bancaria_extratodetalhado_caso_<id>
+        ├── bancaria_extratodetalhado_caso_<id>_padrao  (DEFAULT)
+        └── bancaria_extratodetalhado_coop_<id>
+
+As consultas filtradas por caso (ou cooperação) leem apenas a partição dele, e
+excluir um caso ou uma cooperação passa a ser um DROP TABLE da partição, em vez
+de um DELETE de todos os lançamentos.
+
+A tabela é convertida pelo comando ``python manage.py particionar_extratos``
+(``--desfazer`` volta à tabela simples), executado quando se decide particionar
+a base; as migrações não alteram o layout da tabela. A conversão copia todos os
+lançamentos e bloqueia a tabela até o fim.
+
+Nos demais bancos (ex.: SQLite) e com a tabela não particionada, as funções de
+criação e remoção de partições não fazem nada.
+"""
+import logging
+from contextlib import contextmanager
+
+from django.db import connections, router, transaction
+
+from .models import Cooperacao, ExtratoDetalhado
+
+logger = logging.getLogger(__name__)
+
+TABELA = ExtratoDetalhado._meta.db_table
+PADRAO = f'{TABELA}_padrao'
+
+
+def _particao_caso(caso_id):
+    return f'{TABELA}_caso_{int(caso_id)}'
+
+
+def _particao_cooperacao(cooperacao_id):
+    return f'{TABELA}_coop_{int(cooperacao_id)}'
+
+
+#########################################################################################################################
+# ESTADO
+#########################################################################################################################
+def particionada(using=None):
+    """Indica se ExtratoDetalhado está particionada no banco informado.
+
+    Args:
+        using (Optional[str]): Alias do banco; por padrão, o de gravação de ExtratoDetalhado.
+
+    Returns:
+        bool: True no PostgreSQL com a tabela particionada.
+    """
+    conexao = connections[using or router.db_for_write(ExtratoDetalhado)]
+    if conexao.vendor != 'postgresql':
+        return False
+    with conexao.cursor() as cursor:
+        cursor.execute('SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(%s)', [TABELA])
+        return cursor.fetchone() is not None
+
+
+def _existe(cursor, tabela):
+    cursor.execute('SELECT to_regclass(%s) IS NOT NULL', [tabela])
+    return cursor.fetchone()[0]
+
+
+@contextmanager
+def _restricoes_imediatas(cursor):
+    """Verifica já as chaves estrangeiras adiadas da transação.
+
+    O PostgreSQL não altera nem remove tabelas com verificações de chave
+    estrangeira pendentes (as do Django são DEFERRABLE INITIALLY DEFERRED).
+    """
+    cursor.execute('SET CONSTRAINTS ALL IMMEDIATE')
+    yield
+    cursor.execute('SET CONSTRAINTS ALL DEFERRED')
+
+
+#########################################################################################################################
+# CONVERSÃO DA TABELA
+#########################################################################################################################
+def _recriar_tabela(banco, particionar):
+    """Recria ExtratoDetalhado (particionada ou simples) copiando os lançamentos.
+
+    A tabela atual é renomeada, a nova é criada com as mesmas colunas, os
+    lançamentos são copiados e a antiga é removida; depois, a chave primária, os
+    índices e as chaves estrangeiras são recriados com os nomes originais, para
+    que as migrações seguintes continuem a encontrá-los.
+    """
+    conexao = connections[banco]
+    tabela = conexao.ops.quote_name(TABELA)
+    antiga = conexao.ops.quote_name(f'{TABELA}_antiga')
+
+    with transaction.atomic(using=banco), conexao.cursor() as cursor, _restricoes_imediatas(cursor):
+        cursor.execute(f'LOCK TABLE {tabela} IN ACCESS EXCLUSIVE MODE')
+
+        # Índices (exceto o da chave primária) e chaves estrangeiras atuais
+        cursor.execute(
+            "SELECT indexdef FROM pg_indexes WHERE schemaname = current_schema() AND tablename = %s "
+            "AND indexname NOT IN (SELECT conname FROM pg_constraint WHERE conrelid = %s::regclass "
+            "AND contype = 'p')", [TABELA, TABELA])
+        # Índices de tabela particionada vêm como "ON ONLY"; recriados, devem valer para as partições
+        indices = [linha[0].replace(' ON ONLY ', ' ON ') for linha in cursor.fetchall()]
+        cursor.execute(
+            "SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint "
+            "WHERE conrelid = %s::regclass AND contype = 'f'", [TABELA])
+        chaves_estrangeiras = cursor.fetchall()
+
+        cursor.execute(f'ALTER TABLE {tabela} RENAME TO {antiga}')
+        cursor.execute(
+            f'CREATE TABLE {tabela} (LIKE {antiga} INCLUDING DEFAULTS INCLUDING IDENTITY INCLUDING STORAGE)'
+            + (' PARTITION BY LIST (caso_id)' if particionar else ''))
+
+        if particionar:
+            cursor.execute(f'CREATE TABLE {conexao.ops.quote_name(PADRAO)} PARTITION OF {tabela} DEFAULT')
+            for caso_id, cooperacao_id in Cooperacao.objects.using(banco).order_by('id').values_list('caso_id', 'id'):
+                _criar_particoes(cursor, conexao, caso_id, cooperacao_id)
+
+        cursor.execute(f'INSERT INTO {tabela} SELECT * FROM {antiga}')
+        cursor.execute(
+            f"SELECT setval(pg_get_serial_sequence(%s, 'id'), COALESCE(MAX(id), 0) + 1, false) FROM {antiga}",
+            [TABELA])
+        cursor.execute(f'DROP TABLE {antiga}')
+
+        # Com a antiga removida, a sequência da coluna id pode voltar ao nome original
+        cursor.execute("SELECT pg_get_serial_sequence(%s, 'id')", [TABELA])
+        sequencia = cursor.fetchone()[0]
+        if sequencia.split('.')[-1].strip('"') != f'{TABELA}_id_seq':
+            cursor.execute(f'ALTER SEQUENCE {sequencia} RENAME TO {conexao.ops.quote_name(f"{TABELA}_id_seq")}')
+
+        # A chave primária de uma tabela particionada precisa conter as colunas de partição
+        chave = 'id, caso_id, cooperacao_id' if particionar else 'id'
+        cursor.execute(f'ALTER TABLE {tabela} ADD PRIMARY KEY ({chave})')
+        for definicao in indices:
+            cursor.execute(definicao)
+        for nome, definicao in chaves_estrangeiras:
+            cursor.execute(f'ALTER TABLE {tabela} ADD CONSTRAINT {conexao.ops.quote_name(nome)} {definicao}')
+        cursor.execute(f'ANALYZE {tabela}')
+
+
+def particionar_tabela(using=None):
+    """Converte ExtratoDetalhado em tabela particionada por caso e cooperação.
+
+    Cria as partições de todas as cooperações existentes. Não faz nada fora do
+    PostgreSQL ou se a tabela já estiver particionada.
+
+    Args:
+        using (Optional[str]): Alias do banco; por padrão, o de gravação de ExtratoDetalhado.
+
+    Returns:
+        bool: True se a tabela foi convertida.
+    """
+    banco = using or router.db_for_write(ExtratoDetalhado)
+    if connections[banco].vendor != 'postgresql' or particionada(banco):
+        return False
+    _recriar_tabela(banco, particionar=True)
+    logger.info("Tabela %s convertida em tabela particionada por caso e cooperação", TABELA)
+    return True
+
+
+def desparticionar_tabela(using=None):
+    """Volta ExtratoDetalhado a uma tabela simples, com os lançamentos de todas as partições.
+
+    Args:
+        using (Optional[str]): Alias do banco; por padrão, o de gravação de ExtratoDetalhado.
+
+    Returns:
+        bool: True se a tabela foi convertida.
+    """
+    banco = using or router.db_for_write(ExtratoDetalhado)
+    if not particionada(banco):
+        return False
+    _recriar_tabela(banco, particionar=False)
+    logger.info("Tabela %s convertida em tabela simples", TABELA)
+    return True
+
+
+#########################################################################################################################
+# PARTIÇÕES
+#########################################################################################################################
+def _anexar_particao(cursor, conexao, nome, pai, padrao, coluna, valor, subparticionar=None):
+    """Cria a partição `nome` de `pai` para `coluna` = `valor`, se ainda não existir.
+
+    Lançamentos desse valor gravados antes na partição padrão são movidos para
+    a nova partição antes de anexá-la.
+    """
+    if _existe(cursor, nome):
+        return
+    quote = conexao.ops.quote_name
+    cursor.execute(
+        f'CREATE TABLE {quote(nome)} (LIKE {quote(TABELA)} INCLUDING DEFAULTS INCLUDING STORAGE)'
+        + (f' PARTITION BY LIST ({subparticionar})' if subparticionar else ''))
+    if subparticionar:
+        cursor.execute(f'CREATE TABLE {quote(f"{nome}_padrao")} PARTITION OF {quote(nome)} DEFAULT')
+    cursor.execute(
+        f'WITH movidos AS (DELETE FROM {quote(padrao)} WHERE {coluna} = %s RETURNING *) '
+        f'INSERT INTO {quote(nome)} SELECT * FROM movidos', [valor])
+    cursor.execute(f'ALTER TABLE {quote(pai)} ATTACH PARTITION {quote(nome)} FOR VALUES IN ({int(valor)})')
+
+
+def _criar_particoes(cursor, conexao, caso_id, cooperacao_id):
+    particao_caso = _particao_caso(caso_id)
+    _anexar_particao(cursor, conexao, particao_caso, TABELA, PADRAO, 'caso_id', caso_id,
+                     subparticionar='cooperacao_id')
+    _anexar_particao(cursor, conexao, _particao_cooperacao(cooperacao_id), particao_caso,
+                     f'{particao_caso}_padrao', 'cooperacao_id', cooperacao_id)
+
+
+def criar_particoes(caso_id, cooperacao_id, using=None):
+    """Garante as partições do caso e da cooperação antes de gravar lançamentos.
+
+    Chamada por gravar_extrato na transação da importação. Sem particionamento,
+    não faz nada.
+
+    Args:
+        caso_id (int): Id do caso.
+        cooperacao_id (int): Id da cooperação.
+        using (Optional[str]): Alias do banco; por padrão, o de gravação de ExtratoDetalhado.
+    """
+    banco = using or router.db_for_write(ExtratoDetalhado)
+    if not particionada(banco):
+        return
+    conexao = connections[banco]
+    with transaction.atomic(using=banco), conexao.cursor() as cursor:
+        if _existe(cursor, _particao_cooperacao(cooperacao_id)):
+            return
+        # Serializa a criação de partições entre importações simultâneas
+        cursor.execute('SELECT pg_advisory_xact_lock(hashtext(%s))', [TABELA])
+        with _restricoes_imediatas(cursor):
+            _criar_particoes(cursor, conexao, caso_id, cooperacao_id)
+    logger.info("Partições do caso %s / cooperação %s criadas", caso_id, cooperacao_id)
+
+
+def remover_particoes(casos=(), cooperacoes=(), using=None):
+    """Remove as partições (e os lançamentos) dos casos e cooperações informados.
+
+    Deve ser chamada antes de excluir o caso ou a cooperação, para que o DELETE
+    em cascata do Django não encontre mais lançamentos. As partições são
+    removidas em uma transação própria, como os lotes de app.exclusoes: se a
+    exclusão for interrompida depois disso, os lançamentos já saíram e basta
+    excluir de novo. Sem particionamento, não faz nada e a exclusão segue pelo
+    DELETE.
+
+    Args:
+        casos (Iterable[int]): Ids dos casos.
+        cooperacoes (Iterable[int]): Ids das cooperações.
+        using (Optional[str]): Alias do banco; por padrão, o de gravação de ExtratoDetalhado.
+
+    Returns:
+        list: Nomes das partições removidas.
+    """
+    banco = using or router.db_for_write(ExtratoDetalhado)
+    if not particionada(banco):
+        return []
+    conexao = connections[banco]
+    nomes = [_particao_caso(caso_id) for caso_id in casos]
+    nomes += [_particao_cooperacao(cooperacao_id) for cooperacao_id in cooperacoes]
+
+    removidas = []
+    with transaction.atomic(using=banco), conexao.cursor() as cursor, _restricoes_imediatas(cursor):
+        for nome in nomes:
+            if _existe(cursor, nome):
+                cursor.execute(f'DROP TABLE {conexao.ops.quote_name(nome)}')
+                removidas.append(nome)
+    if removidas:
+        logger.info("Partições de extrato removidas: %s", ', '.join(removidas))
+    return removidas
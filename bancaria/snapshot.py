@@ -0,0 +1,236 @@
+"""Snapshot colunar (Parquet) dos lançamentos bancários de cada caso.
+
+As análises em pandas (relatório bancário, calendário, vínculos selecionados,
+detalhes da pessoa) leem os lançamentos do caso de um arquivo Parquet em
+settings.SNAPSHOTS_ROOT, apenas com as colunas de que precisam, em vez de
+montar o DataFrame a partir do ORM a cada requisição. Nomes, documentos e
+demais textos repetitivos ficam com dictionary encoding no arquivo, e os
+textos são lidos como strings do Arrow (pd.StringDtype('pyarrow')).
+
+O snapshot é gravado pelo worker de importações (ImportJob do tipo 'snapshot'),
+enfileirado pelas importações de cooperação e pelas exclusões; a leitura nunca
+grava. Cada arquivo guarda a assinatura dos contadores das cooperações do caso
+(app.contadores) no momento da gravação. Enquanto o worker não refaz um
+snapshot desatualizado, as análises recebem o último gravado; um caso ainda
+sem snapshot é lido direto do banco. O comando gravar_snapshots grava os
+snapshots de casos importados antes dele ou cujo job falhou.
+"""
+import hashlib
+import logging
+import os
+import uuid
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from django.conf import settings
+
+from app.models import Caso, Contador, ImportJob
+from .models import ExtratoDetalhado
+
+logger = logging.getLogger(__name__)
+
+# Lançamentos lidos do banco por bloco ao gravar o snapshot
+TAMANHO_BLOCO = 100000
+
+CAMPOS_TEXTO = [
+    'banco', 'numero_agencia', 'numero_conta', 'tipo', 'nome_titular', 'cpf_cnpj_titular',
+    'descricao_lancamento', 'cnab', 'numero_documento', 'numero_documento_transacao', 'local_transacao',
+    'natureza_lancamento', 'natureza_saldo', 'cpf_cnpj_od', 'nome_pessoa_od', 'tipo_pessoa_od',
+    'numero_banco_od', 'numero_agencia_od', 'numero_conta_od', 'observacao', 'nome_endossante_cheque',
+    'doc_endossante_cheque',
+]
+
+# Colunas de texto com poucos valores distintos, gravadas com dictionary encoding
+CAMPOS_DICIONARIO = [
+    'banco', 'numero_agencia', 'numero_conta', 'tipo', 'nome_titular', 'cpf_cnpj_titular',
+    'descricao_lancamento', 'natureza_lancamento', 'natureza_saldo', 'cpf_cnpj_od', 'nome_pessoa_od',
+    'tipo_pessoa_od', 'numero_banco_od', 'numero_agencia_od', 'numero_conta_od',
+]
+
+CAMPOS = ['id', 'cooperacao_id', 'arquivo_id', *CAMPOS_TEXTO, 'data_lancamento', 'valor_transacao', 'valor_saldo']
+
+ESQUEMA = pa.schema(
+    [('id', pa.int64()), ('cooperacao_id', pa.int32()), ('arquivo_id', pa.int32())]
+    + [(campo, pa.string()) for campo in CAMPOS_TEXTO]
+    + [('data_lancamento', pa.date32()), ('valor_transacao', pa.float64()), ('valor_saldo', pa.float64())]
+)
+
+
+#########################################################################################################################
+# GRAVAÇÃO
+#########################################################################################################################
+def _caminho(caso_id):
+    return os.path.join(settings.SNAPSHOTS_ROOT, 'extratos', f'caso_{int(caso_id)}.parquet')
+
+
+def _assinatura(caso_id):
+    """Resumo dos contadores das cooperações do caso; muda a cada gravação ou exclusão de lançamentos."""
+    contadores = Contador.objects.filter(caso_id=caso_id, escopo='cooperacao').order_by('escopo_id').values_list(
+        'escopo_id', 'extratos', 'atualizado_em')
+    texto = ';'.join(f'{cooperacao_id}:{extratos}:{atualizado_em.isoformat()}'
+                     for cooperacao_id, extratos, atualizado_em in contadores)
+    return hashlib.sha256(texto.encode()).hexdigest()
+
+
+def gravar_snapshot(caso_id):
+    """Grava o snapshot Parquet dos lançamentos do caso, lendo o banco em blocos.
+
+    O arquivo é gravado com outro nome e renomeado ao final, então os leitores
+    nunca veem um snapshot pela metade.
+
+    Args:
+        caso_id (int): Id do caso.
+
+    Returns:
+        str: Caminho do snapshot.
+    """
+    caminho = _caminho(caso_id)
+    os.makedirs(os.path.dirname(caminho), exist_ok=True)
+    temporario = f'{caminho}.{uuid.uuid4().hex}.tmp'
+    esquema = ESQUEMA.with_metadata({'assinatura': _assinatura(caso_id)})
+
+    linhas = ExtratoDetalhado.objects.filter(caso_id=caso_id).order_by('id').values_list(*CAMPOS).iterator(
+        chunk_size=TAMANHO_BLOCO)
+    try:
+        with pq.ParquetWriter(temporario, esquema, compression='zstd', use_dictionary=CAMPOS_DICIONARIO) as arquivo:
+            bloco = []
+            for linha in linhas:
+                bloco.append(linha)
+                if len(bloco) == TAMANHO_BLOCO:
+                    arquivo.write_table(_tabela(bloco, esquema))
+                    bloco = []
+            arquivo.write_table(_tabela(bloco, esquema))
+        os.replace(temporario, caminho)
+    finally:
+        if os.path.exists(temporario):
+            os.remove(temporario)
+
+    logger.info("Snapshot dos lançamentos do caso %s gravado em %s", caso_id, caminho)
+    return caminho
+
+
+def _tabela(linhas, esquema):
+    """Converte as tuplas do values_list em uma tabela do Arrow (coluna a coluna)."""
+    colunas = list(zip(*linhas)) if linhas else [[] for _ in CAMPOS]
+    return pa.Table.from_arrays(
+        [pa.array(valores, type=esquema.field(campo).type) for campo, valores in zip(CAMPOS, colunas)],
+        schema=esquema)
+
+
+def gravar_snapshots(casos=None):
+    """Grava agora os snapshots dos casos com lançamentos (comando gravar_snapshots).
+
+    Args:
+        casos (Optional[list[int]]): Ids dos casos; por padrão, todos os casos com lançamentos.
+
+    Returns:
+        int: Quantidade de snapshots gravados.
+    """
+    if casos is None:
+        casos = ExtratoDetalhado.objects.order_by('caso_id').values_list('caso_id', flat=True).distinct()
+    total = 0
+    for caso_id in casos:
+        gravar_snapshot(caso_id)
+        total += 1
+    return total
+
+
+def enfileirar_snapshot(caso_id):
+    """Cria o ImportJob que refaz o snapshot do caso no worker de importações.
+
+    Chamado na mesma transação da gravação ou da exclusão dos lançamentos, então o
+    worker só vê o job depois do commit.
+
+    Args:
+        caso_id (int): Id do caso.
+
+    Returns:
+        ImportJob: Job pendente (ou o já pendente para o mesmo caso).
+    """
+    job, _ = ImportJob.objects.get_or_create(
+        caso_id=caso_id,
+        tipo='snapshot',
+        external_id=caso_id,
+        status='pendente',
+        defaults={'created_by_id': Caso.objects.filter(id=caso_id).values_list('created_by_id', flat=True).get()},
+    )
+    return job
+
+
+def processar_snapshot(job, progresso):
+    """Processa um ImportJob do tipo 'snapshot' (executado pelo worker de importações).
+
+    Args:
+        job (ImportJob): Job com o id do caso em external_id.
+        progresso (ProgressoJob): Acumulador do andamento (não usado: a gravação é uma etapa só).
+
+    Returns:
+        str: Resumo da gravação.
+    """
+    return f'Snapshot gravado em {gravar_snapshot(job.external_id)}.'
+
+
+def invalidar_snapshot(caso_id):
+    """Apaga o snapshot do caso (usado na exclusão do caso)."""
+    try:
+        os.remove(_caminho(caso_id))
+    except FileNotFoundError:
+        pass
+
+
+#########################################################################################################################
+# LEITURA
+#########################################################################################################################
+def _snapshot_atual(caso_id):
+    """Caminho do último snapshot gravado do caso, ou None se ainda não houver um.
+
+    Um snapshot desatualizado continua sendo usado até o worker gravar o novo.
+    """
+    caminho = _caminho(caso_id)
+    if not os.path.exists(caminho):
+        return None
+    metadados = pq.read_schema(caminho).metadata or {}
+    if metadados.get(b'assinatura', b'').decode() != _assinatura(caso_id):
+        logger.info("Snapshot dos lançamentos do caso %s desatualizado; usado até o worker gravar o novo", caso_id)
+    return caminho
+
+
+def _filtros_parquet(filtros):
+    return [(campo, 'in', list(valor)) if isinstance(valor, (list, tuple, set)) else (campo, '=', valor)
+            for campo, valor in filtros.items()]
+
+
+def _tabela_do_banco(caso_id, colunas, filtros):
+    """Lançamentos do caso lidos do banco, na tabela do Arrow que o snapshot devolveria (caso sem snapshot)."""
+    filtros = {f'{campo}__in' if isinstance(valor, (list, tuple, set)) else campo: valor
+               for campo, valor in filtros.items()}
+    linhas = ExtratoDetalhado.objects.filter(caso_id=caso_id, **filtros).order_by('id').values_list(*colunas)
+    valores = list(zip(*linhas)) or [[] for _ in colunas]
+    return pa.Table.from_arrays([pa.array(coluna, type=ESQUEMA.field(campo).type)
+                                 for campo, coluna in zip(colunas, valores)], names=list(colunas))
+
+
+def carregar_extratos(caso_id, colunas, filtros=None):
+    """Lançamentos do caso em um DataFrame, só com as colunas pedidas.
+
+    As colunas vêm na ordem pedida, os lançamentos em ordem de id, os textos
+    como strings do Arrow e data_lancamento como datetime64.
+
+    Args:
+        caso_id (int): Id do caso.
+        colunas (list[str]): Campos de ExtratoDetalhado (ver CAMPOS).
+        filtros (Optional[dict]): {campo: valor} ou {campo: lista de valores}, combinados com E.
+
+    Returns:
+        pd.DataFrame: Lançamentos do caso.
+    """
+    caminho = _snapshot_atual(caso_id)
+    if caminho is None:
+        tabela = _tabela_do_banco(caso_id, colunas, filtros or {})
+    else:
+        tabela = pq.read_table(caminho, columns=list(colunas), filters=_filtros_parquet(filtros or {}) or None)
+    df = tabela.to_pandas(types_mapper={pa.string(): pd.StringDtype('pyarrow')}.get, date_as_object=False)
+    if 'data_lancamento' in df.columns:
+        df['data_lancamento'] = pd.to_datetime(df['data_lancamento'])
+    return df
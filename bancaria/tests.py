@@ -1,3 +1,406 @@
-from django.test import TestCase
+import os
+import tempfile
+import zipfile
+from datetime import date, timedelta
+from unittest import mock, skipUnless
 
-# Create your tests here.
+import pandas as pd
+from django.contrib.auth import get_user_model
+from django.db import IntegrityError, connection, transaction
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from app.contadores import atualizar_contadores
+from app.dados_sinteticos import gerar_simba
+from app.importacoes import executar_job, reservar_proximo_job
+from app.models import Arquivo, Caso, ImportJob
+from utils.planos_consulta import PlanoConsultaMixin, atualizar_estatisticas
+from .importacao import (CAMPOS_GRAVADOS, _csv_copy, _gravar_bulk_create, _gravar_copy, _normalizar_bloco,
+                         carregador_extrato, gravar_extrato, ler_arquivo_simba)
+from .models import Cooperacao, ExtratoDetalhado
+from .particionamento import (TABELA, criar_particoes, desparticionar_tabela, particionada, particionar_tabela,
+                              remover_particoes)
+from .snapshot import _caminho, carregar_extratos, gravar_snapshot, pq
+
+
+class GravacaoExtratoTests(TestCase):
+    """Gravação dos lançamentos: COPY no PostgreSQL e bulk_create no SQLite."""
+
+    @classmethod
+    def setUpTestData(cls):
+        usuario = get_user_model().objects.create(
+            cpf=52998224725, username='teste', email='teste@mpce.mp.br', nome_completo='Usuário de Teste')
+        cls.caso = Caso.objects.create(nome='Caso', numero='1', resumo='', created_by=usuario)
+        cls.cooperacao = Cooperacao.objects.create(caso=cls.caso, numero='001', inquerito='', processo='')
+
+    def _bloco(self, quantidade=3):
+        """Bloco no formato produzido por ler_arquivo_simba, com textos que exigem escape no CSV."""
+        linhas = []
+        for i in range(quantidade):
+            linha = {campo: '' for campo in CAMPOS_GRAVADOS}
+            linha.update({
+                'banco': '001',
+                'numero_agencia': '0042',
+                'numero_conta': f'{i:06d}',
+                'nome_titular': 'Titular "Principal"; Ltda',
+                'cpf_cnpj_titular': '09416278530',
+                'descricao_lancamento': 'PIX\nlinha 2 com \\ barra',
+                'natureza_lancamento': 'C',
+                'natureza_saldo': 'C',
+                'data_lancamento': date(2024, 1, 21),
+                'valor_transacao': 1234.56 + i,
+                'valor_saldo': -0.5,
+            })
+            linhas.append(linha)
+        return pd.DataFrame(linhas)
+
+    def _gravar(self, quantidade=3):
+        progresso = mock.Mock()
+        arquivo, gravados, rejeitados = gravar_extrato(
+            [(self._bloco(quantidade), [{'linha': 9, 'motivo': 'Data do lançamento inválida'}])],
+            self.cooperacao, self.caso, 'extrato.csv', 'hash', progresso=progresso)
+        return arquivo, gravados, rejeitados, progresso
+
+    def test_grava_lancamentos_no_banco_em_uso(self):
+        arquivo, gravados, rejeitados, progresso = self._gravar()
+
+        self.assertEqual(gravados, 3)
+        self.assertEqual(arquivo.registros, 3)
+        self.assertEqual(rejeitados, [{'linha': 9, 'motivo': 'Data do lançamento inválida'}])
+        self.assertEqual(sum(chamada.args[0] for chamada in progresso.call_args_list), 3)
+
+        lancamentos = ExtratoDetalhado.objects.filter(arquivo=arquivo).order_by('numero_conta')
+        self.assertEqual(lancamentos.count(), 3)
+        primeiro = lancamentos[0]
+        self.assertEqual(primeiro.cooperacao_id, self.cooperacao.id)
+        self.assertEqual(primeiro.caso_id, self.caso.id)
+        self.assertEqual(primeiro.numero_agencia, '0042')
+        self.assertEqual(primeiro.numero_conta, '000000')
+        self.assertEqual(primeiro.cpf_cnpj_titular, '09416278530')
+        self.assertEqual(primeiro.nome_titular, 'Titular "Principal"; Ltda')
+        self.assertEqual(primeiro.descricao_lancamento, 'PIX\nlinha 2 com \\ barra')
+        self.assertEqual(primeiro.cnab, '')
+        self.assertEqual(primeiro.data_lancamento, date(2024, 1, 21))
+        self.assertAlmostEqual(primeiro.valor_transacao, 1234.56)
+        self.assertAlmostEqual(primeiro.valor_saldo, -0.5)
+
+    def test_carregador_escolhido_pelo_banco(self):
+        with mock.patch.object(connection, 'vendor', 'postgresql'):
+            self.assertIs(carregador_extrato('default'), _gravar_copy)
+        with mock.patch.object(connection, 'vendor', 'sqlite'):
+            self.assertIs(carregador_extrato('default'), _gravar_bulk_create)
+
+    def _inserts_extrato(self, consultas):
+        tabela = ExtratoDetalhado._meta.db_table
+        return [c['sql'] for c in consultas.captured_queries if c['sql'].startswith('INSERT') and tabela in c['sql']]
+
+    @skipUnless(connection.vendor == 'postgresql', 'COPY só está disponível no PostgreSQL')
+    def test_postgresql_grava_com_copy(self):
+        with CaptureQueriesContext(connection) as consultas:
+            self._gravar(quantidade=5)
+        # O COPY não passa pelo ORM: nenhum INSERT em ExtratoDetalhado
+        self.assertEqual(self._inserts_extrato(consultas), [])
+        self.assertEqual(ExtratoDetalhado.objects.count(), 5)
+
+    def test_csv_do_copy_distingue_nulo_de_vazio(self):
+        dados = pd.DataFrame({'texto': ['a,b', '', None], 'valor': [1.5, float('nan'), 2.0]})
+
+        self.assertEqual(_csv_copy(dados).getvalue().splitlines(), ['"a,b",1.5', ',\\N', '\\N,2.0'])
+
+    @skipUnless(connection.vendor == 'postgresql', 'COPY só está disponível no PostgreSQL')
+    def test_copy_com_campo_opcional_ausente(self):
+        # Arquivo sem as colunas da contraparte e sem observação: os campos opcionais ficam vazios
+        bloco = pd.DataFrame([{
+            'NUMERO_BANCO': '1', 'NUMERO_AGENCIA': '42', 'NUMERO_CONTA': '7', 'TIPO_CONTA': '1',
+            'NOME_TITULAR': 'Titular', 'CPF_CNPJ_TITULAR': '09416278530', 'DATA_LANCAMENTO': '2024-01-21',
+            'VALOR_TRANSACAO': '10,00', 'NATUREZA_LANCAMENTO': 'C', 'VALOR_SALDO': '', 'NATUREZA_SALDO': 'C',
+            'OBSERVACAO': None,
+        }], dtype=object)
+        df, rejeitados = _normalizar_bloco(bloco, 2)
+        self.assertEqual(rejeitados, [])
+
+        arquivo, gravados, _ = gravar_extrato([(df, [])], self.cooperacao, self.caso, 'extrato.csv', 'hash')
+
+        self.assertEqual(gravados, 1)
+        lancamento = ExtratoDetalhado.objects.get(arquivo=arquivo)
+        self.assertEqual((lancamento.numero_banco_od, lancamento.numero_conta_od, lancamento.observacao), ('', '', ''))
+        self.assertEqual(lancamento.valor_saldo, 0.0)
+
+    @skipUnless(connection.vendor == 'postgresql', 'COPY só está disponível no PostgreSQL')
+    def test_copy_grava_ausente_como_nulo(self):
+        bloco = self._bloco(quantidade=1)
+        bloco['valor_saldo'] = float('nan')
+
+        # NULL de verdade: a restrição NOT NULL rejeita o bloco em vez de gravar '' ou 0
+        with self.assertRaisesMessage(IntegrityError, 'valor_saldo'), transaction.atomic():
+            gravar_extrato([(bloco, [])], self.cooperacao, self.caso, 'extrato.csv', 'hash')
+
+    @skipUnless(connection.vendor == 'sqlite', 'Alternativa usada nos bancos sem COPY')
+    def test_sqlite_grava_com_bulk_create_em_lotes(self):
+        with mock.patch('bancaria.importacao.TAMANHO_LOTE', 2), CaptureQueriesContext(connection) as consultas:
+            self._gravar(quantidade=5)
+        self.assertEqual(len(self._inserts_extrato(consultas)), 3)
+        self.assertEqual(ExtratoDetalhado.objects.count(), 5)
+
+
+def _linhas_txt(linhas):
+    """Conteúdo de um arquivo em texto do BACEN: campos separados por tabulação."""
+    return ''.join('\t'.join(linha) + '\r\n' for linha in linhas).encode('utf-8')
+
+
+class LeituraZipSimbaTests(SimpleTestCase):
+    """O .zip do BACEN é lido em blocos, com as contrapartes buscadas no índice SQLite e os titulares em memória."""
+
+    CONTA_A = ['001', '0042', '12345', '1']
+    CONTA_B = ['237', '0100', '999', '2']
+
+    def setUp(self):
+        diretorio = tempfile.TemporaryDirectory()
+        self.addCleanup(diretorio.cleanup)
+        self.diretorio = diretorio.name
+
+    def _extrato(self):
+        return [
+            [str(chave), *conta, f'{chave:02d}012024', f'DOC{chave}', 'PIX', '101', str(chave * 1000 + 34), 'C',
+             '500000', 'C', 'FORTALEZA']
+            for chave, conta in zip(range(1, 6), [self.CONTA_A] * 3 + [self.CONTA_B] * 2)
+        ]
+
+    def _origem_destino(self, chave, cpf_cnpj, nome):
+        return ['0', str(chave), '100', '', '104', '0001', '777', '1', '1', cpf_cnpj, nome, '', '', '', '', '0', '',
+                f'E{chave}']
+
+    def _titular(self, conta, tipo, cpf_cnpj, nome):
+        return [*conta, tipo, '1', '1', cpf_cnpj, nome, 'RG', '', '', '', 'CE', 'BR', '', '', '', '', '', '']
+
+    def _zip(self, sem=()):
+        membros = {
+            '_EXTRATO.txt': self._extrato(),
+            # Fora da ordem do extrato: as contrapartes de um bloco podem estar em qualquer parte do arquivo
+            '_ORIGEM_DESTINO.txt': [self._origem_destino(5, '11144477735', 'JOAO'),
+                                    self._origem_destino(1, '52998224725', 'MARIA'),
+                                    self._origem_destino(3, '12345678000195', 'EMPRESA')],
+            '_TITULARES.txt': [
+                self._titular(self.CONTA_A, 'R', '39053344705', 'PROCURADOR'),
+                self._titular(self.CONTA_A, 'T', '09416278530', 'TITULAR A'),
+                self._titular(self.CONTA_A, 'T', '86288366757', 'COTITULAR A'),
+                # Agência sem os zeros à esquerda do EXTRATO
+                self._titular(['237', '100', '999', '2'], 'T', '11222333000181', 'TITULAR B'),
+            ],
+        }
+        caminho = os.path.join(self.diretorio, 'simba.zip')
+        with zipfile.ZipFile(caminho, 'w') as zip_ref:
+            for sufixo, linhas in membros.items():
+                if sufixo not in sem:
+                    zip_ref.writestr(f'0000000-00.2025.8.06.0001{sufixo}', _linhas_txt(linhas))
+        return caminho
+
+    def test_cruzamento_em_blocos(self):
+        with self.assertLogs('bancaria.importacao', 'WARNING') as log:
+            blocos = list(ler_arquivo_simba(self._zip(), tamanho_bloco=2))
+
+        self.assertEqual([len(df) for df, _ in blocos], [2, 2, 1])
+        self.assertEqual([rejeitados for _, rejeitados in blocos], [[], [], []])
+        df = pd.concat([df for df, _ in blocos], ignore_index=True)
+        self.assertEqual(df['numero_documento'].tolist(), [f'DOC{chave}' for chave in range(1, 6)])
+        self.assertEqual(df['cpf_cnpj_od'].tolist(), ['52998224725', '', '12345678000195', '', '11144477735'])
+        self.assertEqual(df['tipo_pessoa_od'].tolist(), ['PF', '', 'PF', '', 'PF'])
+        self.assertEqual(df['nome_titular'].tolist(), ['TITULAR A'] * 3 + ['TITULAR B'] * 2)
+        self.assertEqual(df['valor_transacao'].tolist(), [10.34, 20.34, 30.34, 40.34, 50.34])
+        self.assertEqual(df['data_lancamento'].tolist(), [date(2024, 1, dia) for dia in range(1, 6)])
+
+        # Cotitulares descartados ficam no log
+        self.assertIn('2 titulares de 1 contas conjuntas', log.output[0])
+        self.assertIn('1/42/12345: 2', log.output[0])
+        # A área temporária da leitura é removida ao final
+        self.assertEqual(os.listdir(self.diretorio), ['simba.zip'])
+
+    def test_arquivos_obrigatorios(self):
+        with self.assertRaisesMessage(ValueError, 'EXTRATO, ORIGEM_DESTINO e TITULARES'):
+            list(ler_arquivo_simba(self._zip(sem=['_ORIGEM_DESTINO.txt'])))
+
+
+class IndicesExtratoTests(PlanoConsultaMixin, TestCase):
+    """As consultas do extrato por caso + CPF/CNPJ ou data usam os índices compostos, mesmo em um caso grande."""
+
+    LANCAMENTOS = 6000
+
+    @classmethod
+    def setUpTestData(cls):
+        usuario = get_user_model().objects.create(
+            cpf=52998224725, username='teste', email='teste@mpce.mp.br', nome_completo='Usuário de Teste')
+        cls.caso = Caso.objects.create(nome='Caso grande', numero='1', resumo='', created_by=usuario)
+        cooperacao = Cooperacao.objects.create(caso=cls.caso, numero='001', inquerito='', processo='')
+        arquivo = Arquivo.objects.create(caso=cls.caso, external_id=cooperacao.id, tipo='cooperacao_bancaria',
+                                         nome='extrato.zip', hash='hash', registros=cls.LANCAMENTOS)
+        ExtratoDetalhado.objects.bulk_create([
+            ExtratoDetalhado(cooperacao=cooperacao, caso=cls.caso, arquivo=arquivo,
+                             cpf_cnpj_titular=f'{i % 300:011d}', cpf_cnpj_od=f'{i % 1500:014d}',
+                             data_lancamento=date(2024, 1, 1) + timedelta(days=i % 700),
+                             valor_transacao=i, valor_saldo=0, natureza_lancamento='C')
+            for i in range(cls.LANCAMENTOS)
+        ], batch_size=1000)
+        atualizar_estatisticas(ExtratoDetalhado)
+
+    def test_lancamentos_do_titular(self):
+        self.assertUsaIndice(ExtratoDetalhado.objects.filter(caso=self.caso, cpf_cnpj_titular='00000000042'),
+                             'extrato_caso_titular')
+
+    def test_lancamentos_da_contraparte(self):
+        self.assertUsaIndice(ExtratoDetalhado.objects.filter(caso=self.caso, cpf_cnpj_od='00000000000042'),
+                             'extrato_caso_od')
+
+    def test_lancamentos_do_dia(self):
+        self.assertUsaIndice(ExtratoDetalhado.objects.filter(caso=self.caso, data_lancamento=date(2024, 3, 1)),
+                             'extrato_caso_data')
+
+
+@skipUnless(connection.vendor == 'postgresql', 'Particionamento só está disponível no PostgreSQL')
+class ParticionamentoExtratoTests(TestCase):
+    """Com a tabela particionada, cada cooperação grava na própria partição e é excluída com um DROP."""
+
+    def setUp(self):
+        usuario = get_user_model().objects.create(
+            cpf=52998224725, username='teste', email='teste@mpce.mp.br', nome_completo='Usuário de Teste')
+        self.casos = [Caso.objects.create(nome=f'Caso {i}', numero=str(i), resumo='', created_by=usuario)
+                      for i in (1, 2)]
+        self.cooperacoes = [Cooperacao.objects.create(caso=caso, numero='001', inquerito='', processo='')
+                            for caso in self.casos]
+        # Lançamentos gravados antes da conversão vão para as partições criadas por ela
+        self._gravar(self.cooperacoes[0], 4)
+
+    def _gravar(self, cooperacao, quantidade):
+        linhas = [{**{campo: '' for campo in CAMPOS_GRAVADOS}, 'data_lancamento': date(2024, 1, 1),
+                   'valor_transacao': float(i), 'valor_saldo': 0.0, 'natureza_saldo': 'C'}
+                  for i in range(quantidade)]
+        gravar_extrato([(pd.DataFrame(linhas), [])], cooperacao, cooperacao.caso, 'extrato.csv', 'hash')
+
+    def _particoes_com_lancamentos(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT DISTINCT tableoid::regclass::text FROM {TABELA}')
+            return {linha[0] for linha in cursor.fetchall()}
+
+    def test_conversao_gravacao_e_exclusao(self):
+        self.assertTrue(particionar_tabela())
+        self.assertTrue(particionada())
+        self.assertFalse(particionar_tabela())
+
+        # Cooperação sem partição: criada na importação
+        self._gravar(self.cooperacoes[1], 3)
+        self.assertEqual(self._particoes_com_lancamentos(),
+                         {f'{TABELA}_coop_{cooperacao.id}' for cooperacao in self.cooperacoes})
+        self.assertEqual(ExtratoDetalhado.objects.filter(caso=self.casos[0]).count(), 4)
+
+        # A consulta do caso lê só a partição dele
+        plano = ExtratoDetalhado.objects.filter(caso=self.casos[1]).explain()
+        self.assertIn(f'{TABELA}_coop_{self.cooperacoes[1].id}', plano)
+        self.assertNotIn(f'{TABELA}_coop_{self.cooperacoes[0].id}', plano)
+
+        self.assertEqual(remover_particoes(cooperacoes=[self.cooperacoes[0].id]),
+                         [f'{TABELA}_coop_{self.cooperacoes[0].id}'])
+        self.cooperacoes[0].delete()
+        self.assertEqual(ExtratoDetalhado.objects.count(), 3)
+
+        self.assertTrue(desparticionar_tabela())
+        self.assertFalse(particionada())
+        self.assertEqual(ExtratoDetalhado.objects.count(), 3)
+        self._gravar(self.cooperacoes[1], 2)
+        self.assertEqual(ExtratoDetalhado.objects.count(), 5)
+
+    def test_lancamentos_da_particao_padrao_sao_movidos(self):
+        particionar_tabela()
+        # Gravados sem passar por gravar_extrato: caem na partição padrão
+        with connection.cursor() as cursor:
+            cursor.execute(f'DROP TABLE {TABELA}_caso_{self.casos[0].id}')
+        ExtratoDetalhado.objects.bulk_create([
+            ExtratoDetalhado(cooperacao=self.cooperacoes[0], caso=self.casos[0], arquivo=Arquivo.objects.first(),
+                             data_lancamento=date(2024, 1, 1), valor_transacao=1, valor_saldo=0)
+        ])
+        self.assertEqual(self._particoes_com_lancamentos(), {f'{TABELA}_padrao'})
+
+        criar_particoes(self.casos[0].id, self.cooperacoes[0].id)
+        self.assertEqual(self._particoes_com_lancamentos(), {f'{TABELA}_coop_{self.cooperacoes[0].id}'})
+
+
+class SnapshotExtratoTests(TestCase):
+    """As análises leem os lançamentos do snapshot Parquet do caso, gravado pelo worker (a leitura nunca grava)."""
+
+    COLUNAS = ['cooperacao_id', 'data_lancamento', 'nome_titular', 'cpf_cnpj_titular', 'valor_transacao',
+               'natureza_lancamento']
+
+    @classmethod
+    def setUpTestData(cls):
+        usuario = get_user_model().objects.create(
+            cpf=52998224725, username='teste', email='teste@mpce.mp.br', nome_completo='Usuário de Teste')
+        cls.caso = Caso.objects.create(nome='Caso', numero='1', resumo='', created_by=usuario)
+        cls.cooperacao = Cooperacao.objects.create(caso=cls.caso, numero='001', inquerito='', processo='')
+        with tempfile.TemporaryDirectory() as diretorio:
+            caminho = os.path.join(diretorio, 'simba.zip')
+            gerar_simba(caminho, 120, contas=3, semente=2)
+            gravar_extrato(ler_arquivo_simba(caminho), cls.cooperacao, cls.caso, 'simba.zip', 'hash')
+
+    def setUp(self):
+        diretorio = tempfile.TemporaryDirectory()
+        self.addCleanup(diretorio.cleanup)
+        configuracao = override_settings(SNAPSHOTS_ROOT=diretorio.name)
+        configuracao.enable()
+        self.addCleanup(configuracao.disable)
+
+    def _esperado(self, **filtros):
+        registros = ExtratoDetalhado.objects.filter(caso=self.caso, **filtros).order_by('id')
+        return list(registros.values_list(*self.COLUNAS))
+
+    def _lidos(self, df):
+        df = df.astype(object)
+        df['data_lancamento'] = [data.date() for data in df['data_lancamento']]
+        return [tuple(linha) for linha in df.itertuples(index=False)]
+
+    def test_filtros(self):
+        titular = ExtratoDetalhado.objects.filter(caso=self.caso).values_list('cpf_cnpj_titular', flat=True).first()
+        filtros = [{'cpf_cnpj_titular': [titular]}, {'cpf_cnpj_titular': titular, 'natureza_lancamento': 'C'}]
+
+        # Iguais lidos do banco (caso ainda sem snapshot) e do snapshot
+        sem_snapshot = [carregar_extratos(self.caso.id, self.COLUNAS, filtros=filtro) for filtro in filtros]
+        gravar_snapshot(self.caso.id)
+        com_snapshot = [carregar_extratos(self.caso.id, self.COLUNAS, filtros=filtro) for filtro in filtros]
+
+        for df in sem_snapshot + com_snapshot:
+            self.assertEqual(list(df.columns), self.COLUNAS)
+        for df_banco, df_snapshot in zip(sem_snapshot, com_snapshot):
+            pd.testing.assert_frame_equal(df_banco, df_snapshot)
+        self.assertEqual(self._lidos(com_snapshot[0]), self._esperado(cpf_cnpj_titular=titular))
+        self.assertEqual(self._lidos(com_snapshot[1]),
+                         self._esperado(cpf_cnpj_titular=titular, natureza_lancamento='C'))
+
+    def test_snapshot_gravado_pelo_worker(self):
+        # Sem snapshot, a leitura vem do banco e não grava o arquivo
+        df = carregar_extratos(self.caso.id, self.COLUNAS)
+        self.assertEqual(self._lidos(df), self._esperado())
+        self.assertEqual(str(df['nome_titular'].dtype), 'string')
+        self.assertFalse(os.path.exists(_caminho(self.caso.id)))
+
+        # A importação enfileirou o job que grava o snapshot
+        job = reservar_proximo_job()
+        self.assertEqual((job.tipo, job.external_id), ('snapshot', self.caso.id))
+        executar_job(job)
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'concluido', job.mensagem)
+        self.assertEqual(pq.read_table(_caminho(self.caso.id), columns=['id']).num_rows, 120)
+        self.assertEqual(self._lidos(carregar_extratos(self.caso.id, self.COLUNAS)), self._esperado())
+
+    def test_snapshot_desatualizado_usado_ate_o_worker_gravar(self):
+        gravar_snapshot(self.caso.id)
+        debitos = ExtratoDetalhado.objects.filter(caso=self.caso, natureza_lancamento='D').count()
+
+        # Contadores alterados (nova importação ou exclusão): a leitura segue com o último snapshot, sem gravar
+        ExtratoDetalhado.objects.filter(caso=self.caso, natureza_lancamento='D').delete()
+        atualizar_contadores(self.caso.id, cooperacoes=[self.cooperacao.id])
+        with mock.patch('bancaria.snapshot.gravar_snapshot') as gravar:
+            df = carregar_extratos(self.caso.id, ['natureza_lancamento'], filtros={'natureza_lancamento': 'D'})
+        gravar.assert_not_called()
+        self.assertEqual(len(df), debitos)
+
+        ImportJob.objects.filter(tipo='snapshot').delete()
+        executar_job(ImportJob.objects.create(caso=self.caso, tipo='snapshot', external_id=self.caso.id,
+                                              created_by=self.caso.created_by))
+        self.assertEqual(self._lidos(carregar_extratos(self.caso.id, self.COLUNAS)), self._esperado())
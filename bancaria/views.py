@@ -33,6 +33,13 @@ from django.http import JsonResponse
 from datetime import datetime
 import json
 from app.utils import _buscar_caso_ativo
+from app.importacoes import enfileirar_importacao
+from app.contadores import atualizar_contadores, contadores_do_caso
+from .snapshot import carregar_extratos
+from utils.replica import usar_replica
+from app.exclusoes import (LIMITE_EXCLUSAO_IMEDIATA, enfileirar_exclusao, excluir_arquivo, excluir_cooperacao,
+                           registros_a_excluir)
+from django.urls import reverse
 import zipfile
 from django.conf import settings
 
@@ -52,9 +59,10 @@ def index(request):
     # Obtém todas as cooperações bancárias
     cooperacoes = Cooperacao.objects.filter(caso=caso).select_related('caso').all().order_by('-created_at')
     
+    contadores = contadores_do_caso(caso.id)['cooperacao'] if caso else {}
     for i, cooperacao in enumerate(cooperacoes):
-        cooperacoes[i].arquivos = Arquivo.objects.filter(external_id=cooperacao.id, tipo='cooperacao_bancaria').count()
-        cooperacoes[i].titulares = ExtratoDetalhado.objects.filter(cooperacao=cooperacao).values('cpf_cnpj_titular').distinct().count()
+        cooperacoes[i].arquivos = contadores[cooperacao.id].arquivos
+        cooperacoes[i].titulares = contadores[cooperacao.id].titulares
     
     if request.method == 'POST':
         try:
@@ -75,6 +83,7 @@ def index(request):
                 inquerito=inquerito,
                 processo=processo
             )
+            atualizar_contadores(caso.id, cooperacoes=[cooperacao.id])
             
             return redirect('bancaria:index')
         except Exception as e:
@@ -94,7 +103,18 @@ def index(request):
 @require_http_methods(["DELETE"])
 def delete_cooperacao(request, id):
     cooperacao = get_object_or_404(Cooperacao, id=id)
-    cooperacao.delete()
+
+    # Cooperações grandes são excluídas pelo worker, sem prender a requisição
+    if registros_a_excluir('cooperacao', cooperacao) > LIMITE_EXCLUSAO_IMEDIATA:
+        job = enfileirar_exclusao(request.user, 'cooperacao', cooperacao)
+        return JsonResponse({
+            'message': 'A exclusão da cooperação será processada em segundo plano.',
+            'job_id': job.id,
+            'status_url': reverse('importacao_status', args=[job.id])
+        })
+
+    # Os lançamentos saem com a partição ou com DELETEs em lote, sem carregá-los na memória
+    excluir_cooperacao(cooperacao)
     return JsonResponse({'message': 'Cooperação excluída com sucesso'})
 
 #########################################################################################################################
@@ -103,543 +123,34 @@ def delete_cooperacao(request, id):
 @login_required
 @require_http_methods(["POST"])
 def importar_arquivos(request):
-    try:
-        if 'arquivo' not in request.FILES:
-            return JsonResponse({'error': 'Nenhum arquivo recebido'}, status=400)
-
-        arquivo = request.FILES['arquivo']
-        print("[DEBUG] Arquivo recebido:", arquivo.name)
-        
-        cooperacao_id = request.POST.get('cooperacao')
-        cooperacao = Cooperacao.objects.get(id=cooperacao_id)
-        
-        # Verifica se é um arquivo de extrato detalhado
-        if not arquivo.name.lower().find('extratodetalhado') > -1:
-            print("[DEBUG] Arquivo não é um extrato detalhado", arquivo.name)
-            
-            # Testa se o arquivo é um arquivo .zip
-            if not arquivo.name.lower().endswith('.zip'):
-                return JsonResponse({'error': 'Arquivo não é um arquivo .zip'}, status=400)
-
-        # Obtém o caso ativo
-        caso = _buscar_caso_ativo(request)
-        if not caso:
-            return JsonResponse({'error': 'Nenhum caso ativo encontrado'}, status=400)
-
-        # DESCOMPACTA O ARQUIVO .ZIP E PROCURA OS ARQUIVOS _EXTRATO e _ORIGEM_DESTINO.txt
-        if arquivo.name.lower().endswith('.zip'):
-            with zipfile.ZipFile(arquivo, 'r') as zip_ref:
-                # Extrair para a pasta de uploads de dados
-                zip_ref.extractall(os.path.join(settings.MEDIA_ROOT, 'uploads', 'dados'))
-                print("[DEBUG] Arquivo descompactado com sucesso")
-            
-                # Procura os arquivos que terminam com _EXTRATO e _ORIGEM_DESTINO.txt
-                arquivos = [f for f in zip_ref.namelist()]
-                if len(arquivos) < 5:
-                    return JsonResponse({'error': 'Arquivo .zip inválido.'}, status=400)
-        
-        # Salva o arquivo
-        file_hash = hashlib.sha256(arquivo.read()).hexdigest()
-        arquivo.seek(0)  # Reset file pointer after reading for hash
-
-        # Verifica se o arquivo já foi processado
-        if Arquivo.objects.filter(hash=file_hash, external_id=cooperacao.id, tipo='cooperacao_bancaria', caso=caso).exists():
-            return JsonResponse({'error': 'Este arquivo já foi processado anteriormente'}, status=400)
-
-        # Processa o arquivo com pandas
-        if arquivo.name.endswith('.csv'):
-            # Salva o arquivo temporariamente para processamento
-            import os
-            temp_path = os.path.join(settings.MEDIA_ROOT, 'uploads', 'dados', arquivo.name)
-            os.makedirs(os.path.dirname(temp_path), exist_ok=True)
-            
-            with open(temp_path, 'wb+') as destination:
-                for chunk in arquivo.chunks():
-                    destination.write(chunk)
-            
-            print(f"[DEBUG] Arquivo salvo temporariamente em: {temp_path}")
-            
-            # Testa os encodings possíveis com diferentes separadores
-            df = None
-            sep = ";"
-            
-            for encoding in ['utf-8-sig', 'utf-8', 'latin1', 'iso-8859-1', 'cp1252']:
-                try:
-                    # Tenta ler as primeiras linhas para detectar o formato
-                    df = pd.read_csv(temp_path, sep=sep, encoding=encoding)
-                    # Se chegou aqui, encontrou a combinação correta
-                    print(f"[DEBUG] Testando o enconding para leitura do arquivo {arquivo.name} - encoding: {encoding}, separador: {sep}")
-                    
-                    # Agora lê o arquivo completo com os parâmetros corretos
-                    df = pd.read_csv(temp_path, sep=sep, encoding=encoding)
-                    
-                    print(f"[DEBUG] ***** Formato confirmado: encoding: {encoding}, separador: {sep}")
-                    
-                    # DEBUG com a quantidade de linhas
-                    print("[DEBUG] Quantidade de linhas:", len(df))
-                    print(df.head(15))
-                    
-                    break
-                except Exception as e:
-                    print(f"[DEBUG] Tentativa falhou - encoding: {encoding}, sep: {sep}, erro: {e}")
-                    continue
-            
-            if df is None:
-                # Tenta uma abordagem primaria, lendo o arquivo com o separador ;, linha a linha, e depois monta o dataframe
-                print("[DEBUG] Tentando uma abordagem primaria, lendo o arquivo com o separador ;, linha a linha, e depois monta o dataframe")
-                
-                with open(arquivo.name, 'r') as file:
-                    for line in file:
-                        print(line)
-                        df.append(line.split(';'))
-                
-                df = pd.DataFrame(df)
-                df.columns = df.iloc[0]
-                df = df.iloc[1:]
-                
-                print("[DEBUG] Dataframe montado")
-                
-                print(df.head())
-                
-            if df is None:
-                messages.error(request, "Não foi possível ler o arquivo CSV com nenhuma combinação de encoding e separador")
-                return redirect('bancaria:index')
-            
-        elif arquivo.name.endswith('.xlsx'):
-            # Testa os encodings possíveis
-            for encoding in ['utf-8', 'latin1', 'iso-8859-1', 'cp1252']:
-                try:
-                    df = pd.read_excel(arquivo, encoding=encoding)
-                    break
-                except Exception as e:
-                    print("[DEBUG] Erro ao ler arquivo XLSX:", e)
-                    continue
-        
-        elif arquivo.name.endswith('.zip'):
-            # Cria um dataframe vazio
-            df = pd.DataFrame()
-            
-            print("[DEBUG] Processando os 5 arquivos do BACEN")
-            
-            def converter_data(data):
-                if pd.isna(data):
-                    return None
-                
-                data = str(data)
-                
-                # Remove o .0 se existir
-                if data.endswith('.0'):
-                    data = data[:-2]
-                
-                # Remove espaços em branco
-                data = data.strip()
-                
-                # Se a string estiver vazia após a limpeza
-                if not data:
-                    return None
-                    
-                try:
-                    return datetime.strptime(data, '%d%m%Y').strftime('%Y-%m-%d')
-                except ValueError:
-                    return None
-            
-            def formatar_moeda(valor):
-                valor = str(valor)
-
-                if not valor or len(valor) < 3:
-                    return valor
-                
-                if valor.find(',') != -1:
-                    return float(valor.replace(',', '.'))
-
-                valor = str(int(valor[0:-2])) + '.' + str(valor[-2:])
-                return valor
-            
-            # CRIA O DATAFRAME COM BASE NOS 5 ARQUIVOS
-            # Abre todos os arquivos que foram descompactados
-            for arquivo in arquivos:
-                print("[DEBUG] Arquivo:", arquivo)
-                
-                # Monta o caminho completo para o arquivo descompactado
-                caminho_arquivo = os.path.join(settings.MEDIA_ROOT, 'uploads', 'dados', arquivo)
-                
-                # Verifica se o arquivo existe
-                if not os.path.exists(caminho_arquivo):
-                    print(f"[DEBUG] Arquivo não encontrado: {caminho_arquivo}")
-                    continue
-                
-                print(f"[DEBUG] Processando arquivo: {caminho_arquivo}")
-                
-                df = pd.read_csv(caminho_arquivo, sep='\t', header=None, skip_blank_lines=True, on_bad_lines='skip')
-                print("[DEBUG] Arquivo lido com sucesso")
-                
-                # **********
-                # * AGENCIAS
-                # **********
-                if arquivo.endswith('AGENCIAS.txt'):
-                    print("[DEBUG] Processando arquivo AGENCIAS.txt")
-                    
-                    df_agencias = df
-                    df_agencias.columns = [
-                        'id', 'agencia', 'nome_agencia', 'endereco', 'cidade', 'uf', 
-                        'pais', 'cep', 'telefone', 'data_abertura', 'data_fechamento'
-                    ]
-                    df_agencias['banco'] = df['id']
-                    df_agencias['data_abertura'] = df['data_abertura'].apply(converter_data)
-                    df_agencias['data_fechamento'] = None
-                
-                # **********
-                # *   CONTAS
-                # **********
-                if arquivo.endswith('CONTAS.txt'):
-                    print("[DEBUG] Processando arquivo CONTAS.txt")
-                    
-                    df_contas = df
-                    df_contas.columns = [
-                        'banco', 'agencia', 'conta', 'tipo_conta', 'data_abertura',
-                        'data_encerramento', 'movimentacao'
-                    ]
-                    df_contas['data_abertura'] = df_contas['data_abertura'].apply(converter_data)
-                    df_contas['data_encerramento'] = df_contas['data_encerramento'].apply(converter_data)
-
-
-                # **********
-                # *  EXTRATO
-                # **********
-                if arquivo.endswith('EXTRATO.txt'):
-                    print("[DEBUG] Processando arquivo EXTRATO.txt")
-                    
-                    df_extratos = df
-                    df_extratos.columns  = [
-                        'chave_extrato', 'banco', 'agencia', 'conta',
-                        'tipo_conta', 'data_lancamento', 'documento', 'descricao', 'tipo',
-                        'valor', 'natureza', 'saldo', 'natureza_saldo', 'local_transacao'
-                    ]
-                    df_extratos['data_lancamento'] = df['data_lancamento'].apply(converter_data)
-                    df_extratos['valor'] = df['valor'].apply(formatar_moeda)                    
-
-                # **********
-                # *  ORIGEM_DESTINO
-                # **********
-                if arquivo.endswith('ORIGEM_DESTINO.txt'):
-                    print("[DEBUG] Processando arquivo ORIGEM_DESTINO.txt")
-                    
-                    df_origens_destinos = df
-                    df_origens_destinos.columns = [
-                        'codigo_chave', 'chave_extrato', 'valor', 'documento',
-                        'banco_destino', 'agencia_destino', 'conta_destino', 'tipo_conta',
-                        'tipo_pessoa', 'cpf_cnpj', 'nome_pessoa', 'documento_pessoa',
-                        'codigo_barras', 'endossante_cheque', 'documento_endossante', 'situacao_identificacao',
-                        'observacao', 'documento_transacao'
-                    ]
-                    df_origens_destinos['valor'] = df['valor'].apply(formatar_moeda)
-                    df_origens_destinos['tipo_pessoa'] = df['tipo_pessoa'].apply(lambda x: 'PF' if x == 1 else 'PJ' if x == 2 else None)
-
-
-                # ************
-                # *  TITULARES
-                # ************
-                if arquivo.endswith('TITULARES.txt'):
-                    print("[DEBUG] Processando arquivo TITULARES.txt")
-                    
-                    df_titulares = df
-                    df_titulares.columns = [
-                        'banco', 'agencia', 'conta', 'tipo_conta',
-                        'tipo_titular', 'pessoa_investigada', 'tipo_pessoa', 'cpf_cnpj',
-                        'nome', 'nome_documento', 'documento', 'endereco',
-                        'cidade', 'uf', 'pais', 'cep', 'telefone',
-                        'renda', 'data_renda', 'inicio_relacionamento', 'fim_relacionamento'
-                    ]
-                    df_titulares['cep'] = df['cep']
-                    df_titulares['renda'] = df['renda'].apply(formatar_moeda)
-                    df_titulares['data_renda'] = df['data_renda'].apply(converter_data)
-                    df_titulares['inicio_relacionamento'] = df['inicio_relacionamento'].apply(converter_data)
-                    df_titulares['fim_relacionamento'] = df['fim_relacionamento'].apply(converter_data)
-                    
-            
-            print("[DEBUG] Adicionando número do caso")
-            # Adiciona o número do caso ao DataFrame de extratos
-            df_extratos['numero_caso'] = caso.numero
-            
-            print("[DEBUG] Concatenando os dataframes")
-            df = pd.concat([df_agencias, df_contas, df_extratos, df_origens_destinos, df_titulares])
-            print("[DEBUG] Dataframes concatenados")
-            
-            # Primeiro, fazer o merge entre extratos e origens_destinos
-            df = pd.merge(
-                df_extratos,
-                df_origens_destinos,
-                how='left',
-                left_on='chave_extrato',
-                right_on='chave_extrato',
-                suffixes=('', '_od')  # Evita sufixos _x e _y
-            )
-
-            # Adicionar informações dos titulares
-            df = pd.merge(
-                df,
-                df_titulares,
-                how='left',
-                on=['banco', 'agencia', 'conta'],
-                suffixes=('', '_titular')  # Evita sufixos _x e _y
-            )
-
-            # Adicionar informações dos bancos
-            df = pd.merge(
-                df,
-                df_agencias[['id', 'nome_agencia']],  # Usando as colunas corretas
-                how='left',
-                left_on='banco',
-                right_on='id',
-                suffixes=('', '_agencia')  # Evita sufixos _x e _y
-            )
-
-            # Renomear colunas para o padrão desejado
-            df = df.rename(columns={
-                'nome_agencia': 'nome_banco',  # Ajustando o nome da coluna
-                'descricao': 'descricao_lancamento',
-                'documento': 'numero_documento',
-                'documento_transacao': 'observacao',
-                'banco_destino': 'numero_banco_od',
-                'agencia_destino': 'numero_agencia_od',
-                'conta_destino': 'numero_conta_od',
-                'nome_pessoa': 'nome_pessoa_od',
-                'cpf_cnpj_x': 'cpf_cnpj',
-                'cpf_cnpj_y': 'cpf_cnpj_od'
-            })
-
-            # Primeiro, vamos ver quais colunas temos disponíveis
-            print("[DEBUG] Colunas após merge:", df.columns.tolist())
+    """Recebe o arquivo da cooperação e enfileira a importação em segundo plano"""
+    if 'arquivo' not in request.FILES:
+        return JsonResponse({'success': False, 'error': 'Nenhum arquivo recebido'}, status=400)
 
-            print("[DEBUG] Colunas disponíveis:", df.columns.tolist())
-            
-            # Selecionar as colunas usando os nomes corretos
-            colunas = [
-                # Dados do Caso
-                'numero_caso',
-                
-                # Dados da Conta
-                'banco', 'nome_banco', 'agencia', 'conta', 'tipo_conta',
-                
-                # Dados do Titular
-                'nome', 'cpf_cnpj_titular',
-                
-                # Dados da Transação
-                'descricao_lancamento', 'data_lancamento', 'numero_documento',
-                'local_transacao', 'valor', 'natureza',
-                'saldo', 'natureza_saldo',
-                
-                # Dados de Origem/Destino
-                'cpf_cnpj', 'nome_pessoa_od', 'tipo_pessoa',
-                'numero_banco_od', 'numero_agencia_od', 'numero_conta_od',
-                'observacao', 'endossante_cheque', 'documento_endossante'
-            ]
+    arquivo = request.FILES['arquivo']
 
-            # Selecionar as colunas
-            df = df[colunas]
-
-            # Adicionar coluna CNAB vazia
-            df['cnab'] = ''
-            
-            # Renomear as colunas para o padrão desejado
-            df = df.rename(columns={
-                'banco': 'numero_banco',
-                'agencia': 'numero_agencia',
-                'conta': 'numero_conta',
-                'tipo_conta': 'tipo',
-                'nome': 'nome_titular',
-                'cpf_cnpj_titular': 'cpf_cnpj_titular',
-                'descricao_lancamento': 'descricao_lancamento',
-                'numero_documento': 'numero_documento',
-                'valor': 'valor_transacao',
-                'natureza': 'natureza_lancamento',
-                'saldo': 'valor_saldo',
-                'natureza_saldo': 'natureza_saldo',
-                'cpf_cnpj': 'cpf_cnpj_od',
-                'nome_pessoa_od': 'nome_pessoa_od',
-                'tipo_pessoa': 'tipo_pessoa_od',
-                'observacao': 'observacao',
-                'endossante_cheque': 'nome_endossante_cheque',
-                'documento_endossante': 'doc_endossante_cheque'
-            })
-            
-            # Adicionar coluna numero_documento_transacao vazia
-            df['numero_documento_transacao'] = ''
-            
-        else:
-            return JsonResponse({'error': 'Formato de arquivo não suportado'}, status=400)
+    # Aceita o Extrato Detalhado ou o .zip com os arquivos do BACEN
+    if arquivo.name.lower().find('extratodetalhado') == -1 and not arquivo.name.lower().endswith('.zip'):
+        return JsonResponse({'success': False, 'error': 'Arquivo não é um arquivo .zip'}, status=400)
 
-        print("[DEBUG] Arquivo lido com sucesso")
-        
-        print(df.head())
-
-        # Processa o DataFrame antes de salvar
-        # Remove colunas desnecessárias se existirem
-        colunas_remover = ['NUMERO_CASO', 'NOME_BANCO']
-        for coluna in colunas_remover:
-            if coluna in df.columns:
-                df = df.drop(coluna, axis=1)
-        print("[DEBUG] Colunas removidas")
-        
-        # Converte nomes das colunas para minúsculo
-        df.columns = df.columns.str.lower()
-
-        # Renomeia algumas colunas para match com o modelo
-        mapeamento_colunas = {
-            'numero_banco': 'banco',
-            'numero_agencia': 'numero_agencia',
-            'numero_conta': 'numero_conta',
-            'tipo_conta': 'tipo',
-            'nome_titular': 'nome_titular',
-            'cpf_cnpj_titular': 'cpf_cnpj_titular',
-            'descricao_lancamento': 'descricao_lancamento',
-            'data_lancamento': 'data_lancamento',
-            'numero_documento': 'numero_documento',
-            'numero_documento_transacao': 'numero_documento_transacao',
-            'local_transacao': 'local_transacao',
-            'valor_transacao': 'valor_transacao',
-            'natureza_lancamento': 'natureza_lancamento',
-            'valor_saldo': 'valor_saldo',
-            'natureza_saldo': 'natureza_saldo',
-            'cpf_cnpj_od': 'cpf_cnpj_od',
-            'nome_pessoa_od': 'nome_pessoa_od',
-            'tipo_pessoa_od': 'tipo_pessoa_od',
-            'numero_banco_od': 'numero_banco_od',
-            'numero_agencia_od': 'numero_agencia_od',
-            'numero_conta_od': 'numero_conta_od'
-        }
-        df = df.rename(columns=mapeamento_colunas)
-        print("[DEBUG] Colunas renomeadas", df.columns.tolist())
-
-        # Converte tipos de dados
-        def converter_valor(valor):
-            if pd.isna(valor):
-                return 0.0
-            if isinstance(valor, (int, float)):
-                return float(valor)
-            try:
-                # Remove caracteres não numéricos exceto , e .
-                valor_str = str(valor).replace('R$', '').replace(' ', '')
-                # Substitui vírgula por ponto
-                valor_str = valor_str.replace(',', '.')
-                # Converte para float
-                return float(valor_str)
-            except:
-                return 0.0
-
-        # Converte data_lancamento
-        def converter_data(data):
-            print("[DEBUG] Data informada:", data)
-            if pd.isna(data):
-                return None
-            try:
-                return pd.to_datetime(data, format='%d%m%Y').date()
-            except:
-                try:
-                    return pd.to_datetime(data).date()
-                except:
-                    return None
-        
-        print("[DEBUG] Convertendo datas")
-        print(df['data_lancamento'].head())
-        df['data_lancamento'] = df['data_lancamento'].apply(converter_data)
-        print("[DEBUG] Datas convertidas")
-        
-        print("[DEBUG] Convertendo valores monetários")
-        # Converte valores monetários
-        df['valor_transacao'] = df['valor_transacao'].apply(converter_valor)
-        df['valor_saldo'] = df['valor_saldo'].apply(converter_valor)
-        print("[DEBUG] Tipos de dados convertidos")
-
-        # Trata campos numéricos, convertendo NaN para string vazia
-        campos_numericos = ['banco', 'numero_agencia', 'numero_conta', 'tipo', 
-                          'numero_banco_od', 'numero_agencia_od', 'numero_conta_od']
-        
-        try:
-            print("[DEBUG] Convertendo tipos de dados")
-            for campo in campos_numericos:
-                print("[DEBUG] Convertendo campo:", campo)
-                # Converte NaN para string vazia
-                df[campo] = df[campo].fillna('')
-                # Se o campo não estiver vazio, converte para string removendo '.0' do final
-                df[campo] = df[campo].apply(lambda x: str(int(float(x))) if str(x).strip() != '' else '')
-        except Exception as e:
-            print("[DEBUG] Erro ao converter tipos de dados:", e)
-        print("[DEBUG] Campos numéricos tratados")
-
-        # Trata campos de texto, convertendo NaN para string vazia
-        campos_texto = ['nome_titular', 'cpf_cnpj_titular', 'descricao_lancamento', 'cnab',
-                       'numero_documento', 'numero_documento_transacao', 'local_transacao',
-                       'natureza_lancamento', 'natureza_saldo', 'cpf_cnpj_od', 'nome_pessoa_od',
-                       'tipo_pessoa_od', 'observacao', 'nome_endossante_cheque', 'doc_endossante_cheque']
-        
-        for campo in campos_texto:
-            if campo in df.columns:
-                df[campo] = df[campo].fillna('').astype(str)
-        print("[DEBUG] Campos tratados")
-
-        # Conta o número de registros após o processamento
-        total_registros = len(df)
-        print("[DEBUG] Total de registros:", total_registros)
-        
-        if 'name' in arquivo:
-            arquivo = arquivo.name
-
-        # Salva o arquivo no sistema
-        arquivo_salvo = Arquivo.objects.create(
-            caso=caso,
-            nome=arquivo,
-            hash=file_hash,
-            tipo='cooperacao_bancaria',
-            external_id=cooperacao.id,
-            registros=total_registros
-        )
-        print("[DEBUG] Arquivo salvo com sucesso")
-
-        # Cria os registros no banco de dados
-        registros = []
-        for _, row in df.iterrows():
-            registro = ExtratoDetalhado(
-                cooperacao=cooperacao,
-                caso=caso,
-                arquivo=arquivo_salvo,
-                banco=row['banco'],
-                numero_agencia=row['numero_agencia'],
-                numero_conta=row['numero_conta'],
-                tipo=row['tipo'],
-                nome_titular=row['nome_titular'],
-                cpf_cnpj_titular=row['cpf_cnpj_titular'],
-                descricao_lancamento=row['descricao_lancamento'],
-                cnab=row.get('cnab', ''),
-                data_lancamento=row['data_lancamento'],
-                numero_documento=row['numero_documento'],
-                numero_documento_transacao=row['numero_documento_transacao'],
-                local_transacao=row['local_transacao'],
-                valor_transacao=row['valor_transacao'],
-                natureza_lancamento=row['natureza_lancamento'],
-                valor_saldo=row['valor_saldo'],
-                natureza_saldo=row['natureza_saldo'],
-                cpf_cnpj_od=row['cpf_cnpj_od'],
-                nome_pessoa_od=row['nome_pessoa_od'],
-                tipo_pessoa_od=row['tipo_pessoa_od'],
-                numero_banco_od=row['numero_banco_od'],
-                numero_agencia_od=row['numero_agencia_od'],
-                numero_conta_od=row['numero_conta_od'],
-                observacao=row.get('observacao', ''),
-                nome_endossante_cheque=row.get('nome_endossante_cheque', ''),
-                doc_endossante_cheque=row.get('doc_endossante_cheque', '')
-            )
-            registros.append(registro)
+    caso = _buscar_caso_ativo(request)
+    if not caso:
+        return JsonResponse({'success': False, 'error': 'Nenhum caso ativo encontrado'}, status=400)
 
-        print("VEIO ATE AKI")
+    try:
+        cooperacao = Cooperacao.objects.get(id=request.POST.get('cooperacao'), caso=caso)
+    except (Cooperacao.DoesNotExist, ValueError):
+        return JsonResponse({'success': False, 'error': 'Cooperação não encontrada'}, status=404)
 
-        # Salva todos os registros de uma vez
-        ExtratoDetalhado.objects.bulk_create(registros)
+    # O arquivo é processado pelo worker de importações (comando processar_importacoes)
+    job = enfileirar_importacao(caso, request.user, 'simba', cooperacao.id, {'arquivo': arquivo})
 
-        return redirect('bancaria:index')
-        
-    except Exception as e:
-        return JsonResponse({'error': str(e)}, status=400)
+    return JsonResponse({
+        'success': True,
+        'message': 'Arquivo recebido. A importação será processada em segundo plano.',
+        'job_id': job.id,
+        'status_url': reverse('importacao_status', args=[job.id])
+    })
 
 @login_required
 def gerar_relatorio_bancario(request):
@@ -650,13 +161,15 @@ def gerar_relatorio_bancario(request):
 
     doc = DocxTemplate(f"templates/documentos/simba.docx")
 
-    # Coleta todos os extratos e carrega em um DataFrame do Pandas
-    extratos_qs = ExtratoDetalhado.objects.filter(caso=caso_ativo).values()
-    if not extratos_qs.exists():
+    # Carrega do snapshot do caso só as colunas usadas no relatório
+    df_extratodetalhado = carregar_extratos(caso_ativo.id, [
+        'banco', 'numero_agencia', 'numero_conta', 'nome_titular', 'cpf_cnpj_titular', 'descricao_lancamento',
+        'data_lancamento', 'valor_transacao', 'natureza_lancamento', 'cpf_cnpj_od', 'nome_pessoa_od',
+    ])
+    if df_extratodetalhado.empty:
         messages.error(request, 'Não há dados bancários para gerar o relatório neste caso.')
         return redirect('bancaria:dashboard')
-        
-    df_extratodetalhado = pd.DataFrame(list(extratos_qs))
+
     df_extratodetalhado['valor_transacao'] = pd.to_numeric(df_extratodetalhado['valor_transacao'], errors='coerce').fillna(0)
     df_extratodetalhado['data_lancamento'] = pd.to_datetime(df_extratodetalhado['data_lancamento'], errors='coerce')
 
@@ -954,12 +467,10 @@ def listar_arquivos(request, cooperacao_id):
         tipo='cooperacao_bancaria'
     ).order_by('-created_at')
     
-    # Obtém os extratos detalhados para cada arquivo
+    # Quantidade de lançamentos gravados de cada arquivo
+    contadores = contadores_do_caso(cooperacao.caso_id)['arquivo']
     for arquivo in arquivos:
-        arquivo.total_registros = ExtratoDetalhado.objects.filter(
-            arquivo=arquivo,
-            cooperacao=cooperacao
-        ).count()
+        arquivo.total_registros = contadores[arquivo.id].extratos
     
     context = {
         'cooperacao': cooperacao,
@@ -980,15 +491,21 @@ def delete_arquivo(request, id):
     if not caso_ativo or arquivo.caso != caso_ativo:
         return JsonResponse({'error': 'Este arquivo não pertence ao caso ativo'}, status=403)
     
-    # Exclui os registros de extrato detalhado associados
-    ExtratoDetalhado.objects.filter(arquivo=arquivo).delete()
-    
-    # Exclui o arquivo
-    arquivo.delete()
-    
+    # Arquivos grandes são excluídos pelo worker, sem prender a requisição
+    if registros_a_excluir('arquivo', arquivo) > LIMITE_EXCLUSAO_IMEDIATA:
+        job = enfileirar_exclusao(request.user, 'arquivo', arquivo)
+        return JsonResponse({
+            'message': 'A exclusão do arquivo será processada em segundo plano.',
+            'job_id': job.id,
+            'status_url': reverse('importacao_status', args=[job.id])
+        })
+
+    # Exclui o arquivo e os lançamentos dele com DELETEs em lote
+    excluir_arquivo(arquivo)
     return JsonResponse({'message': 'Arquivo excluído com sucesso'})
 
 @login_required
+@usar_replica
 def dashboard(request):
     caso_ativo = _buscar_caso_ativo(request)
     if not caso_ativo:
@@ -1314,6 +831,7 @@ def analise_de_vinculos(request):
 
 
 @login_required
+@usar_replica
 def download_vinculos_csv(request):
     caso_ativo = _buscar_caso_ativo(request)
     if not caso_ativo:
@@ -1374,14 +892,14 @@ def calendario_eventos(request):
     if not caso_ativo:
         return JsonResponse({'data': [], 'pessoas': []})
     
-    # Para cada data e pessoa, calcular crédito e débito
-    eventos = ExtratoDetalhado.objects.filter(caso=caso_ativo).values('data_lancamento', 'nome_titular').annotate(
-        total_credito=Sum(Case(When(natureza_lancamento='C', then='valor_transacao'), default=Value(0), output_field=FloatField())),
-        total_debito=Sum(Case(When(natureza_lancamento='D', then='valor_transacao'), default=Value(0), output_field=FloatField()))
-    ).order_by('data_lancamento', 'nome_titular')
+    # Para cada data e pessoa, calcular crédito e débito (a partir do snapshot do caso)
+    df = carregar_extratos(caso_ativo.id, ['data_lancamento', 'nome_titular', 'natureza_lancamento', 'valor_transacao'])
+    df['total_credito'] = df['valor_transacao'].where(df['natureza_lancamento'] == 'C', 0)
+    df['total_debito'] = df['valor_transacao'].where(df['natureza_lancamento'] == 'D', 0)
+    eventos = df.groupby(['data_lancamento', 'nome_titular'])[['total_credito', 'total_debito']].sum().reset_index()
 
     eventos_formatados = []
-    for evento in eventos:
+    for evento in eventos.to_dict('records'):
         data = evento['data_lancamento']
         nome = evento['nome_titular']
         eventos_formatados.append({
@@ -1446,38 +964,29 @@ def analise_vinculos_selecionados(request):
         messages.error(request, 'Nenhum caso ativo encontrado.')
         return redirect('casos:index')
 
-    # Obtém lista única de titulares
-    titulares = ExtratoDetalhado.objects.filter(
-        caso=caso_ativo
-    ).values(
-        'cpf_cnpj_titular', 'nome_titular'
-    ).distinct().order_by('nome_titular')
-
     if request.method == 'POST':
         # Obtém os titulares e contrapartes selecionados
         titulares_selecionados = request.POST.getlist('titulares[]')
         contrapartes_selecionadas = request.POST.getlist('contrapartes[]')
 
-        # Filtra os registros que atendem aos critérios
-        registros = ExtratoDetalhado.objects.filter(
-            caso=caso_ativo,
-            cpf_cnpj_titular__in=titulares_selecionados,
-            cpf_cnpj_od__in=contrapartes_selecionadas
-        ).select_related('cooperacao')
+        # Filtra os registros que atendem aos critérios (a partir do snapshot do caso)
+        registros = carregar_extratos(caso_ativo.id, [
+            'data_lancamento', 'nome_titular', 'cpf_cnpj_titular', 'nome_pessoa_od', 'cpf_cnpj_od',
+            'descricao_lancamento', 'valor_transacao', 'natureza_lancamento', 'cooperacao_id',
+        ], filtros={'cpf_cnpj_titular': titulares_selecionados, 'cpf_cnpj_od': contrapartes_selecionadas})
+        numeros = dict(Cooperacao.objects.filter(caso=caso_ativo).values_list('id', 'numero'))
+        registros['data_lancamento'] = registros['data_lancamento'].dt.date
+        registros['cooperacao__numero'] = registros.pop('cooperacao_id').map(numeros)
 
-        return JsonResponse({
-            'data': list(registros.values(
-                'data_lancamento',
-                'nome_titular',
-                'cpf_cnpj_titular',
-                'nome_pessoa_od',
-                'cpf_cnpj_od',
-                'descricao_lancamento',
-                'valor_transacao',
-                'natureza_lancamento',
-                'cooperacao__numero'
-            ))
-        })
+        return JsonResponse({'data': registros.to_dict('records')})
+
+    # Obtém lista única de titulares
+    titulares = (
+        carregar_extratos(caso_ativo.id, ['cpf_cnpj_titular', 'nome_titular'])
+        .drop_duplicates()
+        .sort_values('nome_titular')
+        .to_dict('records')
+    )
 
     # Para AJAX: buscar contrapartes de um titular específico
     if request.headers.get('X-Requested-With') == 'XMLHttpRequest' and request.method == 'GET':
@@ -1486,14 +995,13 @@ def analise_vinculos_selecionados(request):
         print(f"[DEBUG] CPF do titular recebido: {titular_cpf}")
         
         if titular_cpf:
-            contrapartes = ExtratoDetalhado.objects.filter(
-                caso=caso_ativo,
-                cpf_cnpj_titular=titular_cpf
-            ).values(
-                'cpf_cnpj_od', 'nome_pessoa_od'
-            ).distinct().order_by('nome_pessoa_od')
-            
-            contrapartes_list = list(contrapartes)
+            contrapartes_list = (
+                carregar_extratos(caso_ativo.id, ['cpf_cnpj_od', 'nome_pessoa_od'],
+                                  filtros={'cpf_cnpj_titular': titular_cpf})
+                .drop_duplicates()
+                .sort_values('nome_pessoa_od')
+                .to_dict('records')
+            )
             print(f"[DEBUG] Contrapartes encontradas: {len(contrapartes_list)}")
             print(f"[DEBUG] Primeira contraparte: {contrapartes_list[0] if contrapartes_list else None}")
             
@@ -1636,38 +1144,39 @@ def detalhes_pessoa(request):
         if not caso_ativo:
             return JsonResponse({'error': 'Nenhum caso ativo encontrado'}, status=400)
         
-        # Busca todas as transações onde a pessoa aparece como titular ou contraparte
-        transacoes_titular = ExtratoDetalhado.objects.filter(
-            caso=caso_ativo,
-            cpf_cnpj_titular=cpf
-        ).select_related('cooperacao')
-        
-        transacoes_contraparte = ExtratoDetalhado.objects.filter(
-            caso=caso_ativo,
-            cpf_cnpj_od=cpf
-        ).select_related('cooperacao')
-        
-        # Combina e ordena todas as transações
-        todas_transacoes = list(transacoes_titular) + list(transacoes_contraparte)
-        todas_transacoes.sort(key=lambda x: x.data_lancamento, reverse=True)
+        # Busca no snapshot do caso as transações onde a pessoa aparece como titular ou contraparte
+        colunas = ['data_lancamento', 'banco', 'numero_agencia', 'numero_conta', 'nome_titular', 'cpf_cnpj_titular',
+                   'descricao_lancamento', 'valor_transacao', 'natureza_lancamento', 'nome_pessoa_od', 'cpf_cnpj_od',
+                   'cooperacao_id']
+        df = pd.concat([
+            carregar_extratos(caso_ativo.id, colunas, filtros={'cpf_cnpj_titular': cpf}),
+            carregar_extratos(caso_ativo.id, colunas, filtros={'cpf_cnpj_od': cpf}),
+        ], ignore_index=True)
+
+        # Ordena todas as transações, da mais recente para a mais antiga
+        df = df.sort_values('data_lancamento', ascending=False, kind='stable')
+        numeros = dict(Cooperacao.objects.filter(caso=caso_ativo).values_list('id', 'numero'))
+        todas_transacoes = df.to_dict('records')
+        for transacao in todas_transacoes:
+            transacao['cooperacao'] = {'numero': numeros.get(transacao['cooperacao_id'])}
         
         # Calcula estatísticas
-        total_transacoes = len(todas_transacoes)
-        total_valor = sum(t.valor_transacao for t in todas_transacoes)
-        creditos = sum(t.valor_transacao for t in todas_transacoes if t.natureza_lancamento == 'C')
-        debitos = sum(t.valor_transacao for t in todas_transacoes if t.natureza_lancamento == 'D')
+        total_transacoes = len(df)
+        total_valor = float(df['valor_transacao'].sum())
+        creditos = float(df.loc[df['natureza_lancamento'] == 'C', 'valor_transacao'].sum())
+        debitos = float(df.loc[df['natureza_lancamento'] == 'D', 'valor_transacao'].sum())
         
         # Agrupa transações por titular
         transacoes_por_titular = {}
         for transacao in todas_transacoes:
-            titular_key = f"{transacao.cpf_cnpj_titular}_{transacao.nome_titular}"
+            titular_key = f"{transacao['cpf_cnpj_titular']}_{transacao['nome_titular']}"
             if titular_key not in transacoes_por_titular:
                 transacoes_por_titular[titular_key] = {
-                    'cpf_cnpj': transacao.cpf_cnpj_titular,
-                    'nome': transacao.nome_titular,
-                    'banco': transacao.banco,
-                    'agencia': transacao.numero_agencia,
-                    'conta': transacao.numero_conta,
+                    'cpf_cnpj': transacao['cpf_cnpj_titular'],
+                    'nome': transacao['nome_titular'],
+                    'banco': transacao['banco'],
+                    'agencia': transacao['numero_agencia'],
+                    'conta': transacao['numero_conta'],
                     'transacoes': [],
                     'creditos': 0,
                     'debitos': 0,
@@ -1677,8 +1186,8 @@ def detalhes_pessoa(request):
         
         # Calcula estatísticas para cada titular
         for titular_key, titular_data in transacoes_por_titular.items():
-            creditos_titular = sum(t.valor_transacao for t in titular_data['transacoes'] if t.natureza_lancamento == 'C')
-            debitos_titular = sum(t.valor_transacao for t in titular_data['transacoes'] if t.natureza_lancamento == 'D')
+            creditos_titular = sum(t['valor_transacao'] for t in titular_data['transacoes'] if t['natureza_lancamento'] == 'C')
+            debitos_titular = sum(t['valor_transacao'] for t in titular_data['transacoes'] if t['natureza_lancamento'] == 'D')
             total_titular = creditos_titular - debitos_titular
             
             transacoes_por_titular[titular_key]['creditos'] = creditos_titular
@@ -1700,14 +1209,14 @@ def detalhes_pessoa(request):
         # Dados para gráfico de linha (movimentação ao longo do tempo)
         transacoes_por_data = {}
         for transacao in todas_transacoes:
-            data_str = transacao.data_lancamento.strftime('%Y-%m-%d')
+            data_str = transacao['data_lancamento'].strftime('%Y-%m-%d')
             if data_str not in transacoes_por_data:
                 transacoes_por_data[data_str] = {'creditos': 0, 'debitos': 0}
             
-            if transacao.natureza_lancamento == 'C':
-                transacoes_por_data[data_str]['creditos'] += transacao.valor_transacao
+            if transacao['natureza_lancamento'] == 'C':
+                transacoes_por_data[data_str]['creditos'] += transacao['valor_transacao']
             else:
-                transacoes_por_data[data_str]['debitos'] += transacao.valor_transacao
+                transacoes_por_data[data_str]['debitos'] += transacao['valor_transacao']
         
         # Ordena as datas
         datas_ordenadas = sorted(transacoes_por_data.keys())
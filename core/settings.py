@@ -68,6 +68,7 @@ MIDDLEWARE = [
     'middleware.auth_middleware.AuthMiddleware',
     'middleware.user_logs.UserLogsMiddleware',
     'middleware.completa_cadastro.CadastroMiddleware',
+    'middleware.replica.ReplicaMiddleware',
 ]
 
 ROOT_URLCONF = 'core.urls'
@@ -110,6 +111,28 @@ else:
         }
     }
 
+# Réplica somente leitura para dashboards, exportações e consultas customizadas (ver utils/replica.py).
+# Sem DB_REPLICA_HOST (ou DB_REPLICA_NAME, no SQLite), tudo é lido do banco principal.
+BANCO_REPLICA = 'replica'
+if os.getenv('DB_REPLICA_HOST') or os.getenv('DB_REPLICA_NAME'):
+    DATABASES[BANCO_REPLICA] = {
+        **DATABASES['default'],
+        'NAME': os.getenv('DB_REPLICA_NAME', DATABASES['default']['NAME']),
+        'USER': os.getenv('DB_REPLICA_USER', DATABASES['default'].get('USER', '')),
+        'PASSWORD': os.getenv('DB_REPLICA_PASSWORD', DATABASES['default'].get('PASSWORD', '')),
+        'HOST': os.getenv('DB_REPLICA_HOST', DATABASES['default'].get('HOST', '')),
+        'PORT': os.getenv('DB_REPLICA_PORT', DATABASES['default'].get('PORT', '')),
+    }
+DATABASE_ROUTERS = ['utils.replica.RoteadorReplica']
+# Apps cujos modelos podem ser lidos da réplica
+APPS_REPLICA = ['app', 'financeira', 'bancaria']
+# Tempo em que as leituras de quem acabou de gravar ficam no banco principal
+REPLICA_FIXACAO_SEGUNDOS = int(os.getenv('DB_REPLICA_FIXACAO_SEGUNDOS', '10'))
+
+# Segundos sem gravação de progresso após os quais um job 'processando' é considerado abandonado
+# (worker encerrado no meio da importação; ver app/importacoes.py)
+IMPORTACAO_TEMPO_SEM_PROGRESSO = int(os.getenv('IMPORTACAO_TEMPO_SEM_PROGRESSO', '1800'))
+
 # Validação de Senha
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -143,6 +166,9 @@ STATICFILES_DIRS = [
 MEDIA_URL = '/media/'
 MEDIA_ROOT = DATA_DIR / 'media'
 
+# Snapshots Parquet dos lançamentos bancários por caso (bancaria/snapshot.py)
+SNAPSHOTS_ROOT = DATA_DIR / 'snapshots'
+
 # Configuração para uploads grandes
 DATA_UPLOAD_MAX_MEMORY_SIZE = 52428800 # 50 * 1024 * 1024 bytes para 50 MB
 
@@ -0,0 +1,53 @@
+"""Consultas compartilhadas das listagens de ocorrências e de comunicações de um envolvido.
+
+Ocorrências, envolvidos e comunicações se ligam pela RIF e pelo indexador, sem
+FK entre eles. Aqui essa ligação é feita no próprio SELECT (Subquery/Exists
+correlacionados por rif_id e indexador), então cada listagem custa uma consulta,
+qualquer que seja a quantidade de linhas.
+
+O texto de informacoes_adicionais das comunicações, o campo mais pesado da
+tabela, fica fora das listagens (defer) e é buscado só quando o usuário abre a
+linha (view comunicacao_informacoes_adicionais).
+"""
+from django.db.models import Exists, OuterRef, Subquery
+
+from .models import Comunicacao, Envolvido, Ocorrencia
+
+
+def mesma_comunicacao(modelo):
+    """Registros do modelo com a mesma RIF e indexador da linha externa, em ordem de id."""
+    return modelo.objects.filter(rif_id=OuterRef('rif_id'), indexador=OuterRef('indexador')).order_by('id')
+
+
+def ocorrencias_do_caso(caso_id):
+    """Ocorrências do caso com a RIF, o id da comunicação e o titular dela.
+
+    Args:
+        caso_id (int): Id do caso.
+
+    Returns:
+        QuerySet: Ocorrencia com select_related('rif') e as anotações comunicacao_id
+            e titular (None/vazio se não houver comunicação com a mesma RIF e indexador).
+    """
+    comunicacoes = mesma_comunicacao(Comunicacao)
+    return Ocorrencia.objects.filter(caso_id=caso_id).select_related('rif').annotate(
+        comunicacao_id=Subquery(comunicacoes.values('id')[:1]),
+        titular=Subquery(comunicacoes.values('nome_titular')[:1]),
+    )
+
+
+def comunicacoes_do_envolvido(caso_id, cpf_cnpj):
+    """Comunicações do caso em que o CPF/CNPJ aparece como envolvido.
+
+    Args:
+        caso_id (int): Id do caso.
+        cpf_cnpj (int | str): CPF/CNPJ do envolvido, só com números.
+
+    Returns:
+        QuerySet: Comunicacao com select_related('rif'), sem informacoes_adicionais
+            (defer) e com a anotação tipo_envolvido (participação do envolvido na
+            comunicação).
+    """
+    envolvidos = mesma_comunicacao(Envolvido).filter(cpf_cnpj_envolvido=cpf_cnpj)
+    return Comunicacao.objects.filter(caso_id=caso_id).filter(Exists(envolvidos)).select_related('rif').defer(
+        'informacoes_adicionais').annotate(tipo_envolvido=Subquery(envolvidos.values('tipo_envolvido')[:1]))
@@ -0,0 +1,270 @@
+"""Esquemas de importação dos arquivos da RIF.
+
+Cada tipo de arquivo (comunicacoes, envolvidos, ocorrencias) é descrito por um
+Esquema: para cada campo do modelo, as colunas de origem aceitas, o conversor da
+coluna e as regras de rejeição da linha. O esquema é compilado uma única vez em
+uma função que converte um bloco inteiro (DataFrame) coluna a coluna.
+
+Uma nova versão do layout do COAF que apenas renomeie colunas é tratada
+acrescentando o novo nome em ``colunas`` do campo; colunas ausentes no arquivo
+são tratadas como vazias.
+"""
+from decimal import Decimal
+
+import pandas as pd
+from django.db import models
+
+from utils.conversores import datas, valores_monetarios
+from utils.formatar_nomes import normalizar_nome
+from .models import Comunicacao, Envolvido, Ocorrencia
+
+# Maior valor aceito por um IntegerField
+LIMITE_INTEIRO = 2147483647
+
+# Valores monetários devem caber em DecimalField(max_digits=18, decimal_places=2)
+LIMITE_MONETARIO = 10 ** 16
+
+
+#########################################################################################################################
+# CONVERSORES DE COLUNA
+#########################################################################################################################
+def inteiro(serie):
+    """Converte a coluna para inteiro. Valores vazios, inválidos ou acima do limite viram nulo."""
+    numeros = pd.to_numeric(serie, errors='coerce')
+    numeros = numeros.where(numeros.abs() <= LIMITE_INTEIRO)
+    numeros = numeros.where(numeros == numeros.round())
+    return numeros.astype('Int64')
+
+
+def texto(serie):
+    """Converte a coluna para texto, com vazio no lugar de nulos."""
+    return serie.where(serie.notna(), '').astype(str)
+
+
+def texto_opcional(serie):
+    """Converte a coluna para texto, usando None para vazios, '-' e 'nan'."""
+    valores = serie.where(serie.notna(), '').astype(str).str.strip()
+    return valores.where(~valores.isin(['', '-', 'nan']), None)
+
+
+def cpf_cnpj(serie):
+    """Mantém apenas os dígitos do CPF/CNPJ. Tamanhos diferentes de 11 ou 14 viram nulo."""
+    digitos = serie.where(serie.notna(), '').astype(str).str.replace(r'\D', '', regex=True)
+    digitos = digitos.where(digitos.str.len().isin([11, 14]))
+    return pd.to_numeric(digitos, errors='coerce').astype('Int64')
+
+
+def nome(serie):
+    """Normaliza os nomes, chamando normalizar_nome uma única vez para cada nome distinto."""
+    nomes = texto(serie)
+    return nomes.map({valor: normalizar_nome(valor) for valor in nomes.unique()})
+
+
+def monetario(serie):
+    """Converte valores monetários no formato brasileiro (ver utils.conversores) para Decimal com 2 casas.
+
+    Valores acima do limite do campo viram nulo.
+    """
+    valores = valores_monetarios(serie).round(2)
+    valores = valores.where(valores.abs() < LIMITE_MONETARIO)
+    return valores.map(lambda valor: Decimal(f'{valor:.2f}'), na_action='ignore')
+
+
+def data(*formatos):
+    """Conversor de datas para campos DateField, tentando os formatos na ordem."""
+    def converter(serie):
+        return datas(serie, list(formatos)).dt.date
+    return converter
+
+
+def data_iso(*formatos):
+    """Conversor de datas para campos de texto, gravadas no formato ISO (AAAA-MM-DD)."""
+    def converter(serie):
+        return datas(serie, list(formatos)).dt.strftime('%Y-%m-%d').fillna('')
+    return converter
+
+
+#########################################################################################################################
+# ESQUEMAS
+#########################################################################################################################
+class Campo:
+    """Campo do modelo preenchido a partir de uma coluna do arquivo.
+
+    Args:
+        campo (str): Nome do campo no modelo.
+        colunas (str | tuple): Nome da coluna no arquivo ou, se o nome mudou entre
+            versões do layout, todos os nomes aceitos.
+        conversor (callable): Recebe a coluna (pd.Series) e devolve os valores convertidos.
+        obrigatorio (Optional[str]): Motivo da rejeição das linhas em que o valor
+            convertido é nulo.
+        invalido (Optional[str]): Motivo da rejeição das linhas em que o valor
+            informado não pôde ser convertido (valores vazios são aceitos).
+        padrao: Valor usado no lugar dos nulos que não causaram rejeição.
+        traco (bool): Se '-' no arquivo significa valor não informado.
+    """
+
+    def __init__(self, campo, colunas, conversor, obrigatorio=None, invalido=None, padrao=None, traco=False):
+        self.campo = campo
+        self.colunas = (colunas,) if isinstance(colunas, str) else tuple(colunas)
+        self.conversor = conversor
+        self.obrigatorio = obrigatorio
+        self.invalido = invalido
+        self.padrao = padrao
+        self.traco = traco
+
+
+class Esquema:
+    """Layout de um tipo de arquivo da RIF e o modelo em que ele é gravado.
+
+    Args:
+        modelo (Model): Modelo Django de destino.
+        chave_natural (list): Campos que identificam um registro dentro da RIF
+            (restrição única do modelo), usados na reimportação.
+        campos (list): Campos do modelo preenchidos pelo arquivo, na ordem em que
+            as regras de rejeição são avaliadas.
+        chave_opcional (list): Campos da chave natural que podem ser nulos; na
+            reimportação, o nulo é comparado como um valor qualquer.
+    """
+
+    def __init__(self, modelo, chave_natural, campos, chave_opcional=()):
+        self.modelo = modelo
+        self.chave_natural = chave_natural
+        self.campos = campos
+        self.chave_opcional = list(chave_opcional)
+
+    @property
+    def renomear(self):
+        """Mapeamento de todos os nomes de coluna aceitos para o campo do modelo."""
+        return {coluna: campo.campo for campo in self.campos for coluna in campo.colunas}
+
+    @property
+    def colunas_traco(self):
+        """Campos em que '-' significa valor não informado."""
+        return [campo.campo for campo in self.campos if campo.traco]
+
+    def compilar(self):
+        """Compila o esquema em uma função de conversão de blocos.
+
+        A consulta aos campos do modelo (tamanho máximo, tipo) é feita aqui, uma
+        única vez; a função devolvida só executa operações vetorizadas.
+
+        Returns:
+            callable: converter(df) -> (dados, motivos). `df` tem as colunas já
+                renomeadas para os campos do modelo; `dados` traz os campos
+                convertidos e `motivos`, o motivo da rejeição de cada linha (ou None).
+        """
+        passos = [(campo, _adaptador(self.modelo._meta.get_field(campo.campo))) for campo in self.campos]
+
+        def converter(df):
+            dados = pd.DataFrame(index=df.index)
+            motivos = pd.Series(None, index=df.index, dtype=object)
+
+            for campo, adaptar in passos:
+                origem = _coluna(df, campo.campo)
+                valores = campo.conversor(origem)
+
+                if campo.obrigatorio:
+                    _rejeitar(motivos, valores.isna(), campo.obrigatorio)
+                if campo.invalido:
+                    vazios = origem.isna() | (origem.astype(str).str.strip() == '')
+                    _rejeitar(motivos, valores.isna() & ~vazios, campo.invalido)
+                if campo.padrao is not None:
+                    valores = valores.fillna(campo.padrao)
+
+                dados[campo.campo] = adaptar(valores)
+
+            return dados, motivos
+
+        return converter
+
+
+def _coluna(df, nome_coluna):
+    """Retorna a coluna do DataFrame ou uma coluna vazia, se ela não existir no arquivo."""
+    if nome_coluna in df.columns:
+        return df[nome_coluna]
+    return pd.Series(None, index=df.index, dtype=object)
+
+
+def _rejeitar(motivos, mascara, motivo):
+    """Registra o motivo da rejeição nas linhas da máscara que ainda não foram rejeitadas."""
+    mascara = mascara & motivos.isna()
+    motivos[mascara] = motivo
+
+
+def _adaptador(campo_modelo):
+    """Ajuste final dos valores ao tipo do campo: campos de texto recebem texto, cortado no tamanho máximo."""
+    if not isinstance(campo_modelo, (models.CharField, models.TextField)):
+        return lambda valores: valores
+
+    tamanho = campo_modelo.max_length
+
+    def adaptar(valores):
+        if valores.dtype != object:
+            valores = valores.astype(str)
+        if tamanho:
+            valores = valores.str.slice(0, tamanho)
+        return valores
+
+    return adaptar
+
+
+ZERO = Decimal('0.00')
+
+# Formatos das datas no arquivo de Comunicações
+FORMATOS_DATA_COMUNICACAO = ('%d/%m/%Y %H:%M:%S', '%d/%m/%Y')
+
+ESQUEMAS = {
+    'comunicacoes': Esquema(
+        modelo=Comunicacao,
+        chave_natural=['indexador', 'id_comunicacao'],
+        campos=[
+            Campo('indexador', 'Indexador', inteiro, obrigatorio='Indexador inválido'),
+            Campo('id_comunicacao', 'idComunicacao', inteiro, obrigatorio='idComunicacao inválido'),
+            Campo('cpf_cnpj_comunicante', 'cpfCnpjComunicante', cpf_cnpj, traco=True,
+                  obrigatorio='CPF/CNPJ do comunicante inválido'),
+            Campo('campo_a', 'CampoA', monetario, invalido='Valor monetário inválido em campo_a', padrao=ZERO),
+            Campo('campo_b', 'CampoB', monetario, invalido='Valor monetário inválido em campo_b', padrao=ZERO),
+            Campo('campo_c', 'CampoC', monetario, invalido='Valor monetário inválido em campo_c', padrao=ZERO),
+            Campo('campo_d', 'CampoD', monetario, invalido='Valor monetário inválido em campo_d', padrao=ZERO),
+            Campo('campo_e', 'CampoE', monetario, invalido='Valor monetário inválido em campo_e', padrao=ZERO),
+            Campo('data_recebimento', 'Data_do_Recebimento', data_iso(*FORMATOS_DATA_COMUNICACAO), traco=True),
+            Campo('data_operacao', 'Data_da_operacao', data_iso(*FORMATOS_DATA_COMUNICACAO), traco=True),
+            Campo('data_fim_fato', 'DataFimFato', data_iso(*FORMATOS_DATA_COMUNICACAO), traco=True),
+            Campo('numero_ocorrencia_bc', 'NumeroOcorrenciaBC', texto),
+            Campo('nome_comunicante', 'nomeComunicante', texto),
+            Campo('cidade_agencia', 'CidadeAgencia', texto),
+            Campo('uf_agencia', 'UFAgencia', texto),
+            Campo('nome_agencia', 'NomeAgencia', texto),
+            Campo('informacoes_adicionais', 'informacoesAdicionais', texto),
+            Campo('numero_agencia', 'NumeroAgencia', inteiro, padrao=0, traco=True),
+            Campo('codigo_segmento', 'CodigoSegmento', inteiro, padrao=0),
+        ],
+    ),
+    'envolvidos': Esquema(
+        modelo=Envolvido,
+        chave_natural=['indexador', 'cpf_cnpj_envolvido', 'tipo_envolvido', 'agencia_envolvido', 'conta_envolvido'],
+        chave_opcional=['agencia_envolvido', 'conta_envolvido'],
+        campos=[
+            Campo('indexador', 'Indexador', inteiro, obrigatorio='Indexador inválido'),
+            Campo('cpf_cnpj_envolvido', 'cpfCnpjEnvolvido', cpf_cnpj, traco=True),
+            Campo('nome_envolvido', 'nomeEnvolvido', nome),
+            Campo('tipo_envolvido', 'tipoEnvolvido', texto),
+            Campo('agencia_envolvido', 'agenciaEnvolvido', inteiro, traco=True),
+            Campo('conta_envolvido', 'contaEnvolvido', inteiro, traco=True),
+            Campo('data_abertura_conta', 'DataAberturaConta', data('%d/%m/%Y'), traco=True),
+            Campo('data_atualizacao_conta', 'DataAtualizacaoConta', data('%d/%m/%Y'), traco=True),
+            Campo('bit_pep_citado', 'bitPepCitado', texto_opcional, traco=True),
+            Campo('bit_pessoa_obrigada_citado', 'bitPessoaObrigadaCitado', texto_opcional, traco=True),
+            Campo('int_servidor_citado', 'intServidorCitado', texto_opcional, traco=True),
+        ],
+    ),
+    'ocorrencias': Esquema(
+        modelo=Ocorrencia,
+        chave_natural=['indexador', 'id_ocorrencia'],
+        campos=[
+            Campo('indexador', 'Indexador', inteiro, obrigatorio='Indexador inválido'),
+            Campo('id_ocorrencia', 'idOcorrencia', inteiro, padrao=0),
+            Campo('ocorrencia', 'Ocorrencia', texto),
+        ],
+    ),
+}
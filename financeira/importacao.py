@@ -0,0 +1,575 @@
+"""Motor de importação em lote dos arquivos da RIF.
+
+Converte os DataFrames de Comunicações, Envolvidos e Ocorrências em instâncias
+dos modelos coluna a coluna, conforme os esquemas de financeira.esquemas, e grava
+tudo com ``bulk_create`` em lotes, dentro de uma única transação por arquivo.
+Linhas inválidas não interrompem o lote: são descartadas e devolvidas no
+resultado com a linha e o motivo da rejeição.
+Na reimportação de uma RIF, os registros são casados pela chave natural e só os
+novos ou alterados são gravados. Ao final, o titular de cada comunicação é
+resolvido de uma vez e guardado na própria Comunicacao, e os contadores e o
+resumo financeiro do caso são atualizados para a RIF importada.
+"""
+import logging
+import multiprocessing
+import os
+import pickle
+import shutil
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+import pandas as pd
+from django.db import DatabaseError, transaction
+from django.db.models import OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+from app.contadores import atualizar_contadores
+from app.functions import sha256_file
+from app.models import Arquivo
+from .esquemas import ESQUEMAS
+from .problemas import detectar_problemas_importacao
+from .resumo import atualizar_resumo_financeiro
+from .models import RIF, Comunicacao, Envolvido
+
+logger = logging.getLogger(__name__)
+
+# Quantidade de registros enviados ao banco em cada INSERT
+TAMANHO_LOTE = 2000
+
+# Quantidade de linhas lidas do arquivo por vez
+TAMANHO_BLOCO = 5000
+
+# Processos que leem e convertem os arquivos de uma importação em paralelo
+PROCESSOS_CONVERSAO = 3
+
+# Esquema de cada tipo de arquivo, compilado uma única vez em uma função de conversão de blocos
+CONVERSORES = {tipo: esquema.compilar() for tipo, esquema in ESQUEMAS.items()}
+
+
+#########################################################################################################################
+# LEITURA DOS ARQUIVOS
+#########################################################################################################################
+def _sentinela(indexador):
+    """Máscara das linhas que marcam o fim dos dados: Indexador vazio ou iniciado por '#'."""
+    indexador = indexador.str.strip()
+    return (indexador == '') | indexador.str.startswith('#')
+
+
+def ler_arquivo_em_blocos(caminho, tipo, tamanho_bloco=TAMANHO_BLOCO):
+    """Lê um arquivo da RIF em blocos de tamanho fixo, com as colunas já renomeadas.
+
+    A leitura termina na primeira linha com o Indexador vazio ou iniciado por '#'
+    (rodapé do arquivo exportado pelo COAF), sem carregar o restante do arquivo.
+    Todas as colunas são lidas como texto, para que os blocos tenham os mesmos tipos
+    independentemente do conteúdo; a conversão fica a cargo de importar_arquivo_rif.
+
+    Args:
+        caminho (str): Caminho do arquivo (.csv em windows-1252 separado por ';', ou Excel).
+        tipo (str): Tipo do arquivo: 'comunicacoes', 'envolvidos' ou 'ocorrencias'.
+        tamanho_bloco (int): Quantidade de linhas por bloco.
+
+    Yields:
+        DataFrame: Bloco de linhas, indexado pela posição da linha nos dados (0 = primeira linha após o cabeçalho).
+
+    Raises:
+        ValueError: Se o tipo não for reconhecido ou a coluna Indexador não existir.
+    """
+    if tipo not in ESQUEMAS:
+        raise ValueError(f'Tipo de arquivo não reconhecido para mapeamento de colunas: {tipo}')
+    esquema = ESQUEMAS[tipo]
+    renomear = esquema.renomear
+    colunas_traco = esquema.colunas_traco
+
+    ext = os.path.splitext(caminho)[-1].lower()
+    if ext in ['.xlsx', '.xls']:
+        # O Excel não permite leitura parcial; os blocos são fatias da planilha inteira
+        planilha = pd.read_excel(caminho, dtype=str, keep_default_na=False)
+        leitor = (planilha.iloc[inicio:inicio + tamanho_bloco]
+                  for inicio in range(0, len(planilha), tamanho_bloco))
+    else:
+        leitor = pd.read_csv(caminho, encoding='windows-1252', delimiter=';', dtype=str,
+                             keep_default_na=False, chunksize=tamanho_bloco)
+
+    try:
+        for bloco in leitor:
+            bloco = bloco.rename(columns=renomear)
+            if 'indexador' not in bloco.columns:
+                raise ValueError('Coluna "Indexador" não encontrada no arquivo.')
+
+            fim = _sentinela(bloco['indexador'])
+            if fim.any():
+                bloco = bloco.iloc[:fim.values.argmax()]
+
+            # '-' indica data, número ou indicador não informado
+            colunas = bloco.columns.intersection(colunas_traco)
+            bloco[colunas] = bloco[colunas].replace('-', None)
+
+            if len(bloco):
+                yield bloco
+            if fim.any():
+                break
+    finally:
+        if hasattr(leitor, 'close'):
+            leitor.close()
+
+
+def contar_linhas(caminho):
+    """Estimativa da quantidade de linhas do arquivo, sem carregá-lo, usada no cálculo do ETA."""
+    if os.path.splitext(caminho)[-1].lower() in ['.xlsx', '.xls']:
+        return 0
+
+    linhas = 0
+    with open(caminho, 'rb') as arquivo:
+        for bloco in iter(lambda: arquivo.read(1024 * 1024), b''):
+            linhas += bloco.count(b'\n')
+    return max(linhas - 1, 0)
+
+
+#########################################################################################################################
+# GRAVAÇÃO EM LOTE
+#########################################################################################################################
+def _valores(dados):
+    """Converte as colunas já convertidas em uma lista de dicionários, com None no lugar de nulos."""
+    colunas = {
+        campo: dados[campo].astype(object).where(dados[campo].notna(), None).tolist()
+        for campo in dados.columns
+    }
+    return [dict(zip(colunas.keys(), valores)) for valores in zip(*colunas.values())]
+
+
+def _para_registros(modelo, valores, **campos_comuns):
+    """Monta as instâncias do modelo a partir dos valores já convertidos."""
+    return [modelo(**campos_comuns, **registro) for registro in valores]
+
+
+def _chave(registro, campos_chave, campos, campos_opcionais=()):
+    """Chave natural do registro dentro da RIF.
+
+    Registros sem a chave completa (ex.: envolvido sem CPF/CNPJ) só correspondem
+    a outro registro idêntico em todos os campos. Os campos opcionais da chave
+    (ex.: agência e conta do envolvido) podem ser nulos.
+    """
+    chave = tuple(registro[campo] for campo in campos_chave)
+    if any(registro[campo] is None for campo in campos_chave if campo not in campos_opcionais):
+        return tuple(registro[campo] for campo in campos)
+    return chave
+
+
+def _separar_alteracoes(modelo, campos_chave, rif_id, valores, linhas, campos_opcionais=()):
+    """Compara os registros do bloco com os já gravados na RIF, pela chave natural.
+
+    Se a mesma chave aparecer mais de uma vez no bloco, prevalece a última ocorrência.
+
+    Args:
+        modelo (Model): Modelo Django dos registros.
+        campos_chave (list): Campos da chave natural do modelo.
+        rif_id (int): Id da RIF.
+        valores (list): Registros do bloco (saída de _valores).
+        linhas (list): Número da linha no arquivo de cada registro.
+        campos_opcionais (list): Campos da chave natural que podem ser nulos.
+
+    Returns:
+        tuple: (novos, alterados, inalterados, duplicados). Novos e alterados são
+            listas de (registro, linha); alterados traz o 'id' do registro gravado;
+            inalterados é a quantidade de registros iguais aos do banco; duplicados
+            é a lista de linhas rejeitadas por repetirem a chave no bloco.
+    """
+    campos = list(valores[0].keys())
+
+    ultimos = {}
+    duplicados = []
+    for registro, linha in zip(valores, linhas):
+        chave = _chave(registro, campos_chave, campos, campos_opcionais)
+        if chave in ultimos:
+            duplicados.append({'linha': ultimos[chave][1], 'motivo': f'Registro repetido na linha {linha}'})
+        ultimos[chave] = (registro, linha)
+
+    indexadores = {registro['indexador'] for registro in valores}
+    existentes = {
+        _chave(existente, campos_chave, campos, campos_opcionais): existente
+        for existente in modelo.objects.filter(rif_id=rif_id, indexador__in=indexadores).values('id', *campos)
+    }
+
+    novos = []
+    alterados = []
+    inalterados = 0
+    for chave, (registro, linha) in ultimos.items():
+        existente = existentes.get(chave)
+        if existente is None:
+            novos.append((registro, linha))
+        elif any(existente[campo] != registro[campo] for campo in campos):
+            alterados.append((dict(registro, id=existente['id']), linha))
+        else:
+            inalterados += 1
+
+    return novos, alterados, inalterados, duplicados
+
+
+def _gravar_em_lotes(modelo, registros, linhas, progresso=None, atualizar_campos=None):
+    """Grava os registros com bulk_create (ou bulk_update) em lotes de TAMANHO_LOTE.
+
+    Se o banco recusar um lote, apenas esse lote é regravado registro a registro,
+    para isolar as linhas com erro sem descartar as demais.
+
+    Args:
+        modelo (Model): Modelo Django dos registros.
+        registros (list): Instâncias a serem gravadas.
+        linhas (list): Número da linha no arquivo de origem de cada registro.
+        progresso (Optional[callable]): Chamado após cada lote com a quantidade
+            gravada e as linhas rejeitadas no lote.
+        atualizar_campos (Optional[list]): Campos a atualizar. Se informado, os
+            registros já existem no banco e são atualizados em vez de inseridos.
+
+    Returns:
+        tuple: Quantidade de registros gravados e lista de linhas rejeitadas.
+    """
+    gravados = 0
+    rejeitados = []
+
+    for inicio in range(0, len(registros), TAMANHO_LOTE):
+        lote = registros[inicio:inicio + TAMANHO_LOTE]
+        linhas_lote = linhas[inicio:inicio + TAMANHO_LOTE]
+        gravados_lote = 0
+        rejeitados_lote = []
+        try:
+            with transaction.atomic():
+                if atualizar_campos:
+                    modelo.objects.bulk_update(lote, atualizar_campos)
+                else:
+                    modelo.objects.bulk_create(lote)
+            gravados_lote = len(lote)
+        except DatabaseError:
+            for registro, linha in zip(lote, linhas_lote):
+                try:
+                    with transaction.atomic():
+                        if atualizar_campos:
+                            registro.save(update_fields=atualizar_campos)
+                        else:
+                            registro.save(force_insert=True)
+                    gravados_lote += 1
+                except DatabaseError as e:
+                    rejeitados_lote.append({'linha': linha, 'motivo': str(e)})
+
+        gravados += gravados_lote
+        rejeitados.extend(rejeitados_lote)
+        if progresso:
+            progresso(gravados_lote, rejeitados_lote)
+
+    return gravados, rejeitados
+
+
+def converter_blocos(tipo, blocos):
+    """Converte os blocos lidos de um arquivo da RIF para os campos do modelo.
+
+    Não acessa o banco de dados, então pode rodar em outro processo.
+
+    Args:
+        tipo (str): Tipo do arquivo: 'comunicacoes', 'envolvidos' ou 'ocorrencias'.
+        blocos (Iterable[DataFrame]): Blocos lidos por ler_arquivo_em_blocos
+            (ou um único DataFrame já com as colunas renomeadas).
+
+    Yields:
+        tuple: (dados, rejeitados, lidas): linhas válidas já convertidas, linhas
+            rejeitadas na conversão ({'linha', 'motivo'}) e quantidade de linhas do bloco.
+
+    Raises:
+        ValueError: Se o tipo de arquivo não for reconhecido.
+    """
+    if tipo not in CONVERSORES:
+        raise ValueError(f'Tipo de arquivo não reconhecido: {tipo}')
+
+    if isinstance(blocos, pd.DataFrame):
+        blocos = [blocos]
+
+    converter = CONVERSORES[tipo]
+    for bloco in blocos:
+        dados, motivos = converter(bloco)
+        rejeitados = [
+            {'linha': int(indice) + 2, 'motivo': motivo}
+            for indice, motivo in motivos.dropna().items()
+        ]
+        yield dados[motivos.isna()], rejeitados, len(bloco)
+
+
+def importar_arquivo_rif(tipo, blocos, rif, nome_arquivo, hash_arquivo, progresso=None, modo='upsert',
+                         detectar_problemas=True):
+    """Importa um arquivo da RIF (comunicacoes, envolvidos ou ocorrencias) em lote.
+
+    Converte os blocos com converter_blocos e os grava com gravar_arquivo_rif.
+
+    Args:
+        tipo (str): Tipo do arquivo: 'comunicacoes', 'envolvidos' ou 'ocorrencias'.
+        blocos (Iterable[DataFrame]): Blocos lidos por ler_arquivo_em_blocos
+            (ou um único DataFrame já com as colunas renomeadas).
+        rif (RIF): RIF à qual os dados pertencem.
+        nome_arquivo (str): Nome original do arquivo enviado.
+        hash_arquivo (str): Hash SHA256 do conteúdo do arquivo.
+        progresso (Optional[callable]): Recebe (processadas, rejeicoes) a cada lote.
+        modo (str): 'upsert' (padrão) ou 'inserir'.
+        detectar_problemas (bool): Ver gravar_arquivo_rif.
+
+    Returns:
+        dict: Resultado de gravar_arquivo_rif.
+    """
+    return gravar_arquivo_rif(
+        tipo, converter_blocos(tipo, blocos), rif, nome_arquivo, hash_arquivo, progresso, modo, detectar_problemas)
+
+
+def gravar_arquivo_rif(tipo, convertidos, rif, nome_arquivo, hash_arquivo, progresso=None, modo='upsert',
+                       detectar_problemas=True):
+    """Grava os blocos convertidos de um arquivo da RIF em lote.
+
+    Cada bloco é gravado antes do próximo ser lido ou convertido, então a
+    memória usada não depende do tamanho do arquivo. Toda a importação do arquivo,
+    incluindo o registro em Arquivo, acontece em uma única transação: se algo
+    inesperado falhar, nada do arquivo fica gravado.
+
+    No modo 'upsert', cada registro é comparado pela chave natural do esquema
+    com os já gravados na RIF: só os novos são inseridos e só os que mudaram são
+    atualizados, passando a apontar para o novo Arquivo. No modo 'inserir', todos
+    os registros são inseridos.
+
+    Args:
+        tipo (str): Tipo do arquivo: 'comunicacoes', 'envolvidos' ou 'ocorrencias'.
+        convertidos (Iterable[tuple]): Blocos gerados por converter_blocos.
+        rif (RIF): RIF à qual os dados pertencem.
+        nome_arquivo (str): Nome original do arquivo enviado.
+        hash_arquivo (str): Hash SHA256 do conteúdo do arquivo.
+        progresso (Optional[callable]): Recebe (processadas, rejeicoes) a cada lote.
+        modo (str): 'upsert' (padrão) ou 'inserir'.
+        detectar_problemas (bool): Recalcula os problemas de importação da RIF ao
+            final. Quem grava vários arquivos da mesma RIF passa False e chama
+            detectar_problemas_importacao uma vez, depois do último.
+
+    Returns:
+        dict: 'arquivo' (Arquivo criado), 'inseridos', 'atualizados' e
+            'inalterados' (quantidades) e 'rejeitados' (lista de {'linha', 'motivo'}).
+            A linha considera o cabeçalho como linha 1 do arquivo.
+
+    Raises:
+        ValueError: Se o tipo de arquivo ou o modo não forem reconhecidos.
+    """
+    if tipo not in ESQUEMAS:
+        raise ValueError(f'Tipo de arquivo não reconhecido: {tipo}')
+    if modo not in ('upsert', 'inserir'):
+        raise ValueError(f'Modo de importação não reconhecido: {modo}')
+
+    esquema = ESQUEMAS[tipo]
+    modelo = esquema.modelo
+    lidas = 0
+    inseridos = 0
+    atualizados = 0
+    inalterados = 0
+    rejeitados = []
+
+    with transaction.atomic():
+        arquivo = Arquivo.objects.create(
+            caso_id=rif.caso_id,
+            nome=nome_arquivo,
+            hash=hash_arquivo,
+            tipo=tipo,
+            external_id=rif.id,
+            registros=0
+        )
+        campos_comuns = {'rif_id': rif.id, 'caso_id': rif.caso_id, 'arquivo_id': arquivo.id}
+
+        for dados, rejeitados_bloco, lidas_bloco in convertidos:
+            lidas += lidas_bloco
+            if dados.empty:
+                if progresso and rejeitados_bloco:
+                    progresso(0, rejeitados_bloco)
+                rejeitados.extend(rejeitados_bloco)
+                continue
+
+            valores = _valores(dados)
+            linhas = [int(indice) + 2 for indice in dados.index]
+
+            if modo == 'upsert':
+                novos, alterados, inalterados_bloco, duplicados = _separar_alteracoes(
+                    modelo, esquema.chave_natural, rif.id, valores, linhas, esquema.chave_opcional)
+                rejeitados_bloco.extend(duplicados)
+                inalterados += inalterados_bloco
+                if progresso:
+                    progresso(inalterados_bloco, [])
+
+                registros = _para_registros(modelo, [registro for registro, _ in alterados], **campos_comuns)
+                atualizados_bloco, rejeitados_banco = _gravar_em_lotes(
+                    modelo, registros, [linha for _, linha in alterados], progresso,
+                    atualizar_campos=list(dados.columns) + ['arquivo'])
+                atualizados += atualizados_bloco
+                rejeitados.extend(rejeitados_banco)
+
+                valores = [registro for registro, _ in novos]
+                linhas = [linha for _, linha in novos]
+
+            if progresso and rejeitados_bloco:
+                progresso(0, rejeitados_bloco)
+            rejeitados.extend(rejeitados_bloco)
+
+            registros = _para_registros(modelo, valores, **campos_comuns)
+            inseridos_bloco, rejeitados_banco = _gravar_em_lotes(modelo, registros, linhas, progresso)
+            inseridos += inseridos_bloco
+            rejeitados.extend(rejeitados_banco)
+
+        Arquivo.objects.filter(id=arquivo.id).update(registros=lidas)
+        arquivo.registros = lidas
+
+        if tipo in ('comunicacoes', 'envolvidos') and (inseridos or atualizados):
+            atualizar_titulares(rif.id)
+        atualizar_contadores(rif.caso_id, rifs=[rif.id])
+        if inseridos or atualizados:
+            atualizar_resumo_financeiro(rif.caso_id, rifs=[rif.id])
+            if detectar_problemas:
+                detectar_problemas_importacao(rif.caso_id, rifs=[rif.id])
+
+    rejeitados.sort(key=lambda r: r['linha'])
+
+    logger.info(
+        "Importação de %s da RIF %s: %s inseridos, %s atualizados, %s inalterados, %s rejeitados",
+        tipo, rif.id, inseridos, atualizados, inalterados, len(rejeitados)
+    )
+
+    return {
+        'arquivo': arquivo,
+        'inseridos': inseridos,
+        'atualizados': atualizados,
+        'inalterados': inalterados,
+        'rejeitados': rejeitados,
+    }
+
+
+#########################################################################################################################
+# TITULARES
+#########################################################################################################################
+def atualizar_titulares(rif_id):
+    """Resolve o titular de todas as comunicações da RIF em um único UPDATE.
+
+    O titular é o primeiro envolvido do tipo 'Titular' com a mesma RIF e
+    indexador da comunicação. A FK, o nome e o CPF/CNPJ ficam gravados na
+    Comunicacao, e as listagens não precisam buscar o titular linha a linha.
+    Chamada ao final da importação de comunicações ou envolvidos.
+
+    Args:
+        rif_id (int): Id da RIF.
+
+    Returns:
+        int: Quantidade de comunicações atualizadas.
+    """
+    titulares = Envolvido.objects.filter(
+        rif_id=OuterRef('rif_id'),
+        indexador=OuterRef('indexador'),
+        tipo_envolvido='Titular'
+    ).order_by('id')
+    return Comunicacao.objects.filter(rif_id=rif_id).update(
+        envolvido_titular_id=Subquery(titulares.values('id')[:1]),
+        nome_titular=Coalesce(Subquery(titulares.values('nome_envolvido')[:1]), Value('')),
+        cpf_cnpj_titular=Subquery(titulares.values('cpf_cnpj_envolvido')[:1]),
+    )
+
+
+#########################################################################################################################
+# PROCESSAMENTO DO JOB
+#########################################################################################################################
+def _converter_para_disco(tipo, caminho, diretorio):
+    """Lê e converte um arquivo da RIF, gravando cada bloco convertido em disco.
+
+    Executado no pool de processos de processar_importacao_rif: os blocos ficam em
+    arquivos pickle no diretório do job, e não na memória, até a fase de gravação.
+
+    Returns:
+        list: Caminhos dos blocos convertidos, na ordem do arquivo.
+    """
+    caminhos = []
+    for numero, convertido in enumerate(converter_blocos(tipo, ler_arquivo_em_blocos(caminho, tipo))):
+        destino = os.path.join(diretorio, f'{tipo}_{numero:05d}.pkl')
+        with open(destino, 'wb') as arquivo:
+            pickle.dump(convertido, arquivo, protocol=pickle.HIGHEST_PROTOCOL)
+        caminhos.append(destino)
+    return caminhos
+
+
+def _ler_do_disco(caminhos):
+    """Lê os blocos gravados por _converter_para_disco, removendo cada arquivo após a leitura."""
+    for caminho in caminhos:
+        with open(caminho, 'rb') as arquivo:
+            convertido = pickle.load(arquivo)
+        os.unlink(caminho)
+        yield convertido
+
+
+def processar_importacao_rif(job, progresso):
+    """Processa um ImportJob do tipo 'rif' (executado pelo worker de importações).
+
+    Args:
+        job (ImportJob): Job com os caminhos dos arquivos de comunicacoes,
+            envolvidos e ocorrencias.
+        progresso (ProgressoJob): Acumulador do andamento da importação.
+
+    Returns:
+        str: Resumo da importação.
+
+    Raises:
+        RIF.DoesNotExist: Se a RIF do job não pertencer ao caso.
+        ValueError: Se algum arquivo não puder ser lido.
+    """
+    rif = RIF.objects.get(id=job.external_id, caso_id=job.caso_id)
+
+    arquivos = {tipo: job.arquivos[tipo] for tipo in ESQUEMAS if job.arquivos.get(tipo)}
+    progresso.definir_total(sum(contar_linhas(caminho) for caminho in arquivos.values()))
+
+    resumo = {}
+    pendentes = {}
+    for tipo, caminho in arquivos.items():
+        with open(caminho, 'rb') as arquivo:
+            hash_arquivo = sha256_file(arquivo)
+
+        # O mesmo arquivo já importado nesta RIF não tem o que atualizar
+        if Arquivo.objects.filter(hash=hash_arquivo, tipo=tipo, external_id=rif.id, caso_id=rif.caso_id).exists():
+            progresso.registrar(contar_linhas(caminho))
+            resumo[tipo] = f"{tipo}: arquivo já importado anteriormente"
+            continue
+        pendentes[tipo] = (caminho, hash_arquivo)
+
+    # Todos os arquivos já importados: nada a converter, sem iniciar os processos
+    if not pendentes:
+        return '; '.join(resumo[tipo] for tipo in arquivos)
+
+    # Leitura e conversão dos arquivos em paralelo; a gravação é feita neste processo,
+    # um arquivo por vez, na ordem de ESQUEMAS, assim que a conversão dele termina
+    contexto = multiprocessing.get_context('spawn')
+    diretorios = []
+    alterada = False
+    try:
+        with ProcessPoolExecutor(max_workers=max(1, min(len(pendentes), PROCESSOS_CONVERSAO)),
+                                 mp_context=contexto, initializer=django.setup) as pool:
+            futuros = {}
+            for tipo, (caminho, _) in pendentes.items():
+                diretorio = os.path.join(os.path.dirname(caminho), 'convertidos')
+                os.makedirs(diretorio, exist_ok=True)
+                diretorios.append(diretorio)
+                futuros[tipo] = pool.submit(_converter_para_disco, tipo, caminho, diretorio)
+
+            for tipo, (caminho, hash_arquivo) in pendentes.items():
+                try:
+                    blocos = futuros[tipo].result()
+                except (ValueError, UnicodeDecodeError, pd.errors.ParserError) as e:
+                    raise ValueError(f'Erro ao processar arquivo {tipo}: {str(e)}')
+
+                resultado = gravar_arquivo_rif(
+                    tipo, _ler_do_disco(blocos), rif, os.path.basename(caminho),
+                    hash_arquivo, progresso=progresso.registrar, detectar_problemas=False)
+                alterada = alterada or bool(resultado['inseridos'] or resultado['atualizados'])
+
+                resumo[tipo] = (
+                    f"{tipo}: {resultado['inseridos']} inseridos, {resultado['atualizados']} atualizados, "
+                    f"{resultado['inalterados']} inalterados, {len(resultado['rejeitados'])} rejeitados"
+                )
+    finally:
+        # Após o encerramento do pool: blocos não gravados por causa de um erro em outro arquivo
+        for diretorio in diretorios:
+            shutil.rmtree(diretorio, ignore_errors=True)
+        # Problemas de importação verificados uma vez, depois do último arquivo gravado da RIF
+        if alterada:
+            detectar_problemas_importacao(rif.caso_id, rifs=[rif.id])
+
+    return '; '.join(resumo[tipo] for tipo in arquivos)
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from financeira.resumo import reconstruir_resumos
+
+
+class Command(BaseCommand):
+    help = ('Apaga e recalcula o resumo financeiro dos casos (totais, titulares, segmentos, ocorrências e '
+            'comunicações de maior volume) a partir dos dados gravados')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--caso', type=int, action='append', dest='casos',
+            help='Id do caso a recalcular (pode ser repetido); por padrão, todos os casos'
+        )
+
+    def handle(self, *args, **options):
+        total = reconstruir_resumos(options['casos'])
+        self.stdout.write(self.style.SUCCESS(f'Resumo financeiro de {total} caso(s) reconstruído(s).'))
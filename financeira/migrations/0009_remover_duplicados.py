@@ -0,0 +1,73 @@
+# Remove os registros duplicados por reimportações da RIF antes da criação das
+# restrições únicas pela chave natural (0010_chaves_naturais). A remoção não é
+# desfeita na reversão; os ids removidos de cada tabela são registrados no log.
+
+import logging
+
+from django.db import migrations
+from django.db.models import Count, Min
+
+logger = logging.getLogger(__name__)
+
+# Quantidade máxima de ids listados no log, por tabela
+IDS_NO_LOG = 1000
+
+
+def remover_duplicados(apps, schema_editor):
+    Comunicacao = apps.get_model('financeira', 'Comunicacao')
+    Envolvido = apps.get_model('financeira', 'Envolvido')
+    Ocorrencia = apps.get_model('financeira', 'Ocorrencia')
+    InformacaoAdicional = apps.get_model('financeira', 'InformacaoAdicional')
+    KYC = apps.get_model('financeira', 'KYC')
+    AnaliseIA = apps.get_model('financeira', 'AnaliseIA')
+
+    # Mantém o registro mais antigo de cada chave, ao qual as análises e informações já apontavam.
+    # Agência e conta nulas fazem parte da chave (a restrição compara com COALESCE)
+    for modelo, chave, opcionais in [
+        (Comunicacao, ['rif_id', 'indexador', 'id_comunicacao'], []),
+        (Envolvido, ['rif_id', 'indexador', 'cpf_cnpj_envolvido', 'tipo_envolvido', 'agencia_envolvido',
+                     'conta_envolvido'], ['agencia_envolvido', 'conta_envolvido']),
+        (Ocorrencia, ['rif_id', 'indexador', 'id_ocorrencia'], []),
+    ]:
+        removidos = []
+        grupos = (
+            modelo.objects.values(*chave)
+            .annotate(manter=Min('id'), total=Count('id'))
+            .filter(total__gt=1)
+        )
+        for grupo in grupos.iterator():
+            manter = grupo.pop('manter')
+            grupo.pop('total')
+            if any(valor is None for campo, valor in grupo.items() if campo not in opcionais):
+                # NULL não viola a restrição única
+                continue
+
+            repetidos = list(modelo.objects.filter(**grupo).exclude(id=manter).values_list('id', flat=True))
+
+            if modelo is Comunicacao:
+                InformacaoAdicional.objects.filter(comunicacao_id__in=repetidos).update(comunicacao_id=manter)
+                KYC.objects.filter(comunicacao_id__in=repetidos).update(comunicacao_id=manter)
+                casos_com_analise = AnaliseIA.objects.filter(comunicacao_id=manter).values_list('caso_id', flat=True)
+                AnaliseIA.objects.filter(comunicacao_id__in=repetidos).exclude(
+                    caso_id__in=list(casos_com_analise)).update(comunicacao_id=manter)
+
+            modelo.objects.filter(id__in=repetidos).delete()
+            removidos.extend(repetidos)
+
+        if removidos:
+            logger.warning(
+                "%s: %s registros duplicados removidos. Ids: %s%s",
+                modelo._meta.db_table, len(removidos), removidos[:IDS_NO_LOG],
+                ' ...' if len(removidos) > IDS_NO_LOG else ''
+            )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('financeira', '0008_alter_comunicacao_cpf_cnpj_comunicante_and_more'),
+    ]
+
+    operations = [
+        migrations.RunPython(remover_duplicados, migrations.RunPython.noop),
+    ]
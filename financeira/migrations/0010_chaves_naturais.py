@@ -0,0 +1,26 @@
+# Generated by Django 5.1.4 on 2026-10-18 13:01
+
+import django.db.models.functions.comparison
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('financeira', '0009_remover_duplicados'),
+    ]
+
+    operations = [
+        migrations.AddConstraint(
+            model_name='comunicacao',
+            constraint=models.UniqueConstraint(fields=('rif', 'indexador', 'id_comunicacao'), name='comunicacao_chave_natural'),
+        ),
+        migrations.AddConstraint(
+            model_name='envolvido',
+            constraint=models.UniqueConstraint(models.F('rif'), models.F('indexador'), models.F('cpf_cnpj_envolvido'), models.F('tipo_envolvido'), django.db.models.functions.comparison.Coalesce('agencia_envolvido', models.Value(-1)), django.db.models.functions.comparison.Coalesce('conta_envolvido', models.Value(-1)), name='envolvido_chave_natural'),
+        ),
+        migrations.AddConstraint(
+            model_name='ocorrencia',
+            constraint=models.UniqueConstraint(fields=('rif', 'indexador', 'id_ocorrencia'), name='ocorrencia_chave_natural'),
+        ),
+    ]
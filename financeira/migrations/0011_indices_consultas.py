@@ -0,0 +1,34 @@
+# Generated by Django 5.1.4 on 2026-10-18 13:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0008_importjob'),
+        ('financeira', '0010_chaves_naturais'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='comunicacao',
+            index=models.Index(fields=['caso', 'indexador'], name='comunicacao_caso_indexador'),
+        ),
+        migrations.AddIndex(
+            model_name='envolvido',
+            index=models.Index(fields=['caso', 'tipo_envolvido', 'indexador'], name='envolvido_caso_tipo_indexador'),
+        ),
+        migrations.AddIndex(
+            model_name='envolvido',
+            index=models.Index(fields=['cpf_cnpj_envolvido', 'caso'], name='envolvido_cpf_cnpj_caso'),
+        ),
+        migrations.AddIndex(
+            model_name='informacaoadicional',
+            index=models.Index(fields=['rif', 'indexador'], name='infoadicional_rif_indexador'),
+        ),
+        migrations.AddIndex(
+            model_name='ocorrencia',
+            index=models.Index(fields=['caso', 'indexador'], name='ocorrencia_caso_indexador'),
+        ),
+    ]
@@ -0,0 +1,97 @@
+# Normaliza os textos de campo_a..campo_e da Comunicacao para o formato decimal
+# ("1234.56") antes da conversão das colunas para DecimalField
+# (0013_campos_monetarios_decimal). A conversão segue as mesmas regras da
+# importação da RIF (utils.conversores.valores_monetarios, copiada abaixo para
+# que a migração não dependa do código atual). Valores vazios viram 0; valores
+# inválidos ou fora do limite também, e as comunicações afetadas são registradas
+# no log.
+
+import logging
+
+import pandas as pd
+from django.db import migrations
+
+logger = logging.getLogger(__name__)
+
+CAMPOS = ['campo_a', 'campo_b', 'campo_c', 'campo_d', 'campo_e']
+TAMANHO_LOTE = 5000
+LIMITE = 10 ** 16  # max_digits=18, decimal_places=2
+
+# Quantidade máxima de ids listados no log
+IDS_NO_LOG = 100
+
+
+def _valores_monetarios(texto):
+    # Cópia de utils.conversores.valores_monetarios para colunas de texto: com vírgula,
+    # os pontos são separadores de milhar; sem vírgula, "1.234" e "1.234.567" também
+    texto = texto.str.replace(r'R\$|\$|\s', '', regex=True)
+
+    com_virgula = texto.str.contains(',', regex=False)
+    texto = texto.mask(
+        com_virgula,
+        texto.str.replace('.', '', regex=False).str.replace(',', '.', regex=False)
+    )
+
+    milhar = ~com_virgula & texto.str.contains(r'\.\d{3}(?:\.|$)', regex=True)
+    texto = texto.mask(milhar, texto.str.replace('.', '', regex=False))
+
+    return pd.to_numeric(texto.where(texto != ''), errors='coerce').astype(float)
+
+
+def _normalizar(serie):
+    # Retorna os valores no formato decimal e a máscara dos valores informados que
+    # não puderam ser convertidos (inválidos ou fora do limite), gravados como 0
+    texto = serie.where(serie.notna(), '').astype(str).str.strip()
+    valores = _valores_monetarios(texto).round(2)
+    valores = valores.where(valores.abs() < LIMITE)
+    invalidos = valores.isna() & (texto != '')
+    return valores.fillna(0).map('{:.2f}'.format), invalidos
+
+
+def normalizar_campos_monetarios(apps, schema_editor):
+    Comunicacao = apps.get_model('financeira', 'Comunicacao')
+
+    invalidos_por_campo = dict.fromkeys(CAMPOS, 0)
+    ids_invalidos = []
+    ultimo_id = 0
+    while True:
+        lote = list(
+            Comunicacao.objects.filter(id__gt=ultimo_id).order_by('id').values_list('id', *CAMPOS)[:TAMANHO_LOTE]
+        )
+        if not lote:
+            break
+        ultimo_id = lote[-1][0]
+
+        df = pd.DataFrame(lote, columns=['id', *CAMPOS]).set_index('id')
+        normalizados = pd.DataFrame(index=df.index)
+        invalidos = pd.DataFrame(index=df.index)
+        for campo in CAMPOS:
+            normalizados[campo], invalidos[campo] = _normalizar(df[campo])
+            invalidos_por_campo[campo] += int(invalidos[campo].sum())
+        ids_invalidos.extend(df.index[invalidos.any(axis=1)].tolist())
+
+        alterados = (normalizados != df).any(axis=1)
+        registros = [
+            Comunicacao(id=id_comunicacao, **valores)
+            for id_comunicacao, valores in normalizados[alterados].to_dict(orient='index').items()
+        ]
+        Comunicacao.objects.bulk_update(registros, CAMPOS, batch_size=1000)
+
+    if ids_invalidos:
+        logger.warning(
+            "%s comunicações com valores monetários inválidos ou fora do limite gravados como 0 "
+            "(por campo: %s). Ids: %s%s",
+            len(ids_invalidos), invalidos_por_campo, ids_invalidos[:IDS_NO_LOG],
+            ' ...' if len(ids_invalidos) > IDS_NO_LOG else ''
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('financeira', '0011_indices_consultas'),
+    ]
+
+    operations = [
+        migrations.RunPython(normalizar_campos_monetarios, migrations.RunPython.noop),
+    ]
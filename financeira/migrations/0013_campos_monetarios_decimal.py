@@ -0,0 +1,38 @@
+# Generated by Django 5.1.4 on 2026-10-18 13:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('financeira', '0012_normalizar_campos_monetarios'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='comunicacao',
+            name='campo_a',
+            field=models.DecimalField(decimal_places=2, max_digits=18),
+        ),
+        migrations.AlterField(
+            model_name='comunicacao',
+            name='campo_b',
+            field=models.DecimalField(decimal_places=2, max_digits=18),
+        ),
+        migrations.AlterField(
+            model_name='comunicacao',
+            name='campo_c',
+            field=models.DecimalField(decimal_places=2, max_digits=18),
+        ),
+        migrations.AlterField(
+            model_name='comunicacao',
+            name='campo_d',
+            field=models.DecimalField(decimal_places=2, max_digits=18),
+        ),
+        migrations.AlterField(
+            model_name='comunicacao',
+            name='campo_e',
+            field=models.DecimalField(decimal_places=2, max_digits=18),
+        ),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 5.1.4 on 2026-10-18 13:57
+
+import financeira.models
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def preencher_titulares(apps, schema_editor):
+    # Mesmo critério de financeira.importacao.atualizar_titulares, uma RIF por vez
+    RIF = apps.get_model('financeira', 'RIF')
+    Comunicacao = apps.get_model('financeira', 'Comunicacao')
+    Envolvido = apps.get_model('financeira', 'Envolvido')
+
+    titulares = Envolvido.objects.filter(
+        rif_id=OuterRef('rif_id'), indexador=OuterRef('indexador'), tipo_envolvido='Titular').order_by('id')
+    for rif_id in RIF.objects.values_list('id', flat=True):
+        Comunicacao.objects.filter(rif_id=rif_id).update(
+            envolvido_titular_id=Subquery(titulares.values('id')[:1]),
+            nome_titular=Coalesce(Subquery(titulares.values('nome_envolvido')[:1]), Value('')),
+            cpf_cnpj_titular=Subquery(titulares.values('cpf_cnpj_envolvido')[:1]),
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('financeira', '0013_campos_monetarios_decimal'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='comunicacao',
+            name='cpf_cnpj_titular',
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='comunicacao',
+            name='envolvido_titular',
+            field=models.ForeignKey(blank=True, null=True, on_delete=financeira.models.limpar_titular, related_name='comunicacoes_titular', to='financeira.envolvido'),
+        ),
+        migrations.AddField(
+            model_name='comunicacao',
+            name='nome_titular',
+            field=models.CharField(blank=True, default='', max_length=254),
+        ),
+        migrations.RunPython(preencher_titulares, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,56 @@
+# Generated by Django 5.1.4 on 2026-10-18 14:05
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0009_contadores'),
+        ('financeira', '0014_titular_comunicacao'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CasoResumoFinanceiro',
+            fields=[
+                ('comunicacoes', models.IntegerField(default=0)),
+                ('total_campo_a', models.DecimalField(decimal_places=2, default=0, max_digits=20)),
+                ('total_campo_b', models.DecimalField(decimal_places=2, default=0, max_digits=20)),
+                ('total_campo_c', models.DecimalField(decimal_places=2, default=0, max_digits=20)),
+                ('por_titular', models.JSONField(default=dict)),
+                ('por_segmento', models.JSONField(default=dict)),
+                ('por_ocorrencia', models.JSONField(default=dict)),
+                ('volume_por_comunicacao', models.JSONField(default=dict)),
+                ('atualizado_em', models.DateTimeField(auto_now=True)),
+                ('caso', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='resumo_financeiro', serialize=False, to='app.caso')),
+                ('por_rif', models.JSONField(default=dict)),
+                ('versao', models.IntegerField(default=0)),
+            ],
+            options={
+                'verbose_name': 'Resumo Financeiro do Caso',
+                'verbose_name_plural': 'Resumos Financeiros dos Casos',
+            },
+        ),
+        migrations.CreateModel(
+            name='RIFResumoFinanceiro',
+            fields=[
+                ('comunicacoes', models.IntegerField(default=0)),
+                ('total_campo_a', models.DecimalField(decimal_places=2, default=0, max_digits=20)),
+                ('total_campo_b', models.DecimalField(decimal_places=2, default=0, max_digits=20)),
+                ('total_campo_c', models.DecimalField(decimal_places=2, default=0, max_digits=20)),
+                ('por_titular', models.JSONField(default=dict)),
+                ('por_segmento', models.JSONField(default=dict)),
+                ('por_ocorrencia', models.JSONField(default=dict)),
+                ('volume_por_comunicacao', models.JSONField(default=dict)),
+                ('atualizado_em', models.DateTimeField(auto_now=True)),
+                ('rif', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='resumo_financeiro', serialize=False, to='financeira.rif')),
+                ('caso', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='app.caso')),
+            ],
+            options={
+                'verbose_name': 'Resumo Financeiro da RIF',
+                'verbose_name_plural': 'Resumos Financeiros das RIFs',
+            },
+        ),
+    ]
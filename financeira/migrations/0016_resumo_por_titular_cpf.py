@@ -0,0 +1,48 @@
+from decimal import Decimal
+
+from django.db import migrations
+from django.db.models import Count, F, Sum
+
+
+def recalcular_por_titular(apps, schema_editor):
+    # Mesmo critério de financeira.resumo: por CPF/CNPJ e nome do titular, com soma do campo_a e quantidade
+    banco = schema_editor.connection.alias
+    Comunicacao = apps.get_model('financeira', 'Comunicacao')
+    RIFResumoFinanceiro = apps.get_model('financeira', 'RIFResumoFinanceiro')
+    CasoResumoFinanceiro = apps.get_model('financeira', 'CasoResumoFinanceiro')
+
+    parciais = {}
+    linhas = Comunicacao.objects.using(banco).exclude(nome_titular='').order_by().values(
+        'rif_id', 'cpf_cnpj_titular', 'nome_titular').annotate(valor=Sum('campo_a'), quantidade=Count('id'))
+    for linha in linhas:
+        chave = f"{linha['cpf_cnpj_titular'] or ''}|{linha['nome_titular']}"
+        parciais.setdefault(linha['rif_id'], {})[chave] = {
+            'cpf_cnpj': linha['cpf_cnpj_titular'], 'nome': linha['nome_titular'], 'valor': str(linha['valor']),
+            'comunicacoes': linha['quantidade']}
+
+    combinados = {}
+    for resumo in RIFResumoFinanceiro.objects.using(banco).order_by('rif_id'):
+        resumo.por_titular = parciais.get(resumo.rif_id, {})
+        resumo.save(update_fields=['por_titular'])
+        por_titular = combinados.setdefault(resumo.caso_id, {})
+        for chave, titular in resumo.por_titular.items():
+            total = por_titular.setdefault(chave, {**titular, 'valor': Decimal('0'), 'comunicacoes': 0})
+            total['valor'] += Decimal(titular['valor'])
+            total['comunicacoes'] += titular['comunicacoes']
+
+    # Nova versão do resumo, para não reaproveitar valores em cache calculados no formato anterior
+    for caso_id, por_titular in combinados.items():
+        CasoResumoFinanceiro.objects.using(banco).filter(caso_id=caso_id).update(
+            por_titular={chave: {**titular, 'valor': str(titular['valor'])} for chave, titular in por_titular.items()},
+            versao=F('versao') + 1)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('financeira', '0015_resumo_financeiro'),
+    ]
+
+    operations = [
+        migrations.RunPython(recalcular_por_titular, migrations.RunPython.noop),
+    ]
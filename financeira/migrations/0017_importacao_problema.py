@@ -0,0 +1,77 @@
+# Generated by Django 5.1.4 on 2026-10-18 14:40
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import CharField, Exists, F, Func, Min, OuterRef, Subquery, Value
+from django.db.models.functions import Cast
+
+
+def detectar_problemas(apps, schema_editor):
+    # Mesmas verificações de financeira.problemas, para os dados já importados
+    banco = schema_editor.connection.alias
+    modelo = lambda nome: apps.get_model('financeira', nome)
+    Comunicacao, Envolvido, Ocorrencia = modelo('Comunicacao'), modelo('Envolvido'), modelo('Ocorrencia')
+    InformacaoAdicional, ImportacaoProblema = modelo('InformacaoAdicional'), modelo('ImportacaoProblema')
+
+    def mesma_comunicacao(modelo):
+        return modelo.objects.using(banco).filter(rif_id=OuterRef('rif_id'), indexador=OuterRef('indexador'))
+
+    informacoes = InformacaoAdicional.objects.using(banco).filter(caso_id=OuterRef('caso_id')).annotate(
+        cpf_numerico=Func(F('cpf'), Value('0'), function='LTRIM', output_field=CharField()),
+    ).filter(cpf_numerico=Cast(OuterRef('cpf_cnpj_envolvido'), CharField()))
+    primeiros = Envolvido.objects.using(banco).filter(
+        tipo_envolvido__in=['Remetente', 'Beneficiário', 'Outros'], cpf_cnpj_envolvido__isnull=False,
+    ).filter(~Exists(informacoes)).order_by().values('rif_id', 'cpf_cnpj_envolvido').annotate(primeiro=Min('id'))
+
+    consultas = [
+        ('envolvido_sem_informacao', Envolvido.objects.using(banco).filter(id__in=primeiros.values('primeiro')).annotate(
+            comunicacao_id=Subquery(mesma_comunicacao(Comunicacao).order_by('id').values('id')[:1]),
+            envolvido_id=F('id'), cpf_cnpj=F('cpf_cnpj_envolvido'))),
+        ('comunicacao_sem_envolvidos', Comunicacao.objects.using(banco).filter(
+            ~Exists(mesma_comunicacao(Envolvido))).annotate(comunicacao_id=F('id'))),
+        ('comunicacao_sem_titular', Comunicacao.objects.using(banco).filter(
+            envolvido_titular__isnull=True).filter(Exists(mesma_comunicacao(Envolvido))).annotate(comunicacao_id=F('id'))),
+        ('envolvido_sem_comunicacao', Envolvido.objects.using(banco).filter(
+            ~Exists(mesma_comunicacao(Comunicacao))).annotate(envolvido_id=F('id'), cpf_cnpj=F('cpf_cnpj_envolvido'))),
+        ('ocorrencia_sem_comunicacao', Ocorrencia.objects.using(banco).filter(
+            ~Exists(mesma_comunicacao(Comunicacao))).annotate(ocorrencia_id=F('id'))),
+    ]
+    for tipo, consulta in consultas:
+        campos = [campo for campo in ('comunicacao_id', 'envolvido_id', 'ocorrencia_id', 'cpf_cnpj')
+                  if campo in consulta.query.annotations]
+        ImportacaoProblema.objects.using(banco).bulk_create(
+            [ImportacaoProblema(tipo=tipo, **linha)
+             for linha in consulta.values('caso_id', 'rif_id', 'indexador', *campos).iterator(chunk_size=1000)],
+            batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0010_importjob_exclusoes'),
+        ('financeira', '0016_resumo_por_titular_cpf'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImportacaoProblema',
+            fields=[
+                ('id', models.AutoField(primary_key=True, serialize=False)),
+                ('tipo', models.CharField(choices=[('envolvido_sem_informacao', 'Envolvido sem informações adicionais'), ('comunicacao_sem_envolvidos', 'Comunicação sem envolvidos'), ('comunicacao_sem_titular', 'Comunicação sem titular'), ('envolvido_sem_comunicacao', 'Envolvido sem comunicação'), ('ocorrencia_sem_comunicacao', 'Ocorrência sem comunicação')], max_length=30)),
+                ('indexador', models.IntegerField()),
+                ('cpf_cnpj', models.BigIntegerField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('caso', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='app.caso')),
+                ('comunicacao', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='financeira.comunicacao')),
+                ('envolvido', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='financeira.envolvido')),
+                ('ocorrencia', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='financeira.ocorrencia')),
+                ('rif', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='financeira.rif')),
+            ],
+            options={
+                'verbose_name': 'Problema de Importação',
+                'verbose_name_plural': 'Problemas de Importação',
+                'indexes': [models.Index(fields=['caso', 'tipo', 'indexador'], name='problema_caso_tipo_indexador')],
+            },
+        ),
+        migrations.RunPython(detectar_problemas, migrations.RunPython.noop),
+    ]
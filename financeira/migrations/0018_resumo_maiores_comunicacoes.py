@@ -0,0 +1,55 @@
+from django.db import migrations
+from django.db.models import F
+
+# Mesmo limite de financeira.resumo.LIMITE_COMUNICACOES
+LIMITE_COMUNICACOES = 50
+
+
+def _ordenar(comunicacoes):
+    return sorted(comunicacoes.items(), key=lambda item: (-item[1]['valor'], int(item[0])))
+
+
+def recalcular_maiores_comunicacoes(apps, schema_editor):
+    # Mesmo critério de financeira.resumo: as comunicações de maior campo_a de cada RIF, pelo id
+    banco = schema_editor.connection.alias
+    Comunicacao = apps.get_model('financeira', 'Comunicacao')
+    RIFResumoFinanceiro = apps.get_model('financeira', 'RIFResumoFinanceiro')
+    CasoResumoFinanceiro = apps.get_model('financeira', 'CasoResumoFinanceiro')
+
+    combinados = {}
+    for resumo in RIFResumoFinanceiro.objects.using(banco).order_by('rif_id'):
+        maiores = Comunicacao.objects.using(banco).filter(rif_id=resumo.rif_id).order_by('-campo_a', 'id').values_list(
+            'id', 'rif__caso__numero', 'rif__numero', 'indexador', 'campo_a')[:LIMITE_COMUNICACOES]
+        resumo.maiores_comunicacoes = {
+            str(comunicacao_id): {'rotulo': f"{numero_caso} - {numero_rif} - Ind. {indexador}",
+                                  'valor': float(campo_a)}
+            for comunicacao_id, numero_caso, numero_rif, indexador, campo_a in maiores
+        }
+        resumo.save(update_fields=['maiores_comunicacoes'])
+        combinados.setdefault(resumo.caso_id, {}).update(resumo.maiores_comunicacoes)
+
+    # Nova versão do resumo, para não reaproveitar valores em cache calculados no formato anterior
+    for caso_id, maiores in combinados.items():
+        CasoResumoFinanceiro.objects.using(banco).filter(caso_id=caso_id).update(
+            maiores_comunicacoes=dict(_ordenar(maiores)[:LIMITE_COMUNICACOES]), versao=F('versao') + 1)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('financeira', '0017_importacao_problema'),
+    ]
+
+    operations = [
+        migrations.RenameField(
+            model_name='casoresumofinanceiro',
+            old_name='volume_por_comunicacao',
+            new_name='maiores_comunicacoes',
+        ),
+        migrations.RenameField(
+            model_name='rifresumofinanceiro',
+            old_name='volume_por_comunicacao',
+            new_name='maiores_comunicacoes',
+        ),
+        migrations.RunPython(recalcular_maiores_comunicacoes, migrations.RunPython.noop),
+    ]
@@ -1,4 +1,5 @@
 from django.db import models
+from django.db.models.functions import Coalesce
 from django.conf import settings
 from app.models import Caso
 
@@ -16,6 +17,12 @@ class RIF(models.Model):
         verbose_name = 'RIF'
         verbose_name_plural = 'RIFs'
 
+def limpar_titular(collector, field, sub_objs, using):
+    """on_delete do titular da comunicação: além da FK, limpa o nome e o CPF/CNPJ guardados."""
+    collector.add_field_update(field, None, sub_objs)
+    collector.add_field_update(field.model._meta.get_field('nome_titular'), '', sub_objs)
+    collector.add_field_update(field.model._meta.get_field('cpf_cnpj_titular'), None, sub_objs)
+
 class Comunicacao(models.Model):
     id = models.AutoField(primary_key=True)
     rif = models.ForeignKey(RIF, on_delete=models.CASCADE)
@@ -40,12 +47,18 @@ class Comunicacao(models.Model):
                                                                     #    o Resumo das movimentações a débito, informando as características da movimentação financeira.
                                                                     #    o Relação dos principais destinatários de recursos, na opinião do comunicante.
                                                                     #    o Informações de Conheça seu Cliente ou Know your Client (KYC), cujo principal objetivo é identificar o comportamento do titular da conta. Pode trazer indícios da prática de ilícitos, notícias de mídia, informações de diligências realizadas pelo comunicante, entre outros.
-    campo_a = models.TextField()                                # campo A
-    campo_b = models.TextField()                                # campo B
-    campo_c = models.TextField()                                # campo C
-    campo_d = models.TextField()                                # campo D
-    campo_e = models.TextField()                                # campo E
+    campo_a = models.DecimalField(max_digits=18, decimal_places=2)  # campo A
+    campo_b = models.DecimalField(max_digits=18, decimal_places=2)  # campo B
+    campo_c = models.DecimalField(max_digits=18, decimal_places=2)  # campo C
+    campo_d = models.DecimalField(max_digits=18, decimal_places=2)  # campo D
+    campo_e = models.DecimalField(max_digits=18, decimal_places=2)  # campo E
     codigo_segmento = models.IntegerField()                     # registra o segmento da economia que realizou a comunicação.
+    # Titular da comunicação (envolvido 'Titular' da mesma RIF e indexador), resolvido na importação
+    # por financeira.importacao.atualizar_titulares; nome e CPF/CNPJ copiados para as listagens
+    envolvido_titular = models.ForeignKey('Envolvido', null=True, blank=True, on_delete=limpar_titular,
+                                          related_name='comunicacoes_titular')
+    nome_titular = models.CharField(max_length=254, blank=True, default='')
+    cpf_cnpj_titular = models.BigIntegerField(null=True, blank=True)
 
     def __str__(self):
         return f"{self.caso.numero} - {self.id_comunicacao}"
@@ -53,6 +66,14 @@ class Comunicacao(models.Model):
     class Meta:
         verbose_name = 'Comunicacaoo'
         verbose_name_plural = 'Comunicacoes'
+        constraints = [
+            # Chave natural usada na reimportação da RIF (ver financeira.esquemas.ESQUEMAS)
+            models.UniqueConstraint(fields=['rif', 'indexador', 'id_comunicacao'], name='comunicacao_chave_natural'),
+        ]
+        # Consultas por rif + indexador usam o índice da chave natural
+        indexes = [
+            models.Index(fields=['caso', 'indexador'], name='comunicacao_caso_indexador'),
+        ]
 
 class Envolvido(models.Model):
     id = models.AutoField(primary_key=True)
@@ -77,6 +98,21 @@ class Envolvido(models.Model):
     class Meta:
         verbose_name = 'Envolvido'
         verbose_name_plural = 'Envolvidos'
+        constraints = [
+            # A mesma pessoa pode aparecer no mesmo papel com contas diferentes. Agência e conta não
+            # informadas contam como um mesmo valor, como na reimportação; envolvidos sem CPF/CNPJ não
+            # são cobertos pela restrição (NULL é sempre distinto)
+            models.UniqueConstraint(
+                'rif', 'indexador', 'cpf_cnpj_envolvido', 'tipo_envolvido',
+                Coalesce('agencia_envolvido', models.Value(-1)), Coalesce('conta_envolvido', models.Value(-1)),
+                name='envolvido_chave_natural'),
+        ]
+        indexes = [
+            # Titulares do caso e titular de uma comunicação (caso + tipo + indexador)
+            models.Index(fields=['caso', 'tipo_envolvido', 'indexador'], name='envolvido_caso_tipo_indexador'),
+            # Busca por CPF/CNPJ, dentro do caso ou em todos os casos
+            models.Index(fields=['cpf_cnpj_envolvido', 'caso'], name='envolvido_cpf_cnpj_caso'),
+        ]
 
 class Ocorrencia(models.Model):
     id = models.AutoField(primary_key=True)
@@ -93,6 +129,12 @@ class Ocorrencia(models.Model):
     class Meta:
         verbose_name = 'Ocorrencia'
         verbose_name_plural = 'Ocorrencias'
+        constraints = [
+            models.UniqueConstraint(fields=['rif', 'indexador', 'id_ocorrencia'], name='ocorrencia_chave_natural'),
+        ]
+        indexes = [
+            models.Index(fields=['caso', 'indexador'], name='ocorrencia_caso_indexador'),
+        ]
 
 class InformacaoAdicional(models.Model):
     id = models.AutoField(primary_key=True)
@@ -114,6 +156,9 @@ class InformacaoAdicional(models.Model):
     class Meta:
         verbose_name = 'InformacaoAdicional'
         verbose_name_plural = 'InformacoesAdicionais'
+        indexes = [
+            models.Index(fields=['rif', 'indexador'], name='infoadicional_rif_indexador'),
+        ]
 
 class KYC(models.Model):
     id = models.AutoField(primary_key=True)
@@ -162,6 +207,77 @@ class ComunicacaoNaoProcessada(models.Model):
         verbose_name = 'ComunicacaoNaoProcessada'
         verbose_name_plural = 'ComunicacoesNaoProcessadas'
 
+# Inconsistências encontradas nos dados importados (financeira.problemas), recalculadas ao
+# final de cada importação e listadas na tela de erros de importação
+class ImportacaoProblema(models.Model):
+    TIPO_CHOICES = [
+        ('envolvido_sem_informacao', 'Envolvido sem informações adicionais'),
+        ('comunicacao_sem_envolvidos', 'Comunicação sem envolvidos'),
+        ('comunicacao_sem_titular', 'Comunicação sem titular'),
+        ('envolvido_sem_comunicacao', 'Envolvido sem comunicação'),
+        ('ocorrencia_sem_comunicacao', 'Ocorrência sem comunicação'),
+    ]
+
+    id = models.AutoField(primary_key=True)
+    caso = models.ForeignKey('app.Caso', on_delete=models.CASCADE)
+    rif = models.ForeignKey(RIF, on_delete=models.CASCADE)
+    tipo = models.CharField(max_length=30, choices=TIPO_CHOICES)
+    indexador = models.IntegerField()
+    comunicacao = models.ForeignKey(Comunicacao, null=True, blank=True, on_delete=models.CASCADE)
+    envolvido = models.ForeignKey(Envolvido, null=True, blank=True, on_delete=models.CASCADE)
+    ocorrencia = models.ForeignKey(Ocorrencia, null=True, blank=True, on_delete=models.CASCADE)
+    cpf_cnpj = models.BigIntegerField(null=True, blank=True)    # CPF/CNPJ do envolvido, quando houver
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.rif_id} - {self.indexador} - {self.get_tipo_display()}"
+
+    class Meta:
+        verbose_name = 'Problema de Importação'
+        verbose_name_plural = 'Problemas de Importação'
+        indexes = [
+            models.Index(fields=['caso', 'tipo', 'indexador'], name='problema_caso_tipo_indexador'),
+        ]
+
+# Resumo financeiro pré-calculado (financeira.resumo): um parcial por RIF e o total do caso,
+# recalculados apenas para as RIFs afetadas por uma importação ou exclusão
+class ResumoFinanceiroBase(models.Model):
+    comunicacoes = models.IntegerField(default=0)
+    total_campo_a = models.DecimalField(max_digits=20, decimal_places=2, default=0)
+    total_campo_b = models.DecimalField(max_digits=20, decimal_places=2, default=0)
+    total_campo_c = models.DecimalField(max_digits=20, decimal_places=2, default=0)
+    por_titular = models.JSONField(default=dict)                # {"cpf|nome": {cpf_cnpj, nome, valor (soma do campo_a, em texto), comunicacoes}}
+    por_segmento = models.JSONField(default=dict)               # {código do segmento: quantidade de comunicações}
+    por_ocorrencia = models.JSONField(default=dict)             # {ocorrência: quantidade}
+    maiores_comunicacoes = models.JSONField(default=dict)       # {id da comunicação: {rotulo, valor}}: as de maior campo_a, para os gráficos
+    atualizado_em = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        abstract = True
+
+class RIFResumoFinanceiro(ResumoFinanceiroBase):
+    rif = models.OneToOneField(RIF, on_delete=models.CASCADE, primary_key=True, related_name='resumo_financeiro')
+    caso = models.ForeignKey('app.Caso', on_delete=models.CASCADE)
+
+    def __str__(self):
+        return f"Resumo da RIF {self.rif_id}"
+
+    class Meta:
+        verbose_name = 'Resumo Financeiro da RIF'
+        verbose_name_plural = 'Resumos Financeiros das RIFs'
+
+class CasoResumoFinanceiro(ResumoFinanceiroBase):
+    caso = models.OneToOneField('app.Caso', on_delete=models.CASCADE, primary_key=True, related_name='resumo_financeiro')
+    por_rif = models.JSONField(default=dict)                    # {id da RIF: soma do campo_a, em texto}
+    versao = models.IntegerField(default=0)                     # incrementada a cada recálculo; usada nas chaves de cache
+
+    def __str__(self):
+        return f"Resumo do caso {self.caso_id} (versão {self.versao})"
+
+    class Meta:
+        verbose_name = 'Resumo Financeiro do Caso'
+        verbose_name_plural = 'Resumos Financeiros dos Casos'
+
 class Prompt(models.Model):
     modulo = models.CharField(max_length=100, help_text="Módulo onde o prompt é usado (ex: financeira)")
     funcao = models.CharField(max_length=100, help_text="Função específica onde o prompt é usado (ex: comunicacao_detalhes)")
@@ -0,0 +1,154 @@
+"""Detecção das inconsistências dos dados importados das RIFs.
+
+Cada verificação é uma única consulta no banco (anti-join com NOT EXISTS ou
+agrupamento), independentemente do tamanho da RIF:
+
+    - envolvido_sem_informacao: remetentes, beneficiários e outros envolvidos
+      cujo CPF/CNPJ não aparece nas informações adicionais do caso (o primeiro
+      envolvido de cada CPF/CNPJ na RIF);
+    - comunicacao_sem_envolvidos: comunicações sem nenhum envolvido com a mesma
+      RIF e indexador;
+    - comunicacao_sem_titular: comunicações com envolvidos, mas sem titular;
+    - envolvido_sem_comunicacao e ocorrencia_sem_comunicacao: registros sem
+      comunicação com a mesma RIF e indexador.
+
+Os resultados ficam em ImportacaoProblema, recalculados por RIF ao final de
+cada importação e nas exclusões; a tela de erros de importação apenas os lista.
+"""
+import logging
+
+from django.db import router, transaction
+from django.db.models import CharField, Exists, F, Func, Min, OuterRef, Subquery, Value
+from django.db.models.functions import Cast
+
+from .consultas import mesma_comunicacao
+from .models import RIF, Comunicacao, Envolvido, ImportacaoProblema, InformacaoAdicional, Ocorrencia
+
+logger = logging.getLogger(__name__)
+
+# Tipos de envolvido que devem aparecer nas informações adicionais da comunicação
+TIPOS_ENVOLVIDO_INFORMACAO = ['Remetente', 'Beneficiário', 'Outros']
+
+TAMANHO_LOTE = 1000
+
+
+def informacoes_do_cpf(caso_id, cpf_cnpj):
+    """Informações adicionais do caso com o CPF/CNPJ informado.
+
+    InformacaoAdicional.cpf é texto com zeros à esquerda; a comparação com o
+    CPF/CNPJ numérico é feita no banco, sem os zeros.
+
+    Args:
+        caso_id (int | OuterRef): Id do caso.
+        cpf_cnpj (OuterRef | F): Expressão com o CPF/CNPJ numérico.
+
+    Returns:
+        QuerySet: InformacaoAdicional, para uso em Exists().
+    """
+    return InformacaoAdicional.objects.filter(caso_id=caso_id).annotate(
+        cpf_numerico=Func(F('cpf'), Value('0'), function='LTRIM', output_field=CharField()),
+    ).filter(cpf_numerico=Cast(cpf_cnpj, CharField()))
+
+
+#########################################################################################################################
+# VERIFICAÇÕES
+#########################################################################################################################
+def _envolvidos_sem_informacao(rif_ids, banco):
+    envolvidos = Envolvido.objects.using(banco).filter(
+        rif_id__in=rif_ids, tipo_envolvido__in=TIPOS_ENVOLVIDO_INFORMACAO, cpf_cnpj_envolvido__isnull=False,
+    ).filter(~Exists(informacoes_do_cpf(OuterRef('caso_id'), OuterRef('cpf_cnpj_envolvido'))))
+    primeiros = envolvidos.order_by().values('rif_id', 'cpf_cnpj_envolvido').annotate(primeiro=Min('id'))
+
+    linhas = Envolvido.objects.using(banco).filter(id__in=primeiros.values('primeiro')).annotate(
+        comunicacao_id=Subquery(mesma_comunicacao(Comunicacao).values('id')[:1]),
+    ).values('caso_id', 'rif_id', 'indexador', 'comunicacao_id', 'id', 'cpf_cnpj_envolvido')
+    return [
+        ImportacaoProblema(tipo='envolvido_sem_informacao', caso_id=linha['caso_id'], rif_id=linha['rif_id'],
+                           indexador=linha['indexador'], comunicacao_id=linha['comunicacao_id'],
+                           envolvido_id=linha['id'], cpf_cnpj=linha['cpf_cnpj_envolvido'])
+        for linha in linhas
+    ]
+
+
+def _comunicacoes_sem_envolvidos(rif_ids, banco):
+    linhas = Comunicacao.objects.using(banco).filter(rif_id__in=rif_ids).filter(
+        ~Exists(mesma_comunicacao(Envolvido))).values('caso_id', 'rif_id', 'indexador', 'id')
+    return [
+        ImportacaoProblema(tipo='comunicacao_sem_envolvidos', caso_id=linha['caso_id'], rif_id=linha['rif_id'],
+                           indexador=linha['indexador'], comunicacao_id=linha['id'])
+        for linha in linhas
+    ]
+
+
+def _comunicacoes_sem_titular(rif_ids, banco):
+    linhas = Comunicacao.objects.using(banco).filter(rif_id__in=rif_ids, envolvido_titular__isnull=True).filter(
+        Exists(mesma_comunicacao(Envolvido))).values('caso_id', 'rif_id', 'indexador', 'id')
+    return [
+        ImportacaoProblema(tipo='comunicacao_sem_titular', caso_id=linha['caso_id'], rif_id=linha['rif_id'],
+                           indexador=linha['indexador'], comunicacao_id=linha['id'])
+        for linha in linhas
+    ]
+
+
+def _envolvidos_sem_comunicacao(rif_ids, banco):
+    linhas = Envolvido.objects.using(banco).filter(rif_id__in=rif_ids).filter(
+        ~Exists(mesma_comunicacao(Comunicacao))).values('caso_id', 'rif_id', 'indexador', 'id', 'cpf_cnpj_envolvido')
+    return [
+        ImportacaoProblema(tipo='envolvido_sem_comunicacao', caso_id=linha['caso_id'], rif_id=linha['rif_id'],
+                           indexador=linha['indexador'], envolvido_id=linha['id'], cpf_cnpj=linha['cpf_cnpj_envolvido'])
+        for linha in linhas
+    ]
+
+
+def _ocorrencias_sem_comunicacao(rif_ids, banco):
+    linhas = Ocorrencia.objects.using(banco).filter(rif_id__in=rif_ids).filter(
+        ~Exists(mesma_comunicacao(Comunicacao))).values('caso_id', 'rif_id', 'indexador', 'id')
+    return [
+        ImportacaoProblema(tipo='ocorrencia_sem_comunicacao', caso_id=linha['caso_id'], rif_id=linha['rif_id'],
+                           indexador=linha['indexador'], ocorrencia_id=linha['id'])
+        for linha in linhas
+    ]
+
+
+VERIFICACOES = [
+    _envolvidos_sem_informacao,
+    _comunicacoes_sem_envolvidos,
+    _comunicacoes_sem_titular,
+    _envolvidos_sem_comunicacao,
+    _ocorrencias_sem_comunicacao,
+]
+
+
+#########################################################################################################################
+# ATUALIZAÇÃO
+#########################################################################################################################
+def detectar_problemas_importacao(caso_id, rifs=None, using=None):
+    """Recalcula os problemas de importação das RIFs do caso.
+
+    Chamada ao final da importação da RIF (depois do último arquivo) e nas
+    exclusões (em que as informações adicionais de uma RIF excluída podem deixar
+    envolvidos de outras RIFs sem informação).
+
+    Args:
+        caso_id (int): Id do caso.
+        rifs (Optional[Iterable[int]]): Ids das RIFs a verificar; todas as do caso se None.
+        using (Optional[str]): Alias do banco; por padrão, o de gravação dos problemas.
+
+    Returns:
+        int: Quantidade de problemas encontrados.
+    """
+    banco = using or router.db_for_write(ImportacaoProblema)
+    rif_ids = RIF.objects.using(banco).filter(caso_id=caso_id)
+    if rifs is not None:
+        rif_ids = rif_ids.filter(id__in=list(rifs))
+    rif_ids = list(rif_ids.values_list('id', flat=True))
+    if not rif_ids:
+        return 0
+
+    problemas = [problema for verificacao in VERIFICACOES for problema in verificacao(rif_ids, banco)]
+    with transaction.atomic(using=banco):
+        ImportacaoProblema.objects.using(banco).filter(rif_id__in=rif_ids).delete()
+        ImportacaoProblema.objects.using(banco).bulk_create(problemas, batch_size=TAMANHO_LOTE)
+
+    logger.info("Problemas de importação do caso %s (%s RIFs): %s", caso_id, len(rif_ids), len(problemas))
+    return len(problemas)
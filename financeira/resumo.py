@@ -0,0 +1,288 @@
+"""Resumo financeiro pré-calculado dos casos.
+
+Os totais usados nas telas de visão geral (soma dos campos por RIF e por
+titular, comunicações por segmento, ocorrências, comunicações de maior volume)
+ficam em RIFResumoFinanceiro, um registro por RIF, e em CasoResumoFinanceiro, a
+combinação dos parciais de todas as RIFs do caso. Todos têm tamanho limitado,
+qualquer que seja a quantidade de comunicações do caso.
+
+O resumo é gravado apenas pelas importações e exclusões (no worker de
+importações) e pelo comando ``python manage.py reconstruir_resumos``: uma
+importação ou exclusão recalcula apenas os parciais das RIFs afetadas e
+recombina o caso. As views só leem o resumo do caso, em uma única consulta.
+
+A cada recálculo, CasoResumoFinanceiro.versao é incrementada; em_cache_por_versao
+guarda valores derivados dos dados do caso com essa versão na chave, e eles
+deixam de ser usados assim que o caso muda.
+"""
+import logging
+from collections import Counter
+from decimal import Decimal
+
+from django.core.cache import cache
+from django.db import router, transaction
+from django.db.models import Count, F, Sum
+
+from app.models import Caso
+from .models import RIF, CasoResumoFinanceiro, Comunicacao, Ocorrencia, RIFResumoFinanceiro
+
+logger = logging.getLogger(__name__)
+
+CAMPOS_TOTAIS = ['total_campo_a', 'total_campo_b', 'total_campo_c']
+CAMPOS_PARCIAIS = ['comunicacoes', *CAMPOS_TOTAIS, 'por_titular', 'por_segmento', 'por_ocorrencia',
+                   'maiores_comunicacoes']
+
+# Comunicações de maior campo_a guardadas no resumo, para os gráficos de volume por comunicação
+LIMITE_COMUNICACOES = 50
+
+# Somas do banco com as casas decimais dos campos (o SQLite não as arredonda)
+CENTAVOS = Decimal('0.01')
+
+# Validade das entradas de em_cache_por_versao (as de versões antigas não são mais lidas)
+TEMPO_CACHE = 60 * 60 * 24
+
+
+def _chave_titular(cpf_cnpj, nome):
+    return f"{cpf_cnpj or ''}|{nome}"
+
+
+#########################################################################################################################
+# CÁLCULO
+#########################################################################################################################
+def _parciais_rifs(caso, rif_ids, banco):
+    """Calcula no banco os parciais das RIFs (uma consulta agrupada por tipo de total).
+
+    Returns:
+        dict: {id da RIF: {campo: valor}} no formato de RIFResumoFinanceiro.
+    """
+    parciais = {
+        rif_id: {'comunicacoes': 0, **{campo: Decimal('0') for campo in CAMPOS_TOTAIS}, 'por_titular': {},
+                 'por_segmento': {}, 'por_ocorrencia': {}, 'maiores_comunicacoes': {}}
+        for rif_id in rif_ids
+    }
+    comunicacoes = Comunicacao.objects.using(banco).filter(rif_id__in=rif_ids).order_by()
+
+    totais = comunicacoes.values('rif_id').annotate(
+        quantidade=Count('id'), total_campo_a=Sum('campo_a'), total_campo_b=Sum('campo_b'),
+        total_campo_c=Sum('campo_c'))
+    for linha in totais:
+        parcial = parciais[linha['rif_id']]
+        parcial['comunicacoes'] = linha['quantidade']
+        for campo in CAMPOS_TOTAIS:
+            parcial[campo] = (linha[campo] or Decimal('0')).quantize(CENTAVOS)
+
+    por_titular = comunicacoes.exclude(nome_titular='').values('rif_id', 'cpf_cnpj_titular', 'nome_titular').annotate(
+        valor=Sum('campo_a'), quantidade=Count('id'))
+    for linha in por_titular:
+        chave = _chave_titular(linha['cpf_cnpj_titular'], linha['nome_titular'])
+        parciais[linha['rif_id']]['por_titular'][chave] = {
+            'cpf_cnpj': linha['cpf_cnpj_titular'], 'nome': linha['nome_titular'],
+            'valor': str(linha['valor'].quantize(CENTAVOS)), 'comunicacoes': linha['quantidade']}
+
+    for linha in comunicacoes.values('rif_id', 'codigo_segmento').annotate(quantidade=Count('id')):
+        parciais[linha['rif_id']]['por_segmento'][str(linha['codigo_segmento'])] = linha['quantidade']
+
+    ocorrencias = Ocorrencia.objects.using(banco).filter(rif_id__in=rif_ids).order_by()
+    for linha in ocorrencias.values('rif_id', 'ocorrencia').annotate(quantidade=Count('id')):
+        parciais[linha['rif_id']]['por_ocorrencia'][linha['ocorrencia']] = linha['quantidade']
+
+    for rif_id in rif_ids:
+        maiores = comunicacoes.filter(rif_id=rif_id).order_by('-campo_a', 'id').values_list(
+            'id', 'rif__numero', 'indexador', 'campo_a')[:LIMITE_COMUNICACOES]
+        parciais[rif_id]['maiores_comunicacoes'] = {
+            str(comunicacao_id): {'rotulo': f"{caso.numero} - {numero_rif} - Ind. {indexador}",
+                                  'valor': float(campo_a)}
+            for comunicacao_id, numero_rif, indexador, campo_a in maiores
+        }
+
+    return parciais
+
+
+def _combinar(parciais):
+    """Soma os parciais das RIFs no formato de CasoResumoFinanceiro."""
+    combinado = {'comunicacoes': 0, **{campo: Decimal('0') for campo in CAMPOS_TOTAIS}, 'por_rif': {}}
+    por_titular = {}
+    por_segmento = Counter()
+    por_ocorrencia = Counter()
+    maiores_comunicacoes = {}
+
+    for parcial in parciais:
+        combinado['comunicacoes'] += parcial.comunicacoes
+        for campo in CAMPOS_TOTAIS:
+            combinado[campo] += getattr(parcial, campo)
+        combinado['por_rif'][str(parcial.rif_id)] = str(parcial.total_campo_a)
+        for chave, titular in parcial.por_titular.items():
+            total = por_titular.setdefault(chave, {**titular, 'valor': Decimal('0'), 'comunicacoes': 0})
+            total['valor'] += Decimal(titular['valor'])
+            total['comunicacoes'] += titular['comunicacoes']
+        por_segmento.update(parcial.por_segmento)
+        por_ocorrencia.update(parcial.por_ocorrencia)
+        maiores_comunicacoes.update(parcial.maiores_comunicacoes)
+
+    combinado['por_titular'] = {chave: {**titular, 'valor': str(titular['valor'])}
+                                for chave, titular in por_titular.items()}
+    combinado['por_segmento'] = dict(por_segmento)
+    combinado['por_ocorrencia'] = dict(por_ocorrencia)
+    # As maiores do caso estão entre as maiores de cada RIF
+    combinado['maiores_comunicacoes'] = dict(_ordenar_comunicacoes(maiores_comunicacoes)[:LIMITE_COMUNICACOES])
+    return combinado
+
+
+def _ordenar_comunicacoes(comunicacoes):
+    """Itens (id, {rotulo, valor}) em ordem decrescente de valor (o JSON do banco não preserva a ordem)."""
+    return sorted(comunicacoes.items(), key=lambda item: (-item[1]['valor'], int(item[0])))
+
+
+def atualizar_resumo_financeiro(caso_id, rifs=(), using=None):
+    """Recalcula os parciais das RIFs informadas e recombina o resumo do caso.
+
+    RIFs do caso ainda sem parcial também são calculadas; parciais de RIFs
+    excluídas somem pelo CASCADE. Chamada ao final da importação de cada arquivo
+    da RIF e na exclusão de RIFs, na mesma transação.
+
+    Args:
+        caso_id (int): Id do caso.
+        rifs (Iterable[int]): Ids das RIFs cujos registros mudaram.
+        using (Optional[str]): Alias do banco; por padrão, o de gravação do resumo.
+
+    Returns:
+        CasoResumoFinanceiro: Resumo do caso atualizado, com a nova versão.
+    """
+    banco = using or router.db_for_write(CasoResumoFinanceiro)
+
+    with transaction.atomic(using=banco):
+        # Serializa os recálculos do mesmo caso (PostgreSQL)
+        caso = Caso.objects.using(banco).select_for_update().get(id=caso_id)
+
+        rif_ids = set(RIF.objects.using(banco).filter(caso_id=caso_id).values_list('id', flat=True))
+        sem_parcial = rif_ids - set(
+            RIFResumoFinanceiro.objects.using(banco).filter(caso_id=caso_id).values_list('rif_id', flat=True))
+        recalcular = (set(rifs) | sem_parcial) & rif_ids
+
+        if recalcular:
+            parciais = _parciais_rifs(caso, recalcular, banco)
+            RIFResumoFinanceiro.objects.using(banco).bulk_create(
+                [RIFResumoFinanceiro(rif_id=rif_id, caso_id=caso_id, **valores) for rif_id, valores in parciais.items()],
+                update_conflicts=True, unique_fields=['rif'], update_fields=[*CAMPOS_PARCIAIS, 'atualizado_em'])
+
+        combinado = _combinar(RIFResumoFinanceiro.objects.using(banco).filter(caso_id=caso_id).order_by('rif_id'))
+        resumo, criado = CasoResumoFinanceiro.objects.using(banco).get_or_create(
+            caso_id=caso_id, defaults={**combinado, 'versao': 1})
+        if not criado:
+            for campo, valor in combinado.items():
+                setattr(resumo, campo, valor)
+            resumo.versao = F('versao') + 1
+            resumo.save(using=banco)
+            resumo.refresh_from_db(using=banco, fields=['versao'])
+
+    logger.info("Resumo financeiro do caso %s atualizado (%s RIFs recalculadas, versão %s)",
+                caso_id, len(recalcular), resumo.versao)
+    return resumo
+
+
+def reconstruir_resumos(casos=None, using=None):
+    """Apaga e recalcula o resumo financeiro de todos os casos (ou dos casos informados).
+
+    Args:
+        casos (Optional[Iterable[int]]): Ids dos casos; todos, se não informado.
+        using (Optional[str]): Alias do banco; por padrão, o de gravação do resumo.
+
+    Returns:
+        int: Quantidade de casos recalculados.
+    """
+    banco = using or router.db_for_write(CasoResumoFinanceiro)
+    caso_ids = list(casos) if casos is not None else list(
+        Caso.objects.using(banco).order_by('id').values_list('id', flat=True))
+
+    for caso_id in caso_ids:
+        with transaction.atomic(using=banco):
+            RIFResumoFinanceiro.objects.using(banco).filter(caso_id=caso_id).delete()
+            atualizar_resumo_financeiro(caso_id, using=banco)
+    return len(caso_ids)
+
+
+#########################################################################################################################
+# LEITURA
+#########################################################################################################################
+def resumo_financeiro(caso_id, using=None):
+    """Resumo financeiro do caso em uma consulta. A leitura nunca grava.
+
+    Um caso ainda sem resumo gravado (ex.: sem RIFs importadas) recebe um resumo
+    calculado na hora, com versão 0 e sem gravar; o resumo gravado é criado pela
+    próxima importação ou pelo comando reconstruir_resumos.
+
+    Args:
+        caso_id (int): Id do caso.
+        using (Optional[str]): Alias do banco; por padrão, o de leitura do resumo.
+
+    Returns:
+        CasoResumoFinanceiro: Resumo do caso.
+    """
+    banco = using or router.db_for_read(CasoResumoFinanceiro)
+    resumo = CasoResumoFinanceiro.objects.using(banco).filter(caso_id=caso_id).first()
+    if resumo is None:
+        resumo = _resumo_nao_gravado(caso_id, banco)
+    return resumo
+
+
+def _resumo_nao_gravado(caso_id, banco):
+    """Resumo do caso calculado a partir dos registros, sem gravar (versão 0)."""
+    caso = Caso.objects.using(banco).get(id=caso_id)
+    rif_ids = list(RIF.objects.using(banco).filter(caso_id=caso_id).order_by('id').values_list('id', flat=True))
+    if rif_ids:
+        logger.warning("Caso %s sem resumo financeiro gravado; calculado na leitura (ver reconstruir_resumos)",
+                       caso_id)
+    parciais = _parciais_rifs(caso, rif_ids, banco) if rif_ids else {}
+    combinado = _combinar(RIFResumoFinanceiro(rif_id=rif_id, caso_id=caso_id, **valores)
+                          for rif_id, valores in parciais.items())
+    return CasoResumoFinanceiro(caso_id=caso_id, versao=0, **combinado)
+
+
+def versao_resumo(caso_id, using=None):
+    """Versão do resumo do caso, sem carregar os totais; 0 se o caso ainda não tiver resumo gravado.
+
+    Args:
+        caso_id (int): Id do caso.
+        using (Optional[str]): Alias do banco; por padrão, o de leitura do resumo.
+
+    Returns:
+        int: Versão atual do resumo.
+    """
+    banco = using or router.db_for_read(CasoResumoFinanceiro)
+    versao = CasoResumoFinanceiro.objects.using(banco).filter(caso_id=caso_id).values_list('versao', flat=True).first()
+    return versao or 0
+
+
+def maiores_comunicacoes(resumo):
+    """Comunicações de maior campo_a do resumo, para os gráficos de volume por comunicação.
+
+    Args:
+        resumo (CasoResumoFinanceiro): Resumo do caso.
+
+    Returns:
+        list: [{'id', 'rotulo', 'valor'}] em ordem decrescente de valor; o rótulo
+            ("caso - RIF - Ind. n") pode se repetir entre comunicações.
+    """
+    return [{'id': int(comunicacao_id), **comunicacao}
+            for comunicacao_id, comunicacao in _ordenar_comunicacoes(resumo.maiores_comunicacoes)]
+
+
+def em_cache_por_versao(caso_id, nome, calcular):
+    """Valor derivado dos dados do caso, guardado no cache até a próxima versão do resumo.
+
+    Custa uma consulta (a versão) quando o valor já está no cache.
+
+    Args:
+        caso_id (int): Id do caso.
+        nome (str): Identifica o valor na chave do cache.
+        calcular (Callable[[], Any]): Calcula o valor quando ele não está no cache.
+
+    Returns:
+        Any: Valor calculado por `calcular` para a versão atual do caso.
+    """
+    chave = f'{nome}:caso_{caso_id}:v{versao_resumo(caso_id)}'
+    valor = cache.get(chave)
+    if valor is None:
+        valor = calcular()
+        cache.set(chave, valor, TEMPO_CACHE)
+    return valor
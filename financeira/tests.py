@@ -1,3 +1,1005 @@
-from django.test import TestCase
+import csv
+import importlib
+import io
+import json
+import os
+import tempfile
+import zipfile
+from decimal import Decimal
+from unittest import mock, skipUnless
 
-# Create your tests here.
+import pandas as pd
+from django.apps import apps
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import DatabaseError, IntegrityError, connection, transaction
+from django.db.models import Count, Sum
+from django.http import Http404
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from app.dados_sinteticos import gerar_rif
+from app.models import Arquivo, Caso, CasoAtivoUsuario, ImportJob
+from utils.planos_consulta import PlanoConsultaMixin, atualizar_estatisticas
+from .consultas import comunicacoes_do_envolvido, ocorrencias_do_caso
+from .esquemas import ESQUEMAS, ZERO, Campo, Esquema, inteiro, monetario, texto
+from .importacao import (_chave, _valores, atualizar_titulares, contar_linhas, importar_arquivo_rif,
+                         ler_arquivo_em_blocos, processar_importacao_rif)
+from .models import (RIF, CasoResumoFinanceiro, Comunicacao, Envolvido, ImportacaoProblema, InformacaoAdicional,
+                     Ocorrencia, RIFResumoFinanceiro)
+from .problemas import TIPOS_ENVOLVIDO_INFORMACAO, detectar_problemas_importacao
+from .resumo import atualizar_resumo_financeiro, maiores_comunicacoes, resumo_financeiro, versao_resumo
+from .views import (_dados_financeira_index, _somar_campos_por, comunicacao_informacoes_adicionais,
+                    comunicacoes_envolvido, download_vinculos_csv, envolvido_detalhes, financeira_errosimportacao,
+                    financeira_ocorrencias, segmentos_dados_api)
+from .vinculos import TIPO_MESMO_CPF, construir_grafo, grafo_vinculos_anx, grafo_vinculos_json
+
+
+class IndicesConsultasTests(PlanoConsultaMixin, TestCase):
+    """As buscas por caso/rif + indexador das views usam os índices compostos, mesmo em um caso grande."""
+
+    COMUNICACOES = 4000
+
+    @classmethod
+    def setUpTestData(cls):
+        usuario = get_user_model().objects.create(
+            cpf=52998224725, username='teste', email='teste@mpce.mp.br', nome_completo='Usuário de Teste')
+        outro_caso = Caso.objects.create(nome='Outro caso', numero='2', resumo='', created_by=usuario)
+        cls.caso = Caso.objects.create(nome='Caso grande', numero='1', resumo='', created_by=usuario)
+
+        for caso, quantidade in ((cls.caso, cls.COMUNICACOES), (outro_caso, 50)):
+            rif = RIF.objects.create(caso=caso, numero=f'RIF {caso.numero}', outras_informacoes='')
+            arquivo = Arquivo.objects.create(caso=caso, external_id=rif.id, tipo='comunicacoes', nome='RIF.csv',
+                                             hash='hash', registros=quantidade)
+            comuns = {'rif': rif, 'caso': caso, 'arquivo': arquivo}
+            comunicacoes = Comunicacao.objects.bulk_create([
+                Comunicacao(**comuns, indexador=i, id_comunicacao=i, numero_ocorrencia_bc='', data_recebimento='',
+                            data_operacao='', data_fim_fato='', cpf_cnpj_comunicante=191, nome_comunicante='Banco',
+                            cidade_agencia='', uf_agencia='CE', nome_agencia='', numero_agencia=1,
+                            informacoes_adicionais='', campo_a=0, campo_b=0, campo_c=0, campo_d=0, campo_e=0,
+                            codigo_segmento=41)
+                for i in range(1, quantidade + 1)
+            ])
+            Envolvido.objects.bulk_create([
+                Envolvido(**comuns, indexador=i, cpf_cnpj_envolvido=10000000000 + i * 10 + tipo,
+                          nome_envolvido=f'Envolvido {i}', tipo_envolvido=nome_tipo)
+                for i in range(1, quantidade + 1)
+                for tipo, nome_tipo in enumerate(['Titular', 'Remetente', 'Destinatário'])
+            ])
+            Ocorrencia.objects.bulk_create([
+                Ocorrencia(**comuns, indexador=i, id_ocorrencia=1010 + i % 3, ocorrencia='Movimentação atípica')
+                for i in range(1, quantidade + 1)
+            ])
+            InformacaoAdicional.objects.bulk_create([
+                InformacaoAdicional(**comuns, comunicacao=comunicacao, indexador=comunicacao.indexador,
+                                    tipo_transacao='PIX', cpf='', nome='', valor=0, transacoes='', plataforma='')
+                for comunicacao in comunicacoes
+            ])
+            if caso == cls.caso:
+                cls.rif = rif
+
+        atualizar_estatisticas(Comunicacao, Envolvido, Ocorrencia, InformacaoAdicional)
+
+    def test_titular_da_ocorrencia(self):
+        # _buscar_titular_ocorrencia
+        consulta = Envolvido.objects.filter(caso_id=self.caso.id, tipo_envolvido='Titular', indexador=1234)
+        self.assertUsaIndice(consulta, 'envolvido_caso_tipo_indexador')
+
+    def test_envolvidos_e_ocorrencias_da_comunicacao(self):
+        # comunicacao_detalhes, processar_comunicacao e relatorio_documento; rif + indexador
+        # usa o índice da chave natural
+        self.assertUsaIndice(Envolvido.objects.filter(rif=self.rif, indexador=1234))
+        self.assertUsaIndice(Envolvido.objects.filter(caso=self.caso, rif=self.rif, indexador=1234))
+        self.assertUsaIndice(Ocorrencia.objects.filter(rif=self.rif, indexador=1234))
+        self.assertUsaIndice(Ocorrencia.objects.filter(caso=self.caso, indexador=1234),
+                             'ocorrencia_caso_indexador')
+        self.assertUsaIndice(InformacaoAdicional.objects.filter(rif=self.rif, indexador=1234),
+                             'infoadicional_rif_indexador')
+
+    def test_comunicacao_por_indexador(self):
+        self.assertUsaIndice(Comunicacao.objects.filter(caso=self.caso, indexador=1234),
+                             'comunicacao_caso_indexador')
+
+    def test_envolvido_por_cpf_cnpj(self):
+        cpf_cnpj = 10000000000 + 1234 * 10
+        self.assertUsaIndice(Envolvido.objects.filter(caso=self.caso, cpf_cnpj_envolvido=cpf_cnpj),
+                             'envolvido_cpf_cnpj_caso')
+        self.assertUsaIndice(Envolvido.objects.filter(cpf_cnpj_envolvido=cpf_cnpj),
+                             'envolvido_cpf_cnpj_caso')
+
+
+class TitularComunicacaoTests(TestCase):
+    """O titular de cada comunicação é resolvido na importação e acompanha os envolvidos."""
+
+    def setUp(self):
+        usuario = get_user_model().objects.create(
+            cpf=52998224725, username='teste', email='teste@mpce.mp.br', nome_completo='Usuário de Teste')
+        caso = Caso.objects.create(nome='Caso', numero='1', resumo='', created_by=usuario)
+        self.rif = RIF.objects.create(caso=caso, numero='RIF 1', outras_informacoes='')
+
+        with tempfile.TemporaryDirectory() as diretorio:
+            arquivos = gerar_rif(diretorio, 30, semente=1)
+            for tipo in ('comunicacoes', 'envolvidos'):
+                importar_arquivo_rif(tipo, ler_arquivo_em_blocos(arquivos[tipo]['caminho'], tipo),
+                                     self.rif, f'{tipo}.csv', tipo)
+
+    def _titular_esperado(self, comunicacao):
+        return Envolvido.objects.filter(rif=self.rif, indexador=comunicacao.indexador,
+                                        tipo_envolvido='Titular').order_by('id').first()
+
+    def test_titular_gravado_na_importacao(self):
+        comunicacoes = list(Comunicacao.objects.filter(rif=self.rif))
+        self.assertEqual(len(comunicacoes), 30)
+        for comunicacao in comunicacoes:
+            titular = self._titular_esperado(comunicacao)
+            self.assertEqual(comunicacao.envolvido_titular_id, titular.id)
+            self.assertEqual(comunicacao.nome_titular, titular.nome_envolvido)
+            self.assertEqual(comunicacao.cpf_cnpj_titular, titular.cpf_cnpj_envolvido)
+
+    def test_atualizado_com_os_envolvidos(self):
+        comunicacao = Comunicacao.objects.filter(rif=self.rif).first()
+        Envolvido.objects.filter(id=comunicacao.envolvido_titular_id).update(nome_envolvido='Novo Nome')
+
+        atualizar_titulares(self.rif.id)
+        comunicacao.refresh_from_db()
+        self.assertEqual(comunicacao.nome_titular, 'Novo Nome')
+
+    def test_titular_excluido(self):
+        comunicacao = Comunicacao.objects.filter(rif=self.rif).first()
+        Envolvido.objects.filter(rif=self.rif, indexador=comunicacao.indexador, tipo_envolvido='Titular').delete()
+
+        comunicacao.refresh_from_db()
+        self.assertIsNone(comunicacao.envolvido_titular_id)
+        self.assertEqual(comunicacao.nome_titular, '')
+        self.assertIsNone(comunicacao.cpf_cnpj_titular)
+
+
+def _bloco(registros):
+    """Bloco como os de ler_arquivo_em_blocos: colunas já renomeadas, valores em texto."""
+    return pd.DataFrame(registros, dtype=str)
+
+
+class LeituraArquivoRifTests(SimpleTestCase):
+    """A leitura em blocos termina no rodapé do COAF, esteja ele no meio de um bloco ou no início do seguinte."""
+
+    RODAPE_COAF = ['#;;', 'Arquivo gerado pelo Siscoaf;;']
+
+    def _arquivo(self, dados, rodape):
+        diretorio = tempfile.TemporaryDirectory()
+        self.addCleanup(diretorio.cleanup)
+        caminho = os.path.join(diretorio.name, 'Ocorrencias.csv')
+        linhas = ['Indexador;idOcorrencia;Ocorrencia']
+        linhas += [f'{i};{1000 + i};Ocorrência {i}' for i in range(1, dados + 1)]
+        # Linhas depois do rodapé não fazem parte dos dados
+        linhas += rodape + [f'{i};{1000 + i};Após o rodapé' for i in range(90, 96)]
+        with open(caminho, 'w', encoding='windows-1252') as arquivo:
+            arquivo.write('\r\n'.join(linhas) + '\r\n')
+        return caminho
+
+    def test_fim_dos_dados(self):
+        casos = [
+            # (linhas de dados, rodapé, tamanhos dos blocos)
+            (6, self.RODAPE_COAF, [4, 2]),
+            (4, self.RODAPE_COAF, [4]),
+            (3, self.RODAPE_COAF, [3]),
+            (6, [';;'], [4, 2]),
+            (5, ['   ;;'], [4, 1]),
+            (0, self.RODAPE_COAF, []),
+        ]
+        for dados, rodape, tamanhos in casos:
+            with self.subTest(dados=dados, rodape=rodape):
+                blocos = list(ler_arquivo_em_blocos(self._arquivo(dados, rodape), 'ocorrencias', tamanho_bloco=4))
+
+                self.assertEqual([len(bloco) for bloco in blocos], tamanhos)
+                linhas = pd.concat(blocos) if blocos else pd.DataFrame(columns=['indexador'])
+                self.assertEqual(linhas.index.tolist(), list(range(dados)))
+                self.assertEqual(linhas['indexador'].tolist(), [str(i) for i in range(1, dados + 1)])
+
+
+class EsquemasTests(SimpleTestCase):
+    """Os esquemas convertem as colunas, rejeitam as linhas inválidas com o motivo e extraem a chave natural."""
+
+    def test_coluna_obrigatoria_ausente(self):
+        converter = ESQUEMAS['comunicacoes'].compilar()
+        # Arquivo sem a coluna idComunicacao: todas as linhas são rejeitadas
+        dados, motivos = converter(_bloco({'indexador': ['1', '2'], 'cpf_cnpj_comunicante': ['00000000191'] * 2}))
+
+        self.assertEqual(motivos.dropna().to_dict(), {0: 'idComunicacao inválido', 1: 'idComunicacao inválido'})
+        self.assertEqual(len(dados), 2)
+
+    def test_conversao_dos_tipos(self):
+        converter = ESQUEMAS['comunicacoes'].compilar()
+        dados, motivos = converter(_bloco({
+            'indexador': ['1', 'x', '3', '4'],
+            'id_comunicacao': ['10', '11', '12', '13'],
+            'cpf_cnpj_comunicante': ['00.000.000/0001-91', '00000000191', '-', '000.000.001-91'],
+            'campo_a': ['1.234,56', '', '', 'abc'],
+            'uf_agencia': ['CE', 'CE', 'CE', 'Ceará'],
+        }))
+
+        # A primeira regra que falha é o motivo da rejeição
+        self.assertEqual(motivos.dropna().to_dict(), {1: 'Indexador inválido', 2: 'CPF/CNPJ do comunicante inválido',
+                                                      3: 'Valor monetário inválido em campo_a'})
+        primeira = _valores(dados)[0]
+        self.assertEqual(primeira['indexador'], 1)
+        self.assertEqual(primeira['cpf_cnpj_comunicante'], 191)
+        self.assertEqual(primeira['campo_a'], Decimal('1234.56'))
+        # Colunas ausentes ficam com o valor padrão
+        self.assertEqual(primeira['campo_b'], ZERO)
+        self.assertEqual(primeira['numero_agencia'], 0)
+        # Texto cortado no tamanho máximo do campo
+        self.assertEqual(dados['uf_agencia'].tolist(), ['CE', 'CE', 'CE', 'Ce'])
+
+    def test_nomes_alternativos_da_coluna(self):
+        esquema = Esquema(modelo=Ocorrencia, chave_natural=['indexador', 'id_ocorrencia'], campos=[
+            Campo('indexador', 'Indexador', inteiro, obrigatorio='Indexador inválido'),
+            Campo('id_ocorrencia', ('idOcorrencia', 'IdOcorrencia'), inteiro, padrao=0),
+            Campo('ocorrencia', 'Ocorrencia', texto),
+        ])
+
+        self.assertEqual(esquema.renomear, {'Indexador': 'indexador', 'idOcorrencia': 'id_ocorrencia',
+                                            'IdOcorrencia': 'id_ocorrencia', 'Ocorrencia': 'ocorrencia'})
+
+    def test_chave_natural(self):
+        esquema = ESQUEMAS['envolvidos']
+        dados, motivos = esquema.compilar()(_bloco({
+            'indexador': ['1', '1'],
+            'cpf_cnpj_envolvido': ['529.982.247-25', '-'],
+            'nome_envolvido': ['Joao da Silva', 'Sem documento'],
+            'tipo_envolvido': ['Titular', 'Remetente'],
+            'agencia_envolvido': ['-', '-'],
+            'conta_envolvido': ['', ''],
+        }))
+        self.assertTrue(motivos.isna().all())
+        campos = list(dados.columns)
+        com_cpf, sem_cpf = _valores(dados)
+
+        # Agência e conta são opcionais na chave; sem CPF/CNPJ, a chave é o registro inteiro
+        self.assertEqual(_chave(com_cpf, esquema.chave_natural, campos, esquema.chave_opcional),
+                         (1, 52998224725, 'Titular', None, None))
+        self.assertEqual(_chave(sem_cpf, esquema.chave_natural, campos, esquema.chave_opcional),
+                         tuple(sem_cpf[campo] for campo in campos))
+
+
+class ImportacaoRifTests(TestCase):
+    """A importação grava em lote, descarta só as linhas inválidas e é desfeita inteira em caso de falha."""
+
+    def setUp(self):
+        usuario = get_user_model().objects.create(
+            cpf=52998224725, username='teste', email='teste@mpce.mp.br', nome_completo='Usuário de Teste')
+        caso = Caso.objects.create(nome='Caso', numero='1', resumo='', created_by=usuario)
+        self.rif = RIF.objects.create(caso=caso, numero='RIF 1', outras_informacoes='')
+
+    def _ocorrencias(self, quantidade, inicio=1):
+        # Índice = posição da linha nos dados, como em ler_arquivo_em_blocos
+        linhas = range(inicio, inicio + quantidade)
+        return _bloco([{'indexador': str(i), 'id_ocorrencia': str(1000 + i), 'ocorrencia': f'Ocorrência {i}'}
+                       for i in linhas]).set_axis([i - 1 for i in linhas])
+
+    def test_importacao(self):
+        progresso = mock.Mock()
+        with mock.patch('financeira.importacao.TAMANHO_LOTE', 4):
+            resultado = importar_arquivo_rif('ocorrencias', [self._ocorrencias(10), self._ocorrencias(5, 11)],
+                                             self.rif, 'ocorrencias.csv', 'hash', progresso=progresso)
+
+        self.assertEqual((resultado['inseridos'], resultado['rejeitados']), (15, []))
+        self.assertEqual(resultado['arquivo'].registros, 15)
+        ocorrencias = Ocorrencia.objects.filter(rif=self.rif, arquivo=resultado['arquivo'])
+        self.assertEqual(sorted(ocorrencias.values_list('id_ocorrencia', flat=True)), list(range(1001, 1016)))
+        self.assertEqual(sum(chamada.args[0] for chamada in progresso.call_args_list), 15)
+
+    def test_linha_rejeitada_nao_interrompe_o_bloco(self):
+        bloco = self._ocorrencias(5)
+        bloco.loc[2, 'indexador'] = 'abc'
+        resultado = importar_arquivo_rif('ocorrencias', bloco, self.rif, 'ocorrencias.csv', 'hash')
+
+        self.assertEqual(resultado['inseridos'], 4)
+        self.assertEqual(resultado['rejeitados'], [{'linha': 4, 'motivo': 'Indexador inválido'}])
+        self.assertEqual(sorted(Ocorrencia.objects.filter(rif=self.rif).values_list('indexador', flat=True)),
+                         [1, 2, 4, 5])
+
+    def test_linha_recusada_pelo_banco_nao_interrompe_o_lote(self):
+        importar_arquivo_rif('ocorrencias', self._ocorrencias(1, 3), self.rif, 'ocorrencias.csv', 'hash')
+        # Sem a comparação pela chave natural, a linha já gravada viola a restrição única
+        resultado = importar_arquivo_rif('ocorrencias', self._ocorrencias(5), self.rif, 'ocorrencias2.csv', 'hash2',
+                                         modo='inserir')
+
+        self.assertEqual(resultado['inseridos'], 4)
+        self.assertEqual([rejeitado['linha'] for rejeitado in resultado['rejeitados']], [4])
+        self.assertEqual(Ocorrencia.objects.filter(rif=self.rif).count(), 5)
+
+    def test_falha_desfaz_o_arquivo_inteiro(self):
+        with mock.patch('financeira.importacao.atualizar_contadores', side_effect=DatabaseError('falha')), \
+                self.assertRaises(DatabaseError):
+            importar_arquivo_rif('ocorrencias', [self._ocorrencias(10), self._ocorrencias(5, 11)],
+                                 self.rif, 'ocorrencias.csv', 'hash')
+
+        self.assertFalse(Ocorrencia.objects.filter(rif=self.rif).exists())
+        self.assertFalse(Arquivo.objects.filter(external_id=self.rif.id).exists())
+
+
+class ProcessamentoImportacaoRifTests(TestCase):
+    """O job da RIF converte os arquivos em outros processos e grava os blocos na ordem, neste processo."""
+
+    def setUp(self):
+        usuario = get_user_model().objects.create(
+            cpf=52998224725, username='teste', email='teste@mpce.mp.br', nome_completo='Usuário de Teste')
+        caso = Caso.objects.create(nome='Caso', numero='1', resumo='', created_by=usuario)
+        self.rif = RIF.objects.create(caso=caso, numero='RIF 1', outras_informacoes='')
+
+        diretorio = tempfile.TemporaryDirectory()
+        self.addCleanup(diretorio.cleanup)
+        # Um diretório por arquivo, como em enfileirar_importacao
+        self.arquivos = {}
+        for tipo, arquivo in gerar_rif(os.path.join(diretorio.name, 'gerados'), 30, semente=3).items():
+            self.arquivos[tipo] = os.path.join(diretorio.name, tipo, os.path.basename(arquivo['caminho']))
+            os.makedirs(os.path.dirname(self.arquivos[tipo]))
+            os.replace(arquivo['caminho'], self.arquivos[tipo])
+        self.job = ImportJob.objects.create(caso=caso, tipo='rif', external_id=self.rif.id, arquivos=self.arquivos,
+                                            created_by=usuario)
+
+    def _processar(self):
+        with mock.patch('financeira.importacao.PROCESSOS_CONVERSAO', 1):
+            return processar_importacao_rif(self.job, mock.Mock())
+
+    def _convertidos(self):
+        return [os.path.join(os.path.dirname(caminho), 'convertidos') for caminho in self.arquivos.values()]
+
+    def test_arquivos_convertidos_e_gravados(self):
+        resumo = self._processar()
+
+        self.assertEqual(resumo.split('; ')[0],
+                         'comunicacoes: 30 inseridos, 0 atualizados, 0 inalterados, 0 rejeitados')
+        self.assertEqual(Comunicacao.objects.filter(rif=self.rif).count(), 30)
+        # Linhas do arquivo sem as duas do rodapé do COAF
+        for tipo, modelo in (('envolvidos', Envolvido), ('ocorrencias', Ocorrencia)):
+            self.assertEqual(modelo.objects.filter(rif=self.rif).count(), contar_linhas(self.arquivos[tipo]) - 2)
+        # Titulares resolvidos: as comunicações foram gravadas antes dos envolvidos
+        self.assertFalse(Comunicacao.objects.filter(rif=self.rif, envolvido_titular__isnull=True).exists())
+        self.assertFalse([diretorio for diretorio in self._convertidos() if os.path.exists(diretorio)])
+
+    def test_arquivos_ja_importados_sem_processos(self):
+        self._processar()
+        with mock.patch('financeira.importacao.ProcessPoolExecutor') as pool:
+            resumo = self._processar()
+        pool.assert_not_called()
+        self.assertEqual(resumo.split('; ')[0], 'comunicacoes: arquivo já importado anteriormente')
+
+    def test_problemas_detectados_uma_vez_por_rif(self):
+        with mock.patch('financeira.importacao.detectar_problemas_importacao',
+                        wraps=detectar_problemas_importacao) as detectar:
+            self._processar()
+        detectar.assert_called_once_with(self.rif.caso_id, rifs=[self.rif.id])
+
+    def test_erro_na_conversao(self):
+        with open(self.arquivos['envolvidos'], 'w', encoding='windows-1252') as arquivo:
+            arquivo.write('Coluna;Outra\r\n1;2\r\n')
+
+        with self.assertRaisesMessage(ValueError, 'Erro ao processar arquivo envolvidos: Coluna "Indexador"'):
+            self._processar()
+        # O arquivo anterior já foi gravado na própria transação; o seguinte não chega a ser gravado
+        self.assertEqual(Comunicacao.objects.filter(rif=self.rif).count(), 30)
+        self.assertFalse(Envolvido.objects.filter(rif=self.rif).exists())
+        self.assertFalse(Ocorrencia.objects.filter(rif=self.rif).exists())
+        self.assertFalse([diretorio for diretorio in self._convertidos() if os.path.exists(diretorio)])
+
+
+class ReimportacaoRifTests(TestCase):
+    """Na reimportação, os envolvidos são casados pela chave natural, que inclui agência e conta."""
+
+    def setUp(self):
+        usuario = get_user_model().objects.create(
+            cpf=52998224725, username='teste', email='teste@mpce.mp.br', nome_completo='Usuário de Teste')
+        caso = Caso.objects.create(nome='Caso', numero='1', resumo='', created_by=usuario)
+        self.rif = RIF.objects.create(caso=caso, numero='RIF 1', outras_informacoes='')
+        self.envolvidos = [
+            {'indexador': '1', 'cpf_cnpj_envolvido': '529.982.247-25', 'nome_envolvido': 'Maria',
+             'tipo_envolvido': 'Titular', 'agencia_envolvido': '10', 'conta_envolvido': '1234'},
+            # Mesma pessoa e papel, em outra conta
+            {'indexador': '1', 'cpf_cnpj_envolvido': '529.982.247-25', 'nome_envolvido': 'Maria',
+             'tipo_envolvido': 'Titular', 'agencia_envolvido': '10', 'conta_envolvido': '5678'},
+            {'indexador': '1', 'cpf_cnpj_envolvido': '111.444.777-35', 'nome_envolvido': 'Joao',
+             'tipo_envolvido': 'Remetente', 'agencia_envolvido': '-', 'conta_envolvido': '-'},
+        ]
+
+    def _importar(self, registros, nome='envolvidos.csv'):
+        return importar_arquivo_rif('envolvidos', _bloco(registros), self.rif, nome, nome)
+
+    def test_contas_diferentes_sao_registros_diferentes(self):
+        resultado = self._importar(self.envolvidos)
+
+        self.assertEqual((resultado['inseridos'], resultado['rejeitados']), (3, []))
+        self.assertEqual(sorted(Envolvido.objects.filter(rif=self.rif, cpf_cnpj_envolvido=52998224725)
+                                .values_list('conta_envolvido', flat=True)), [1234, 5678])
+
+    def test_reimportacao_sem_alteracoes(self):
+        self._importar(self.envolvidos)
+        resultado = self._importar(self.envolvidos, 'envolvidos2.csv')
+
+        self.assertEqual((resultado['inseridos'], resultado['atualizados'], resultado['inalterados']), (0, 0, 3))
+        self.assertEqual(Envolvido.objects.filter(rif=self.rif).count(), 3)
+
+    def test_registro_alterado_e_atualizado(self):
+        self._importar(self.envolvidos)
+        alterados = [dict(registro) for registro in self.envolvidos]
+        alterados[2]['nome_envolvido'] = 'Joao da Silva'
+        resultado = self._importar(alterados, 'envolvidos2.csv')
+
+        self.assertEqual((resultado['inseridos'], resultado['atualizados'], resultado['inalterados']), (0, 1, 2))
+        envolvido = Envolvido.objects.get(rif=self.rif, cpf_cnpj_envolvido=11144477735)
+        self.assertEqual(envolvido.nome_envolvido, 'Joao da Silva')
+        self.assertEqual(envolvido.arquivo_id, resultado['arquivo'].id)
+
+    def test_repetido_no_bloco_e_rejeitado(self):
+        resultado = self._importar(self.envolvidos + [dict(self.envolvidos[0], nome_envolvido='Maria Souza')])
+
+        self.assertEqual(resultado['inseridos'], 3)
+        self.assertEqual(resultado['rejeitados'], [{'linha': 2, 'motivo': 'Registro repetido na linha 5'}])
+        self.assertEqual(Envolvido.objects.get(rif=self.rif, conta_envolvido=1234).nome_envolvido, 'Maria Souza')
+
+    def _duplicar(self, envolvido):
+        envolvido.pk = None
+        envolvido.save()
+        return envolvido
+
+    def test_restricao_com_conta_nao_informada(self):
+        self._importar(self.envolvidos)
+        sem_conta = Envolvido.objects.get(rif=self.rif, cpf_cnpj_envolvido=11144477735)
+
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            self._duplicar(sem_conta)
+
+        # Sem CPF/CNPJ, a chave natural não se aplica
+        sem_conta.cpf_cnpj_envolvido = None
+        sem_conta.save()
+        self._duplicar(sem_conta)
+        self.assertEqual(Envolvido.objects.filter(rif=self.rif, cpf_cnpj_envolvido=None).count(), 2)
+
+    def test_migracao_mantem_contas_diferentes(self):
+        self._importar(self.envolvidos)
+        migracao = importlib.import_module('financeira.migrations.0009_remover_duplicados')
+        migracao.remover_duplicados(apps, None)
+
+        self.assertEqual(Envolvido.objects.filter(rif=self.rif).count(), 3)
+
+    @skipUnless(connection.vendor == 'postgresql', 'DDL dentro da transação do teste')
+    def test_migracao_remove_duplicados_sem_conta(self):
+        self._importar(self.envolvidos)
+        # Estado anterior a 0010: sem a restrição, as reimportações antigas duplicavam os registros
+        restricao = next(r for r in Envolvido._meta.constraints if r.name == 'envolvido_chave_natural')
+        with connection.schema_editor() as editor:
+            editor.remove_constraint(Envolvido, restricao)
+        original = Envolvido.objects.get(rif=self.rif, cpf_cnpj_envolvido=11144477735)
+        duplicado = self._duplicar(Envolvido.objects.get(id=original.id))
+
+        migracao = importlib.import_module('financeira.migrations.0009_remover_duplicados')
+        with self.assertLogs(migracao.logger, 'WARNING') as logs:
+            migracao.remover_duplicados(apps, None)
+
+        self.assertEqual(len(logs.output), 1)
+        self.assertIn(f'financeira_envolvido: 1 registros duplicados removidos. Ids: [{duplicado.id}]', logs.output[0])
+        self.assertEqual(set(Envolvido.objects.filter(rif=self.rif).values_list('conta_envolvido', flat=True)),
+                         {1234, 5678, None})
+        self.assertTrue(Envolvido.objects.filter(id=original.id).exists())
+
+
+class CamposMonetariosTests(TestCase):
+    """Os campos monetários são somados no banco sem perda e os legados convertidos como na importação."""
+
+    def setUp(self):
+        usuario = get_user_model().objects.create(
+            cpf=52998224725, username='teste', email='teste@mpce.mp.br', nome_completo='Usuário de Teste')
+        self.caso = Caso.objects.create(nome='Caso', numero='1', resumo='', created_by=usuario)
+        self.rif = RIF.objects.create(caso=self.caso, numero='RIF 1', outras_informacoes='')
+
+    def test_somas_no_banco(self):
+        valores = [('1', '1.234,56', '10,00'), ('1', 'R$ 55,00', ''), ('2', '0,10', '0,10'), ('2', '0,10', '0,10'),
+                   ('2', '0,10', '0,10'), ('3', '', '')]
+        bloco = _bloco([{'indexador': indexador, 'id_comunicacao': str(i), 'cpf_cnpj_comunicante': '00000000191',
+                         'campo_a': campo_a, 'campo_b': campo_b}
+                        for i, (indexador, campo_a, campo_b) in enumerate(valores)])
+        importar_arquivo_rif('comunicacoes', bloco, self.rif, 'comunicacoes.csv', 'hash')
+        comunicacoes = Comunicacao.objects.filter(caso=self.caso)
+
+        # Somas exatas em Decimal (em float, 0,10 + 0,10 + 0,10 daria 0.30000000000000004)
+        self.assertEqual(_somar_campos_por(comunicacoes, 'indexador', 'campo_a', 'campo_b'), {
+            1: {'campo_a': Decimal('1289.56'), 'campo_b': Decimal('10.00')},
+            2: {'campo_a': Decimal('0.30'), 'campo_b': Decimal('0.30')},
+            3: {'campo_a': Decimal('0.00'), 'campo_b': Decimal('0.00')},
+        })
+        resumo = resumo_financeiro(self.caso.id)
+        self.assertEqual((resumo.total_campo_a, resumo.total_campo_b), (Decimal('1289.86'), Decimal('10.30')))
+
+    def test_migracao_converte_como_a_importacao(self):
+        migracao = importlib.import_module('financeira.migrations.0012_normalizar_campos_monetarios')
+        casos = [
+            # (texto legado, valor gravado, inválido)
+            ('1.234,56', '1234.56', False),
+            ('R$ 55,00', '55.00', False),
+            ('19318.3', '19318.30', False),
+            ('1.234', '1234.00', False),
+            ('-0,5', '-0.50', False),
+            ('', '0.00', False),
+            (None, '0.00', False),
+            ('1e+20', '0.00', True),
+            ('(3,00)', '0.00', True),
+            ('abc', '0.00', True),
+        ]
+        textos = pd.Series([texto for texto, _, _ in casos], dtype=object)
+        normalizados, invalidos = migracao._normalizar(textos)
+        importados = monetario(textos)
+
+        for i, (texto, esperado, invalido) in enumerate(casos):
+            with self.subTest(texto=texto):
+                self.assertEqual(normalizados[i], esperado)
+                self.assertEqual(invalidos[i], invalido)
+                # Mesmo valor da importação; inválidos são rejeitados por ela
+                if texto and not invalido:
+                    self.assertEqual(importados[i], Decimal(esperado))
+                elif invalido:
+                    self.assertTrue(pd.isna(importados[i]))
+
+    def test_migracao_registra_os_valores_zerados(self):
+        migracao = importlib.import_module('financeira.migrations.0012_normalizar_campos_monetarios')
+        # Modelo histórico com os campos em texto: um lote de duas comunicações e o fim da paginação
+        comunicacoes = mock.MagicMock()
+        lotes = comunicacoes.objects.filter.return_value.order_by.return_value.values_list.return_value
+        lotes.__getitem__.side_effect = [[(7, '1.234,56', '(3,00)', '', '1e+20', '0'), (8, '1,00', '', '', '', '')], []]
+        modelos = mock.Mock(get_model=mock.Mock(return_value=comunicacoes))
+
+        with self.assertLogs(migracao.logger, 'WARNING') as logs:
+            migracao.normalizar_campos_monetarios(modelos, None)
+
+        self.assertIn("1 comunicações", logs.output[0])
+        self.assertIn("'campo_b': 1, 'campo_c': 0, 'campo_d': 1", logs.output[0])
+        self.assertIn('Ids: [7]', logs.output[0])
+        atualizados = comunicacoes.objects.bulk_update.call_args.args[0]
+        self.assertEqual(len(atualizados), 2)
+
+
+class RIFsSinteticasMixin:
+    """Caso com duas RIFs (20 e 30 comunicações) importadas do gerador de dados sintéticos."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = usuario = get_user_model().objects.create(
+            cpf=52998224725, username='teste', email='teste@mpce.mp.br', nome_completo='Usuário de Teste')
+        cls.caso = Caso.objects.create(nome='Caso', numero='1', resumo='', created_by=usuario)
+        cls.rifs = [RIF.objects.create(caso=cls.caso, numero=f'RIF {i}', outras_informacoes='') for i in (1, 2)]
+
+        with tempfile.TemporaryDirectory() as diretorio:
+            for semente, rif in enumerate(cls.rifs):
+                arquivos = gerar_rif(os.path.join(diretorio, str(semente)), 20 + semente * 10, semente=semente)
+                for tipo, arquivo in arquivos.items():
+                    importar_arquivo_rif(tipo, ler_arquivo_em_blocos(arquivo['caminho'], tipo),
+                                         rif, f'{tipo}.csv', f'{tipo}{semente}')
+
+
+class ResumoFinanceiroTests(RIFsSinteticasMixin, TestCase):
+    """O resumo financeiro do caso acompanha as importações e recalcula só as RIFs afetadas."""
+
+    def test_totais_iguais_aos_calculados_no_banco(self):
+        resumo = resumo_financeiro(self.caso.id)
+        comunicacoes = Comunicacao.objects.filter(caso=self.caso)
+        somas = comunicacoes.aggregate(a=Sum('campo_a'), b=Sum('campo_b'), c=Sum('campo_c'))
+
+        self.assertEqual(resumo.comunicacoes, 50)
+        self.assertEqual((resumo.total_campo_a, resumo.total_campo_b, resumo.total_campo_c),
+                         (somas['a'], somas['b'], somas['c']))
+        for rif in self.rifs:
+            self.assertEqual(Decimal(resumo.por_rif[str(rif.id)]),
+                             comunicacoes.filter(rif=rif).aggregate(total=Sum('campo_a'))['total'])
+        por_titular = comunicacoes.exclude(nome_titular='').values('cpf_cnpj_titular', 'nome_titular').annotate(
+            valor=Sum('campo_a'), quantidade=Count('id'))
+        self.assertEqual(
+            {(t['cpf_cnpj'], t['nome']): (Decimal(t['valor']), t['comunicacoes']) for t in resumo.por_titular.values()},
+            {(linha['cpf_cnpj_titular'], linha['nome_titular']): (linha['valor'], linha['quantidade'])
+             for linha in por_titular})
+        self.assertEqual(sum(resumo.por_segmento.values()), 50)
+        self.assertEqual(sum(resumo.por_ocorrencia.values()), Ocorrencia.objects.filter(caso=self.caso).count())
+        self.assertEqual(len(resumo.maiores_comunicacoes), 50)
+
+    def test_maiores_comunicacoes_pelo_id(self):
+        # RIFs de mesmo número: os rótulos "caso - RIF - Ind. n" se repetem, as comunicações não
+        RIF.objects.filter(id=self.rifs[1].id).update(numero=self.rifs[0].numero)
+        rifs = [rif.id for rif in self.rifs]
+        with mock.patch('financeira.resumo.LIMITE_COMUNICACOES', 100):
+            comunicacoes = maiores_comunicacoes(atualizar_resumo_financeiro(self.caso.id, rifs=rifs))
+        self.assertEqual(len(comunicacoes), 50)
+        self.assertLess(len({comunicacao['rotulo'] for comunicacao in comunicacoes}), 50)
+
+        # Só as de maior campo_a ficam no resumo, qualquer que seja o tamanho do caso
+        with mock.patch('financeira.resumo.LIMITE_COMUNICACOES', 5):
+            resumo = atualizar_resumo_financeiro(self.caso.id, rifs=rifs)
+        esperadas = Comunicacao.objects.filter(caso=self.caso).order_by('-campo_a', 'id')[:5]
+        self.assertEqual([(c['id'], c['valor']) for c in maiores_comunicacoes(resumo)],
+                         [(c.id, float(c.campo_a)) for c in esperadas])
+
+    def test_leitura_nao_grava(self):
+        resumo_gravado = resumo_financeiro(self.caso.id)
+        CasoResumoFinanceiro.objects.filter(caso=self.caso).delete()
+        RIFResumoFinanceiro.objects.filter(caso=self.caso).delete()
+
+        with CaptureQueriesContext(connection) as consultas, self.assertLogs('financeira.resumo', 'WARNING'):
+            resumo = resumo_financeiro(self.caso.id)
+            versao = versao_resumo(self.caso.id)
+
+        self.assertFalse([c['sql'] for c in consultas.captured_queries if not c['sql'].startswith('SELECT')])
+        self.assertFalse(CasoResumoFinanceiro.objects.filter(caso=self.caso).exists())
+        self.assertEqual((resumo.versao, versao), (0, 0))
+        self.assertEqual((resumo.comunicacoes, resumo.total_campo_a, resumo.por_rif),
+                         (resumo_gravado.comunicacoes, resumo_gravado.total_campo_a, resumo_gravado.por_rif))
+        self.assertEqual(maiores_comunicacoes(resumo), maiores_comunicacoes(resumo_gravado))
+
+    def test_recalcula_apenas_as_rifs_informadas(self):
+        versao = resumo_financeiro(self.caso.id).versao
+        intacta = RIFResumoFinanceiro.objects.get(rif=self.rifs[1])
+        Comunicacao.objects.filter(rif=self.rifs[0]).delete()
+        Comunicacao.objects.filter(rif=self.rifs[1]).delete()
+
+        resumo = atualizar_resumo_financeiro(self.caso.id, rifs=[self.rifs[0].id])
+        self.assertEqual(resumo.versao, versao + 1)
+        self.assertEqual(Decimal(resumo.por_rif[str(self.rifs[0].id)]), 0)
+        self.assertEqual(RIFResumoFinanceiro.objects.get(rif=self.rifs[1]).comunicacoes, intacta.comunicacoes)
+
+    def test_leitura_em_uma_consulta(self):
+        resumo_financeiro(self.caso.id)
+        with self.assertNumQueries(1):
+            resumo_financeiro(self.caso.id)
+
+    def test_pagina_inicial_em_cache_por_versao(self):
+        cache.clear()
+        resumo_financeiro(self.caso.id)
+        # Versão e resumo, sem consultas por comunicação ou titular
+        with self.assertNumQueries(2):
+            dados = _dados_financeira_index(self.caso.id)
+        with self.assertNumQueries(1):
+            self.assertEqual(_dados_financeira_index(self.caso.id), dados)
+
+        Comunicacao.objects.filter(rif=self.rifs[0]).delete()
+        atualizar_resumo_financeiro(self.caso.id, rifs=[self.rifs[0].id])
+        self.assertEqual(_dados_financeira_index(self.caso.id)['totais']['total_a'],
+                         Comunicacao.objects.filter(caso=self.caso).aggregate(total=Sum('campo_a'))['total'])
+
+
+@mock.patch('financeira.views.moeda', lambda valor: f'{valor:.2f}')  # independe do locale pt_BR do sistema
+class SegmentosApiTests(RIFsSinteticasMixin, TestCase):
+    """No modo server-side (DataTables), a API de segmentos filtra, ordena e pagina no banco."""
+
+    def setUp(self):
+        CasoAtivoUsuario.objects.create(caso=self.caso, usuario=self.usuario)
+
+    def _get(self, **parametros):
+        request = RequestFactory().get('/financeira/api/segmentos/dados/', parametros)
+        request.user = self.usuario
+        return json.loads(segmentos_dados_api(request).content)
+
+    def _pagina(self, **parametros):
+        return self._get(draw='3', **{'start': '0', 'length': '10', 'search[value]': '', **parametros})
+
+    def test_pagina_ordenada(self):
+        resposta = self._pagina(**{'start': '7', 'length': '7', 'order[0][column]': '2', 'order[0][dir]': 'desc',
+                                   'columns[2][data]': 'titular'})
+        esperado = Comunicacao.objects.filter(caso=self.caso).order_by('-nome_titular', 'id')[7:14]
+
+        self.assertEqual(resposta['draw'], 3)
+        self.assertEqual((resposta['recordsTotal'], resposta['recordsFiltered']), (50, 50))
+        self.assertEqual([linha['id'] for linha in resposta['data']], [c.id for c in esperado])
+
+    def test_busca_e_filtros(self):
+        nome = Comunicacao.objects.filter(caso=self.caso).exclude(nome_titular='').values_list(
+            'nome_titular', flat=True).first()
+        rif = self.rifs[1]
+        resposta = self._pagina(**{'rif': str(rif.id), 'search[value]': nome.split()[0]})
+        esperado = Comunicacao.objects.filter(rif=rif, nome_titular__icontains=nome.split()[0]).order_by('id')
+
+        self.assertEqual(resposta['recordsTotal'], 30)
+        self.assertEqual(resposta['recordsFiltered'], esperado.count())
+        self.assertEqual({linha['id'] for linha in resposta['data']}, set(esperado.values_list('id', flat=True)[:10]))
+
+    def test_consultas_independem_do_tamanho_da_pagina(self):
+        self._pagina()
+        with CaptureQueriesContext(connection) as pequena:
+            self.assertEqual(len(self._pagina(length='5')['data']), 5)
+        with CaptureQueriesContext(connection) as grande:
+            self.assertEqual(len(self._pagina(length='40')['data']), 40)
+        self.assertEqual(len(pequena.captured_queries), len(grande.captured_queries))
+
+    def test_graficos(self):
+        resposta = self._get(graficos='1')
+        self.assertNotIn('tabela', resposta)
+        self.assertEqual(sum(resposta['barras']['dados']), 50)
+
+
+class ProblemasImportacaoTests(RIFsSinteticasMixin, TestCase):
+    """As verificações de importação são consultas no banco, com o mesmo resultado da verificação linha a linha."""
+
+    def setUp(self):
+        rif = self.rifs[0]
+        comunicacoes = list(Comunicacao.objects.filter(rif=rif).order_by('id'))
+        # Comunicação sem envolvidos, comunicação sem titular e envolvidos/ocorrências sem comunicação
+        Envolvido.objects.filter(rif=rif, indexador=comunicacoes[0].indexador).delete()
+        Comunicacao.objects.filter(id=comunicacoes[1].id).delete()
+        sem_titular = next(c for c in comunicacoes[3:] if Envolvido.objects.filter(
+            rif=rif, indexador=c.indexador).exclude(tipo_envolvido='Titular').exists())
+        Envolvido.objects.filter(rif=rif, indexador=sem_titular.indexador, tipo_envolvido='Titular').delete()
+        atualizar_titulares(rif.id)
+        # Informação adicional (com zeros à esquerda) para um dos envolvidos
+        self.envolvido = Envolvido.objects.filter(
+            rif=rif, tipo_envolvido__in=TIPOS_ENVOLVIDO_INFORMACAO, cpf_cnpj_envolvido__isnull=False).first()
+        self._informacao(self.envolvido, comunicacoes[-1])
+
+    def _informacao(self, envolvido, comunicacao):
+        InformacaoAdicional.objects.create(
+            rif=comunicacao.rif, caso=self.caso, arquivo=comunicacao.arquivo, comunicacao=comunicacao,
+            indexador=comunicacao.indexador, tipo_transacao='crédito', cpf=str(envolvido.cpf_cnpj_envolvido).zfill(14),
+            nome=envolvido.nome_envolvido, valor=1.0, transacoes='1', plataforma='PIX')
+
+    def _esperado(self):
+        """Verificação linha a linha, como era feita na tela de erros de importação."""
+        cpfs_com_info = {int(cpf) for cpf in InformacaoAdicional.objects.filter(caso=self.caso).values_list('cpf', flat=True)}
+        comunicacoes = {(c.rif_id, c.indexador): c for c in Comunicacao.objects.filter(caso=self.caso).order_by('-id')}
+        envolvidos = list(Envolvido.objects.filter(caso=self.caso).order_by('id'))
+        indexadores_com_envolvidos = {(e.rif_id, e.indexador) for e in envolvidos}
+
+        esperado, processados = set(), set()
+        for envolvido in envolvidos:
+            chave = (envolvido.rif_id, envolvido.indexador)
+            if chave not in comunicacoes:
+                esperado.add(('envolvido_sem_comunicacao', envolvido.id))
+            cpf = envolvido.cpf_cnpj_envolvido
+            if (envolvido.tipo_envolvido in TIPOS_ENVOLVIDO_INFORMACAO and cpf is not None
+                    and cpf not in cpfs_com_info and (envolvido.rif_id, cpf) not in processados):
+                processados.add((envolvido.rif_id, cpf))
+                esperado.add(('envolvido_sem_informacao', envolvido.id))
+        for chave, comunicacao in comunicacoes.items():
+            if chave not in indexadores_com_envolvidos:
+                esperado.add(('comunicacao_sem_envolvidos', comunicacao.id))
+            elif comunicacao.envolvido_titular_id is None:
+                esperado.add(('comunicacao_sem_titular', comunicacao.id))
+        for ocorrencia in Ocorrencia.objects.filter(caso=self.caso):
+            if (ocorrencia.rif_id, ocorrencia.indexador) not in comunicacoes:
+                esperado.add(('ocorrencia_sem_comunicacao', ocorrencia.id))
+        return esperado
+
+    def _problemas(self):
+        return {(p.tipo, p.envolvido_id or p.ocorrencia_id or p.comunicacao_id)
+                for p in ImportacaoProblema.objects.filter(caso=self.caso)}
+
+    def test_problemas_iguais_a_verificacao_linha_a_linha(self):
+        detectar_problemas_importacao(self.caso.id)
+        problemas = self._problemas()
+
+        self.assertEqual(problemas, self._esperado())
+        self.assertEqual({tipo for tipo, _ in problemas}, {valor for valor, _ in ImportacaoProblema.TIPO_CHOICES})
+        self.assertNotIn(('envolvido_sem_informacao', self.envolvido.id), problemas)
+
+    def test_recalculados_na_importacao(self):
+        # A importação do setUpTestData já gravou os problemas dos dados íntegros
+        self.assertFalse(ImportacaoProblema.objects.filter(caso=self.caso).exclude(tipo='envolvido_sem_informacao'))
+        self.assertTrue(ImportacaoProblema.objects.filter(caso=self.caso, tipo='envolvido_sem_informacao'))
+
+    def test_consultas_independem_do_tamanho_da_rif(self):
+        with CaptureQueriesContext(connection) as menor:
+            detectar_problemas_importacao(self.caso.id, rifs=[self.rifs[0].id])
+        with CaptureQueriesContext(connection) as maior:
+            detectar_problemas_importacao(self.caso.id, rifs=[self.rifs[1].id])
+        self.assertEqual(len(menor.captured_queries), len(maior.captured_queries))
+        self.assertLessEqual(len(maior.captured_queries), 10)
+
+    def test_pagina_lista_os_problemas(self):
+        detectar_problemas_importacao(self.caso.id)
+        CasoAtivoUsuario.objects.create(caso=self.caso, usuario=self.usuario)
+        # Envolvido que ganhou informação adicional depois da verificação deixa de aparecer
+        resolvido = ImportacaoProblema.objects.filter(caso=self.caso, tipo='envolvido_sem_informacao').first()
+        self._informacao(resolvido.envolvido, Comunicacao.objects.filter(caso=self.caso).first())
+
+        request = RequestFactory().get('/financeira/errosimportacao/', {'tipo': 'envolvido_sem_informacao'})
+        request.user = self.usuario
+        with mock.patch('financeira.views.render') as render:
+            financeira_errosimportacao(request)
+        contexto = render.call_args.args[2]
+
+        sem_info = ImportacaoProblema.objects.filter(caso=self.caso, tipo='envolvido_sem_informacao').exclude(
+            id=resolvido.id)
+        self.assertEqual(contexto['total_sem_info'], sem_info.count())
+        self.assertEqual([p.id for p in contexto['problemas']], list(sem_info.order_by('rif_id', 'indexador', 'id')
+                                                                      .values_list('id', flat=True)[:50]))
+        self.assertEqual(sum(item['sem_info'] for item in contexto['contagem_por_indexador']), sem_info.count())
+
+
+class GrafoVinculosTests(RIFsSinteticasMixin, TestCase):
+    """O grafo de vínculos sai de uma consulta, com as mesmas arestas da montagem envolvido a envolvido."""
+
+    def setUp(self):
+        # Um CPF repetido em outra RIF, para as arestas de mesmo CPF/CNPJ
+        self.repetido = Envolvido.objects.filter(rif=self.rifs[0], tipo_envolvido='Titular').first()
+        Envolvido.objects.filter(
+            id=Envolvido.objects.filter(rif=self.rifs[1]).exclude(tipo_envolvido='Titular').first().id
+        ).update(cpf_cnpj_envolvido=self.repetido.cpf_cnpj_envolvido)
+
+    def _links_esperados(self):
+        envolvidos = list(Envolvido.objects.filter(caso=self.caso).order_by('id'))
+        links = []
+        for titular in [e for e in envolvidos if e.tipo_envolvido == 'Titular']:
+            for outro in envolvidos:
+                if (outro.rif_id, outro.indexador) == (titular.rif_id, titular.indexador) and outro.id != titular.id:
+                    links.append((str(outro.cpf_cnpj_envolvido), str(titular.cpf_cnpj_envolvido),
+                                  f'{outro.tipo_envolvido} -> Titular'))
+        primeiros = {}
+        for envolvido in envolvidos:
+            cpf = str(envolvido.cpf_cnpj_envolvido)
+            if cpf in primeiros:
+                links.append((cpf, cpf, TIPO_MESMO_CPF))
+            primeiros.setdefault(cpf, envolvido)
+        return sorted(links)
+
+    def test_arestas_iguais_a_montagem_linha_a_linha(self):
+        with self.assertNumQueries(1):
+            grafo = construir_grafo(self.caso.id)
+
+        self.assertEqual(sorted((l['source'], l['target'], l['tipo']) for l in grafo.links()), self._links_esperados())
+        self.assertEqual(grafo.quantidade_nos, Envolvido.objects.filter(caso=self.caso).values(
+            'cpf_cnpj_envolvido').distinct().count())
+        self.assertIn({'source': str(self.repetido.cpf_cnpj_envolvido), 'target': str(self.repetido.cpf_cnpj_envolvido),
+                       'tipo': TIPO_MESMO_CPF, 'metadata': {'indexador_source': str(self.repetido.indexador),
+                                                            'indexador_target': mock.ANY}},
+                      grafo.links(metadados=True))
+
+    def test_adjacencia_csr(self):
+        grafo = construir_grafo(self.caso.id)
+        origens = grafo.origens()
+
+        self.assertEqual(grafo.indptr[-1], grafo.quantidade_arestas)
+        self.assertTrue((origens[1:] >= origens[:-1]).all())
+        for no in range(grafo.quantidade_nos):
+            self.assertEqual(list(grafo.vizinhos(no)), list(grafo.destinos[origens == no]))
+
+    def test_json_em_cache_por_versao(self):
+        cache.clear()
+        grafo = grafo_vinculos_json(self.caso.id)
+        self.assertEqual(json.loads(grafo['links']), construir_grafo(self.caso.id).links())
+        anx = grafo_vinculos_anx(self.caso.id, self.caso.numero)
+
+        # Com o cache, nem consulta aos envolvidos nem montagem do grafo: o JSON volta pronto
+        with CaptureQueriesContext(connection) as consultas, \
+                mock.patch('financeira.vinculos.construir_grafo') as construir:
+            self.assertEqual(grafo_vinculos_json(self.caso.id), grafo)
+            self.assertEqual(grafo_vinculos_anx(self.caso.id, self.caso.numero), anx)
+        construir.assert_not_called()
+        self.assertFalse([c for c in consultas.captured_queries if 'financeira_envolvido' in c['sql']])
+
+        atualizar_resumo_financeiro(self.caso.id, rifs=[self.rifs[0].id])
+        with CaptureQueriesContext(connection) as consultas:
+            grafo_vinculos_json(self.caso.id)
+        self.assertTrue([c for c in consultas.captured_queries if 'financeira_envolvido' in c['sql']])
+
+    def test_arquivo_anx(self):
+        cache.clear()
+        grafo = construir_grafo(self.caso.id)
+        anx = json.loads(grafo_vinculos_anx(self.caso.id, self.caso.numero))
+        self.assertEqual(anx, {'caso': {'numero': self.caso.numero}, 'nodes': grafo.nodes(metadados=True),
+                               'links': grafo.links(metadados=True)})
+
+
+@override_settings(BANCO_REPLICA='inexistente')
+class VinculosCsvTests(RIFsSinteticasMixin, TestCase):
+    """A exportação dos vínculos é um ZIP montado durante o envio, com as linhas lidas em blocos."""
+
+    def setUp(self):
+        CasoAtivoUsuario.objects.create(caso=self.caso, usuario=self.usuario)
+
+    def _resposta(self):
+        request = RequestFactory().get('/financeira/analisedevinculos/download_csv/')
+        request.user = self.usuario
+        return download_vinculos_csv(request)
+
+    def test_linhas_por_comunicacao_titular_e_envolvido(self):
+        resposta = self._resposta()
+        self.assertTrue(resposta.streaming)
+        arquivo = zipfile.ZipFile(io.BytesIO(b''.join(resposta.streaming_content)))
+
+        # Sem informações adicionais no caso, o CSV delas fica fora do ZIP
+        self.assertEqual(arquivo.namelist(), [
+            'vinculos.csv', 'Trace - RIF - Vínculos.ximp', 'Trace - RIF - Informações Adicionais.ximp'])
+        linhas = list(csv.DictReader(io.StringIO(arquivo.read('vinculos.csv').decode('utf-8'))))
+        esperado = sum(
+            Envolvido.objects.filter(rif_id=c.rif_id, indexador=c.indexador, tipo_envolvido='Titular').count()
+            * Envolvido.objects.filter(rif_id=c.rif_id, indexador=c.indexador).count()
+            for c in Comunicacao.objects.filter(caso=self.caso))
+        self.assertEqual(len(linhas), esperado)
+        comunicacao = Comunicacao.objects.filter(caso=self.caso).order_by('rif_id', 'indexador', 'id').first()
+        self.assertEqual((linhas[0]['id_comunicacao'], linhas[0]['titular'], linhas[0]['indexador']),
+                         (str(comunicacao.id), comunicacao.nome_titular, str(comunicacao.indexador)))
+
+    def test_consultas_durante_o_envio(self):
+        with CaptureQueriesContext(connection) as consultas:
+            resposta = self._resposta()
+        self.assertFalse([c for c in consultas.captured_queries if 'financeira_' in c['sql']])
+
+        with CaptureQueriesContext(connection) as consultas:
+            for _ in resposta.streaming_content:
+                pass
+        self.assertEqual(len(consultas.captured_queries), 3)
+
+
+class ConsultasCompartilhadasTests(RIFsSinteticasMixin, TestCase):
+    """Ocorrências e comunicações do envolvido saem de uma consulta, ligadas pela RIF e pelo indexador."""
+
+    def setUp(self):
+        CasoAtivoUsuario.objects.create(caso=self.caso, usuario=self.usuario)
+
+    def _contexto(self, view, *args):
+        request = RequestFactory().get('/')
+        request.user = self.usuario
+        with mock.patch('financeira.views.render') as render:
+            view(request, *args)
+        return render.call_args.args[2]
+
+    def _cpf_com_mais_comunicacoes(self):
+        return Envolvido.objects.filter(caso=self.caso, cpf_cnpj_envolvido__isnull=False).values(
+            'cpf_cnpj_envolvido').annotate(total=Count('id')).order_by('-total').first()['cpf_cnpj_envolvido']
+
+    def test_ocorrencias_com_comunicacao_e_titular(self):
+        with self.assertNumQueries(1):
+            ocorrencias = list(ocorrencias_do_caso(self.caso.id))
+            numeros = {o.rif.numero for o in ocorrencias}
+
+        self.assertEqual(len(ocorrencias), Ocorrencia.objects.filter(caso=self.caso).count())
+        self.assertEqual(numeros, {rif.numero for rif in self.rifs})
+        for ocorrencia in ocorrencias:
+            comunicacao = Comunicacao.objects.filter(
+                rif_id=ocorrencia.rif_id, indexador=ocorrencia.indexador).order_by('id').first()
+            self.assertEqual(ocorrencia.comunicacao_id, comunicacao.id if comunicacao else None)
+            self.assertEqual(ocorrencia.titular, comunicacao.nome_titular if comunicacao else None)
+
+    def test_comunicacoes_do_envolvido(self):
+        cpf = self._cpf_com_mais_comunicacoes()
+        with self.assertNumQueries(1):
+            comunicacoes = list(comunicacoes_do_envolvido(self.caso.id, cpf))
+            [c.rif.numero for c in comunicacoes]
+
+        envolvidos = Envolvido.objects.filter(caso=self.caso, cpf_cnpj_envolvido=cpf).order_by('id')
+        esperadas = Comunicacao.objects.filter(
+            caso=self.caso, id__in=[c.id for e in envolvidos for c in Comunicacao.objects.filter(
+                rif_id=e.rif_id, indexador=e.indexador)])
+        self.assertEqual(sorted(c.id for c in comunicacoes), sorted(esperadas.values_list('id', flat=True)))
+        for comunicacao in comunicacoes:
+            self.assertIn('informacoes_adicionais', comunicacao.get_deferred_fields())
+            self.assertEqual(comunicacao.tipo_envolvido, envolvidos.filter(
+                rif_id=comunicacao.rif_id, indexador=comunicacao.indexador).first().tipo_envolvido)
+
+    def test_consultas_das_paginas_independem_da_quantidade_de_linhas(self):
+        cpf = self._cpf_com_mais_comunicacoes()
+        paginas = [
+            (financeira_ocorrencias, (), 'ocorrencias'),
+            (envolvido_detalhes, (cpf,), 'comunicacoes'),
+            (comunicacoes_envolvido, (cpf, self.rifs[0].id), 'comunicacoes'),
+        ]
+
+        def consultas(view, args, chave):
+            with CaptureQueriesContext(connection) as capturadas:
+                linhas = list(self._contexto(view, *args)[chave])
+            return len(capturadas.captured_queries), len(linhas)
+
+        antes = [consultas(*pagina) for pagina in paginas]
+        Ocorrencia.objects.filter(rif=self.rifs[1]).delete()
+        Comunicacao.objects.filter(rif=self.rifs[1]).delete()
+        depois = [consultas(*pagina) for pagina in paginas]
+
+        self.assertEqual([c for c, _ in antes], [c for c, _ in depois])
+        self.assertGreater(antes[0][1], depois[0][1])
+
+    def test_informacoes_adicionais_sob_demanda(self):
+        comunicacao = Comunicacao.objects.filter(caso=self.caso).first()
+        Comunicacao.objects.filter(id=comunicacao.id).update(informacoes_adicionais='Texto longo')
+        request = RequestFactory().get('/')
+        request.user = self.usuario
+
+        resposta = comunicacao_informacoes_adicionais(request, comunicacao.id)
+        self.assertEqual(json.loads(resposta.content), {'id': comunicacao.id, 'informacoes_adicionais': 'Texto longo'})
+
+        outro_caso = Caso.objects.create(nome='Outro', numero='2', resumo='', created_by=self.usuario)
+        CasoAtivoUsuario.objects.filter(usuario=self.usuario).update(caso=outro_caso)
+        with self.assertRaises(Http404):
+            comunicacao_informacoes_adicionais(request, comunicacao.id)
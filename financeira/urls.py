@@ -38,6 +38,8 @@ urlpatterns = [
     
     path('envolvido_detalhes/<str:cpf_cnpj>/', views.envolvido_detalhes, name='envolvido_detalhes'),
     path('envolvidos/<str:cpf_cnpj_envolvido>/<int:rif_id>/', views.comunicacoes_envolvido, name='comunicacoes_envolvido'),
+    path('comunicacao/<int:comunicacao_id>/informacoes_adicionais/', views.comunicacao_informacoes_adicionais,
+         name='comunicacao_informacoes_adicionais'),
 
     path('resumo', views.resumo, name='resumo'),
     path('resumo/<int:caso_id>/', views.resumo_por_id, name='resumo_por_id'),
@@ -3,16 +3,20 @@ from django.contrib.auth.decorators import login_required
 from unidecode import unidecode
 from django.utils import timezone
 import json
-from .models import RIF, Comunicacao, Envolvido, Ocorrencia, InformacaoAdicional, KYC, AnaliseIA, Prompt
+from .models import (RIF, Comunicacao, Envolvido, Ocorrencia, InformacaoAdicional, KYC, AnaliseIA, Prompt,
+                     ImportacaoProblema)
 from app.models import Caso, Arquivo, Relatorio, CasoAtivoUsuario
 from django.contrib import messages
-from django.http import JsonResponse, HttpResponse
+from django.http import JsonResponse, HttpResponse, StreamingHttpResponse
+from django.urls import reverse
 import pandas as pd
 import os
 import tempfile
 import locale
-from django.db import connection
-from django.db.models import Count
+from django.db import connection, connections, transaction
+from django.db.models import Count, Exists, Min, OuterRef, Q, Subquery, Sum
+from django.core.paginator import Paginator
+from decimal import Decimal
 from django.views.decorators.csrf import csrf_exempt
 from app.functions import sha256_dataframe
 from utils.ia import executar_prompt
@@ -22,15 +26,27 @@ from docx import Document
 import zipfile
 from io import BytesIO
 from utils.moeda import moeda, processar_valor_monetario
+from utils.conversores import valores_monetarios
 from utils.cpfcnpj import validar_e_limpar_cpf_cnpj
 from utils.formatar_nomes import normalizar_nome
 import json
 from .models import Prompt
+import itertools
 import time
 import re
 import logging
 from typing import Optional
 from app.utils import _buscar_caso_ativo
+from app.importacoes import enfileirar_importacao
+from app.contadores import atualizar_contadores, contadores_do_caso
+from app.exclusoes import (LIMITE_EXCLUSAO_IMEDIATA, enfileirar_exclusao, excluir_rif as excluir_rif_em_massa,
+                           registros_a_excluir)
+from .consultas import comunicacoes_do_envolvido, ocorrencias_do_caso
+from .problemas import TIPOS_ENVOLVIDO_INFORMACAO, informacoes_do_cpf
+from .resumo import em_cache_por_versao, maiores_comunicacoes, resumo_financeiro
+from .vinculos import grafo_vinculos_anx, grafo_vinculos_json
+from utils.replica import banco_leitura, usar_replica
+from utils.zip_em_fluxo import csv_em_blocos, zip_em_fluxo
 
 logger = logging.getLogger(__name__)
 pd.options.mode.chained_assignment = None
@@ -74,6 +90,48 @@ def _buscar_titular_ocorrencia(ocorrencia: 'Ocorrencia') -> Optional['Envolvido'
         return None
 
 
+def _somar_campos_por(comunicacoes, chave, *campos):
+    """Soma os campos monetários das comunicações agrupadas por `chave` (GROUP BY no banco).
+
+    Returns:
+        dict: {valor da chave: {campo: total}}.
+    """
+    linhas = comunicacoes.order_by().values(chave).annotate(
+        **{f'soma_{campo}': Sum(campo) for campo in campos})
+    return {
+        linha[chave]: {campo: linha[f'soma_{campo}'] or Decimal('0') for campo in campos}
+        for linha in linhas
+    }
+
+
+def _dados_financeira_index(caso_id):
+    """Totais e séries dos gráficos de financeira_index, a partir do resumo do caso.
+
+    Ficam no cache até a próxima versão do resumo (financeira.resumo.em_cache_por_versao):
+    a página faz o mesmo número de consultas qualquer que seja o tamanho do caso.
+
+    Returns:
+        dict: Totais dos campos (Decimal) e os dados dos gráficos, já serializados em JSON.
+    """
+    def calcular():
+        resumo = resumo_financeiro(caso_id)
+        titulares = sorted(resumo.por_titular.values(), key=lambda titular: -Decimal(titular['valor']))
+        comunicacoes = maiores_comunicacoes(resumo)
+        return {
+            'totais': {'total_a': resumo.total_campo_a, 'total_b': resumo.total_campo_b,
+                       'total_c': resumo.total_campo_c},
+            'valores_campo_a': [comunicacao['valor'] for comunicacao in comunicacoes],
+            'valores_por_titular': json.dumps([
+                {'titular': titular['nome'], 'cpf_cnpj': titular['cpf_cnpj'], 'valor': float(titular['valor']),
+                 'comunicacoes': titular['comunicacoes']}
+                for titular in titulares
+            ]),
+            'volume_financeiro_por_comunicacao': json.dumps(comunicacoes),
+        }
+
+    return em_cache_por_versao(caso_id, 'financeira_index', calcular)
+
+
 def _get_prompt_from_db(modulo, funcao, label=None):
     """Busca um prompt ativo do banco de dados com base no módulo e função.
 
@@ -193,6 +251,7 @@ def replace_ignorando_acentos(texto, busca, substituto_func):
 #
 #########################################################################################################################
 @login_required
+@usar_replica
 def financeira_index(request):
 
     # Testa se tem um caso ativo.
@@ -206,81 +265,19 @@ def financeira_index(request):
     rifs = RIF.objects.filter(caso=caso_ativo).select_related(
         'caso').order_by('-created_at')
     # Incluir em rif o numero de comunicacoes e envolvidos de cada rif
+    contadores = contadores_do_caso(caso_ativo.id)
     for rif in rifs:
-        rif.total_comunicacoes = Comunicacao.objects.filter(rif=rif).count()
-        rif.total_envolvidos = Envolvido.objects.filter(rif=rif).count()
-
-    total_rifs = rifs.count()
-    total_comunicacoes = Comunicacao.objects.filter(caso=caso_ativo).count()
-    total_envolvidos = Envolvido.objects.filter(caso=caso_ativo).count()
-    total_ocorrencias = Ocorrencia.objects.filter(caso=caso_ativo).count()
-
-    # Dados dos últimos 30 dias
-    comunicacoes = Comunicacao.objects.filter(caso=caso_ativo).count()
-
-    comunicacoes = Comunicacao.objects.filter(caso_id=caso_ativo.id)
-
-    # Converte os valores para float
-    somas = {
-        'total_a': 0,
-        'total_b': 0,
-        'total_c': 0
-    }
-
-    # Lista para armazenar os valores do campo_a para o gráfico
-    valores_campo_a = []
+        rif.total_comunicacoes = contadores['rif'][rif.id].comunicacoes
+        rif.total_envolvidos = contadores['rif'][rif.id].envolvidos
 
-    # Dicionário para armazenar os valores por titular
-    valores_por_titular = {}
+    total_rifs = contadores['caso'].rifs
+    total_comunicacoes = contadores['caso'].comunicacoes
+    total_envolvidos = contadores['caso'].envolvidos
+    total_ocorrencias = contadores['caso'].ocorrencias
 
-    for comunicacao in comunicacoes:
-        try:
-            # Remove o símbolo da moeda e espaços
-            valor_a = str(comunicacao.campo_a)
-            valor_b = str(comunicacao.campo_b)
-            valor_c = str(comunicacao.campo_c)
-            
-            # Converte do formato brasileiro para float
-            comunicacao.campo_a = float(valor_a)
-            comunicacao.campo_b = float(valor_b)
-            comunicacao.campo_c = float(valor_c)
-
-            # Adiciona o valor do campo_a à lista para o gráfico
-            valores_campo_a.append(comunicacao.campo_a)
-
-            somas['total_a'] += comunicacao.campo_a
-            somas['total_b'] += comunicacao.campo_b
-            somas['total_c'] += comunicacao.campo_c
-
-            # Adiciona o valor ao titular correspondente
-            titular = Envolvido.objects.filter(
-                indexador=comunicacao.indexador, tipo_envolvido='Titular').first()
-            if titular:
-                if titular.nome_envolvido not in valores_por_titular:
-                    valores_por_titular[titular.nome_envolvido] = 0
-                valores_por_titular[titular.nome_envolvido] += comunicacao.campo_a
-
-        except (ValueError, AttributeError):
-            # Se houver erro na conversão, define como 0
-            comunicacao.campo_a = 0
-            comunicacao.campo_b = 0
-            comunicacao.campo_c = 0
-            valores_campo_a.append(0)
-
-    # Somas
-    somas['total_a'] = moeda(somas['total_a'])
-    somas['total_b'] = moeda(somas['total_b'])
-    somas['total_c'] = moeda(somas['total_c'])
-
-    # Converte o dicionário de valores por titular para uma lista de objetos
-    valores_por_titular_list = [
-        {'titular': k, 'valor': float(v)} for k, v in valores_por_titular.items()
-    ]
-
-    # Calcular o volume financeiro por comunicação
-    volume_financeiro_por_comunicacao = {}
-    for comunicacao in caso_ativo.comunicacao_set.all():
-        volume_financeiro_por_comunicacao[f"{comunicacao.rif} - Ind. {comunicacao.indexador}"] = comunicacao.campo_a
+    # Totais e gráficos do resumo pré-calculado do caso, em cache por versão
+    dados = _dados_financeira_index(caso_ativo.id)
+    somas = {campo: moeda(total) for campo, total in dados['totais'].items()}
 
     # Modelos de Relatórios
     relatorios = Relatorio.objects.filter(tipo='financeiro', status='ativo')
@@ -293,10 +290,9 @@ def financeira_index(request):
         'total_ocorrencias': total_ocorrencias,
         'rifs': rifs,
         'somas': somas,
-        'valores_campo_a': valores_campo_a,  # Adiciona os valores para o gráfico
-        # Serializa para JSON
-        'valores_por_titular': json.dumps(valores_por_titular_list),
-        'volume_financeiro_por_comunicacao': json.dumps(volume_financeiro_por_comunicacao),
+        'valores_campo_a': dados['valores_campo_a'],  # Adiciona os valores para o gráfico
+        'valores_por_titular': dados['valores_por_titular'],
+        'volume_financeiro_por_comunicacao': dados['volume_financeiro_por_comunicacao'],
         'relatorios': relatorios,
     }
 
@@ -336,6 +332,7 @@ def cadastrar_rif(request):
                 outras_informacoes=outras_informacoes or '',
                 caso=caso_ativo
             )
+            atualizar_contadores(caso_ativo.id, rifs=[rif.id])
 
             return JsonResponse({
                 'success': True,
@@ -367,16 +364,18 @@ def cadastrar_rif(request):
 def excluir_rif(request, rif_id):
     rif = RIF.objects.get(id=rif_id)
 
-    # Excluir os arquivos associados à RIF
-    Arquivo.objects.filter(caso_id=rif.caso_id, external_id=rif.id).delete()
-    # Excluir as comunicações associadas à RIF
-    Comunicacao.objects.filter(caso_id=rif.caso_id, rif_id=rif.id).delete()
-    # Excluir os envolvidos associados à RIF
-    Envolvido.objects.filter(caso_id=rif.caso_id, rif_id=rif.id).delete()
-    # Excluir as ocorrências associadas à RIF
-    Ocorrencia.objects.filter(caso_id=rif.caso_id, rif_id=rif.id).delete()
+    # RIFs grandes são excluídas pelo worker, sem prender a requisição
+    if registros_a_excluir('rif', rif) > LIMITE_EXCLUSAO_IMEDIATA:
+        job = enfileirar_exclusao(request.user, 'rif', rif)
+        return JsonResponse({
+            'success': True,
+            'message': 'A exclusão da RIF será processada em segundo plano.',
+            'job_id': job.id,
+            'status_url': reverse('importacao_status', args=[job.id])
+        }, status=200)
 
-    rif.delete()
+    # Comunicações, envolvidos e ocorrências saem com DELETEs em lote, sem carregá-los na memória
+    excluir_rif_em_massa(rif)
 
     # retorna um json com o sucesso
     return JsonResponse({
@@ -401,26 +400,6 @@ def financeira_comunicacoes(request):
     envolvidos = Envolvido.objects.filter(
         caso_id=caso_ativo.id).select_related('rif').distinct()
 
-    titulares_distintos = []    
-    for comunicacao in comunicacoes:
-        """
-        texto = comunicacao.informacoes_adicionais
-        if texto:
-            for envolvido in envolvidos:
-                # Pesquisa os nomes sem acentos
-                if envolvido.nome_envolvido and unidecode(envolvido.nome_envolvido).upper() in unidecode(texto).upper():
-                    def replacer(match):
-                        return f'<span style="border-bottom: 2px dotted red;">{match.group()}</span>'
-
-                    texto = replace_ignorando_acentos(
-                        texto, envolvido.nome_envolvido, replacer)
-
-            comunicacao.informacoes_adicionais = texto
-        """
-        titular = _buscar_titular_ocorrencia(comunicacao)
-        comunicacao.titular = titular.nome_envolvido
-        titulares_distintos.append(titular.nome_envolvido)
-
     context = {
         'comunicacoes': comunicacoes,
         'comunicacoes_distinct': comunicacoes.values_list('nome_comunicante', flat=True).distinct(),
@@ -470,16 +449,8 @@ def financeira_ocorrencias(request):
             request, 'Nenhum caso ativo encontrado. Por favor, cadastre um caso para continuar.')
         return redirect('casos')
 
-    # Busca todas as ocorrências do caso ativo, incluindo o número do RIF
-    ocorrencias = Ocorrencia.objects.filter(
-        caso_id=caso_ativo.id).select_related('rif')
-
-    # Adiciona a comunicação correspondente a cada ocorrência
-    for ocorrencia in ocorrencias:
-        ocorrencia.comunicacao = Comunicacao.objects.filter(
-            caso_id=caso_ativo.id,
-            rif_id=ocorrencia.rif_id,
-            indexador=ocorrencia.indexador).first()
+    # Ocorrências do caso ativo com o número da RIF, a comunicação e o titular, em uma consulta
+    ocorrencias = list(ocorrencias_do_caso(caso_ativo.id))
 
     # Serializar as ocorrências para JSON
     ocorrencias_json = json.dumps([
@@ -488,7 +459,7 @@ def financeira_ocorrencias(request):
             'ocorrencia': o.ocorrencia[:6],
             'id': o.id,
             'rif': {'numero': o.rif.numero},
-            'comunicacao': o.comunicacao.id if o.comunicacao else None
+            'comunicacao': o.comunicacao_id
         } for o in ocorrencias])
 
     context = {
@@ -547,6 +518,150 @@ def ocorrencia_ajuda(request, id):
 ########################################################################################
 # SEGMENTOS
 ########################################################################################
+# Mapeamento de códigos de segmento para descrições
+SEGMENTOS = {
+    1: 'Bancos',
+    2: 'Seguradoras',
+    3: 'Corretoras',
+    4: 'Cartões de Crédito',
+    5: 'Consórcios',
+    6: 'Câmbio',
+    7: 'Previdência',
+    8: 'Capitalização',
+    9: 'Fintechs',
+    10: 'Outros'
+}
+
+# Colunas da tabela de comunicações por segmento e o campo usado para ordená-las
+COLUNAS_SEGMENTOS = {
+    'id': 'id',
+    'rif': 'rif__numero',
+    'indexador': 'indexador',
+    'titular': 'nome_titular',
+    'campo_a': 'campo_a',
+    'campo_b': 'campo_b',
+    'campo_c': 'campo_c',
+    'segmento': 'codigo_segmento',
+}
+
+# Maior página aceita no modo server-side (length=-1 do DataTables também é limitado a ela)
+TAMANHO_MAXIMO_PAGINA = 1000
+
+
+def _descricao_segmento(codigo):
+    return SEGMENTOS.get(codigo, f'Segmento {codigo}')
+
+
+def _linhas_tabela_segmentos(comunicacoes):
+    """Linhas da tabela de segmentos, lidas com values() (RIF e titular na mesma consulta)."""
+    linhas = comunicacoes.values('id', 'rif__numero', 'indexador', 'nome_titular', 'campo_a', 'campo_b', 'campo_c',
+                                 'codigo_segmento')
+    return [{
+        'id': linha['id'],
+        'rif': linha['rif__numero'],
+        'indexador': str(linha['indexador']).zfill(6),
+        'titular': linha['nome_titular'] or 'N/A',
+        'campo_a': 'R$ ' + moeda(float(linha['campo_a'])) if linha['campo_a'] else 'R$ 0,00',
+        'campo_b': 'R$ ' + moeda(float(linha['campo_b'])) if linha['campo_b'] else 'R$ 0,00',
+        'campo_c': 'R$ ' + moeda(float(linha['campo_c'])) if linha['campo_c'] else 'R$ 0,00',
+        'segmento': _descricao_segmento(linha['codigo_segmento']),
+        'acao': f'<a href="/financeira/comunicacao/{linha["id"]}/" class="btn btn-outline-primary btn-sm"><em class="icon fas fa-folder"></em></a>'
+    } for linha in linhas]
+
+
+def _graficos_segmentos(caso_id, comunicacoes, filtrado):
+    """Gráficos de barras (comunicações por segmento) e pizza (top 5 titulares por campo_a)."""
+    if filtrado:
+        # Dados para o gráfico de barras
+        dados_barras = comunicacoes.order_by().values('codigo_segmento').annotate(
+            total=Count('id')
+        ).order_by('-total')
+
+        # Dados para o gráfico de pizza - Top 5 titulares por valor do campo_a
+        top_titulares = [
+            (item['nome_titular'], float(item['valor']))
+            for item in comunicacoes.exclude(nome_titular='')
+            .values('nome_titular')
+            .annotate(valor=Sum('campo_a'))
+            .order_by('-valor')[:5]
+        ]
+    else:
+        # Sem filtros, os gráficos vêm do resumo pré-calculado do caso
+        resumo = resumo_financeiro(caso_id)
+        dados_barras = sorted(
+            ({'codigo_segmento': int(codigo), 'total': total} for codigo, total in resumo.por_segmento.items()),
+            key=lambda d: -d['total'])
+        top_titulares = [
+            (titular['nome'], float(titular['valor']))
+            for titular in sorted(resumo.por_titular.values(), key=lambda titular: -Decimal(titular['valor']))[:5]
+        ]
+
+    return {
+        'barras': {
+            'labels': [_descricao_segmento(d['codigo_segmento']) for d in dados_barras],
+            'dados': [d['total'] for d in dados_barras]
+        },
+        'pizza': {
+            'labels': [t[0] for t in top_titulares],
+            'dados': [t[1] for t in top_titulares]
+        }
+    }
+
+
+def _inteiro(valor, padrao):
+    try:
+        return int(valor)
+    except (TypeError, ValueError):
+        return padrao
+
+
+def _pagina_datatables(parametros, comunicacoes, total):
+    """Filtra, ordena e pagina as comunicações no banco, com os parâmetros do DataTables (modo server-side).
+
+    Args:
+        parametros (QueryDict): start, length, search[value], order[i][column], order[i][dir] e columns[i][data].
+        comunicacoes (QuerySet): Comunicações do caso já filtradas por RIF/segmento.
+        total (int): Quantidade de comunicações antes da busca.
+
+    Returns:
+        dict: Resposta no formato do DataTables (draw, recordsTotal, recordsFiltered, data).
+    """
+    inicio = max(_inteiro(parametros.get('start'), 0), 0)
+    tamanho = _inteiro(parametros.get('length'), 10)
+    if tamanho < 0 or tamanho > TAMANHO_MAXIMO_PAGINA:
+        tamanho = TAMANHO_MAXIMO_PAGINA
+
+    filtrados = total
+    busca = parametros.get('search[value]', '').strip()
+    if busca:
+        condicoes = Q(nome_titular__icontains=busca) | Q(rif__numero__icontains=busca)
+        segmentos = [codigo for codigo, descricao in SEGMENTOS.items() if busca.lower() in descricao.lower()]
+        if segmentos:
+            condicoes |= Q(codigo_segmento__in=segmentos)
+        if busca.isdigit():
+            condicoes |= Q(id=int(busca)) | Q(indexador=int(busca)) | Q(cpf_cnpj_titular=int(busca))
+        comunicacoes = comunicacoes.filter(condicoes)
+        filtrados = comunicacoes.count()
+
+    ordenacao = []
+    i = 0
+    while f'order[{i}][column]' in parametros:
+        coluna = parametros.get(f'columns[{parametros[f"order[{i}][column]"]}][data]')
+        if coluna in COLUNAS_SEGMENTOS:
+            direcao = '-' if parametros.get(f'order[{i}][dir]') == 'desc' else ''
+            ordenacao.append(direcao + COLUNAS_SEGMENTOS[coluna])
+        i += 1
+    # id no final deixa a paginação estável entre páginas
+    comunicacoes = comunicacoes.order_by(*ordenacao, 'id')
+
+    return {
+        'draw': _inteiro(parametros.get('draw'), 0),
+        'recordsTotal': total,
+        'recordsFiltered': filtrados,
+        'data': _linhas_tabela_segmentos(comunicacoes[inicio:inicio + tamanho]),
+    }
+
+
 @login_required
 def financeira_segmentos(request):
     caso_ativo = _buscar_caso_ativo(request)
@@ -555,30 +670,14 @@ def financeira_segmentos(request):
             request, 'Nenhum caso ativo encontrado. Por favor, cadastre um caso para continuar.')
         return redirect('casos')
 
-    # Busca todos os segmentos únicos das comunicações
-    segmentos = Comunicacao.objects.filter(
-        caso_id=caso_ativo.id
-    ).values('codigo_segmento').distinct().order_by('codigo_segmento')
+    # Segmentos únicos das comunicações, do resumo pré-calculado do caso
+    segmentos = sorted(int(codigo) for codigo in resumo_financeiro(caso_ativo.id).por_segmento)
 
     # Busca todos os RIFs do caso
     rifs = RIF.objects.filter(caso_id=caso_ativo.id).order_by('-created_at')
 
-    # Mapeamento de códigos de segmento para descrições
-    SEGMENTOS = {
-        1: 'Bancos',
-        2: 'Seguradoras',
-        3: 'Corretoras',
-        4: 'Cartões de Crédito',
-        5: 'Consórcios',
-        6: 'Câmbio',
-        7: 'Previdência',
-        8: 'Capitalização',
-        9: 'Fintechs',
-        10: 'Outros'
-    }
-
     context = {
-        'segmentos': [{'codigo': s['codigo_segmento'], 'descricao': SEGMENTOS.get(s['codigo_segmento'], f'Segmento {s["codigo_segmento"]}')} for s in segmentos],
+        'segmentos': [{'codigo': codigo, 'descricao': _descricao_segmento(codigo)} for codigo in segmentos],
         'rifs': rifs,
         'caso': caso_ativo,
     }
@@ -586,91 +685,46 @@ def financeira_segmentos(request):
 
 @login_required
 def segmentos_dados_api(request):
-    # Mapeamento de códigos de segmento para descrições
-    SEGMENTOS = {
-        1: 'Bancos',
-        2: 'Seguradoras',
-        3: 'Corretoras',
-        4: 'Cartões de Crédito',
-        5: 'Consórcios',
-        6: 'Câmbio',
-        7: 'Previdência',
-        8: 'Capitalização',
-        9: 'Fintechs',
-        10: 'Outros'
-    }
+    """Dados da tela de segmentos, filtrados por RIF e segmento.
 
+    Três modos:
+        - com `draw` (DataTables, server-side): uma página da tabela, filtrada
+          (search), ordenada (order) e paginada (start/length) no banco;
+        - com `graficos=1`: apenas os gráficos;
+        - sem eles: a tabela inteira e os gráficos.
+    """
     caso_ativo = _buscar_caso_ativo(request)
     if not caso_ativo:
         return JsonResponse({'error': 'Nenhum caso ativo encontrado'}, status=400)
     
-    segmento_filtro = request.GET.get('segmento', '')
-    
     # Query base
-    comunicacoes = Comunicacao.objects.filter(caso_id=caso_ativo.id).select_related('rif')
+    comunicacoes = Comunicacao.objects.filter(caso_id=caso_ativo.id)
     
     # Aplicar filtros
     rif_filtro = request.GET.get('rif', '')
-    if rif_filtro and rif_filtro.isdigit():
+    rif_filtro = rif_filtro if rif_filtro.isdigit() else ''
+    segmento_filtro = request.GET.get('segmento', '')
+    segmento_filtro = segmento_filtro if segmento_filtro.isdigit() else ''
+    if rif_filtro:
         comunicacoes = comunicacoes.filter(rif_id=int(rif_filtro))
-    
-    if segmento_filtro and segmento_filtro.isdigit():
+    if segmento_filtro:
         comunicacoes = comunicacoes.filter(codigo_segmento=int(segmento_filtro))
-    
-    # Dados para a tabela
-    dados_tabela = []
-    for com in comunicacoes:
-        titular = _buscar_titular_ocorrencia(com)
-        dados_tabela.append({
-            'id': com.id,
-            'rif': com.rif.numero,
-            'indexador': str(com.indexador).zfill(6),
-            'titular': titular.nome_envolvido if titular else 'N/A',
-            'campo_a': 'R$ ' + moeda(float(com.campo_a)) if com.campo_a else 'R$ 0,00',
-            'campo_b': 'R$ ' + moeda(float(com.campo_b)) if com.campo_b else 'R$ 0,00',
-            'campo_c': 'R$ ' + moeda(float(com.campo_c)) if com.campo_c else 'R$ 0,00',
-            'segmento': SEGMENTOS.get(com.codigo_segmento, f'Segmento {com.codigo_segmento}'),
-            'acao': f'<a href="/financeira/comunicacao/{com.id}/" class="btn btn-outline-primary btn-sm"><em class="icon fas fa-folder"></em></a>'
-        })
-    
-    # Dados para o gráfico de barras
-    dados_barras = comunicacoes.values('codigo_segmento').annotate(
-        total=Count('id')
-    ).order_by('-total')
-    
-    # Dados para o gráfico de pizza - Top 5 titulares por valor do campo_a
-    titulares_valores = {}
-    for com in comunicacoes:
-        titular = _buscar_titular_ocorrencia(com)
-        if titular:
-            nome = titular.nome_envolvido
-            if nome not in titulares_valores:
-                titulares_valores[nome] = 0
-            try:
-                valor_str = com.campo_a if com.campo_a else '0'
-                valor_limpo = valor_str.replace('.', '').replace(',', '')
-                if valor_limpo.isdigit():
-                    valor = float(valor_limpo) / 100
-                else:
-                    valor = 0
-            except (ValueError, AttributeError):
-                valor = 0
-            titulares_valores[nome] += valor
-    
-    # Ordenar e pegar top 5
-    top_titulares = sorted(titulares_valores.items(), key=lambda x: x[1], reverse=True)[:5]
-    
-    return JsonResponse({
-        'tabela': dados_tabela,
-        'barras': {
-            'labels': [SEGMENTOS.get(d['codigo_segmento'], f'Segmento {d["codigo_segmento"]}') for d in dados_barras],
-            'dados': [d['total'] for d in dados_barras]
-        },
-        'pizza': {
-            'labels': [t[0] for t in top_titulares],
-            'dados': [t[1] for t in top_titulares]
-        }
-    })
+    filtrado = bool(rif_filtro or segmento_filtro)
+
+    if 'draw' in request.GET:
+        # Total antes da busca: dos contadores, sem COUNT, quando não há filtro de segmento
+        if segmento_filtro:
+            total = comunicacoes.count()
+        else:
+            contadores = contadores_do_caso(caso_ativo.id)
+            total = (contadores['rif'][int(rif_filtro)] if rif_filtro else contadores['caso']).comunicacoes
+        return JsonResponse(_pagina_datatables(request.GET, comunicacoes, total))
+
+    resposta = _graficos_segmentos(caso_ativo.id, comunicacoes, filtrado)
+    if not request.GET.get('graficos'):
+        # Dados para a tabela
+        resposta['tabela'] = _linhas_tabela_segmentos(comunicacoes.order_by('id'))
+    return JsonResponse(resposta)
 
 
 ########################################################################################
@@ -847,162 +901,112 @@ def financeira_analisedevinculos(request):
             request, 'Nenhum caso ativo encontrado. Por favor, cadastre um caso para continuar.')
         return redirect('casos')
 
-    # Busca todos os envolvidos do caso ativo
-    envolvidos = Envolvido.objects.filter(caso=caso_ativo)
-
-    # Monta os nós (pessoas) usando CPF/CNPJ como identificador
-    nodes = []
-    node_ids = set()
-    for e in envolvidos:
-        cpf_cnpj = str(e.cpf_cnpj_envolvido)
-        if cpf_cnpj not in node_ids:
-            nodes.append({
-                "id": cpf_cnpj,
-                "nome": e.nome_envolvido,
-                "cpf_cnpj": cpf_cnpj,
-                "tipo": e.tipo_envolvido,
-                "indexador": str(e.indexador),
-            })
-            node_ids.add(cpf_cnpj)
+    # Grafo de vínculos do caso (financeira.vinculos), já em JSON, do cache por versão do caso
+    grafo = grafo_vinculos_json(caso_ativo.id)
 
-    # Monta os links (conexões) entre os nós
-    links = []
+    context = {
+        "nodes": grafo['nodes'],
+        "links": grafo['links'],
+        "caso": caso_ativo
+    }
+    return render(request, 'financeira/analisedevinculos.html', context)
 
-    # Primeiro, encontra todos os titulares
-    titulares = envolvidos.filter(tipo_envolvido='Titular')
 
-    # Para cada titular, cria conexões com outros envolvidos que compartilham o mesmo indexador
-    for titular in titulares:
-        outros_envolvidos = envolvidos.filter(
-            indexador=titular.indexador).exclude(id=titular.id)
-
-        for outro in outros_envolvidos:
-            links.append({
-                "source": str(outro.cpf_cnpj_envolvido),
-                "target": str(titular.cpf_cnpj_envolvido),
-                "tipo": f"{outro.tipo_envolvido} -> Titular",
-                "tipo_relacao": "Titular"
-            })
+# Registros lidos do banco por bloco na exportação dos vínculos
+TAMANHO_BLOCO_VINCULOS = 5000
+
+COLUNAS_VINCULOS = [
+    'tipo_registro', 'id_comunicacao', 'numero_ocorrencia_bc', 'data_recebimento', 'data_operacao', 'data_fim_fato',
+    'cpf_cnpj_comunicante', 'nome_comunicante', 'titular', 'titular_cpf_cnpj', 'envolvido', 'envolvido_cpf_cnpj',
+    'tipo_envolvido', 'indexador',
+]
+
+COLUNAS_VINCULOS_INFORMACOES_ADICIONAIS = [
+    'indexador', 'tipo_transacao', 'titular', 'titular_cpf_cnpj', 'envolvido', 'envolvido_cpf_cnpj', 'valor',
+    'plataforma', 'transacoes',
+]
+
+
+def _linhas_vinculos(caso_id, banco):
+    """Linhas do vinculos.csv: cada comunicação com cada titular e cada envolvido da mesma RIF e indexador.
+
+    Comunicações e envolvidos são lidos em blocos, ordenados por RIF e
+    indexador, e combinados como em um merge join: só os envolvidos de uma
+    comunicação ficam na memória de cada vez.
+    """
+    from core.templatetags.mask import mask
 
-    # Cria conexões entre redes quando o mesmo envolvido aparece em diferentes indexadores
-    for cpf_cnpj in node_ids:
+    chave = lambda registro: (registro[0], registro[1])
+    comunicacoes = Comunicacao.objects.using(banco).filter(caso_id=caso_id).order_by('rif_id', 'indexador', 'id').values_list(
+        'rif_id', 'indexador', 'id', 'numero_ocorrencia_bc', 'data_recebimento', 'data_operacao', 'data_fim_fato',
+        'cpf_cnpj_comunicante', 'nome_comunicante').iterator(chunk_size=TAMANHO_BLOCO_VINCULOS)
+    envolvidos = Envolvido.objects.using(banco).filter(caso_id=caso_id).order_by('rif_id', 'indexador', 'id').values_list(
+        'rif_id', 'indexador', 'nome_envolvido', 'cpf_cnpj_envolvido', 'tipo_envolvido').iterator(
+        chunk_size=TAMANHO_BLOCO_VINCULOS)
 
-        if cpf_cnpj == '':
+    grupos = ((indexador, list(grupo)) for indexador, grupo in itertools.groupby(envolvidos, key=chave))
+    grupo = next(grupos, None)
+    for indexador, comunicacoes_indexador in itertools.groupby(comunicacoes, key=chave):
+        while grupo is not None and grupo[0] < indexador:
+            grupo = next(grupos, None)
+        if grupo is None or grupo[0] != indexador:
             continue
 
-        envolvidos_mesmo_cpf = envolvidos.filter(cpf_cnpj_envolvido=cpf_cnpj)
-        if envolvidos_mesmo_cpf.count() > 1:
-            # Pega o primeiro envolvido como referência
-            primeiro = envolvidos_mesmo_cpf.first()
-            # Cria conexões com os outros envolvidos do mesmo CPF/CNPJ
-            for outro in envolvidos_mesmo_cpf.exclude(id=primeiro.id):
-                links.append({
-                    "source": str(primeiro.cpf_cnpj_envolvido),
-                    "target": str(outro.cpf_cnpj_envolvido),
-                    "tipo": "Mesmo CPF/CNPJ"
-                })
+        membros = [(nome, mask(cpf_cnpj, 'cpf_cnpj'), tipo) for _, _, nome, cpf_cnpj, tipo in grupo[1]]
+        titulares = [membro for membro in membros if membro[2] == 'Titular']
+        for _, indexador_com, id_com, ocorrencia_bc, recebimento, operacao, fim_fato, comunicante, nome_comunicante \
+                in comunicacoes_indexador:
+            dados_comunicacao = ['comunicacao', id_com, ocorrencia_bc, recebimento, operacao, fim_fato,
+                                 mask(comunicante, 'cpf_cnpj'), nome_comunicante]
+            for nome_titular, cpf_cnpj_titular, _ in titulares:
+                for nome, cpf_cnpj, tipo in membros:
+                    yield [*dados_comunicacao, nome_titular, cpf_cnpj_titular, nome, cpf_cnpj, tipo, str(indexador_com)]
 
-    context = {
-        "nodes": nodes,
-        "links": links,
-        "caso": caso_ativo
-    }
-    return render(request, 'financeira/analisedevinculos.html', context)
+
+def _linhas_vinculos_informacoes_adicionais(caso_id, banco):
+    """Linhas do vinculos_informacoes_adicionais.csv, lidas em blocos."""
+    from core.templatetags.mask import real, mask
+
+    informacoes = InformacaoAdicional.objects.using(banco).filter(caso_id=caso_id).order_by('id').values_list(
+        'indexador', 'tipo_transacao', 'comunicacao__nome_titular', 'comunicacao__cpf_cnpj_titular', 'nome', 'cpf',
+        'valor', 'plataforma', 'transacoes').iterator(chunk_size=TAMANHO_BLOCO_VINCULOS)
+    for indexador, tipo_transacao, titular, cpf_cnpj_titular, nome, cpf, valor, plataforma, transacoes in informacoes:
+        yield [str(indexador), tipo_transacao, titular, mask(cpf_cnpj_titular, 'cpf_cnpj'), nome,
+               mask(cpf, 'cpf_cnpj'), real(valor), plataforma, transacoes]
+
+
+def _anexo(caminho):
+    with open(caminho, 'rb') as arquivo:
+        return arquivo.read()
 
 
 @login_required
+@usar_replica
 def download_vinculos_csv(request):
-    """Endpoint para download dos dados de vínculos em formato CSV"""
-    from core.templatetags.mask import real, mask
+    """Endpoint para download dos dados de vínculos em formato CSV
 
+    O ZIP é montado enquanto é enviado (utils.zip_em_fluxo), com as linhas lidas
+    do banco em blocos.
+    """
     caso_ativo = _buscar_caso_ativo(request)
     if not caso_ativo:
         messages.error(request, 'Nenhum caso ativo encontrado.')
         return redirect('casos')
 
-    csv_data = []
-    csv_data_informacoes_adicionais = []
-
-    # Busca todas as comunicações do caso ativo
-    comunicacoes = Comunicacao.objects.filter(caso=caso_ativo)
-
-    for com in comunicacoes:
-        # Busca os titulares da comunicação
-        titulares = Envolvido.objects.filter(
-            caso=caso_ativo, tipo_envolvido='Titular', indexador=com.indexador)
-        for titular in titulares:
-            # Busca os envolvidos da comunicação
-            envolvidos = Envolvido.objects.filter(
-                caso=caso_ativo, indexador=com.indexador)
-            for envolvido in envolvidos:
-                # Busca os dados da comunicação
-                csv_data.append({
-                    "tipo_registro": "comunicacao",
-                    "id_comunicacao": com.id,
-                    "numero_ocorrencia_bc": com.numero_ocorrencia_bc,
-                    "data_recebimento": com.data_recebimento,
-                    "data_operacao": com.data_operacao,
-                    "data_fim_fato": com.data_fim_fato,
-                    "cpf_cnpj_comunicante": mask(com.cpf_cnpj_comunicante, 'cpf_cnpj'),
-                    "nome_comunicante": com.nome_comunicante,
-                    "titular": titular.nome_envolvido,
-                    "titular_cpf_cnpj": mask(titular.cpf_cnpj_envolvido, 'cpf_cnpj'),
-                    "envolvido": envolvido.nome_envolvido,
-                    "envolvido_cpf_cnpj": mask(envolvido.cpf_cnpj_envolvido, 'cpf_cnpj'),
-                    "tipo_envolvido": envolvido.tipo_envolvido,
-                    "indexador": str(envolvido.indexador),
-                })
-
-    # Busca todos os registros de informações adicionais do caso ativo
-    informacoes_adicionais = InformacaoAdicional.objects.filter(
-        caso=caso_ativo)
-    for info in informacoes_adicionais:
-        titular = Envolvido.objects.filter(
-            caso=caso_ativo, tipo_envolvido='Titular', rif_id=info.rif_id, indexador=info.indexador).first()
-        csv_data_informacoes_adicionais.append({
-            "indexador": str(info.indexador),
-            "tipo_transacao": info.tipo_transacao,
-            "titular": titular.nome_envolvido,
-            "titular_cpf_cnpj": mask(titular.cpf_cnpj_envolvido, 'cpf_cnpj'),
-            "envolvido": info.nome,
-            "envolvido_cpf_cnpj": mask(info.cpf, 'cpf_cnpj'),
-            # Usa a templatetag real para formatar o valor
-            "valor": real(info.valor),
-            "plataforma": info.plataforma,
-            "transacoes": info.transacoes,
-        })
+    # O conteúdo é lido depois que a view retorna: o banco de leitura é fixado aqui
+    banco = banco_leitura()
+    entradas = [
+        ('vinculos.csv', csv_em_blocos(COLUNAS_VINCULOS, _linhas_vinculos(caso_ativo.id, banco))),
+        ('vinculos_informacoes_adicionais.csv', csv_em_blocos(
+            COLUNAS_VINCULOS_INFORMACOES_ADICIONAIS, _linhas_vinculos_informacoes_adicionais(caso_ativo.id, banco))),
+        # Arquivos de especificações do I2
+        ('Trace - RIF - Vínculos.ximp', _anexo('utils/anexos/rif_vinculos.ximp')),
+        ('Trace - RIF - Informações Adicionais.ximp', _anexo('utils/anexos/rif_informacoes_adicionais.ximp')),
+    ]
 
-    # Cria DataFrame com todos os dados
-    df = pd.DataFrame(csv_data)
-    df_informacoes_adicionais = pd.DataFrame(csv_data_informacoes_adicionais)
-
-    # Cria um arquivo temporário para o ZIP
-    with tempfile.NamedTemporaryFile(delete=False) as temp_file:
-        # Cria o arquivo ZIP
-        with zipfile.ZipFile(temp_file.name, 'w') as zf:
-            # Adiciona os CSVs ao ZIP
-            if not df.empty:
-                csv_content = df.to_csv(index=False)
-                zf.writestr('vinculos.csv', csv_content)
-
-            if not df_informacoes_adicionais.empty:
-                csv_content_informacoes_adicionais = df_informacoes_adicionais.to_csv(
-                    index=False)
-                zf.writestr('vinculos_informacoes_adicionais.csv',
-                            csv_content_informacoes_adicionais)
-
-            # Adiciona o arquivo de especificações do I2
-            with open('utils/anexos/rif_vinculos.ximp', 'rb') as ximp_file:
-                zf.writestr('Trace - RIF - Vínculos.ximp', ximp_file.read())
-            with open('utils/anexos/rif_informacoes_adicionais.ximp', 'rb') as ximp_file:
-                zf.writestr(
-                    'Trace - RIF - Informações Adicionais.ximp', ximp_file.read())
-
-        # Lê o arquivo ZIP
-        with open(temp_file.name, 'rb') as f:
-            response = HttpResponse(f.read(), content_type='application/zip')
-            response['Content-Disposition'] = f'attachment; filename=vinculos_{caso_ativo.numero}.zip'
-            return response
+    response = StreamingHttpResponse(zip_em_fluxo(entradas), content_type='application/zip')
+    response['Content-Disposition'] = f'attachment; filename=vinculos_{caso_ativo.numero}.zip'
+    return response
 
 
 @login_required
@@ -1013,80 +1017,8 @@ def download_vinculos_anx(request):
         messages.error(request, 'Nenhum caso ativo encontrado.')
         return redirect('casos')
 
-    # Busca todos os envolvidos do caso ativo
-    envolvidos = Envolvido.objects.filter(caso=caso_ativo)
-
-    # Prepara os dados para o ANX (formato específico para análise de vínculos)
-    anx_data = {
-        "caso": {
-            "numero": caso_ativo.numero
-        },
-        "nodes": [],
-        "links": []
-    }
-
-    # Monta os nós (pessoas)
-    node_ids = set()
-    for e in envolvidos:
-        cpf_cnpj = str(e.cpf_cnpj_envolvido)
-        if cpf_cnpj not in node_ids:
-            anx_data["nodes"].append({
-                "id": cpf_cnpj,
-                "nome": e.nome_envolvido,
-                "cpf_cnpj": cpf_cnpj,
-                "tipo": e.tipo_envolvido,
-                "indexador": str(e.indexador),
-                "metadata": {
-                    "agencia": e.agencia_envolvido,
-                    "conta": e.conta_envolvido,
-                    "data_abertura": str(e.data_abertura_conta) if e.data_abertura_conta else None,
-                    "data_atualizacao": str(e.data_atualizacao_conta) if e.data_atualizacao_conta else None,
-                    "pep": e.bit_pep_citado,
-                    "pessoa_obrigada": e.bit_pessoa_obrigada_citado,
-                    "servidor": e.int_servidor_citado
-                }
-            })
-            node_ids.add(cpf_cnpj)
-
-    # Monta os links (conexões)
-    titulares = envolvidos.filter(tipo_envolvido='Titular')
-    for titular in titulares:
-        outros_envolvidos = envolvidos.filter(
-            indexador=titular.indexador).exclude(id=titular.id)
-
-        for outro in outros_envolvidos:
-            anx_data["links"].append({
-                "source": str(outro.cpf_cnpj_envolvido),
-                "target": str(titular.cpf_cnpj_envolvido),
-                "tipo": f"{outro.tipo_envolvido} -> Titular",
-                "tipo_relacao": "Titular",
-                "metadata": {
-                    "indexador": str(titular.indexador)
-                }
-            })
-
-    # Cria conexões entre redes (mesmo CPF/CNPJ)
-    for cpf_cnpj in node_ids:
-        if cpf_cnpj == '':
-            continue
-
-        envolvidos_mesmo_cpf = envolvidos.filter(cpf_cnpj_envolvido=cpf_cnpj)
-        if envolvidos_mesmo_cpf.count() > 1:
-            primeiro = envolvidos_mesmo_cpf.first()
-            for outro in envolvidos_mesmo_cpf.exclude(id=primeiro.id):
-                anx_data["links"].append({
-                    "source": str(primeiro.cpf_cnpj_envolvido),
-                    "target": str(outro.cpf_cnpj_envolvido),
-                    "tipo": "Mesmo CPF/CNPJ",
-                    "metadata": {
-                        "indexador_source": str(primeiro.indexador),
-                        "indexador_target": str(outro.indexador)
-                    }
-                })
-
-    # Cria a resposta com o arquivo ANX
-    response = HttpResponse(json.dumps(anx_data, indent=2, ensure_ascii=False),
-                            content_type='application/json')
+    # Arquivo ANX (formato específico para análise de vínculos), do cache por versão do caso
+    response = HttpResponse(grafo_vinculos_anx(caso_ativo.id, caso_ativo.numero), content_type='application/json')
     response['Content-Disposition'] = f'attachment; filename=vinculos_{caso_ativo.numero}.anx'
 
     return response
@@ -1097,109 +1029,66 @@ def financeira_dashboard(request):
     return render(request, 'financeira/dashboard.html')
 
 
+# Problemas de importação listados por página
+PROBLEMAS_POR_PAGINA = 50
+
+
 @login_required
 def financeira_errosimportacao(request):
-    """Mostra envolvidos que não têm informações adicionais"""
+    """Lista os problemas de importação do caso ativo (financeira.problemas), com paginação.
+
+    Envolvidos que ganharam informações adicionais depois da importação (ex.:
+    pelo reprocessamento da comunicação) deixam de ser listados.
+    """
     # Busca o caso ativo
     caso_ativo = _buscar_caso_ativo(request)
     if not caso_ativo:
         messages.error(request, 'Nenhum caso ativo encontrado.')
         return redirect('casos')
 
-    # Busca todos os envolvidos do caso ativo
-    envolvidos = Envolvido.objects.filter(caso=caso_ativo)
-
-    # Busca todas as informações adicionais do caso
-    info_adicionais = InformacaoAdicional.objects.filter(caso=caso_ativo)
-
-    # Cria um set de CPFs que já têm informações adicionais
-    cpfs_com_info = set(info_adicionais.values_list('cpf', flat=True))
-    # Converte em INT
-    cpfs_com_info = set(int(cpf) for cpf in cpfs_com_info)
-
-    # Filtra envolvidos que não têm informações adicionais
-    envolvidos_sem_info = []
-    cpfs_processados = set()
-
-    # Dicionário para contar envolvidos por indexador
-    contagem_por_indexador = {}
-
-    for envolvido in envolvidos:
-
-        # Testa se o tipo_envolvido é "Remetente" ou "Beneficiário"
-        if envolvido.tipo_envolvido not in ['Remetente', 'Beneficiário', 'Outros']:
-            continue
-
-        # Normaliza o CPF/CNPJ removendo pontuação
-        cpf_cnpj_limpo = int(str(envolvido.cpf_cnpj_envolvido).replace(
-            '.', '').replace('-', '').replace('/', ''))
-
-        # Contagem por indexador
-        indexador = str(envolvido.indexador)
-        if indexador not in contagem_por_indexador:
-            contagem_por_indexador[indexador] = {
-                'total': 0,
-                'sem_info': 0
-            }
-        contagem_por_indexador[indexador]['total'] += 1
-
-        # Se já processamos este CPF/CNPJ ou tem informações adicionais, pula
-        if cpf_cnpj_limpo in cpfs_processados or cpf_cnpj_limpo in cpfs_com_info:
-            continue
-
-        # Marca este CPF/CNPJ como processado
-        cpfs_processados.add(cpf_cnpj_limpo)
-
-        # Incrementa contador de não processados do indexador
-        contagem_por_indexador[indexador]['sem_info'] += 1
-
-        # Busca a comunicação relacionada
-        comunicacao = Comunicacao.objects.filter(
-            caso=caso_ativo,
-            rif=envolvido.rif,
-            indexador=envolvido.indexador
-        ).first()
-
-        if comunicacao:
-            # Busca o titular do grupo
-            titular = envolvidos.filter(
-                rif=envolvido.rif,
-                indexador=envolvido.indexador,
-                tipo_envolvido='Titular'
-            ).first()
-
-            contagem_por_indexador[indexador]['comunicacao_id'] = comunicacao.id
-
-            envolvidos_sem_info.append({
-                'id': envolvido.id,
-                'comunicacao_id': comunicacao.id,
-                'rif_numero': envolvido.rif.numero,
-                'indexador': envolvido.indexador,
-                'nome_comunicante': comunicacao.nome_comunicante,
-                'tipo_envolvido': envolvido.tipo_envolvido,
-                'titular': envolvido.nome_envolvido,
-                'cpf_cnpj': envolvido.cpf_cnpj_envolvido,
-                'data_comunicacao': comunicacao.data_recebimento,
-                'valor': comunicacao.campo_a,
-                'informacoes_adicionais': comunicacao.informacoes_adicionais
-            })
-
-    # Ordena o dicionário de contagem por total de envolvidos (decrescente)
-    contagem_ordenada = sorted(
-        [{'indexador': k, **v} for k, v in contagem_por_indexador.items()],
-        key=lambda x: x['total'],
-        reverse=True
-    )
+    resolvidos = Q(tipo='envolvido_sem_informacao') & Q(
+        Exists(informacoes_do_cpf(OuterRef('caso_id'), OuterRef('cpf_cnpj'))))
+    problemas = ImportacaoProblema.objects.filter(caso=caso_ativo).exclude(resolvidos)
+
+    # Quantidade de problemas por tipo, em uma consulta agrupada
+    por_tipo = dict(problemas.order_by().values_list('tipo').annotate(quantidade=Count('id')))
+    tipos = [{'valor': valor, 'descricao': descricao, 'quantidade': por_tipo.get(valor, 0)}
+             for valor, descricao in ImportacaoProblema.TIPO_CHOICES]
+
+    # Envolvidos e envolvidos sem informações por indexador
+    sem_info = problemas.filter(tipo='envolvido_sem_informacao')
+    contagem_por_indexador = {
+        linha['indexador']: {**linha, 'sem_info': 0}
+        for linha in Envolvido.objects.filter(caso=caso_ativo, tipo_envolvido__in=TIPOS_ENVOLVIDO_INFORMACAO)
+        .order_by().values('indexador').annotate(total=Count('id'))
+    }
+    for linha in sem_info.order_by().values('indexador').annotate(
+            sem_info=Count('id'), comunicacao_id=Min('comunicacao_id')):
+        contagem_por_indexador.setdefault(linha['indexador'], {'indexador': linha['indexador'], 'total': 0}).update(
+            sem_info=linha['sem_info'], comunicacao_id=linha['comunicacao_id'])
+    contagem_ordenada = sorted(contagem_por_indexador.values(), key=lambda x: x['total'], reverse=True)
 
     # Calcula totais
-    total_envolvidos = len(envolvidos)
-    total_sem_info = len(cpfs_processados)
+    total_envolvidos = contadores_do_caso(caso_ativo.id)['caso'].envolvidos
+    total_sem_info = por_tipo.get('envolvido_sem_informacao', 0)
     percentual_sem_info = (
         total_sem_info / total_envolvidos * 100) if total_envolvidos > 0 else 0
 
+    # Página da lista de problemas, filtrada pelo tipo escolhido
+    tipo = request.GET.get('tipo', '')
+    if tipo in por_tipo:
+        problemas = problemas.filter(tipo=tipo)
+    problemas = problemas.select_related('rif', 'comunicacao', 'envolvido', 'ocorrencia').order_by(
+        'tipo', 'rif_id', 'indexador', 'id')
+    paginator = Paginator(problemas, PROBLEMAS_POR_PAGINA)
+    pagina = paginator.get_page(request.GET.get('page'))
+
     context = {
         'caso': caso_ativo,
-        'envolvidos_sem_info': envolvidos_sem_info,
+        'problemas': pagina,
+        'paginator': paginator,
+        'tipos': tipos,
+        'tipo': tipo,
         'total_envolvidos': total_envolvidos,
         'total_sem_info': total_sem_info,
         'percentual_sem_info': round(percentual_sem_info, 2),
@@ -1255,603 +1144,34 @@ def importar_arquivos(request):
             'message': 'RIF não encontrada'
         }, status=404)
 
-    try:
-        # Processar os arquivos
-        # Processa cada arquivo enviado
-        arquivos = {
-            'comunicacoes': request.FILES.get('comunicacoes'),
-            'envolvidos': request.FILES.get('envolvidos'),
-            'ocorrencias': request.FILES.get('ocorrencias')
-        }
-
-        registros_totais = 0
-        resultado = {}
-
-        for tipo, arquivo in arquivos.items():
-            if not arquivo:
-                continue
-
-            try:
-                df = ler_arquivo(arquivo)
-            except ValueError as e:
-                return JsonResponse({
-                    'success': False,
-                    'message': f'Erro ao processar arquivo {tipo}: {str(e)}'
-                }, status=400)
-
-            # Adiciona campos comuns
-            df['rif_id'] = rif.id
-            df['caso_id'] = rif.caso_id
-
-            # Salva os dados do arquivo no banco de dados para não processar duas vezes
-            hash_arquivo = sha256_dataframe(df.to_csv())
-            caso = Caso.objects.get(id=rif.caso_id)
-            # Salva o arquivo no sistema
-            arquivo_salvo = Arquivo.objects.create(
-                caso=caso,
-                nome=arquivo,
-                hash=hash_arquivo,
-                tipo=tipo,
-                external_id=rif.id,
-                registros=df.shape[0]
-            )
-            print("[DEBUG] Arquivo salvo com sucesso", arquivo_salvo, '|', arquivo_salvo.id)
-            df['arquivo_id'] = arquivo_salvo.id
-
-            # Processa os dados do arquivo e salva no banco de dados usando os modelos Django
-            try:
-                if tipo == 'comunicacoes':
-                    # Ajusta colunas
-                    df = df.rename(
-                        columns={'informacoesAdicionais': 'informacoes_adicionais'})
-                    df = df.rename(columns={'CampoA': 'campo_a', 'CampoB': 'campo_b', 'CampoC': 'campo_c', 'CampoD': 'campo_d', 'CampoE': 'campo_e'})
-                    
-                    # Converte os campos monetários para float
-                    df['campo_a'] = df['campo_a'].apply(converter_valores)
-                    df['campo_b'] = df['campo_b'].apply(converter_valores)
-                    df['campo_c'] = df['campo_c'].apply(converter_valores)
-                    df['campo_d'] = df['campo_d'].apply(converter_valores)
-                    df['campo_e'] = df['campo_e'].apply(converter_valores)
-                    
-                    # Corrige colunas de data com tratamento de erro
-                    for col in ['data_recebimento', 'data_operacao', 'data_fim_fato']:
-                        if col in df.columns:
-                            try:
-                                # Primeiro tenta o formato com hora
-                                df[col] = pd.to_datetime(df[col], format='%d/%m/%Y %H:%M:%S', errors='coerce')
-                                # Se não funcionar, tenta apenas a data
-                                if df[col].isna().all():
-                                    df[col] = pd.to_datetime(df[col], format='%d/%m/%Y', errors='coerce')
-                                # Se ainda não funcionar, converte para string
-                                df[col] = df[col].dt.strftime('%Y-%m-%d').fillna('')
-                            except Exception as e:
-                                print(f"Erro ao converter {col}: {e}")
-                                df[col] = df[col].astype(str)
-
-                    # Salva os dados usando o modelo Django
-                    comunicacoes_criadas = []
-                    for index, row in df.iterrows():
-                        try:
-                            comunicacao = Comunicacao.objects.create(
-                                rif_id=row['rif_id'],
-                                caso_id=row['caso_id'],
-                                arquivo_id=row['arquivo_id'],
-                                indexador=row['indexador'],
-                                id_comunicacao=row['id_comunicacao'],
-                                numero_ocorrencia_bc=str(row['numero_ocorrencia_bc']),
-                                data_recebimento=str(row['data_recebimento']),
-                                data_operacao=str(row['data_operacao']),
-                                data_fim_fato=str(row['data_fim_fato']),
-                                cpf_cnpj_comunicante=safe_cpf_cnpj_converter(row['cpf_cnpj_comunicante']),
-                                nome_comunicante=str(row['nome_comunicante']),
-                                cidade_agencia=str(row['cidade_agencia']),
-                                uf_agencia=str(row['uf_agencia']),
-                                nome_agencia=str(row['nome_agencia']),
-                                numero_agencia=int(row['numero_agencia']) if pd.notna(row['numero_agencia']) else 0,
-                                informacoes_adicionais=str(row['informacoes_adicionais']),
-                                campo_a=str(row['campo_a']),
-                                campo_b=str(row['campo_b']),
-                                campo_c=str(row['campo_c']),
-                                campo_d=str(row['campo_d']),
-                                campo_e=str(row['campo_e']),
-                                codigo_segmento=int(row['codigo_segmento']) if pd.notna(row['codigo_segmento']) else 0
-                            )
-                            comunicacoes_criadas.append(comunicacao)
-                        except Exception as e:
-                            print(f"Erro ao criar comunicação na linha {index}: {e}")
-                            continue
-                    
-                    resultado['comunicacoes'] = len(comunicacoes_criadas)
-
-                elif tipo == 'envolvidos':
-                    # Formata CPF/CNPJ
-                    df['cpf_cnpj_envolvido'] = df['cpf_cnpj_envolvido'].str.replace(
-                        r'\D', '', regex=True)
-
-                    # Renomeia colunas
-                    df = df.rename(columns={'nomeEnvolvido': 'nome_envolvido'})
-                    df = df.rename(columns={'tipoEnvolvido': 'tipo_envolvido'})
-
-                    # Normaliza o nome do envolvido
-                    df['nome_envolvido'] = df['nome_envolvido'].apply(
-                        lambda x: normalizar_nome(x))
-                    
-                    # Corrige colunas de data com tratamento de erro
-                    for col in ['data_abertura_conta', 'data_atualizacao_conta']:
-                        if col in df.columns:
-                            try:
-                                df[col] = pd.to_datetime(df[col], format='%d/%m/%Y', errors='coerce')
-                                df[col] = df[col].dt.strftime('%Y-%m-%d').fillna('')
-                            except Exception as e:
-                                print(f"Erro ao converter {col}: {e}")
-                                df[col] = df[col].astype(str)
-                                        
-                    # Remove todas as linhas que o Indexador não é um número
-                    df = df[df['indexador'].astype(str).str.isnumeric()]
-
-                    # Salva os dados usando o modelo Django
-                    envolvidos_criados = []
-                    for index, row in df.iterrows():
-                        try:
-                            # Processa datas
-                            data_abertura = None
-                            data_atualizacao = None
-                            
-                            if pd.notna(row['data_abertura_conta']) and str(row['data_abertura_conta']).strip():
-                                try:
-                                    data_abertura = pd.to_datetime(row['data_abertura_conta']).date()
-                                except:
-                                    data_abertura = None
-                            
-                            if pd.notna(row['data_atualizacao_conta']) and str(row['data_atualizacao_conta']).strip():
-                                try:
-                                    data_atualizacao = pd.to_datetime(row['data_atualizacao_conta']).date()
-                                except:
-                                    data_atualizacao = None
-
-                            envolvido = Envolvido.objects.create(
-                                rif_id=row['rif_id'],
-                                caso_id=row['caso_id'],
-                                arquivo_id=row['arquivo_id'],
-                                indexador=row['indexador'],
-                                cpf_cnpj_envolvido=safe_cpf_cnpj_converter(row['cpf_cnpj_envolvido']),
-                                nome_envolvido=str(row['nome_envolvido']),
-                                tipo_envolvido=str(row['tipo_envolvido']),
-                                agencia_envolvido=safe_int_converter(row['agencia_envolvido']),
-                                conta_envolvido=safe_int_converter(row['conta_envolvido']),
-                                data_abertura_conta=data_abertura,
-                                data_atualizacao_conta=data_atualizacao,
-                                bit_pep_citado=safe_str_converter(row['bit_pep_citado']),
-                                bit_pessoa_obrigada_citado=safe_str_converter(row['bit_pessoa_obrigada_citado']),
-                                int_servidor_citado=safe_str_converter(row['int_servidor_citado'])
-                            )
-                            envolvidos_criados.append(envolvido)
-                        except Exception as e:
-                            print(f"Erro ao criar envolvido na linha {index}: {e}")
-                            continue
-                    
-                    resultado['envolvidos'] = len(envolvidos_criados)
-
-                elif tipo == 'ocorrencias':
-                    # Corrige colunas de data com tratamento de erro
-                    for col in ['data_recebimento']:
-                        if col in df.columns:
-                            try:
-                                df[col] = pd.to_datetime(df[col], format='%d/%m/%Y', errors='coerce')
-                                df[col] = df[col].dt.strftime('%Y-%m-%d').fillna('').astype(str)
-                            except Exception as e:
-                                print(f"Erro ao converter {col}: {e}")
-                                df[col] = df[col].astype(str)
-                    
-                    # Remove todas as linhas que o Indexador não é um número
-                    df = df[df['indexador'].astype(str).str.isnumeric()]
-                    
-                    # Salva os dados usando o modelo Django
-                    ocorrencias_criadas = []
-                    for index, row in df.iterrows():
-                        try:
-                            ocorrencia = Ocorrencia.objects.create(
-                                rif_id=row['rif_id'],
-                                caso_id=row['caso_id'],
-                                arquivo_id=row['arquivo_id'],
-                                indexador=row['indexador'],
-                                id_ocorrencia=int(row['id_ocorrencia']) if pd.notna(row['id_ocorrencia']) else 0,
-                                ocorrencia=str(row['ocorrencia'])
-                            )
-                            ocorrencias_criadas.append(ocorrencia)
-                        except Exception as e:
-                            print(f"Erro ao criar ocorrência na linha {index}: {e}")
-                            continue
-                    
-                    resultado['ocorrencias'] = len(ocorrencias_criadas)
-
-            except Exception as e:
-                print(f"Erro geral ao processar {tipo}: {e}")
-                return JsonResponse({
-                    'success': False,
-                    'message': f'Erro ao salvar {tipo}: {str(e)}'
-                }, status=500)
-
-            registros_totais += len(df)
-
-        # Atualiza contadores na RIF
-        rif.total_comunicacoes = resultado.get('comunicacoes', 0)
-        rif.total_envolvidos = resultado.get('envolvidos', 0)
-        rif.save()
-
+    arquivos = {
+        'comunicacoes': request.FILES.get('comunicacoes'),
+        'envolvidos': request.FILES.get('envolvidos'),
+        'ocorrencias': request.FILES.get('ocorrencias')
+    }
+    if not any(arquivos.values()):
         return JsonResponse({
-            'success': True,
-            'message': 'Arquivos importados com sucesso!'
-        })
+            'success': False,
+            'message': 'Nenhum arquivo enviado'
+        }, status=400)
 
-    except Exception as e:
+    # Os arquivos são gravados pelo worker de importações (comando processar_importacoes)
+    try:
+        job = enfileirar_importacao(caso_ativo, request.user, 'rif', rif.id, arquivos)
+    except OSError as e:
+        logger.exception("Erro ao armazenar os arquivos da RIF %s", rif.id)
         return JsonResponse({
             'success': False,
-            'message': f'Erro ao processar arquivos: {str(e)}'
+            'message': f'Erro ao armazenar os arquivos: {str(e)}'
         }, status=500)
 
+    return JsonResponse({
+        'success': True,
+        'message': 'Arquivos recebidos. A importação será processada em segundo plano.',
+        'job_id': job.id,
+        'status_url': reverse('importacao_status', args=[job.id])
+    })
 
-def converter_valores(valor):
-    """
-    Converte valores monetários em formato texto para float.
-    
-    Esta função recebe um valor que pode estar em diferentes formatos (int, float ou string)
-    e o converte para float. Se o valor estiver em formato brasileiro (usando vírgula como 
-    separador decimal), faz a conversão apropriada.
-
-    Args:
-        valor: O valor a ser convertido, pode ser int, float ou string
-
-    Returns:
-        float: O valor convertido para float
-
-    Exemplo:
-        >>> converter_valores("1.234,56")
-        1234.56
-        >>> converter_valores(1234)
-        1234.0
-        >>> converter_valores("")
-        0.0
-    """
-    if isinstance(valor, (int, float)):
-        return valor  # Retorna diretamente se já for numérico
-
-    if str(valor).count(',') > 0:
-        locale.setlocale(locale.LC_ALL, 'pt_BR.UTF-8')
-
-        valor = locale.atof(valor)
-
-    if valor == '':
-        valor = 0
-
-    return float(valor)
-
-
-def safe_int_converter(valor):
-    """
-    Converte um valor para inteiro de forma segura, tratando valores vazios ou inválidos.
-    
-    Args:
-        valor: O valor a ser convertido
-        
-    Returns:
-        int ou None: O valor convertido ou None se inválido
-    """
-    if pd.isna(valor) or valor is None:
-        return None
-    
-    valor_str = str(valor).strip()
-    if valor_str == '' or valor_str == '-' or valor_str == 'nan':
-        return None
-    
-    try:
-        valor_int = int(valor_str)
-        # Verifica se o valor não excede o limite de um IntegerField (2147483647)
-        if valor_int > 2147483647:
-            return None
-        return valor_int
-    except (ValueError, TypeError):
-        return None
-
-
-def safe_str_converter(valor):
-    """
-    Converte um valor para string de forma segura, tratando valores vazios ou inválidos.
-    
-    Args:
-        valor: O valor a ser convertido
-        
-    Returns:
-        str ou None: O valor convertido ou None se inválido
-    """
-    if pd.isna(valor) or valor is None:
-        return None
-    
-    valor_str = str(valor).strip()
-    if valor_str == '' or valor_str == '-' or valor_str == 'nan':
-        return None
-    
-    return valor_str
-
-
-def safe_cpf_cnpj_converter(valor):
-    """
-    Converte um valor para string de CPF/CNPJ de forma segura.
-    
-    Args:
-        valor: O valor a ser convertido
-        
-    Returns:
-        str ou None: O valor convertido ou None se inválido
-    """
-    if pd.isna(valor) or valor is None:
-        return None
-    
-    valor_str = str(valor).strip()
-    if valor_str == '' or valor_str == '-' or valor_str == 'nan':
-        return None
-    
-    # Remove caracteres não numéricos
-    valor_limpo = re.sub(r'\D', '', valor_str)
-    
-    # Verifica se tem o tamanho correto (11 para CPF ou 14 para CNPJ)
-    if len(valor_limpo) in [11, 14]:
-        return valor_limpo
-    
-    return None
-
-
-def save_dataframe(df, table_name, if_exists='append', index=False):
-    """
-    Salva um DataFrame no banco de dados usando os modelos Django.
-    
-    Args:
-        df: DataFrame pandas com os dados
-        table_name: Nome da tabela (usado apenas para identificar o tipo de modelo)
-        if_exists: Não usado, mantido para compatibilidade
-        index: Não usado, mantido para compatibilidade
-    
-    Returns:
-        list: Lista com os IDs dos registros criados
-    """
-    try:
-        # Testa se existe a coluna CPF no df
-        coluna_cpf = next((col for col in ['cpf', 'CPF', 'cnpj', 'CNPJ', 'cpf_cnpj',
-                          'cpfCnpjTitular', 'cpfCnpjEnvolvido'] if col in df.columns), None)
-        if coluna_cpf:
-            # Somente digitos (com RE)
-            df[coluna_cpf] = df[coluna_cpf].str.replace(r'\D', '', regex=True)
-
-        # Testa se existe a coluna de valor financeiro
-        for col in df.columns:
-            if col in ['campo_a', 'campo_b', 'campo_c', 'campo_d', 'campo_e', 'valor']:
-                df[col] = df[col].apply(converter_valores)
-
-        # Tratar colunas de data para evitar problemas com formato brasileiro
-        date_columns = [col for col in df.columns if 'data' in col.lower()]
-        for col in date_columns:
-            if col in df.columns:
-                try:
-                    # Tentar diferentes formatos de data
-                    df[col] = df[col].astype(str)
-                    # Primeiro tenta formato com hora
-                    temp_dates = pd.to_datetime(df[col], format='%d/%m/%Y %H:%M:%S', errors='coerce')
-                    # Se não funcionar, tenta apenas data
-                    mask = temp_dates.isna()
-                    if mask.any():
-                        temp_dates[mask] = pd.to_datetime(df[col][mask], format='%d/%m/%Y', errors='coerce')
-                    # Converte para string ISO
-                    df[col] = temp_dates.dt.strftime('%Y-%m-%d').fillna('')
-                except Exception as e:
-                    print(f"Erro ao converter coluna {col}: {e}")
-                    # Se falhar, mantém como string
-                    df[col] = df[col].astype(str)
-
-        # Salva os dados usando os modelos Django baseado no nome da tabela
-        ids = []
-        
-        if 'comunicacao' in table_name.lower():
-            # Salva comunicações
-            for index, row in df.iterrows():
-                try:
-                    comunicacao = Comunicacao.objects.create(
-                        rif_id=row['rif_id'],
-                        caso_id=row['caso_id'],
-                        arquivo_id=row['arquivo_id'],
-                        indexador=row['indexador'],
-                        id_comunicacao=row['id_comunicacao'],
-                        numero_ocorrencia_bc=str(row['numero_ocorrencia_bc']),
-                        data_recebimento=str(row['data_recebimento']),
-                        data_operacao=str(row['data_operacao']),
-                        data_fim_fato=str(row['data_fim_fato']),
-                        cpf_cnpj_comunicante=int(row['cpf_cnpj_comunicante']) if pd.notna(row['cpf_cnpj_comunicante']) else 0,
-                        nome_comunicante=str(row['nome_comunicante']),
-                        cidade_agencia=str(row['cidade_agencia']),
-                        uf_agencia=str(row['uf_agencia']),
-                        nome_agencia=str(row['nome_agencia']),
-                        numero_agencia=int(row['numero_agencia']) if pd.notna(row['numero_agencia']) else 0,
-                        informacoes_adicionais=str(row['informacoes_adicionais']),
-                        campo_a=str(row['campo_a']),
-                        campo_b=str(row['campo_b']),
-                        campo_c=str(row['campo_c']),
-                        campo_d=str(row['campo_d']),
-                        campo_e=str(row['campo_e']),
-                        codigo_segmento=int(row['codigo_segmento']) if pd.notna(row['codigo_segmento']) else 0
-                    )
-                    ids.append(comunicacao.id)
-                except Exception as e:
-                    print(f"Erro ao criar comunicação na linha {index}: {e}")
-                    continue
-                    
-        elif 'envolvido' in table_name.lower():
-            # Salva envolvidos
-            for index, row in df.iterrows():
-                try:
-                    # Processa datas
-                    data_abertura = None
-                    data_atualizacao = None
-                    
-                    if pd.notna(row['data_abertura_conta']) and str(row['data_abertura_conta']).strip():
-                        try:
-                            data_abertura = pd.to_datetime(row['data_abertura_conta']).date()
-                        except:
-                            data_abertura = None
-                    
-                    if pd.notna(row['data_atualizacao_conta']) and str(row['data_atualizacao_conta']).strip():
-                        try:
-                            data_atualizacao = pd.to_datetime(row['data_atualizacao_conta']).date()
-                        except:
-                            data_atualizacao = None
-
-                            envolvido = Envolvido.objects.create(
-                                rif_id=row['rif_id'],
-                                caso_id=row['caso_id'],
-                                arquivo_id=row['arquivo_id'],
-                                indexador=row['indexador'],
-                                cpf_cnpj_envolvido=safe_cpf_cnpj_converter(row['cpf_cnpj_envolvido']),
-                                nome_envolvido=str(row['nome_envolvido']),
-                                tipo_envolvido=str(row['tipo_envolvido']),
-                                agencia_envolvido=safe_int_converter(row['agencia_envolvido']),
-                                conta_envolvido=safe_int_converter(row['conta_envolvido']),
-                                data_abertura_conta=data_abertura,
-                                data_atualizacao_conta=data_atualizacao,
-                                bit_pep_citado=safe_str_converter(row['bit_pep_citado']),
-                                bit_pessoa_obrigada_citado=safe_str_converter(row['bit_pessoa_obrigada_citado']),
-                                int_servidor_citado=safe_str_converter(row['int_servidor_citado'])
-                            )
-                    ids.append(envolvido.id)
-                except Exception as e:
-                    print(f"Erro ao criar envolvido na linha {index}: {e}")
-                    continue
-                    
-        elif 'ocorrencia' in table_name.lower():
-            # Salva ocorrências
-            for index, row in df.iterrows():
-                try:
-                    ocorrencia = Ocorrencia.objects.create(
-                        rif_id=row['rif_id'],
-                        caso_id=row['caso_id'],
-                        arquivo_id=row['arquivo_id'],
-                        indexador=row['indexador'],
-                        id_ocorrencia=int(row['id_ocorrencia']) if pd.notna(row['id_ocorrencia']) else 0,
-                        ocorrencia=str(row['ocorrencia'])
-                    )
-                    ids.append(ocorrencia.id)
-                except Exception as e:
-                    print(f"Erro ao criar ocorrência na linha {index}: {e}")
-                    continue
-        else:
-            print(f"Tipo de tabela não reconhecido: {table_name}")
-            return []
-
-        return ids
-
-    except Exception as e:
-        print(f'Erro ao salvar o dataframe: {e}')
-        return []
-
-
-def ler_arquivo(uploaded_file):
-    ext = os.path.splitext(uploaded_file.name)[-1].lower()
-    nome_original = uploaded_file.name
-    print(
-        f'Extensão: {ext}, Tipo: {type(uploaded_file)}, Nome original: {nome_original}')
-    # Salva o arquivo temporariamente
-    with tempfile.NamedTemporaryFile(delete=False, suffix=ext) as tmp:
-        for chunk in uploaded_file.chunks():
-            tmp.write(chunk)
-        tmp_path = tmp.name
-
-    try:
-        if ext in ['.xlsx', '.xls']:
-            df = pd.read_excel(tmp_path)
-        else:
-            df = pd.read_csv(tmp_path, encoding='windows-1252',
-                             delimiter=';', keep_default_na=False)
-    finally:
-        os.unlink(tmp_path)  # Remove o arquivo temporário
-
-    if 'Indexador' not in df.columns:
-        raise ValueError('Coluna "Indexador" não encontrada no arquivo.')
-
-    condicao = (df['Indexador'].astype(str).str.strip() == '') | (
-        df['Indexador'].astype(str).str.startswith('#'))
-    indices = df[condicao].index
-
-    # RENOMEAR TODAS AS COLUNAS
-    # Mapeamento das colunas do DF para os nomes das colunas do modelo
-    if 'Comunicacoes.csv' in nome_original:
-        mapeamento_colunas = {
-            'Indexador': 'indexador',
-            'idComunicacao': 'id_comunicacao',
-            'NumeroOcorrenciaBC': 'numero_ocorrencia_bc',
-            'Data_do_Recebimento': 'data_recebimento',
-            'Data_da_operacao': 'data_operacao',
-            'DataFimFato': 'data_fim_fato',
-            'cpfCnpjComunicante': 'cpf_cnpj_comunicante',
-            'nomeComunicante': 'nome_comunicante',
-            'CidadeAgencia': 'cidade_agencia',
-            'UFAgencia': 'uf_agencia',
-            'NomeAgencia': 'nome_agencia',
-            'NumeroAgencia': 'numero_agencia',
-            'informacoes_adicionais': 'informacoes_adicionais',
-            'campo_a': 'campo_a',
-            'campo_b': 'campo_b',
-            'campo_c': 'campo_c',
-            'campo_d': 'campo_d',
-            'CampoE': 'campo_e',
-            'CodigoSegmento': 'codigo_segmento'
-        }
-    elif 'Envolvidos.csv' in nome_original:
-        mapeamento_colunas = {
-            'Indexador': 'indexador',
-            'cpfCnpjEnvolvido': 'cpf_cnpj_envolvido',
-            'nome_envolvido': 'nome_envolvido',
-            'tipo_envolvido': 'tipo_envolvido',
-            'agenciaEnvolvido': 'agencia_envolvido',
-            'contaEnvolvido': 'conta_envolvido',
-            'DataAberturaConta': 'data_abertura_conta',
-            'DataAtualizacaoConta': 'data_atualizacao_conta',
-            'bitPepCitado': 'bit_pep_citado',
-            'bitPessoaObrigadaCitado': 'bit_pessoa_obrigada_citado',
-            'intServidorCitado': 'int_servidor_citado'
-        }
-    elif 'Ocorrencias.csv' in nome_original:
-        mapeamento_colunas = {
-            'Indexador': 'indexador',
-            'idOcorrencia': 'id_ocorrencia',
-            'Ocorrencia': 'ocorrencia'
-        }
-    else:
-        raise ValueError(
-            'Tipo de arquivo não reconhecido para mapeamento de colunas: ' + nome_original)
-
-    # Renomear as colunas do DataFrame
-    df = df.rename(columns=mapeamento_colunas)
-
-    if not indices.empty:
-        indice_parada = indices[0]
-        df = df.iloc[:indice_parada]
-
-    # Limpa colunas de data e outros campos
-    date_columns = ['data_abertura_conta', 'data_atualizacao_conta', 'data_recebimento', 'data_operacao', 'data_fim_fato']
-    for col in date_columns:
-        if col in df.columns:
-            df[col] = df[col].replace('-', None)
-    
-    # Limpa campos numéricos que podem ter '-'
-    numeric_columns = ['cpf_cnpj_envolvido', 'agencia_envolvido', 'conta_envolvido', 'cpf_cnpj_comunicante', 'numero_agencia']
-    for col in numeric_columns:
-        if col in df.columns:
-            df[col] = df[col].replace('-', None)
-    
-    # Limpa campos de texto que podem ter '-'
-    text_columns = ['bit_pep_citado', 'bit_pessoa_obrigada_citado', 'int_servidor_citado']
-    for col in text_columns:
-        if col in df.columns:
-            df[col] = df[col].replace('-', None)
-
-    return df
 
 ##################################################################################################
 # ENVOLVIDO DETALHES
@@ -1877,26 +1197,16 @@ def envolvido_detalhes(request, cpf_cnpj):
     caso_ativo = _buscar_caso_ativo(request)
 
     # Busca o envolvido
-    envolvido = Envolvido.objects.filter(cpf_cnpj_envolvido=cpf_cnpj)
+    envolvido = Envolvido.objects.filter(cpf_cnpj_envolvido=cpf_cnpj, caso=caso_ativo).first()
 
     if not envolvido:
         messages.error(request, 'Envolvido não encontrado.')
         return redirect('financeira:financeira_envolvidos')
 
-    # Busca todas as comunicações relacionadas ao envolvido
-    comunicacoes = Comunicacao.objects.filter(
-        caso_id=caso_ativo.id,
-        indexador__in=envolvido.values_list('indexador', flat=True)
-    )
-
-    for comunicacao in comunicacoes:
-        comunicacao.titular = _buscar_titular_ocorrencia(comunicacao)
-        comunicacao.envolvido = envolvido.filter(
-            indexador=comunicacao.indexador).first()
-
+    # Comunicações do caso com o envolvido, já com a participação dele (tipo_envolvido)
     context = {
-        'envolvido': envolvido.first(),
-        'comunicacoes': comunicacoes,
+        'envolvido': envolvido,
+        'comunicacoes': comunicacoes_do_envolvido(caso_ativo.id, cpf_cnpj),
     }
 
     return render(request, 'financeira/envolvido_detalhes.html', context)
@@ -1912,36 +1222,12 @@ def comunicacoes_envolvido(request, cpf_cnpj_envolvido, rif_id):
         # Buscar o RIF
         rif = get_object_or_404(RIF, id=rif_id)
 
-        # Buscar o envolvido em todos os RIFs do caso
-        envolvidos = Envolvido.objects.filter(
-            cpf_cnpj_envolvido=cpf_cnpj_envolvido, caso_id=rif.caso.id)
-        comunicacoes = []
-
-        for envolvido in envolvidos:
-            # Buscar comunicações para este envolvido
-            comunicacoes_envolvido = Comunicacao.objects.filter(
-                rif__caso=rif.caso,
-                indexador=envolvido.indexador
-            ).order_by('-data_recebimento')
-
-            # Buscar titular para este envolvido
-            titular = Envolvido.objects.filter(
-                indexador=envolvido.indexador, rif=rif, tipo_envolvido='Titular').first()
-
-            # Adicionar informações do titular a cada comunicação
-            for comunicacao in comunicacoes_envolvido:
-                if titular:
-                    comunicacao.titular = titular.nome_envolvido
-                    comunicacao.cpf_cnpj_titular = titular.cpf_cnpj_envolvido
-                else:
-                    comunicacao.titular = "Não identificado"
-                    comunicacao.cpf_cnpj_titular = "N/A"
-
-            # Adicionar as comunicações à lista
-            comunicacoes.extend(comunicacoes_envolvido)
+        # Comunicações do envolvido em todas as RIFs do caso, em uma consulta
+        envolvido = Envolvido.objects.filter(cpf_cnpj_envolvido=cpf_cnpj_envolvido, caso_id=rif.caso_id).first()
+        comunicacoes = comunicacoes_do_envolvido(rif.caso_id, cpf_cnpj_envolvido).order_by('-data_recebimento', 'id')
 
         context = {
-            'envolvido': envolvidos.first(),
+            'envolvido': envolvido,
             'rif': rif,
             'comunicacoes': comunicacoes,
             'caso': rif.caso
@@ -1957,6 +1243,19 @@ def comunicacoes_envolvido(request, cpf_cnpj_envolvido, rif_id):
         return redirect('financeira:financeira_envolvidos')
 
 
+@login_required
+@require_GET
+def comunicacao_informacoes_adicionais(request, comunicacao_id):
+    """Texto de informações adicionais da comunicação, carregado quando o usuário abre a linha
+
+    As listagens de comunicações (financeira.consultas) não trazem esse campo.
+    """
+    caso_ativo = _buscar_caso_ativo(request)
+    comunicacao = get_object_or_404(
+        Comunicacao.objects.only('id', 'informacoes_adicionais'), id=comunicacao_id, caso=caso_ativo)
+    return JsonResponse({'id': comunicacao.id, 'informacoes_adicionais': comunicacao.informacoes_adicionais})
+
+
 @login_required(login_url='/login')
 def resumo(request):
     """Gera relatório financeiro do caso"""
@@ -1983,12 +1282,10 @@ def resumo(request):
     ocorrencias = Ocorrencia.objects.filter(
         caso=caso).values('ocorrencia', 'indexador', 'id').distinct()
 
-    total_movimentacao = sum(processar_valor_monetario(com.campo_a)
-                             for com in comunicacoes if com.campo_a)
-    total_creditos = sum(processar_valor_monetario(com.campo_b)
-                         for com in comunicacoes if com.campo_b)
-    total_debitos = sum(processar_valor_monetario(com.campo_c)
-                        for com in comunicacoes if com.campo_c)
+    resumo_caso = resumo_financeiro(caso.id)
+    total_movimentacao = resumo_caso.total_campo_a
+    total_creditos = resumo_caso.total_campo_b
+    total_debitos = resumo_caso.total_campo_c
 
     # Preparar dados para o template
     context = {
@@ -2014,6 +1311,7 @@ def resumo(request):
 # 
 ##################################################################################################
 @login_required
+@usar_replica
 def relatorio_documento(request):
     """Gera relatório financeiro do caso"""
 
@@ -2038,9 +1336,9 @@ def relatorio_documento(request):
         })
 
     # Calcular movimentação para cada RIF
+    resumo = resumo_financeiro(caso.id)
     for i, rif_dict in enumerate(rifs_list):
-        movimentacao_rif = sum(processar_valor_monetario(com.campo_a)
-                               for com in comunicacoes if com.caso == rif_dict['caso'])
+        movimentacao_rif = Decimal(resumo.por_rif.get(str(rif_dict['id']), '0'))
         rifs_list[i]['movimentacao'] = moeda(movimentacao_rif)
 
     # Filtra os titulares e representantes
@@ -2050,18 +1348,16 @@ def relatorio_documento(request):
         'cpf_cnpj_envolvido', 'nome_envolvido', 'tipo_envolvido', 'indexador').distinct().order_by('nome_envolvido')
 
     # Total movimentado no Caso
-    movimentacao = sum(processar_valor_monetario(com.campo_a)
-                       for com in comunicacoes if com.campo_a)
+    movimentacao = resumo.total_campo_a
 
-    # Total movimentado por titular
+    # Total movimentado por titular (comunicações com o mesmo indexador)
+    totais_por_indexador = _somar_campos_por(comunicacoes, 'indexador', 'campo_a', 'campo_b', 'campo_c')
+    sem_comunicacoes = {'campo_a': 0, 'campo_b': 0, 'campo_c': 0}
     for i, titular in enumerate(titulares):
-        movimentacao_titular = sum(processar_valor_monetario(
-            com.campo_a) for com in comunicacoes if com.campo_a and com.indexador == titular['cpf_cnpj_envolvido'])
-        titulares[i]['movimentacao'] = moeda(movimentacao_titular)
-        titulares[i]['creditos'] = moeda(sum(processar_valor_monetario(
-            com.campo_b) for com in comunicacoes if com.indexador == titular['indexador']))
-        titulares[i]['debitos'] = moeda(sum(processar_valor_monetario(
-            com.campo_c) for com in comunicacoes if com.indexador == titular['indexador']))
+        totais_titular = totais_por_indexador.get(titular['indexador'], sem_comunicacoes)
+        titulares[i]['movimentacao'] = moeda(totais_titular['campo_a'])
+        titulares[i]['creditos'] = moeda(totais_titular['campo_b'])
+        titulares[i]['debitos'] = moeda(totais_titular['campo_c'])
 
     df_rifdetalhado = pd.DataFrame()
 
@@ -3117,14 +2413,14 @@ def resumo_por_id(request, caso_id):
         informacoes_adicionais = InformacaoAdicional.objects.filter(caso=caso)
 
         # Converter RIFs para lista de dicionários
+        resumo = resumo_financeiro(caso.id)
         rifs_list = []
         for rif in rifs:
             rifs_list.append({
                 'id': rif.id,
                 'numero': rif.numero,
                 'caso': rif.caso,
-                'movimentacao': moeda(sum(processar_valor_monetario(com.campo_a)
-                                          for com in comunicacoes.filter(rif=rif) if com.campo_a))
+                'movimentacao': moeda(Decimal(resumo.por_rif.get(str(rif.id), '0')))
             })
 
         # Filtra os titulares e representantes
@@ -3137,8 +2433,11 @@ def resumo_por_id(request, caso_id):
         ).distinct().order_by('nome_envolvido')
 
         # Total movimentado no Caso
-        movimentacao = sum(processar_valor_monetario(com.campo_a)
-                           for com in comunicacoes if com.campo_a)
+        movimentacao = resumo.total_campo_a
+
+        # Totais de cada titular (comunicações com o mesmo indexador), em uma única consulta
+        totais_por_indexador = _somar_campos_por(comunicacoes, 'indexador', 'campo_a', 'campo_b', 'campo_c')
+        sem_comunicacoes = {'campo_a': 0, 'campo_b': 0, 'campo_c': 0}
 
         # Processar dados dos titulares
         titulares_extratos = []
@@ -3147,13 +2446,11 @@ def resumo_por_id(request, caso_id):
             comunicacoes_titular = comunicacoes.filter(
                 indexador=titular['indexador'])
 
-            # Calcular totais do titular
-            movimentacao_titular = sum(processar_valor_monetario(
-                com.campo_a) for com in comunicacoes_titular if com.campo_a)
-            creditos_titular = sum(processar_valor_monetario(
-                com.campo_b) for com in comunicacoes_titular if com.campo_b)
-            debitos_titular = sum(processar_valor_monetario(
-                com.campo_c) for com in comunicacoes_titular if com.campo_c)
+            # Totais do titular
+            totais_titular = totais_por_indexador.get(titular['indexador'], sem_comunicacoes)
+            movimentacao_titular = totais_titular['campo_a']
+            creditos_titular = totais_titular['campo_b']
+            debitos_titular = totais_titular['campo_c']
 
             # Buscar ocorrências do titular
             ocorrencias_titular = ocorrencias.filter(
@@ -3771,9 +3068,10 @@ def gerar_relatorio_estatisticas_caso(caso_id):
         caso = get_object_or_404(Caso, id=caso_id)
 
         # Estatísticas básicas
-        total_rifs = RIF.objects.filter(caso=caso).count()
-        total_comunicacoes = Comunicacao.objects.filter(caso=caso).count()
-        total_envolvidos = Envolvido.objects.filter(caso=caso).count()
+        contadores = contadores_do_caso(caso.id)['caso']
+        total_rifs = contadores.rifs
+        total_comunicacoes = contadores.comunicacoes
+        total_envolvidos = contadores.envolvidos
         total_info_adicionais = InformacaoAdicional.objects.filter(
             caso=caso).count()
 
@@ -3789,9 +3087,7 @@ def gerar_relatorio_estatisticas_caso(caso_id):
             taxa_processamento = 0
 
         # Valores financeiros
-        comunicacoes = Comunicacao.objects.filter(caso=caso)
-        valor_total = sum(processar_valor_monetario(com.campo_a)
-                          for com in comunicacoes if com.campo_a)
+        valor_total = resumo_financeiro(caso.id).total_campo_a
 
         # Top 10 envolvidos por valor
         info_adicionais = InformacaoAdicional.objects.filter(
@@ -3949,6 +3245,9 @@ def upload_planilha(request):
                     'message': f'Colunas obrigatórias não encontradas!\n\nColunas encontradas: {", ".join(colunas_encontradas)}\n\nColunas obrigatórias faltantes: {", ".join(colunas_faltantes)}\n\nVerifique se os nomes das colunas estão exatamente como esperado (sem espaços extras, acentos, etc.)'
                 }, status=400)
 
+            # Converte a coluna de valores de uma só vez
+            df['valor_numerico'] = valores_monetarios(df['valor']).fillna(0.0)
+
             # Processa e salva os dados
             registros_salvos = 0
             registros_erro = 0
@@ -3976,10 +3275,9 @@ def upload_planilha(request):
                     plataforma = str(row['plataforma']).strip(
                     ) if pd.notna(row['plataforma']) else ''
 
-                    # Processa valor monetário
                     valor_original = str(row['valor']) if pd.notna(
                         row['valor']) else '0'
-                    valor_numerico = processar_valor_monetario(valor_original)
+                    valor_numerico = row['valor_numerico']
 
                     # Valida campos obrigatórios
                     if not nome:
@@ -4252,10 +3550,10 @@ Pedro Oliveira,99988877766,crédito,5000.00,1,Depósito"""
 
 def execute_custom_query(query):
     """
-    Executa uma query SQL customizada diretamente no banco de dados
+    Executa uma query SQL customizada diretamente no banco de dados (na réplica, se em uso)
     """
     try:
-        with connection.cursor() as cursor:
+        with connections[banco_leitura()].cursor() as cursor:
             cursor.execute(query)
             columns = [col[0] for col in cursor.description]
             results = cursor.fetchall()
@@ -4335,6 +3633,7 @@ def get_custom_queries_results(custom_queries = None):
 
 @csrf_exempt
 @login_required
+@usar_replica
 def execute_custom_query_api(request):
     """
     API para executar queries customizadas
@@ -4458,6 +3757,7 @@ def create_query_api(request):
     return JsonResponse({'error': 'Método não permitido'}, status=405)
 
 @login_required
+@usar_replica
 def custom_queries_dashboard(request):
     """
     Dashboard para visualizar resultados de queries customizadas
@@ -0,0 +1,274 @@
+"""Grafo de vínculos entre os envolvidos do caso.
+
+Os nós são as pessoas (um por CPF/CNPJ, com os dados do primeiro envolvido) e
+as arestas ligam:
+
+    - cada envolvido de uma comunicação aos titulares da mesma comunicação (RIF
+      e indexador), com o tipo "<tipo do envolvido> -> Titular";
+    - as demais ocorrências de um CPF/CNPJ à primeira, com o tipo
+      "Mesmo CPF/CNPJ" (o mesmo envolvido em comunicações diferentes).
+
+Os envolvidos são lidos em uma única consulta e as arestas montadas por
+agrupamento no pandas. A adjacência fica em arrays CSR do NumPy (indptr e
+destinos, com os atributos das arestas alinhados a destinos). As telas recebem
+o grafo já serializado em JSON, guardado no cache por versão do caso
+(financeira.resumo.em_cache_por_versao): com o cache, a requisição não monta
+listas nem serializa nada.
+"""
+import json
+import logging
+
+import numpy as np
+import pandas as pd
+
+from .models import Envolvido
+from .resumo import em_cache_por_versao
+
+logger = logging.getLogger(__name__)
+
+TIPO_MESMO_CPF = 'Mesmo CPF/CNPJ'
+
+# Envolvidos lidos do banco por bloco
+TAMANHO_BLOCO = 50000
+
+CAMPOS = [
+    'id', 'rif_id', 'indexador', 'cpf_cnpj_envolvido', 'nome_envolvido', 'tipo_envolvido', 'agencia_envolvido',
+    'conta_envolvido', 'data_abertura_conta', 'data_atualizacao_conta', 'bit_pep_citado',
+    'bit_pessoa_obrigada_citado', 'int_servidor_citado',
+]
+
+# Dados do envolvido levados para o nó no arquivo ANX: {chave em metadata: campo}
+METADADOS_NO = {
+    'agencia': 'agencia_envolvido',
+    'conta': 'conta_envolvido',
+    'data_abertura': 'data_abertura_conta',
+    'data_atualizacao': 'data_atualizacao_conta',
+    'pep': 'bit_pep_citado',
+    'pessoa_obrigada': 'bit_pessoa_obrigada_citado',
+    'servidor': 'int_servidor_citado',
+}
+
+
+def _valor(valor):
+    """Converte valores do pandas/NumPy para tipos nativos (NA vira None), para o JSON."""
+    if valor is None or valor is pd.NA or (isinstance(valor, float) and np.isnan(valor)):
+        return None
+    return valor.item() if isinstance(valor, np.generic) else valor
+
+
+#########################################################################################################################
+# GRAFO
+#########################################################################################################################
+class GrafoVinculos:
+    """Grafo de vínculos com a adjacência em CSR.
+
+    As arestas que saem do nó i são as posições indptr[i]:indptr[i + 1] de
+    destinos, tipos, indexadores_origem e indexadores_destino.
+
+    Attributes:
+        nos (pd.DataFrame): Um registro por nó, na ordem dos índices dos nós, com
+            a coluna 'chave' (CPF/CNPJ em texto) e os CAMPOS do primeiro envolvido.
+        indptr (np.ndarray): Início das arestas de cada nó (tamanho nós + 1).
+        destinos (np.ndarray): Índice do nó de destino de cada aresta.
+        tipos (np.ndarray): Posição do tipo de cada aresta em `rotulos`.
+        indexadores_origem (np.ndarray): Indexador do envolvido de origem de cada aresta.
+        indexadores_destino (np.ndarray): Indexador do envolvido de destino de cada aresta.
+        rotulos (list[str]): Tipos de aresta.
+    """
+
+    def __init__(self, nos, indptr, destinos, tipos, indexadores_origem, indexadores_destino, rotulos):
+        self.nos = nos
+        self.indptr = indptr
+        self.destinos = destinos
+        self.tipos = tipos
+        self.indexadores_origem = indexadores_origem
+        self.indexadores_destino = indexadores_destino
+        self.rotulos = rotulos
+
+    @property
+    def quantidade_nos(self):
+        return len(self.nos)
+
+    @property
+    def quantidade_arestas(self):
+        return len(self.destinos)
+
+    def vizinhos(self, no):
+        """Índices dos nós ligados ao nó informado (arestas de saída)."""
+        return self.destinos[self.indptr[no]:self.indptr[no + 1]]
+
+    def origens(self):
+        """Índice do nó de origem de cada aresta (expansão do indptr)."""
+        return np.repeat(np.arange(self.quantidade_nos, dtype=self.destinos.dtype), np.diff(self.indptr))
+
+    def nodes(self, metadados=False):
+        """Nós no formato da tela de análise de vínculos (e do arquivo ANX, com metadados).
+
+        Args:
+            metadados (bool): Inclui os dados de conta e os indicadores do envolvido.
+
+        Returns:
+            list[dict]: {id, nome, cpf_cnpj, tipo, indexador[, metadata]}.
+        """
+        colunas = ['chave', 'nome_envolvido', 'tipo_envolvido', 'indexador']
+        if metadados:
+            colunas += list(METADADOS_NO.values())
+        registros = self.nos[colunas].astype(object).to_dict('records')
+
+        nodes = []
+        for registro in registros:
+            node = {
+                "id": registro['chave'],
+                "nome": registro['nome_envolvido'],
+                "cpf_cnpj": registro['chave'],
+                "tipo": registro['tipo_envolvido'],
+                "indexador": str(registro['indexador']),
+            }
+            if metadados:
+                node["metadata"] = {chave: _valor(registro[campo]) for chave, campo in METADADOS_NO.items()}
+                for chave in ('data_abertura', 'data_atualizacao'):
+                    if node["metadata"][chave] is not None:
+                        node["metadata"][chave] = str(node["metadata"][chave])
+            nodes.append(node)
+        return nodes
+
+    def links(self, metadados=False):
+        """Arestas no formato da tela de análise de vínculos (e do arquivo ANX, com metadados).
+
+        Args:
+            metadados (bool): Inclui os indexadores das pontas da aresta.
+
+        Returns:
+            list[dict]: {source, target, tipo[, tipo_relacao][, metadata]}.
+        """
+        chaves = self.nos['chave'].to_numpy(dtype=object)
+        rotulos = np.array(self.rotulos, dtype=object)
+        mesmo_cpf = self.rotulos.index(TIPO_MESMO_CPF) if TIPO_MESMO_CPF in self.rotulos else -1
+
+        links = []
+        for origem, destino, tipo, indexador_origem, indexador_destino in zip(
+                chaves[self.origens()].tolist(), chaves[self.destinos].tolist(), self.tipos.tolist(),
+                self.indexadores_origem.tolist(), self.indexadores_destino.tolist()):
+            link = {"source": origem, "target": destino, "tipo": rotulos[tipo]}
+            if tipo != mesmo_cpf:
+                link["tipo_relacao"] = "Titular"
+                if metadados:
+                    link["metadata"] = {"indexador": str(indexador_destino)}
+            elif metadados:
+                link["metadata"] = {"indexador_source": str(indexador_origem),
+                                    "indexador_target": str(indexador_destino)}
+            links.append(link)
+        return links
+
+
+#########################################################################################################################
+# CONSTRUÇÃO
+#########################################################################################################################
+def _arestas_titulares(envolvidos):
+    """Pares (envolvido, titular) da mesma comunicação, sem o próprio titular."""
+    titulares = envolvidos.loc[envolvidos['tipo_envolvido'] == 'Titular', ['rif_id', 'indexador', 'id', 'no']]
+    pares = envolvidos[['rif_id', 'indexador', 'id', 'no', 'tipo_envolvido']].merge(
+        titulares, on=['rif_id', 'indexador'], suffixes=('', '_titular'))
+    pares = pares[pares['id'] != pares['id_titular']]
+    return pd.DataFrame({
+        'origem': pares['no'],
+        'destino': pares['no_titular'],
+        'tipo': pares['tipo_envolvido'] + ' -> Titular',
+        'indexador_origem': pares['indexador'],
+        'indexador_destino': pares['indexador'],
+    })
+
+
+def _arestas_mesmo_cpf(envolvidos):
+    """Demais ocorrências de cada CPF/CNPJ ligadas à primeira."""
+    com_cpf = envolvidos[envolvidos['cpf_cnpj_envolvido'].notna()]
+    primeiros = com_cpf.groupby('cpf_cnpj_envolvido')[['id', 'indexador']].transform('first')
+    outros = com_cpf['id'] != primeiros['id']
+    return pd.DataFrame({
+        'origem': com_cpf.loc[outros, 'no'],
+        'destino': com_cpf.loc[outros, 'no'],
+        'tipo': TIPO_MESMO_CPF,
+        'indexador_origem': primeiros.loc[outros, 'indexador'],
+        'indexador_destino': com_cpf.loc[outros, 'indexador'],
+    })
+
+
+def construir_grafo(caso_id):
+    """Monta o grafo de vínculos do caso a partir de uma única consulta dos envolvidos.
+
+    Args:
+        caso_id (int): Id do caso.
+
+    Returns:
+        GrafoVinculos: Grafo do caso.
+    """
+    linhas = Envolvido.objects.filter(caso_id=caso_id).order_by('id').values_list(*CAMPOS)
+    envolvidos = pd.DataFrame.from_records(linhas.iterator(chunk_size=TAMANHO_BLOCO), columns=CAMPOS)
+    envolvidos['cpf_cnpj_envolvido'] = envolvidos['cpf_cnpj_envolvido'].astype('Int64')
+    for campo in ('agencia_envolvido', 'conta_envolvido'):
+        envolvidos[campo] = envolvidos[campo].astype('Int64')
+
+    # Um nó por CPF/CNPJ (em texto, 'None' quando ausente), na ordem do primeiro envolvido
+    chaves = envolvidos['cpf_cnpj_envolvido'].astype('string').fillna('None')
+    envolvidos['no'], _ = pd.factorize(chaves)
+    nos = envolvidos.assign(chave=chaves.astype(object)).drop_duplicates('no').reset_index(drop=True)
+
+    arestas = pd.concat([_arestas_titulares(envolvidos), _arestas_mesmo_cpf(envolvidos)], ignore_index=True)
+    tipos, rotulos = pd.factorize(arestas['tipo'])
+    ordem = np.argsort(arestas['origem'].to_numpy(), kind='stable')
+    origens = arestas['origem'].to_numpy(dtype=np.int64)[ordem]
+
+    grafo = GrafoVinculos(
+        nos=nos[['chave', *CAMPOS]],
+        indptr=np.concatenate([[0], np.cumsum(np.bincount(origens, minlength=len(nos)))]).astype(np.int64),
+        destinos=arestas['destino'].to_numpy(dtype=np.int32)[ordem],
+        tipos=tipos.astype(np.int16)[ordem],
+        indexadores_origem=arestas['indexador_origem'].to_numpy(dtype=np.int64)[ordem],
+        indexadores_destino=arestas['indexador_destino'].to_numpy(dtype=np.int64)[ordem],
+        rotulos=[str(rotulo) for rotulo in rotulos],
+    )
+    logger.info("Grafo de vínculos do caso %s: %s nós, %s arestas", caso_id, grafo.quantidade_nos,
+                grafo.quantidade_arestas)
+    return grafo
+
+
+#########################################################################################################################
+# JSON EM CACHE
+#########################################################################################################################
+def grafo_vinculos_json(caso_id):
+    """Nós e arestas da tela de análise de vínculos, em JSON, do cache enquanto o caso não mudar.
+
+    Args:
+        caso_id (int): Id do caso.
+
+    Returns:
+        dict: {'nodes': JSON dos nós, 'links': JSON das arestas}.
+    """
+    def serializar():
+        grafo = construir_grafo(caso_id)
+        return {'nodes': json.dumps(grafo.nodes(), ensure_ascii=False),
+                'links': json.dumps(grafo.links(), ensure_ascii=False)}
+
+    return em_cache_por_versao(caso_id, 'grafo_vinculos_json', serializar)
+
+
+def grafo_vinculos_anx(caso_id, numero_caso):
+    """Conteúdo do arquivo ANX do caso (grafo com metadados), do cache enquanto o caso não mudar.
+
+    Args:
+        caso_id (int): Id do caso.
+        numero_caso (str): Número do caso, gravado no arquivo (e na chave do cache).
+
+    Returns:
+        str: JSON do arquivo ANX.
+    """
+    def serializar():
+        grafo = construir_grafo(caso_id)
+        anx_data = {
+            "caso": {"numero": numero_caso},
+            "nodes": grafo.nodes(metadados=True),
+            "links": grafo.links(metadados=True)
+        }
+        return json.dumps(anx_data, indent=2, ensure_ascii=False)
+
+    return em_cache_por_versao(caso_id, f'grafo_vinculos_anx:{numero_caso}', serializar)
@@ -0,0 +1,28 @@
+from django.conf import settings
+
+from utils.replica import COOKIE_FIXACAO, EstadoRequisicao, _estado, replica_configurada
+
+
+class ReplicaMiddleware:
+    """Acompanha as gravações de cada requisição para o roteamento da réplica (utils/replica.py).
+
+    Se a requisição gravou algo, define o cookie que mantém as leituras do
+    navegador no banco principal por settings.REPLICA_FIXACAO_SEGUNDOS. Deve ser
+    o último middleware, para não contar as gravações dos demais (ex.: logs).
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        estado = EstadoRequisicao()
+        token = _estado.set(estado)
+        try:
+            response = self.get_response(request)
+        finally:
+            _estado.reset(token)
+
+        if estado.gravou and replica_configurada():
+            response.set_cookie(COOKIE_FIXACAO, '1', max_age=settings.REPLICA_FIXACAO_SEGUNDOS, httponly=True,
+                                secure=settings.SESSION_COOKIE_SECURE, samesite='Lax')
+        return response
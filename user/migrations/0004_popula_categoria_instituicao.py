@@ -14,6 +14,7 @@ def popula_categoria_instituicao(apps, schema_editor):
     CategoriaInstituicao.objects.create(id=8, categoria_instituicao='Força Aérea Brasileira')
     CategoriaInstituicao.objects.create(id=9, categoria_instituicao='Receita Federal')
     CategoriaInstituicao.objects.create(id=10, categoria_instituicao='ABIN')
+    CategoriaInstituicao.objects.create(id=11, categoria_instituicao='Ministério Público')
 
 def reverse_categoria_instituicao(apps, schema_editor):
     CategoriaInstituicao = apps.get_model('user', 'CategoriaInstituicao')
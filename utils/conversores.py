@@ -0,0 +1,109 @@
+"""Conversores vetorizados de valores monetários e datas no formato brasileiro.
+
+Usados pelos importadores da RIF e das cooperações bancárias: cada função recebe
+uma coluna inteira (pd.Series) e converte todos os valores de uma vez, sem
+depender do locale do processo.
+"""
+import pandas as pd
+
+
+def _texto(serie):
+    """Converte a coluna para texto sem espaços nas pontas, com vazio no lugar de nulos."""
+    return serie.where(serie.notna(), '').astype(str).str.strip()
+
+
+def valores_monetarios(serie):
+    """
+    Converte uma coluna de valores monetários para float.
+
+    Aceita números, "1234.56", "1.234,56", "1234,56", "R$ 55,00" e "-1.234,56".
+    Com vírgula, os pontos são separadores de milhar; sem vírgula, um único ponto
+    seguido de até 2 dígitos é o separador decimal e os demais são de milhar.
+
+    Args:
+        serie (pd.Series): Coluna com os valores.
+
+    Returns:
+        pd.Series: Valores em float. Vazios e inválidos viram NaN.
+
+    Exemplo:
+        >>> valores_monetarios(pd.Series(['1.234,56', 'R$ 55,00', 1234, '', 'abc'])).tolist()
+        [1234.56, 55.0, 1234.0, nan, nan]
+    """
+    if pd.api.types.is_numeric_dtype(serie):
+        return serie.astype(float)
+
+    texto = _texto(serie).str.replace(r'R\$|\$|\s', '', regex=True)
+
+    com_virgula = texto.str.contains(',', regex=False)
+    texto = texto.mask(
+        com_virgula,
+        texto.str.replace('.', '', regex=False).str.replace(',', '.', regex=False)
+    )
+
+    # Sem vírgula: "1.234.567" ou "1.234" (3 dígitos após o ponto) usam o ponto como milhar
+    milhar = ~com_virgula & texto.str.contains(r'\.\d{3}(?:\.|$)', regex=True)
+    texto = texto.mask(milhar, texto.str.replace('.', '', regex=False))
+
+    return pd.to_numeric(texto.where(texto != ''), errors='coerce').astype(float)
+
+
+def valores_centavos(serie):
+    """
+    Converte uma coluna de valores em centavos, sem separador decimal, para float.
+
+    É o formato dos arquivos em texto do BACEN (SIMBA): "5300" corresponde a 53,00.
+    Valores que já trazem vírgula decimal são convertidos como valores_monetarios.
+
+    Args:
+        serie (pd.Series): Coluna com os valores.
+
+    Returns:
+        pd.Series: Valores em float. Vazios e inválidos viram NaN.
+
+    Exemplo:
+        >>> valores_centavos(pd.Series(['5300', '53', '12,50', ''])).tolist()
+        [53.0, 0.53, 12.5, nan]
+    """
+    if pd.api.types.is_numeric_dtype(serie):
+        return serie.astype(float) / 100
+
+    texto = _texto(serie)
+    # Colunas com nulos chegam como float: "5300.0"
+    texto = texto.mask(texto.str.endswith('.0'), texto.str.slice(0, -2))
+
+    centavos = texto.str.fullmatch(r'-?\d+')
+    valores = pd.to_numeric(texto.where(centavos), errors='coerce') / 100
+
+    # Só os valores que não são centavos passam pela conversão completa
+    outros = ~centavos & (texto != '')
+    if outros.any():
+        valores[outros] = valores_monetarios(texto[outros])
+    return valores.astype(float)
+
+
+def datas(serie, formatos):
+    """
+    Converte uma coluna de datas tentando cada formato, na ordem, para os valores ainda não convertidos.
+
+    Args:
+        serie (pd.Series): Coluna com as datas.
+        formatos (list): Formatos aceitos pelo strptime, ex.: ['%d/%m/%Y', '%d%m%Y'].
+
+    Returns:
+        pd.Series: Datas (datetime64). Vazias e inválidas viram NaT.
+    """
+    if pd.api.types.is_datetime64_any_dtype(serie):
+        return serie
+
+    texto = _texto(serie).str.replace(r'\.0$', '', regex=True)
+    # Datas DDMMAAAA lidas como número perdem o zero à esquerda
+    texto = texto.mask(texto.str.fullmatch(r'\d{7}'), texto.str.zfill(8))
+
+    resultado = pd.Series(pd.NaT, index=serie.index, dtype='datetime64[ns]')
+    for formato in formatos:
+        pendentes = resultado.isna() & (texto != '')
+        if not pendentes.any():
+            break
+        resultado[pendentes] = pd.to_datetime(texto[pendentes], format=formato, errors='coerce')
+    return resultado
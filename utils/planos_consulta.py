@@ -0,0 +1,47 @@
+"""Verificação do plano de execução das consultas (EXPLAIN), usada nos testes.
+
+Garante que as consultas mais frequentes das views continuam usando os índices
+compostos declarados nos modelos, em vez de varrer a tabela inteira.
+"""
+from django.db import connections, router
+
+
+def atualizar_estatisticas(*modelos):
+    """Executa ANALYZE nas tabelas, para o planejador considerar a distribuição real dos dados."""
+    for modelo in modelos:
+        conexao = connections[router.db_for_write(modelo)]
+        with conexao.cursor() as cursor:
+            cursor.execute(f'ANALYZE {conexao.ops.quote_name(modelo._meta.db_table)}')
+
+
+def varreduras_sequenciais(plano, vendor):
+    """Linhas do plano que leem a tabela inteira.
+
+    Args:
+        plano (str): Saída de QuerySet.explain().
+        vendor (str): connection.vendor do banco que gerou o plano.
+
+    Returns:
+        list: Linhas com 'Seq Scan' (PostgreSQL) ou 'SCAN <tabela>' sem índice (SQLite).
+    """
+    if vendor == 'postgresql':
+        return [linha.strip() for linha in plano.splitlines() if 'Seq Scan' in linha]
+    return [linha.strip() for linha in plano.splitlines() if ' SCAN ' in f' {linha} ' and 'INDEX' not in linha]
+
+
+class PlanoConsultaMixin:
+    """Asserções sobre o plano de execução para TestCase."""
+
+    def assertUsaIndice(self, queryset, *indices):
+        """Falha se a consulta varrer a tabela ou, se informados, não usar nenhum dos índices.
+
+        Sem nomes, só a ausência de varredura é verificada (o SQLite dá nomes próprios
+        aos índices das restrições únicas).
+        """
+        vendor = connections[queryset.db].vendor
+        plano = queryset.explain()
+        varreduras = varreduras_sequenciais(plano, vendor)
+        self.assertFalse(varreduras, f'Varredura sequencial no plano:\n{plano}')
+        if indices:
+            self.assertTrue(any(indice in plano for indice in indices),
+                            f'Nenhum dos índices {indices} foi usado:\n{plano}')
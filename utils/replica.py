@@ -0,0 +1,121 @@
+"""Leituras das telas analíticas em uma réplica somente leitura do banco.
+
+Dashboards, exportações e o motor de consultas customizadas disputam o banco
+principal com as importações. As views marcadas com @usar_replica passam a ler
+os modelos das apps do sistema (settings.APPS_REPLICA) do banco
+settings.BANCO_REPLICA; todo o resto continua no banco principal.
+
+As leituras voltam ao banco principal:
+    - quando a réplica não está configurada (não há o alias em DATABASES);
+    - depois de qualquer gravação na mesma requisição (inclusive
+      select_for_update e get_or_create, que o Django envia ao banco de gravação);
+    - por settings.REPLICA_FIXACAO_SEGUNDOS depois de uma requisição do mesmo
+      navegador que gravou algo (cookie definido por
+      middleware.replica.ReplicaMiddleware), para que o usuário não deixe de
+      ver o que acabou de gravar enquanto a réplica se atualiza.
+"""
+from contextvars import ContextVar
+from functools import wraps
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+# Cookie que mantém as leituras no banco principal logo após uma gravação
+COOKIE_FIXACAO = 'fixar_banco_principal'
+
+
+class EstadoRequisicao:
+    """Estado da requisição em andamento usado pelo roteador."""
+
+    def __init__(self):
+        self.replica = False
+        self.gravou = False
+
+
+_estado = ContextVar('estado_replica', default=None)
+
+
+def replica_configurada():
+    """Alias da réplica, ou None se ela não estiver configurada."""
+    banco = getattr(settings, 'BANCO_REPLICA', None)
+    return banco if banco in connections.databases else None
+
+
+def banco_leitura():
+    """Alias do banco para as leituras da requisição em andamento.
+
+    Também usado pelas consultas SQL feitas diretamente no cursor, que não
+    passam pelo roteador.
+
+    Returns:
+        str: Alias da réplica, dentro de uma view @usar_replica que ainda não
+            gravou nada; o banco principal nos demais casos.
+    """
+    estado = _estado.get()
+    banco = replica_configurada()
+    if estado is None or not estado.replica or estado.gravou or banco is None:
+        return DEFAULT_DB_ALIAS
+    return banco
+
+
+#########################################################################################################################
+# ROTEADOR
+#########################################################################################################################
+class RoteadorReplica:
+    """Roteador de banco (settings.DATABASE_ROUTERS) das leituras analíticas."""
+
+    def db_for_read(self, model, **hints):
+        if model._meta.app_label not in getattr(settings, 'APPS_REPLICA', ()):
+            return None
+        banco = banco_leitura()
+        return banco if banco != DEFAULT_DB_ALIAS else None
+
+    def db_for_write(self, model, **hints):
+        # Gravações vão sempre ao banco principal e fixam nele as leituras seguintes
+        estado = _estado.get()
+        if estado is not None:
+            estado.gravou = True
+        return None
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # A réplica tem os mesmos dados do banco principal
+        bancos = {DEFAULT_DB_ALIAS, replica_configurada()}
+        if obj1._state.db in bancos and obj2._state.db in bancos:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Na réplica, só as operações de estrutura: os dados chegam pela replicação, e as migrações de
+        # dados (RunPython/RunSQL, sem model_name) gravariam no banco principal
+        if db == replica_configurada() and model_name is None:
+            return False
+        return None
+
+
+#########################################################################################################################
+# DECORADOR
+#########################################################################################################################
+def usar_replica(view):
+    """Faz a view ler da réplica (ver o docstring do módulo).
+
+    Deve ficar abaixo de @login_required, para que a autenticação continue a
+    ler o banco principal.
+    """
+    @wraps(view)
+    def _view(request, *args, **kwargs):
+        estado = _estado.get()
+        token = None
+        if estado is None:
+            # Fora do ReplicaMiddleware: estado válido apenas durante a view
+            estado = EstadoRequisicao()
+            token = _estado.set(estado)
+
+        estado.replica = not request.COOKIES.get(COOKIE_FIXACAO)
+        try:
+            return view(request, *args, **kwargs)
+        finally:
+            estado.replica = False
+            if token is not None:
+                _estado.reset(token)
+
+    return _view
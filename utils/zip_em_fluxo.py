@@ -0,0 +1,95 @@
+"""Arquivos ZIP montados à medida que são enviados (StreamingHttpResponse).
+
+O zipfile grava em um destino sem seek usando descritores de dados depois de
+cada entrada; aqui o destino é um buffer esvaziado a cada bloco, então a
+resposta começa a sair com a primeira linha e a memória não cresce com o
+tamanho do arquivo.
+
+Exemplo:
+    >>> blocos = zip_em_fluxo([('dados.csv', csv_em_blocos(['a', 'b'], [(1, 2)]))])
+    >>> StreamingHttpResponse(blocos, content_type='application/zip')
+"""
+import csv
+import io
+import zipfile
+
+# Linhas do CSV acumuladas antes de cada bloco enviado ao ZIP
+LINHAS_POR_BLOCO = 1000
+
+
+class _Saida:
+    """Destino do ZipFile: acumula o que foi gravado até o próximo esvaziar()."""
+
+    def __init__(self):
+        self._partes = []
+
+    def write(self, dados):
+        self._partes.append(bytes(dados))
+        return len(dados)
+
+    def flush(self):
+        pass
+
+    def esvaziar(self):
+        dados = b''.join(self._partes)
+        self._partes = []
+        return dados
+
+
+def zip_em_fluxo(entradas):
+    """Gera os bytes de um ZIP com as entradas, lidas uma de cada vez.
+
+    Entradas cujo conteúdo não gera nenhum bloco ficam fora do arquivo.
+
+    Args:
+        entradas (Iterable[tuple[str, bytes | Iterable[bytes]]]): (nome no ZIP, conteúdo).
+
+    Yields:
+        bytes: Partes do arquivo ZIP.
+    """
+    saida = _Saida()
+    with zipfile.ZipFile(saida, 'w', compression=zipfile.ZIP_DEFLATED) as zf:
+        for nome, blocos in entradas:
+            if isinstance(blocos, bytes):
+                blocos = [blocos]
+            arquivo = None
+            for bloco in blocos:
+                if arquivo is None:
+                    # Tamanho desconhecido de antemão: cabeçalho ZIP64 para arquivos acima de 2 GiB
+                    arquivo = zf.open(nome, 'w', force_zip64=True)
+                arquivo.write(bloco)
+                dados = saida.esvaziar()
+                if dados:
+                    yield dados
+            if arquivo is not None:
+                arquivo.close()
+    yield saida.esvaziar()
+
+
+def csv_em_blocos(cabecalho, linhas, linhas_por_bloco=LINHAS_POR_BLOCO):
+    """Gera um CSV (UTF-8, separado por vírgulas) em blocos de linhas.
+
+    Não gera nada se não houver linhas, nem mesmo o cabeçalho.
+
+    Args:
+        cabecalho (list[str]): Nomes das colunas.
+        linhas (Iterable[Sequence]): Valores de cada linha, na ordem do cabeçalho.
+        linhas_por_bloco (int): Linhas em cada bloco gerado.
+
+    Yields:
+        bytes: Partes do CSV.
+    """
+    texto = io.StringIO()
+    escritor = csv.writer(texto, lineterminator='\n')
+    quantidade = 0
+    for linha in linhas:
+        if quantidade == 0:
+            escritor.writerow(cabecalho)
+        escritor.writerow(linha)
+        quantidade += 1
+        if quantidade % linhas_por_bloco == 0:
+            yield texto.getvalue().encode('utf-8')
+            texto.seek(0)
+            texto.truncate()
+    if quantidade % linhas_por_bloco:
+        yield texto.getvalue().encode('utf-8')